@@ -0,0 +1,134 @@
+"""
+Mesure le passage à l'échelle du traitement sur des chantiers synthétiques.
+
+Pour chaque échelle (par défaut 1, 4 et 16), un chantier est généré avec benchmarks/chantier_synthetique.py (ou réutilisé s'il existe déjà avec les mêmes paramètres),
+puis samonGouttiere.py le traite dans un processus séparé, pour que les mesures de mémoire d'une échelle ne dépendent pas des précédentes.
+Le résumé donne, pour chaque étape, la durée, le temps CPU et le pic de mémoire à chaque échelle, ainsi que le rapport de durée avec la plus petite échelle.
+
+Exemple :
+python benchmarks/benchmark_echelle.py --output benchmark --echelles 1 4 16 --nb_cpus 8
+"""
+import argparse
+import os
+import sys
+import json
+import time
+import subprocess
+from typing import List, Dict
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from benchmarks.chantier_synthetique import ChantierSynthetique
+
+
+def preparer_chantier(path:str, echelle:float, relief:str, graine:int, regenerer:bool)->ChantierSynthetique:
+    chantier = ChantierSynthetique(path, echelle, relief, graine)
+    if regenerer or not chantier.existe():
+        print(f"Génération du chantier synthétique à l'échelle {echelle} dans {path}")
+        chantier.generer()
+    return chantier
+
+
+def executer(chantier:ChantierSynthetique, path_resultats:str, nb_cpus:int, options:List[str])->Dict:
+    """
+    Traite le chantier avec samonGouttiere.py et renvoie les lignes du rapport de performances
+    """
+    commande = [
+        sys.executable, os.path.join(RACINE, "samonGouttiere.py"),
+        "--input", chantier.path,
+        "--output", path_resultats,
+        "--emprise", os.path.join(chantier.path, "emprise.gpkg"),
+        "--nb_cpus", str(nb_cpus),
+        # Le cache des hauteurs d'une exécution précédente fausserait les mesures
+        "--cache", os.path.join(path_resultats, f"cache_{time.time_ns()}")
+    ] + options
+    tic = time.perf_counter()
+    subprocess.run(commande, check=True, cwd=RACINE)
+    duree = time.perf_counter() - tic
+    with open(os.path.join(path_resultats, "rapport_performances.json"), "r") as f:
+        rapport = json.load(f)
+    return {"duree_processus_s":duree, "rapport":rapport}
+
+
+def resumer(resultats:List[Dict])->List[Dict]:
+    """
+    Une ligne par étape (et sous-étape) du traitement, avec les mesures de chaque échelle
+    """
+    lignes:Dict[str, Dict] = {}
+    for resultat in resultats:
+        echelle = resultat["echelle"]
+        for mesure in resultat["rapport"]:
+            # Les lots du mode streaming ont des noms différents d'une échelle à l'autre : on ne les compare pas
+            if mesure["etape"].startswith("lot_"):
+                continue
+            ligne = lignes.setdefault(mesure["etape"], {"etape":mesure["etape"], "niveau":mesure["niveau"], "echelles":{}})
+            ligne["echelles"][echelle] = {
+                "duree_s":mesure["duree_s"],
+                "cpu_total_s":mesure["cpu_total_s"],
+                "rss_max_principal_mo":mesure["rss_max_principal_mo"],
+                "rss_max_workers_mo":mesure["rss_max_workers_mo"],
+                "nb_batiments":mesure.get("nb_batiments")
+            }
+
+    echelle_reference = min([resultat["echelle"] for resultat in resultats])
+    for ligne in lignes.values():
+        reference = ligne["echelles"].get(echelle_reference)
+        for echelle, mesure in ligne["echelles"].items():
+            mesure["rapport_duree"] = None
+            if reference is not None and reference["duree_s"]:
+                mesure["rapport_duree"] = mesure["duree_s"] / reference["duree_s"] if mesure["duree_s"] is not None else None
+    return list(lignes.values())
+
+
+def afficher(resume:List[Dict], echelles:List[float])->None:
+    entete = f"{'étape':<32}" + "".join([f"{'x'+format(echelle, 'g'):>30}" for echelle in echelles])
+    print(entete)
+    print(f"{'':<32}" + "".join([f"{'durée s (rapport) / RSS Mo':>30}" for _ in echelles]))
+    for ligne in resume:
+        nom = "  " * ligne["niveau"] + ligne["etape"]
+        cellules = ""
+        for echelle in echelles:
+            mesure = ligne["echelles"].get(echelle)
+            if mesure is None or mesure["duree_s"] is None:
+                cellules += f"{'-':>30}"
+                continue
+            rapport = f" (x{mesure['rapport_duree']:.1f})" if mesure["rapport_duree"] is not None else ""
+            rss = max(mesure["rss_max_principal_mo"], mesure["rss_max_workers_mo"])
+            cellules += f"{format(mesure['duree_s'], '.1f') + rapport + ' / ' + format(rss, '.0f'):>30}"
+        print(f"{nom[:32]:<32}" + cellules)
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Passage à l'échelle du traitement sur des chantiers synthétiques")
+    parser.add_argument('--output', help='Répertoire des chantiers générés et des résultats', required=True)
+    parser.add_argument('--echelles', help="Echelles des chantiers synthétiques", nargs="+", default=[1, 4, 16], type=float)
+    parser.add_argument('--relief', help='Relief du MNT', default="plat", choices=["plat", "vallonne"])
+    parser.add_argument('--graine', help='Graine du générateur aléatoire', default=0, type=int)
+    parser.add_argument('--nb_cpus', help='Nombre de cpus pour la parallélisation', default=4, type=int)
+    parser.add_argument('--regenerer', help="Régénère les chantiers même s'ils existent déjà", action="store_true")
+    parser.add_argument('--pipeline', help="Traitement avec l'option --pipeline", action="store_true")
+    parser.add_argument('--streaming', help="Traitement avec l'option --streaming", action="store_true")
+    args = parser.parse_args()
+
+    options = []
+    if args.pipeline:
+        options.append("--pipeline")
+    if args.streaming:
+        options.append("--streaming")
+
+    resultats = []
+    for echelle in args.echelles:
+        nom = f"x{echelle:g}_{args.relief}_{args.graine}"
+        chantier = preparer_chantier(os.path.join(args.output, "chantiers", nom), echelle, args.relief, args.graine, args.regenerer)
+        print(f"Traitement du chantier synthétique à l'échelle {echelle:g}")
+        resultat = executer(chantier, os.path.join(args.output, "resultats", nom), args.nb_cpus, options)
+        resultat["echelle"] = echelle
+        resultats.append(resultat)
+
+    resume = resumer(resultats)
+    afficher(resume, args.echelles)
+    path_resume = os.path.join(args.output, "benchmark_echelle.json")
+    with open(path_resume, "w") as f:
+        json.dump({"parametres":vars(args), "resultats":resultats, "resume":resume}, f, indent=2)
+    print(f"Mesures enregistrées dans {path_resume}")
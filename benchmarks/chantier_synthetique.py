@@ -0,0 +1,529 @@
+"""
+Génère un chantier synthétique, pour mesurer les performances du traitement sans données réelles.
+
+Le chantier contient, dans l'arborescence attendue par SamonGouttiere :
+- mnt/mnt.vrt : un MNT plat ou vallonné
+- raf/raf2020_2154.tif : une grille RAF constante
+- orientation/ta_synthetique.XML : un TA avec des bandes de clichés verticaux, lisible par ShotOriente.createShot
+- pvas/*.tif : les images, rendues à partir d'une texture du sol et des faces (murs et toits) des bâtiments
+- gouttieres/predictions_FFL/*.gpkg : pour chaque image, le contour des toits des bâtiments visibles en coordonnées image (c, -l), comme les prédictions du FFL
+- emprise.gpkg : l'emprise de la ville
+- verite_terrain.gpkg : le contour 3D du toit de chaque bâtiment, à hauteur de gouttière, pour mesurer la précision du traitement
+- parametres.json : les paramètres de la génération
+
+La ville est une grille d'îlots. Chaque îlot contient deux rangées de maisons mitoyennes, qui forment deux pâtés de maisons,
+et un bâtiment isolé au centre. Les toits sont plats ou à deux pans. Le nombre d'îlots est proportionnel à l'échelle.
+Le chantier ne dépend que de l'échelle, du relief et de la graine : deux générations avec les mêmes paramètres donnent le même chantier.
+
+Exemple :
+python benchmarks/chantier_synthetique.py --output chantiers/x4 --echelle 4 --relief vallonne
+"""
+import argparse
+import os
+import sys
+import math
+import zlib
+import json
+from typing import List, Dict, Tuple
+import numpy as np
+from shapely import Polygon
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class BatimentSynthetique:
+    """
+    Bâtiment rectangulaire. coins : les quatre coins de l'emprise au sol, dans l'ordre. Pour un toit à deux pans, le faîtage
+    est parallèle aux côtés coins[0]-coins[1] et coins[3]-coins[2]
+    """
+
+    def __init__(self, coins:List[Tuple[float, float]], z_sol:float, hauteur:float, toit:str, hauteur_faitage:float=0):
+        self.coins = coins
+        self.z_sol = z_sol
+        self.hauteur = hauteur
+        self.toit = toit
+        self.hauteur_faitage = hauteur_faitage
+
+    def get_z_gouttiere(self)->float:
+        return self.z_sol + self.hauteur
+
+    def get_contour_toit(self)->List[Tuple[float, float, float]]:
+        """
+        Contour du toit à hauteur de gouttière : c'est ce que prédit le FFL
+        """
+        z = self.get_z_gouttiere()
+        return [(x, y, z) for x, y in self.coins]
+
+    def get_faces(self)->List[Tuple[List[Tuple[float, float, float]], str]]:
+        """
+        Faces à dessiner dans les images, des murs vers le toit
+        """
+        z_sol = self.z_sol
+        z = self.get_z_gouttiere()
+        faces = []
+        for i in range(4):
+            (x0, y0), (x1, y1) = self.coins[i], self.coins[(i+1)%4]
+            faces.append(([(x0, y0, z_sol), (x1, y1, z_sol), (x1, y1, z), (x0, y0, z)], "mur"))
+        if self.toit == "plat":
+            faces.append((self.get_contour_toit(), "toit_plat"))
+        else:
+            a, b, c, d = self.get_contour_toit()
+            z_faitage = z + self.hauteur_faitage
+            faitage_a = ((a[0]+d[0])/2, (a[1]+d[1])/2, z_faitage)
+            faitage_b = ((b[0]+c[0])/2, (b[1]+c[1])/2, z_faitage)
+            faces.append(([a, b, faitage_b, faitage_a], "pan_eclaire"))
+            faces.append(([d, c, faitage_b, faitage_a], "pan_ombre"))
+        return faces
+
+
+class ChantierSynthetique:
+
+    # Coin sud-ouest de la ville, en Lambert 93
+    x0 = 650000.0
+    y0 = 6860000.0
+
+    # Nombre d'îlots par côté à l'échelle 1, taille d'un îlot et largeur des rues en mètres
+    nb_ilots = 4
+    taille_ilot = 80
+    largeur_rue = 20
+
+    # MNT : résolution en mètres, et marge autour de la ville (le MNT est lu avec un buffer de 1 km autour de l'emprise et des clichés)
+    resolution_mnt = 2
+    marge_mnt = 1500
+    altitude_sol = 100
+    amplitude_relief = 25
+    longueur_onde_relief = 700
+
+    # Ondulation de la grille RAF, en mètres
+    valeur_raf = 45
+
+    # Caméra : hauteur de vol au-dessus du sol, taille des images et focale en pixels (soit 50 cm par pixel)
+    hauteur_vol = 1000
+    largeur_image = 2000
+    hauteur_image = 1500
+    focale = 2000
+    recouvrement_longitudinal = 0.6
+    recouvrement_lateral = 0.3
+    # Rotation de -90° autour de z : caméra verticale, colonnes vers l'est et lignes vers le sud
+    quaternion = (0.0, 0.0, -math.sqrt(0.5), math.sqrt(0.5))
+
+    # Bruit sur les sommets prédits, en pixels, et marge en pixels pour qu'un bâtiment soit considéré comme visible
+    bruit_predictions = 0.5
+    marge_image = 10
+
+    # Couleur de chaque type de face dans les images
+    couleurs = {
+        "mur":(90, 85, 80),
+        "toit_plat":(150, 150, 155),
+        "pan_eclaire":(190, 90, 70),
+        "pan_ombre":(120, 55, 45)
+    }
+
+    def __init__(self, path:str, echelle:float=1, relief:str="plat", graine:int=0):
+        self.path = path
+        self.echelle = echelle
+        self.relief = relief
+        self.graine = graine
+        self.rng = np.random.default_rng(graine)
+
+        self.nb_ilots_cote = max(1, int(round(ChantierSynthetique.nb_ilots * math.sqrt(echelle))))
+        pas = ChantierSynthetique.taille_ilot + ChantierSynthetique.largeur_rue
+        self.xmin = ChantierSynthetique.x0
+        self.ymin = ChantierSynthetique.y0
+        self.xmax = self.xmin + self.nb_ilots_cote * pas
+        self.ymax = self.ymin + self.nb_ilots_cote * pas
+
+        self.batiments:List[BatimentSynthetique] = []
+        self.images:List[Dict] = []
+
+
+    def get_altitude(self, x, y):
+        """
+        Altitude du sol, calculée analytiquement : le MNT et les bâtiments utilisent la même surface
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if self.relief == "plat":
+            return np.full(np.broadcast(x, y).shape, float(ChantierSynthetique.altitude_sol))
+        longueur_onde = ChantierSynthetique.longueur_onde_relief
+        return ChantierSynthetique.altitude_sol + ChantierSynthetique.amplitude_relief * np.sin(2*np.pi*(x-self.xmin)/longueur_onde) * np.cos(2*np.pi*(y-self.ymin)/(1.3*longueur_onde))
+
+
+    def generer(self)->None:
+        for sous_repertoire in ["mnt", "raf", "orientation", "pvas", os.path.join("gouttieres", "predictions_FFL")]:
+            os.makedirs(os.path.join(self.path, sous_repertoire), exist_ok=True)
+
+        self.creer_batiments()
+        print(f"{len(self.batiments)} bâtiments dans {self.nb_ilots_cote}x{self.nb_ilots_cote} îlots")
+        self.ecrire_mnt()
+        self.ecrire_raf()
+        self.ecrire_emprise()
+        self.creer_images()
+        self.ecrire_ta()
+
+        from v2.shot import RAF
+        from v2.ressources_partagees import lire_shots_ta
+        raf = RAF(self.get_path_raf())
+        shots = lire_shots_ta(self.get_path_ta(), raf, [image["nom"] for image in self.images])
+        for i, image in enumerate(self.images):
+            shot = shots[image["nom"]]
+            self.ecrire_prediction(shot)
+            self.ecrire_image(shot)
+            print(f"Image {i+1}/{len(self.images)} : {image['nom']}")
+        self.ecrire_verite_terrain()
+
+        # Ecrit en dernier : un chantier sans ce fichier est incomplet
+        with open(self.get_path_parametres(), "w") as f:
+            json.dump(self.get_parametres(), f, indent=2)
+
+
+    def get_parametres(self)->Dict:
+        return {"echelle":self.echelle, "relief":self.relief, "graine":self.graine}
+
+
+    def get_path_parametres(self)->str:
+        return os.path.join(self.path, "parametres.json")
+
+
+    def existe(self)->bool:
+        """
+        Vrai si le chantier a déjà été entièrement généré avec les mêmes paramètres
+        """
+        if not os.path.isfile(self.get_path_parametres()):
+            return False
+        with open(self.get_path_parametres(), "r") as f:
+            return json.load(f) == self.get_parametres()
+
+
+    def creer_batiments(self)->None:
+        pas = ChantierSynthetique.taille_ilot + ChantierSynthetique.largeur_rue
+        for i in range(self.nb_ilots_cote):
+            for j in range(self.nb_ilots_cote):
+                x_ilot = self.xmin + i * pas + ChantierSynthetique.largeur_rue / 2
+                y_ilot = self.ymin + j * pas + ChantierSynthetique.largeur_rue / 2
+                profondeur = self.rng.uniform(9, 12)
+                self.creer_rangee(x_ilot, y_ilot, profondeur)
+                self.creer_rangee(x_ilot, y_ilot + ChantierSynthetique.taille_ilot - profondeur, profondeur)
+                self.creer_batiment_isole(x_ilot + ChantierSynthetique.taille_ilot / 2, y_ilot + ChantierSynthetique.taille_ilot / 2)
+
+
+    def creer_rangee(self, x:float, y:float, profondeur:float)->None:
+        """
+        Maisons mitoyennes le long de l'axe x. Elles ont la même hauteur de gouttière pour que leurs contours se touchent aussi dans les images
+        """
+        x_fin = x + ChantierSynthetique.taille_ilot
+        coupures = [x]
+        while x_fin - coupures[-1] > 12:
+            coupures.append(coupures[-1] + self.rng.uniform(7, 12))
+        coupures.append(x_fin)
+
+        hauteur = self.rng.uniform(6, 12)
+        z_sol = float(np.min(self.get_altitude([x, x_fin, x, x_fin], [y, y, y+profondeur, y+profondeur])))
+        for k in range(len(coupures)-1):
+            xa, xb = coupures[k], coupures[k+1]
+            coins = [(xa, y), (xb, y), (xb, y+profondeur), (xa, y+profondeur)]
+            if self.rng.uniform() < 0.6:
+                self.batiments.append(BatimentSynthetique(coins, z_sol, hauteur, "deux_pans", self.rng.uniform(2, 4)))
+            else:
+                self.batiments.append(BatimentSynthetique(coins, z_sol, hauteur, "plat"))
+
+
+    def creer_batiment_isole(self, x_centre:float, y_centre:float)->None:
+        demi_largeur = self.rng.uniform(5, 10)
+        demi_longueur = self.rng.uniform(5, 12)
+        angle = self.rng.uniform(0, np.pi)
+        cos_a, sin_a = np.cos(angle), np.sin(angle)
+        coins = []
+        for dx, dy in [(-demi_longueur, -demi_largeur), (demi_longueur, -demi_largeur), (demi_longueur, demi_largeur), (-demi_longueur, demi_largeur)]:
+            coins.append((x_centre + cos_a*dx - sin_a*dy, y_centre + sin_a*dx + cos_a*dy))
+        z_sol = float(np.min(self.get_altitude([c[0] for c in coins], [c[1] for c in coins])))
+        self.batiments.append(BatimentSynthetique(coins, z_sol, self.rng.uniform(8, 20), "plat"))
+
+
+    def ecrire_raster(self, path:str, array:np.ndarray, gt:Tuple, type_gdal:int)->None:
+        from osgeo import gdal, osr
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(2154)
+        nb_bandes = 1 if array.ndim == 2 else array.shape[0]
+        ds = gdal.GetDriverByName("GTiff").Create(path, array.shape[-1], array.shape[-2], nb_bandes, type_gdal, options=["COMPRESS=DEFLATE", "TILED=YES"])
+        if gt is not None:
+            ds.SetGeoTransform(gt)
+            ds.SetProjection(srs.ExportToWkt())
+        if array.ndim == 2:
+            ds.GetRasterBand(1).WriteArray(array)
+        else:
+            for i in range(nb_bandes):
+                ds.GetRasterBand(i+1).WriteArray(array[i])
+        ds = None
+
+
+    def ecrire_mnt(self)->None:
+        from osgeo import gdal
+        resolution = ChantierSynthetique.resolution_mnt
+        marge = ChantierSynthetique.marge_mnt
+        xmin, ymax = self.xmin - marge, self.ymax + marge
+        nb_colonnes = int(math.ceil((self.xmax - self.xmin + 2*marge) / resolution))
+        nb_lignes = int(math.ceil((self.ymax - self.ymin + 2*marge) / resolution))
+        x = xmin + (np.arange(nb_colonnes) + 0.5) * resolution
+        y = ymax - (np.arange(nb_lignes) + 0.5) * resolution
+        xx, yy = np.meshgrid(x, y)
+        mnt = self.get_altitude(xx, yy).astype(np.float32)
+        path_tif = os.path.join(self.path, "mnt", "mnt.tif")
+        self.ecrire_raster(path_tif, mnt, (xmin, resolution, 0, ymax, 0, -resolution), gdal.GDT_Float32)
+        vrt = gdal.BuildVRT(os.path.join(self.path, "mnt", "mnt.vrt"), [path_tif])
+        vrt = None
+
+
+    def get_path_raf(self)->str:
+        return os.path.join(self.path, "raf", "raf2020_2154.tif")
+
+
+    def ecrire_raf(self)->None:
+        from osgeo import gdal
+        # Grille grossière qui couvre largement le MNT
+        resolution = 1000
+        marge = ChantierSynthetique.marge_mnt + 2 * resolution
+        xmin, ymax = self.xmin - marge, self.ymax + marge
+        nb_colonnes = int(math.ceil((self.xmax - self.xmin + 2*marge) / resolution))
+        nb_lignes = int(math.ceil((self.ymax - self.ymin + 2*marge) / resolution))
+        raf = np.full((nb_lignes, nb_colonnes), ChantierSynthetique.valeur_raf, dtype=np.float32)
+        self.ecrire_raster(self.get_path_raf(), raf, (xmin, resolution, 0, ymax, 0, -resolution), gdal.GDT_Float32)
+
+
+    def ecrire_emprise(self)->None:
+        import geopandas as gpd
+        emprise = Polygon.from_bounds(self.xmin, self.ymin, self.xmax, self.ymax)
+        gpd.GeoDataFrame({"geometry":[emprise]}, crs="EPSG:2154").to_file(os.path.join(self.path, "emprise.gpkg"))
+
+
+    def get_path_verite_terrain(self)->str:
+        return os.path.join(self.path, "verite_terrain.gpkg")
+
+
+    def ecrire_verite_terrain(self)->None:
+        import geopandas as gpd
+        geometries = [Polygon(batiment.get_contour_toit()) for batiment in self.batiments]
+        d = {
+            "toit":[batiment.toit for batiment in self.batiments],
+            "z_gouttiere":[batiment.get_z_gouttiere() for batiment in self.batiments],
+            "geometry":geometries
+        }
+        gpd.GeoDataFrame(d, crs="EPSG:2154").to_file(self.get_path_verite_terrain())
+
+
+    def creer_images(self)->None:
+        """
+        Bandes de clichés est-ouest qui couvrent la ville avec les recouvrements demandés
+        """
+        gsd = ChantierSynthetique.hauteur_vol / ChantierSynthetique.focale
+        largeur_sol = ChantierSynthetique.largeur_image * gsd
+        hauteur_sol = ChantierSynthetique.hauteur_image * gsd
+        base = largeur_sol * (1 - ChantierSynthetique.recouvrement_longitudinal)
+        ecart_bandes = hauteur_sol * (1 - ChantierSynthetique.recouvrement_lateral)
+
+        nb_cliches_bande = int(math.ceil((self.xmax - self.xmin) / base)) + 2
+        nb_bandes = int(math.ceil((self.ymax - self.ymin) / ecart_bandes)) + 1
+        x_debut = (self.xmin + self.xmax) / 2 - (nb_cliches_bande - 1) * base / 2
+        y_debut = (self.ymin + self.ymax) / 2 - (nb_bandes - 1) * ecart_bandes / 2
+        altitude_vol = ChantierSynthetique.altitude_sol + ChantierSynthetique.hauteur_vol
+        for bande in range(nb_bandes):
+            for k in range(nb_cliches_bande):
+                x = x_debut + k * base
+                y = y_debut + bande * ecart_bandes
+                self.images.append({
+                    "nom":f"synthetique_{bande+1:02d}_{k+1:03d}",
+                    "x":x,
+                    "y":y,
+                    "z":altitude_vol,
+                    "z_nadir":float(self.get_altitude(x, y)),
+                    "emprise":[(x - largeur_sol/2, y + hauteur_sol/2), (x + largeur_sol/2, y + hauteur_sol/2), (x + largeur_sol/2, y - hauteur_sol/2), (x - largeur_sol/2, y - hauteur_sol/2)]
+                })
+
+
+    def get_path_ta(self)->str:
+        return os.path.join(self.path, "orientation", "ta_synthetique.XML")
+
+
+    def ecrire_ta(self)->None:
+        """
+        TA au format des tableaux d'assemblage IGN, réduit aux éléments lus par ShotOriente.createShot.
+        Les altitudes du TA sont des hauteurs ellipsoïdales : on leur ajoute la RAF, que createShot retranche
+        """
+        from lxml import etree
+
+        def ajouter(parent, nom:str, texte=None):
+            element = etree.SubElement(parent, nom)
+            if texte is not None:
+                element.text = str(texte)
+            return element
+
+        def ajouter_point(parent, nom:str, x:float, y:float, z:float):
+            pt3d = ajouter(ajouter(parent, nom), "pt3d")
+            ajouter(pt3d, "x", x)
+            ajouter(pt3d, "y", y)
+            ajouter(pt3d, "z", z)
+            return pt3d
+
+        raf = ChantierSynthetique.valeur_raf
+        root = etree.Element("TA")
+        chantier = ajouter(root, "chantier")
+        centre_rep_local = ajouter(chantier, "centre_rep_local")
+        ajouter(centre_rep_local, "x", (self.xmin + self.xmax) / 2)
+        ajouter(centre_rep_local, "y", (self.ymin + self.ymax) / 2)
+
+        vol = ajouter(chantier, "vol")
+        sensor = ajouter(vol, "sensor")
+        ajouter(sensor, "name", "camera_synthetique")
+        focal = ajouter(sensor, "focal")
+        ajouter(focal, "x", ChantierSynthetique.largeur_image / 2)
+        ajouter(focal, "y", ChantierSynthetique.hauteur_image / 2)
+        ajouter(focal, "z", ChantierSynthetique.focale)
+        cadre = ajouter(sensor, "usefull-frame")
+        ajouter(cadre, "w", ChantierSynthetique.largeur_image)
+        ajouter(cadre, "h", ChantierSynthetique.hauteur_image)
+
+        for image in self.images:
+            cliche = ajouter(vol, "cliche")
+            ajouter(cliche, "image", image["nom"])
+            ajouter(cliche, "origine", "camera_synthetique")
+            model = ajouter(cliche, "model")
+            pt3d = ajouter(model, "pt3d")
+            ajouter(pt3d, "x", image["x"])
+            ajouter(pt3d, "y", image["y"])
+            ajouter(pt3d, "z", image["z"] + raf)
+            quaternion = ajouter(model, "quaternion")
+            for nom, valeur in zip(["x", "y", "z", "w"], ChantierSynthetique.quaternion):
+                ajouter(quaternion, nom, valeur)
+            ajouter_point(cliche, "nadir", image["x"], image["y"], image["z_nadir"] + raf)
+            polygon2d = ajouter(cliche, "polygon2d")
+            for x, y in image["emprise"]:
+                ajouter(polygon2d, "x", x)
+                ajouter(polygon2d, "y", y)
+
+        etree.ElementTree(root).write(self.get_path_ta(), pretty_print=True, xml_declaration=True, encoding="UTF-8")
+
+
+    def projeter(self, shot, points:List[Tuple[float, float, float]])->Tuple[np.ndarray, np.ndarray]:
+        points = np.array(points, dtype=np.float64)
+        c, l = shot.world_to_image(points[:, 0], points[:, 1], points[:, 2])
+        return np.asarray(c), np.asarray(l)
+
+
+    def est_visible(self, c:np.ndarray, l:np.ndarray)->bool:
+        marge = ChantierSynthetique.marge_image
+        return bool(np.all(c >= marge) and np.all(c <= ChantierSynthetique.largeur_image - marge) and np.all(l >= marge) and np.all(l <= ChantierSynthetique.hauteur_image - marge))
+
+
+    def get_batiments_visibles(self, shot)->List[Tuple[BatimentSynthetique, np.ndarray, np.ndarray]]:
+        x_min, y_min, x_max, y_max = shot.emprise.bounds
+        visibles = []
+        for batiment in self.batiments:
+            x, y = batiment.coins[0]
+            if x < x_min or x > x_max or y < y_min or y > y_max:
+                continue
+            c, l = self.projeter(shot, batiment.get_contour_toit())
+            if self.est_visible(c, l):
+                visibles.append((batiment, c, l))
+        return visibles
+
+
+    def ecrire_prediction(self, shot)->None:
+        """
+        Contour des toits des bâtiments entièrement visibles dans l'image. Un sommet partagé par deux maisons mitoyennes
+        reçoit le même bruit dans les deux contours, pour que les prédictions se touchent comme celles du FFL
+        """
+        import geopandas as gpd
+        # crc32 plutôt que hash() : la graine de chaque image ne change pas d'une exécution à l'autre
+        rng = np.random.default_rng([self.graine, zlib.crc32(shot.image.encode("utf-8"))])
+        bruits:Dict[Tuple[float, float], np.ndarray] = {}
+        geometries = []
+        for batiment, c, l in self.get_batiments_visibles(shot):
+            points = []
+            for k, (x, y) in enumerate(batiment.coins):
+                cle = (round(x, 3), round(y, 3))
+                if cle not in bruits:
+                    bruits[cle] = rng.normal(0, ChantierSynthetique.bruit_predictions, 2)
+                points.append((c[k] + bruits[cle][0], -(l[k] + bruits[cle][1])))
+            geometries.append(Polygon(points))
+        gdf = gpd.GeoDataFrame({"id":range(len(geometries)), "geometry":geometries})
+        gdf.to_file(os.path.join(self.path, "gouttieres", "predictions_FFL", f"{shot.image}.gpkg"))
+
+
+    def get_texture_sol(self, shot)->np.ndarray:
+        """
+        Texture du sol, définie en coordonnées terrain pour être la même dans toutes les images.
+        Le passage image -> terrain est approché par une transformation affine, suffisante pour une caméra verticale
+        """
+        x_min, y_min, x_max, y_max = shot.emprise.bounds
+        xx, yy = np.meshgrid(np.linspace(x_min, x_max, 5), np.linspace(y_min, y_max, 5))
+        xx, yy = xx.ravel(), yy.ravel()
+        c, l = self.projeter(shot, list(zip(xx, yy, self.get_altitude(xx, yy))))
+        A = np.vstack([c, l, np.ones_like(c)]).T
+        coefficients_x = np.linalg.lstsq(A, xx, rcond=None)[0]
+        coefficients_y = np.linalg.lstsq(A, yy, rcond=None)[0]
+
+        colonnes = np.arange(ChantierSynthetique.largeur_image, dtype=np.float32)
+        lignes = np.arange(ChantierSynthetique.hauteur_image, dtype=np.float32)
+        cc, ll = np.meshgrid(colonnes, lignes)
+        x = coefficients_x[0]*cc + coefficients_x[1]*ll + (coefficients_x[2] - self.xmin)
+        y = coefficients_y[0]*cc + coefficients_y[1]*ll + (coefficients_y[2] - self.ymin)
+
+        # Cellules de 3 m avec un niveau de gris pseudo-aléatoire, et une ondulation plus lente
+        i = np.floor(x / 3).astype(np.int64)
+        j = np.floor(y / 3).astype(np.int64)
+        bruit = ((i * 73856093) ^ (j * 19349663)) & 63
+        texture = 80 + bruit + 20 * np.sin(x / 17) * np.cos(y / 23)
+        return texture.astype(np.float32)
+
+
+    def ecrire_image(self, shot)->None:
+        """
+        Image RGB : texture du sol, puis faces des bâtiments rasterisées de la plus basse à la plus haute
+        """
+        from osgeo import gdal, ogr
+
+        faces = []
+        for batiment, _, _ in sorted(self.get_batiments_visibles(shot), key=lambda v: v[0].get_z_gouttiere()):
+            faces += batiment.get_faces()
+
+        largeur, hauteur = ChantierSynthetique.largeur_image, ChantierSynthetique.hauteur_image
+        indices = np.zeros((hauteur, largeur), dtype=np.int32)
+        if len(faces) > 0:
+            c, l = self.projeter(shot, [point for face, _ in faces for point in face])
+            ds_ogr = ogr.GetDriverByName("Memory").CreateDataSource("")
+            couche = ds_ogr.CreateLayer("faces", geom_type=ogr.wkbPolygon)
+            couche.CreateField(ogr.FieldDefn("indice", ogr.OFTInteger))
+            debut = 0
+            for indice, (face, _) in enumerate(faces):
+                fin = debut + len(face)
+                points = list(zip(c[debut:fin], -l[debut:fin]))
+                debut = fin
+                feature = ogr.Feature(couche.GetLayerDefn())
+                feature.SetField("indice", indice+1)
+                feature.SetGeometry(ogr.CreateGeometryFromWkb(Polygon(points).wkb))
+                couche.CreateFeature(feature)
+            # Même convention que les prédictions : x = c, y = -l
+            ds = gdal.GetDriverByName("MEM").Create("", largeur, hauteur, 1, gdal.GDT_Int32)
+            ds.SetGeoTransform((0, 1, 0, 0, 0, -1))
+            gdal.RasterizeLayer(ds, [1], couche, options=["ATTRIBUTE=indice"])
+            indices = ds.GetRasterBand(1).ReadAsArray()
+            ds = None
+
+        texture = self.get_texture_sol(shot)
+        image = np.zeros((3, hauteur, largeur), dtype=np.uint8)
+        couleurs = np.array([[0, 0, 0]] + [ChantierSynthetique.couleurs[type_face] for _, type_face in faces], dtype=np.float32)
+        for canal in range(3):
+            valeurs = np.where(indices > 0, couleurs[indices, canal], texture)
+            image[canal] = np.clip(valeurs, 0, 255).astype(np.uint8)
+        self.ecrire_raster(os.path.join(self.path, "pvas", f"{shot.image}.tif"), image, None, gdal.GDT_Byte)
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Génère un chantier synthétique pour les mesures de performances")
+    parser.add_argument('--output', help='Répertoire du chantier à créer', required=True)
+    parser.add_argument('--echelle', help="Taille de la ville : à l'échelle 4, il y a 4 fois plus d'îlots qu'à l'échelle 1", default=1, type=float)
+    parser.add_argument('--relief', help='Relief du MNT', default="plat", choices=["plat", "vallonne"])
+    parser.add_argument('--graine', help='Graine du générateur aléatoire', default=0, type=int)
+    args = parser.parse_args()
+
+    ChantierSynthetique(args.output, args.echelle, args.relief, args.graine).generer()
@@ -0,0 +1,135 @@
+"""
+Vérifie que les composantes connexes calculées sur le graphe creux (v2/composantes.py) sont les mêmes que celles des parcours qu'elles remplacent,
+et mesure leur durée sur des graphes d'homologues de plus en plus grands (jusqu'à plusieurs millions d'arêtes).
+
+Les graphes imitent ceux du traitement : des sommets (bâtiments, segments) reliés à quelques homologues, dans des composantes de taille variable,
+avec quelques très grandes composantes (zones denses), où les anciens parcours étaient quadratiques.
+Pour chaque graphe, on vérifie que les composantes sont les mêmes, dans le même ordre et avec le même premier sommet.
+Le parcours d'origine n'est mesuré que jusqu'à --nb_aretes_max_reference arêtes.
+Le code de retour vaut 1 si au moins une composante est différente.
+
+Exemples :
+python benchmarks/composantes.py
+python benchmarks/composantes.py --nb_aretes 10000 100000 1000000 3000000
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from v2.composantes import composantes_objets
+
+
+class Sommet:
+
+    def __init__(self, numero:int):
+        self.numero = numero
+        self.homologues:List[Sommet] = []
+        self._marque = False
+
+
+# Code d'origine
+
+def reference_composantes(sommets:List[Sommet])->List[List[Sommet]]:
+    composantes = []
+    for sommet in sommets:
+        if not sommet._marque:
+            liste_connexe = [sommet]
+            liste = [sommet]
+            sommet._marque = True
+            while len(liste) > 0:
+                g = liste.pop()
+                for homologue in g.homologues:
+                    if not homologue._marque:
+                        homologue._marque = True
+                        if homologue not in liste:
+                            liste.append(homologue)
+                        if homologue not in liste_connexe:
+                            liste_connexe.append(homologue)
+            composantes.append(liste_connexe)
+    return composantes
+
+
+# Données aléatoires
+
+def generer_graphe(rng:np.random.Generator, nb_aretes:int)->List[Sommet]:
+    """
+    Graphe d'environ nb_aretes arêtes (chacune présente dans les deux sens, comme les homologues), avec deux à trois fois moins de sommets.
+    Les sommets sont répartis en composantes de tailles tirées selon une loi de Pareto : quelques composantes réunissent des milliers de sommets
+    """
+    nb_sommets = max(nb_aretes * 2 // 5, 2)
+    tailles = np.minimum(np.ceil(rng.pareto(1.2, nb_sommets) + 1).astype(np.int64), max(nb_sommets // 10, 2))
+    debuts = np.concatenate(([0], np.cumsum(tailles)))
+    debuts = debuts[debuts < nb_sommets]
+    fins = np.append(debuts[1:], nb_sommets)
+
+    sommets = [Sommet(i) for i in range(nb_sommets)]
+    permutation = rng.permutation(nb_sommets)
+    nb_aretes_composantes = np.maximum((nb_aretes * (fins - debuts) / nb_sommets).astype(np.int64), fins - debuts - 1)
+    for debut, fin, nb in zip(debuts, fins, nb_aretes_composantes):
+        if fin - debut < 2:
+            continue
+        # Un chemin pour que la composante soit connexe, puis des arêtes au hasard dans la composante
+        membres = permutation[debut:fin]
+        i = np.concatenate((membres[:-1], rng.choice(membres, nb - (fin - debut - 1))))
+        j = np.concatenate((membres[1:], rng.choice(membres, nb - (fin - debut - 1))))
+        for a, b in zip(i, j):
+            if a != b:
+                sommets[a].homologues.append(sommets[b])
+                sommets[b].homologues.append(sommets[a])
+    return sommets
+
+
+def demarquer(sommets:List[Sommet])->None:
+    for sommet in sommets:
+        sommet._marque = False
+
+
+def identiques(attendues:List[List[Sommet]], obtenues:List[List[Sommet]])->bool:
+    if len(attendues) != len(obtenues):
+        return False
+    for attendue, obtenue in zip(attendues, obtenues):
+        if attendue[0] is not obtenue[0] or set(s.numero for s in attendue) != set(s.numero for s in obtenue):
+            return False
+    return True
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Vérifie les composantes connexes calculées sur le graphe creux et mesure leur durée")
+    parser.add_argument('--nb_aretes', help="Nombres d'arêtes des graphes", nargs="+", default=[1000, 10000, 100000, 1000000], type=int)
+    parser.add_argument('--nb_aretes_max_reference', help="Nombre maximal d'arêtes pour lequel le parcours d'origine est exécuté", default=100000, type=int)
+    parser.add_argument('--graine', help="Graine des données aléatoires", default=0, type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.graine)
+    tout_identique = True
+    print(f"{'arêtes':>10}{'sommets':>10}{'composantes':>13}{'plus grande':>13}{'origine s':>12}{'graphe creux s':>16}{'identique':>11}")
+    for nb_aretes in args.nb_aretes:
+        sommets = generer_graphe(rng, nb_aretes)
+
+        tic = time.perf_counter()
+        obtenues = composantes_objets(sommets, lambda sommet: sommet.homologues, "_marque")
+        duree = time.perf_counter() - tic
+
+        duree_reference = None
+        identique = None
+        if nb_aretes <= args.nb_aretes_max_reference:
+            demarquer(sommets)
+            tic = time.perf_counter()
+            attendues = reference_composantes(sommets)
+            duree_reference = time.perf_counter() - tic
+            identique = identiques(attendues, obtenues)
+            tout_identique = tout_identique and identique
+
+        nb_aretes_graphe = sum([len(sommet.homologues) for sommet in sommets]) // 2
+        print(
+            f"{nb_aretes_graphe:>10}{len(sommets):>10}{len(obtenues):>13}{max([len(c) for c in obtenues]):>13}"
+            f"{'-' if duree_reference is None else format(duree_reference, '.3f'):>12}{duree:>16.3f}"
+            f"{'-' if identique is None else ('oui' if identique else 'NON'):>11}"
+        )
+    sys.exit(0 if tout_identique else 1)
@@ -0,0 +1,99 @@
+"""
+Mesure le temps de démarrage d'un pool de workers spawn, et ce que les workers importent avant de traiter leur première tâche.
+
+Pour chaque worker, on mesure :
+- l'initialisation : imports du contexte (numpy, shapely, pyproj, scipy...) et lecture du contexte, faits par l'initializer du pool ;
+- l'import des tâches : import des fonctions des tâches (v2/parallelisation.py) et des classes des objets qu'elles reçoivent, fait à la première tâche.
+  Il comprend geopandas et pandas.
+
+La liste des modules lourds chargés dans les workers après la première tâche est affichée : GDAL, lxml et le traitement principal ne doivent pas y être.
+
+Exemple :
+python benchmarks/demarrage_workers.py --nb_cpus 16 --repetitions 3
+"""
+import argparse
+import os
+import sys
+import time
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+MODULES_LOURDS = ["numpy", "scipy", "shapely", "pyproj", "pandas", "geopandas", "tqdm", "osgeo", "lxml", "v2.samon_gouttiere"]
+
+# Durée de l'import des tâches dans le worker courant, en secondes
+duree_import_taches:float = None
+
+
+def premiere_tache(_):
+    """
+    Importe les tâches comme le fait un worker en désérialisant sa première tâche, et renvoie les durées mesurées dans le worker
+    """
+    global duree_import_taches
+    from v2 import worker
+    if duree_import_taches is None:
+        tic = time.perf_counter()
+        import v2.parallelisation
+        duree_import_taches = time.perf_counter() - tic
+    return os.getpid(), worker.get_duree_initialisation(), duree_import_taches, [module for module in MODULES_LOURDS if module in sys.modules]
+
+
+def mesurer(nb_cpus:int)->dict:
+    import multiprocessing
+    from v2 import worker, contexte
+
+    # Contexte vide : on ne mesure que les imports et le démarrage des interpréteurs
+    contexte.initialiser([], None, None, None, False)
+
+    tic = time.perf_counter()
+    pool = multiprocessing.Pool(processes=nb_cpus, initializer=worker.initialiser_worker, initargs=(contexte.serialiser(),))
+    # On attend que chaque worker ait traité au moins une tâche
+    resultats = pool.map(premiere_tache, range(4*nb_cpus), chunksize=1)
+    duree_totale = time.perf_counter() - tic
+    pool.close()
+    pool.join()
+
+    # Une mesure par worker
+    workers = {}
+    for pid, duree_initialisation, duree_import, modules in resultats:
+        workers[pid] = (duree_initialisation, duree_import, modules)
+    initialisations = [duree for duree, _, _ in workers.values()]
+    imports = [duree for _, duree, _ in workers.values()]
+    modules = sorted(set([module for _, _, liste in workers.values() for module in liste]))
+    return {
+        "nb_cpus":nb_cpus,
+        "nb_workers_mesures":len(workers),
+        "duree_demarrage_pool":duree_totale,
+        "duree_initialisation_moyenne":sum(initialisations)/len(initialisations),
+        "duree_initialisation_max":max(initialisations),
+        "duree_import_taches_moyenne":sum(imports)/len(imports),
+        "duree_import_taches_max":max(imports),
+        "modules_lourds":modules
+    }
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Temps de démarrage des workers du pool")
+    parser.add_argument('--nb_cpus', help='Nombre de workers', default=4, type=int)
+    parser.add_argument('--repetitions', help='Nombre de mesures', default=3, type=int)
+    parser.add_argument('--output', help='Fichier json où enregistrer les mesures', default=None)
+    args = parser.parse_args()
+
+    from v2.worker import configurer_processus
+    configurer_processus()
+
+    resultats = []
+    for repetition in range(args.repetitions):
+        resultat = mesurer(args.nb_cpus)
+        resultats.append(resultat)
+        print(
+            f"Pool prêt en {resultat['duree_demarrage_pool']:.2f} s ({resultat['nb_workers_mesures']} workers mesurés) : "
+            f"initialisation {resultat['duree_initialisation_moyenne']:.2f} s en moyenne ({resultat['duree_initialisation_max']:.2f} s au maximum), "
+            f"import des tâches {resultat['duree_import_taches_moyenne']:.2f} s en moyenne ({resultat['duree_import_taches_max']:.2f} s au maximum)"
+        )
+    print(f"Modules lourds chargés dans les workers : {', '.join(resultats[-1]['modules_lourds'])}")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(resultats, f, indent=2)
@@ -0,0 +1,193 @@
+"""
+Vérifie que l'association par l'index spatial de tout le chantier (v2/index_spatial.py) donne les mêmes homologues, dans le même ordre,
+que les parcours d'origine, avec un index par paire de prédictions (pâtés de maisons) ou par paire de pâtés de maisons (bâtiments), et mesure leur durée.
+
+Les prédictions sont des rectangles au sol vus depuis plusieurs clichés, avec un décalage de quelques mètres et un bruit sur les sommets.
+Pour les bâtiments, les rectangles sont regroupés en groupes de pâtés de maisons voisins, un pâté de maisons par cliché.
+Le code de retour vaut 1 si au moins un homologue est différent.
+
+Exemples :
+python benchmarks/index_spatial.py
+python benchmarks/index_spatial.py --nb_objets 20000 --nb_cliches 8
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+from shapely import Polygon, STRtree, area, intersection
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from v2.index_spatial import IndexSpatial
+
+
+class Objet:
+
+    def __init__(self, geometrie:Polygon, image:str):
+        self.geometrie_terrain = geometrie
+        self.shot = Cliche(image)
+        self.homologues:List[Objet] = []
+
+    def get_geometrie_terrain(self)->Polygon:
+        return self.geometrie_terrain
+
+    def add_homologue(self, objet):
+        if objet not in self.homologues:
+            self.homologues.append(objet)
+
+
+class Cliche:
+
+    def __init__(self, image:str):
+        self.image = image
+
+
+class Liste:
+    """
+    Prédiction (liste de pâtés de maisons) ou pâté de maisons (liste de bâtiments)
+    """
+
+    def __init__(self, objets:List[Objet], image:str):
+        self.shot = Cliche(image)
+        self.pates_maisons = objets
+        self.batiments = objets
+
+    def get_pates_maisons(self)->List[Objet]:
+        return self.pates_maisons
+
+
+class Groupe:
+
+    def __init__(self, pates_maisons:List[Liste]):
+        self.pates_maisons = pates_maisons
+
+
+# Code d'origine (Prediction.association_pates_maisons et GroupePatesMaisons.association)
+
+def reference_association(listes:List[Liste], images_differentes:bool)->None:
+    for l1 in listes:
+        for l2 in listes:
+            if l1 is l2 or (images_differentes and l1.shot.image == l2.shot.image):
+                continue
+            geometries_2 = [objet.get_geometrie_terrain() for objet in l2.batiments]
+            if len(l1.batiments) == 0 or len(geometries_2) == 0:
+                continue
+            intersections = STRtree(geometries_2).query([objet.get_geometrie_terrain() for objet in l1.batiments], predicate="intersects")
+            for i, objet_1 in enumerate(l1.batiments):
+                area_max = 0
+                objet_max = None
+                # L'index d'origine (GeoSeries.sindex) renvoie les candidats d'un objet dans l'ordre de l'arbre : on les trie, comme le nouvel index
+                for j in np.sort(intersections[1, intersections[0,:]==i]):
+                    objet_2 = l2.batiments[j]
+                    aire_commune = objet_1.get_geometrie_terrain().intersection(objet_2.get_geometrie_terrain()).area
+                    if aire_commune > area_max:
+                        area_max = aire_commune
+                        objet_max = objet_2
+                if objet_max is not None:
+                    objet_1.add_homologue(objet_max)
+                    objet_max.add_homologue(objet_1)
+
+
+def index_pates_maisons(predictions:List[Liste])->None:
+    index = IndexSpatial.depuis_pates_maisons(predictions)
+    a, b = index.associer(*index.paires("intersects", images_differentes=True))
+    for i, j in zip(a.tolist(), b.tolist()):
+        pm_1 = predictions[index.source[i]].pates_maisons[index.indice[i]]
+        pm_2 = predictions[index.source[j]].pates_maisons[index.indice[j]]
+        pm_1.add_homologue(pm_2)
+        pm_2.add_homologue(pm_1)
+
+
+def index_batiments(groupes:List[Groupe])->None:
+    index = IndexSpatial.depuis_batiments(groupes)
+    candidats = index.candidats_par_groupe(*index.paires("intersects"), len(groupes))
+    for groupe, candidats_groupe in zip(groupes, candidats):
+        batiments_1 = [groupe.pates_maisons[pm].batiments[i] for pm, i in candidats_groupe[:,:2].tolist()]
+        batiments_2 = [groupe.pates_maisons[pm].batiments[i] for pm, i in candidats_groupe[:,2:].tolist()]
+        aires = area(intersection([bati.get_geometrie_terrain() for bati in batiments_1], [bati.get_geometrie_terrain() for bati in batiments_2]))
+        for k in IndexSpatial.meilleures_paires([candidats_groupe[:,0], candidats_groupe[:,1], candidats_groupe[:,2]], aires).tolist():
+            batiments_1[k].add_homologue(batiments_2[k])
+            batiments_2[k].add_homologue(batiments_1[k])
+
+
+# Données aléatoires
+
+def generer_listes(rng:np.random.Generator, nb_objets:int, nb_cliches:int)->List[List[Objet]]:
+    """
+    Pour chaque cliché, les mêmes rectangles au sol décalés de quelques mètres, avec un bruit sur les sommets. Certains rectangles manquent sur certains clichés
+    """
+    centres = rng.uniform(0, np.sqrt(nb_objets) * 25, (nb_objets, 2))
+    tailles = rng.uniform(5, 20, (nb_objets, 2))
+    listes = []
+    for c in range(nb_cliches):
+        decalage = rng.normal(0, 2, 2)
+        objets = []
+        for centre, taille in zip(centres, tailles):
+            if rng.uniform() < 0.1:
+                continue
+            coins = centre + decalage + np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * taille / 2 + rng.normal(0, 0.3, (4, 2))
+            objets.append(Objet(Polygon(coins), f"cliche_{c}"))
+        listes.append(objets)
+    return listes
+
+
+def signature(listes:List[List[Objet]]):
+    numeros = {id(objet):k for k, objet in enumerate([objet for objets in listes for objet in objets])}
+    return [[numeros[id(homologue)] for homologue in objet.homologues] for objets in listes for objet in objets]
+
+
+def creer_groupes(listes:List[List[Objet]], taille_groupe:float)->List[Groupe]:
+    """
+    Groupes de pâtés de maisons : les objets de chaque cliché sont répartis dans des cases de taille_groupe mètres, une case donnant un groupe
+    """
+    cases = {}
+    for c, objets in enumerate(listes):
+        for objet in objets:
+            x, y = objet.get_geometrie_terrain().centroid.coords[0]
+            case = (int(x // taille_groupe), int(y // taille_groupe))
+            cases.setdefault(case, [[] for _ in listes])[c].append(objet)
+    return [Groupe([Liste(objets, f"cliche_{c}") for c, objets in enumerate(cases[case]) if len(objets) > 0]) for case in sorted(cases)]
+
+
+def vider(listes:List[List[Objet]])->None:
+    for objets in listes:
+        for objet in objets:
+            objet.homologues = []
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Vérifie l'association par l'index spatial de tout le chantier et mesure sa durée")
+    parser.add_argument('--nb_objets', help="Nombre d'objets au sol", default=5000, type=int)
+    parser.add_argument('--nb_cliches', help="Nombre de clichés qui voient chaque objet", default=6, type=int)
+    parser.add_argument('--taille_groupe', help="Taille en mètres des groupes de pâtés de maisons, pour l'association des bâtiments", default=100, type=float)
+    parser.add_argument('--graine', help="Graine des données aléatoires", default=0, type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.graine)
+    listes = generer_listes(rng, args.nb_objets, args.nb_cliches)
+    predictions = [Liste(objets, f"cliche_{c}") for c, objets in enumerate(listes)]
+    groupes = creer_groupes(listes, args.taille_groupe)
+
+    tout_identique = True
+    print(f"{'association':>14}{'objets':>9}{'origine s':>12}{'index s':>10}{'identique':>11}")
+    for nom, reference, nouveau in [
+        ("pâtés", lambda: reference_association(predictions, True), lambda: index_pates_maisons(predictions)),
+        ("bâtiments", lambda: [reference_association(groupe.pates_maisons, False) for groupe in groupes], lambda: index_batiments(groupes)),
+    ]:
+        vider(listes)
+        tic = time.perf_counter()
+        reference()
+        duree_reference = time.perf_counter() - tic
+        attendus = signature(listes)
+
+        vider(listes)
+        tic = time.perf_counter()
+        nouveau()
+        duree = time.perf_counter() - tic
+        identique = attendus == signature(listes)
+        tout_identique = tout_identique and identique
+        print(f"{nom:>14}{sum([len(objets) for objets in listes]):>9}{duree_reference:>12.3f}{duree:>10.3f}{'oui' if identique else 'NON':>11}")
+    sys.exit(0 if tout_identique else 1)
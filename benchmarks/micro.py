@@ -0,0 +1,450 @@
+"""
+Micro-benchmarks des fonctions les plus appelées du traitement, avec un historique des mesures.
+
+Les données viennent d'un petit chantier synthétique (benchmarks/chantier_synthetique.py, généré au premier lancement) :
+clichés du TA, MNT et images réels du point de vue du code mesuré, et un bâtiment vu dans plusieurs images.
+Chaque fonction est appelée plusieurs fois ; la préparation des données d'un appel n'est pas chronométrée.
+
+Chaque lancement ajoute une ligne à l'historique (json lines) : date, commit, machine et, pour chaque fonction, la médiane et le minimum des durées.
+La commande comparer compare la dernière mesure à une mesure de référence et signale les régressions au-delà d'un seuil (code de retour 1).
+
+Exemples :
+python benchmarks/micro.py lancer
+python benchmarks/micro.py lancer --noyaux shot_world_to_image mnt_get --repetitions 50
+python benchmarks/micro.py comparer --seuil 0.1
+python benchmarks/micro.py comparer --reference a1b2c3d
+"""
+import argparse
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from typing import List, Dict
+
+import numpy as np
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from benchmarks.chantier_synthetique import ChantierSynthetique
+
+
+class DonneesMicro:
+    """
+    Données communes aux micro-benchmarks, chargées une seule fois à partir du chantier synthétique
+    """
+
+    # Nombre minimum d'images dans lesquelles le bâtiment de référence doit être visible
+    nb_images_min = 3
+
+    def __init__(self, path_chantier:str):
+        from v2.shot import MNT, RAF
+        from v2.ressources_partagees import lire_shots_ta
+        import geopandas as gpd
+
+        self.chantier = ChantierSynthetique(path_chantier, echelle=1)
+        if not self.chantier.existe():
+            print(f"Génération du chantier synthétique dans {path_chantier}")
+            self.chantier.generer()
+        else:
+            self.chantier.creer_batiments()
+            self.chantier.creer_images()
+
+        self.repertoire_temporaire = tempfile.mkdtemp(prefix="micro_samon_")
+        self.raf = RAF(self.chantier.get_path_raf())
+        emprise = gpd.read_file(os.path.join(path_chantier, "emprise.gpkg")).geometry
+        self.mnt = MNT.load_mnt(os.path.join(path_chantier, "mnt", "mnt.vrt"), emprise, self.repertoire_temporaire)
+        self.shots = list(lire_shots_ta(self.chantier.get_path_ta(), self.raf, [image["nom"] for image in self.chantier.images]).values())
+        self.path_pvas = os.path.join(path_chantier, "pvas")
+
+        # Premier bâtiment visible dans assez d'images, avec sa géométrie image (c, -l) dans chacune
+        self.batiment_synthetique = None
+        self.vues = []
+        for batiment in self.chantier.batiments:
+            vues = []
+            for shot in self.shots:
+                c, l = self.chantier.projeter(shot, batiment.get_contour_toit())
+                if self.chantier.est_visible(c, l):
+                    vues.append((shot, c, l))
+            if len(vues) >= DonneesMicro.nb_images_min:
+                self.batiment_synthetique = batiment
+                self.vues = vues
+                break
+        if self.batiment_synthetique is None:
+            raise ValueError(f"Aucun bâtiment n'est visible dans {DonneesMicro.nb_images_min} images")
+
+        self.x_centre = float(np.mean([x for x, _ in self.batiment_synthetique.coins]))
+        self.y_centre = float(np.mean([y for _, y in self.batiment_synthetique.coins]))
+
+
+    def creer_batiment(self, i:int):
+        """
+        Bâtiment tel que prédit dans la i-ème image qui le voit
+        """
+        from shapely import Polygon
+        from v2.batiment import Batiment
+        shot, c, l = self.vues[i]
+        batiment = Batiment(Polygon(list(zip(c, -l))), shot, self.mnt, identifiant=i)
+        batiment.groupe_batiment_identifiant = 0
+        batiment.groupe_batiment_estim_z = self.batiment_synthetique.get_z_gouttiere()
+        return batiment
+
+
+class MicroBenchmark:
+    """
+    Un micro-benchmark : preparer() construit les données d'un appel (non chronométré), executer() est la fonction mesurée.
+    Les fonctions très courtes sont appelées nombre fois par mesure
+    """
+
+    nom = ""
+    nombre = 1
+
+    def __init__(self, donnees:DonneesMicro):
+        self.donnees = donnees
+
+    def preparer(self)->tuple:
+        return ()
+
+    def executer(self, *args)->None:
+        raise NotImplementedError
+
+    def mesurer(self, repetitions:int)->Dict:
+        # Un premier appel non mesuré : imports, caches, allocation des tableaux
+        self.executer(*self.preparer())
+        durees = []
+        for _ in range(repetitions):
+            args = self.preparer()
+            tic = time.perf_counter()
+            for _ in range(self.nombre):
+                self.executer(*args)
+            durees.append((time.perf_counter() - tic) / self.nombre)
+        return {
+            "median_s":statistics.median(durees),
+            "min_s":min(durees),
+            "max_s":max(durees),
+            "repetitions":repetitions,
+            "nombre":self.nombre
+        }
+
+
+class ShotImageToWorld(MicroBenchmark):
+
+    nom = "shot_image_to_world"
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        rng = np.random.default_rng(0)
+        self.shot = donnees.shots[0]
+        self.c = rng.uniform(0, self.shot.width, 1000)
+        self.l = rng.uniform(0, self.shot.height, 1000)
+
+    def executer(self):
+        self.shot.image_to_world(self.c, self.l, self.donnees.mnt)
+
+
+class ShotWorldToImage(MicroBenchmark):
+
+    nom = "shot_world_to_image"
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        rng = np.random.default_rng(0)
+        self.shot = donnees.vues[0][0]
+        self.x = donnees.x_centre + rng.uniform(-100, 100, 1000)
+        self.y = donnees.y_centre + rng.uniform(-100, 100, 1000)
+        self.z = donnees.chantier.get_altitude(self.x, self.y)
+
+    def executer(self):
+        self.shot.world_to_image(self.x, self.y, self.z)
+
+
+class MntGet(MicroBenchmark):
+
+    nom = "mnt_get"
+    nombre = 10
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        rng = np.random.default_rng(0)
+        self.x = donnees.x_centre + rng.uniform(-50, 50, 1000)
+        self.y = donnees.y_centre + rng.uniform(-50, 50, 1000)
+
+    def executer(self):
+        self.donnees.mnt.get(self.x, self.y)
+
+
+class BatimentComputeZMean(MicroBenchmark):
+
+    nom = "batiment_compute_z_mean"
+    nombre = 10
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        self.b1 = donnees.creer_batiment(0)
+        self.b2 = donnees.creer_batiment(1)
+        self.z_mnt = float(donnees.mnt.get(donnees.x_centre, donnees.y_centre)[0])
+
+    def executer(self):
+        self.b1.compute_z_mean(self.b2, self.z_mnt)
+
+
+class GroupeSegmentsMoindresCarres(MicroBenchmark):
+
+    nom = "groupe_segments_moindres_carres"
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        # Le même côté du bâtiment (perpendiculaire aux bandes) dans chaque image qui le voit
+        self.segments = []
+        for i in range(len(donnees.vues)):
+            batiment = donnees.creer_batiment(i)
+            batiment.create_segments(4*i)
+            segment = batiment.segments[1]
+            segment.compute_equation_plan()
+            self.segments.append(segment)
+
+    def preparer(self):
+        from v2.groupe_segments import GroupeSegments
+        # moindres_carres peut retirer des segments du groupe : chaque appel a son propre groupe
+        return (GroupeSegments(list(self.segments), 0),)
+
+    def executer(self, groupe):
+        groupe.moindres_carres()
+
+
+class CorrelationSansArgmax(MicroBenchmark):
+
+    nom = "correlation_compute_correlation_without_argmax"
+
+    # Taille de la vignette de référence et nombre de positions testées le long de la ligne
+    taille = 11
+    nb_positions = 60
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        from v2.samon.pva import Pva
+        from v2.samon.correlation_engine import CorrelationEngine
+
+        shot_1, c_1, l_1 = donnees.vues[0]
+        shot_2, c_2, l_2 = donnees.vues[1]
+        pva_1 = Pva(os.path.join(donnees.path_pvas, f"{shot_1.image}.tif"), donnees.repertoire_temporaire)
+        pva_2 = Pva(os.path.join(donnees.path_pvas, f"{shot_2.image}.tif"), donnees.repertoire_temporaire)
+        reference = pva_2.create_vignette(np.array([round(c_2[0])]), np.array([round(l_2[0])]), CorrelationSansArgmax.taille, 1)
+        self.engine = CorrelationEngine(pva_1, CorrelationSansArgmax.taille, reference)
+        demi = CorrelationSansArgmax.nb_positions // 2
+        self.x = round(c_1[0]) + np.arange(-demi, demi)
+        self.y = np.full_like(self.x, round(l_1[0]))
+
+    def executer(self):
+        self.engine.compute_correlation_without_argmax(self.x, self.y, False)
+
+
+class OrthoLocaleCreateSmallOrtho(MicroBenchmark):
+
+    nom = "ortholocale_create_small_ortho_numpy"
+
+    taille = 61
+    nb_orthos = 30
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        from shapely import Point
+        from v2.samon.monoscopie import Monoscopie
+        from v2.samon.orthoLocale import OrthoLocale
+
+        shot = donnees.vues[0][0]
+        monoscopie = Monoscopie(donnees.path_pvas, donnees.mnt, donnees.raf, donnees.shots)
+        centre = Point(donnees.x_centre, donnees.y_centre)
+        self.ortho_locale = OrthoLocale(0.2, centre, shot, monoscopie.size_orthoLocale, os.path.join(donnees.path_pvas, shot.image), monoscopie, donnees.repertoire_temporaire, donnees.repertoire_temporaire)
+        self.x = donnees.x_centre + np.linspace(-10, 10, OrthoLocaleCreateSmallOrtho.nb_orthos)
+        self.y = np.full_like(self.x, donnees.y_centre)
+
+    def executer(self):
+        self.ortho_locale.create_small_ortho_numpy(self.x, self.y, OrthoLocaleCreateSmallOrtho.taille, 1)
+
+
+class RecalageRansac(MicroBenchmark):
+
+    nom = "recalage_ransac"
+
+    # Même nombre d'itérations que compute_recalage
+    iterations = 100
+    nb_points = 20
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        from shapely import Point
+        # Les scripts du recalage importent leurs modules (goutiere, bati, shot) sans préfixe
+        sys.path.insert(0, os.path.join(RACINE, "recalage"))
+        import recalage
+        self.ransac = recalage.ransac
+
+        # Transformation de Helmert proche de l'identité, avec 20 % de points faux
+        rng = np.random.default_rng(0)
+        tx, ty, a, b = 0.8, -0.5, 0.002, 0.999
+        self.points = []
+        for i in range(RecalageRansac.nb_points):
+            x, y = donnees.x_centre + rng.uniform(-20, 20), donnees.y_centre + rng.uniform(-20, 20)
+            x_b, y_b = tx + b*x + a*y, ty - a*x + b*y
+            if i % 5 == 0:
+                x_b, y_b = x_b + rng.uniform(2, 5), y_b - rng.uniform(2, 5)
+            self.points.append((Point(x_b, y_b), Point(x, y)))
+
+    def preparer(self):
+        # ransac tire ses points avec le module random
+        random.seed(0)
+        return ()
+
+    def executer(self):
+        self.ransac(self.points, RecalageRansac.iterations, 0.5)
+
+
+class ConvertToObjGetOrCreate(MicroBenchmark):
+
+    nom = "convert_to_obj_get_or_create"
+
+    nb_batiments = 100
+
+    def __init__(self, donnees:DonneesMicro):
+        super().__init__(donnees)
+        from v2.convert_to_obj import get_or_create
+        self.get_or_create = get_or_create
+        self.batiments = donnees.chantier.batiments[:ConvertToObjGetOrCreate.nb_batiments]
+
+    def executer(self):
+        # Mêmes appels que convert_to_obj.py pour les murs et le toit de chaque bâtiment
+        liste_points = []
+        for batiment in self.batiments:
+            z_haut = batiment.get_z_gouttiere()
+            points = batiment.coins + [batiment.coins[0]]
+            for j in range(len(points)-1):
+                liste_points, p1 = self.get_or_create(liste_points, points[j][0], points[j][1], z_haut)
+                liste_points, p2 = self.get_or_create(liste_points, points[j+1][0], points[j+1][1], z_haut)
+                liste_points, _ = self.get_or_create(liste_points, p1.x, p1.y, batiment.z_sol)
+                liste_points, _ = self.get_or_create(liste_points, p2.x, p2.y, batiment.z_sol)
+            for j in range(len(points)-1):
+                liste_points, _ = self.get_or_create(liste_points, points[j][0], points[j][1], z_haut)
+
+
+MICRO_BENCHMARKS = [
+    ShotImageToWorld,
+    ShotWorldToImage,
+    MntGet,
+    BatimentComputeZMean,
+    GroupeSegmentsMoindresCarres,
+    CorrelationSansArgmax,
+    OrthoLocaleCreateSmallOrtho,
+    RecalageRansac,
+    ConvertToObjGetOrCreate
+]
+
+
+def get_commit()->str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RACINE, capture_output=True, text=True, check=True).stdout.strip()
+        modifications = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RACINE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    if modifications != "":
+        commit += "+modifications"
+    return commit
+
+
+def lancer(noyaux:List[str], repetitions:int, path_chantier:str, path_historique:str)->Dict:
+    donnees = DonneesMicro(path_chantier)
+    resultats = {}
+    for classe in MICRO_BENCHMARKS:
+        if noyaux is not None and classe.nom not in noyaux:
+            continue
+        resultat = classe(donnees).mesurer(repetitions)
+        resultats[classe.nom] = resultat
+        print(f"{classe.nom:<48} médiane {resultat['median_s']*1000:10.3f} ms   min {resultat['min_s']*1000:10.3f} ms")
+
+    mesure = {
+        "date":datetime.now().isoformat(timespec="seconds"),
+        "commit":get_commit(),
+        "machine":platform.node(),
+        "python":platform.python_version(),
+        "numpy":np.__version__,
+        "resultats":resultats
+    }
+    with open(path_historique, "a") as f:
+        f.write(json.dumps(mesure) + "\n")
+    print(f"Mesures ajoutées à {path_historique}")
+    return mesure
+
+
+def lire_historique(path_historique:str)->List[Dict]:
+    if not os.path.isfile(path_historique):
+        return []
+    with open(path_historique, "r") as f:
+        return [json.loads(ligne) for ligne in f if ligne.strip() != ""]
+
+
+def comparer(path_historique:str, reference:str, seuil:float)->bool:
+    """
+    Compare la dernière mesure à la référence : la mesure précédente par défaut, sinon la dernière mesure d'un commit,
+    ou la mesure d'indice donné (négatif pour partir de la fin). Renvoie True s'il y a au moins une régression
+    """
+    historique = lire_historique(path_historique)
+    if len(historique) < 2:
+        raise ValueError(f"Il faut au moins deux mesures dans {path_historique} pour comparer")
+    courante = historique[-1]
+
+    if reference is None:
+        mesure_reference = historique[-2]
+    else:
+        try:
+            mesure_reference = historique[int(reference)]
+        except ValueError:
+            candidates = [mesure for mesure in historique[:-1] if mesure["commit"] is not None and mesure["commit"].startswith(reference)]
+            if len(candidates) == 0:
+                raise ValueError(f"Aucune mesure du commit {reference} dans {path_historique}")
+            mesure_reference = candidates[-1]
+
+    print(f"Référence : {mesure_reference['date']} ({mesure_reference['commit']}), mesure : {courante['date']} ({courante['commit']})")
+    if mesure_reference["machine"] != courante["machine"]:
+        print(f"Attention : mesures faites sur deux machines différentes ({mesure_reference['machine']} et {courante['machine']})")
+
+    regression = False
+    for nom, resultat in courante["resultats"].items():
+        resultat_reference = mesure_reference["resultats"].get(nom)
+        if resultat_reference is None:
+            print(f"{nom:<48} pas de mesure de référence")
+            continue
+        rapport = resultat["median_s"] / resultat_reference["median_s"]
+        statut = ""
+        if rapport > 1 + seuil:
+            statut = "REGRESSION"
+            regression = True
+        elif rapport < 1 - seuil:
+            statut = "amélioration"
+        print(f"{nom:<48} {resultat_reference['median_s']*1000:10.3f} ms -> {resultat['median_s']*1000:10.3f} ms   x{rapport:.2f}   {statut}")
+    return regression
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks des fonctions les plus appelées du traitement")
+    parser.add_argument('--historique', help="Fichier d'historique des mesures", default=os.path.join(RACINE, "benchmarks", "historique_micro.jsonl"))
+    commandes = parser.add_subparsers(dest="commande", required=True)
+
+    parser_lancer = commandes.add_parser("lancer", help="Mesure les fonctions et ajoute les résultats à l'historique")
+    parser_lancer.add_argument('--noyaux', help="Fonctions à mesurer (par défaut toutes)", nargs="+", default=None, choices=[classe.nom for classe in MICRO_BENCHMARKS])
+    parser_lancer.add_argument('--repetitions', help="Nombre de mesures par fonction", default=20, type=int)
+    parser_lancer.add_argument('--chantier', help="Répertoire du chantier synthétique, généré s'il n'existe pas", default=os.path.join(tempfile.gettempdir(), "samon_chantier_micro"))
+
+    parser_comparer = commandes.add_parser("comparer", help="Compare la dernière mesure de l'historique à une mesure de référence")
+    parser_comparer.add_argument('--reference', help="Commit, ou indice de la mesure dans l'historique (par défaut : la mesure précédente)", default=None)
+    parser_comparer.add_argument('--seuil', help="Augmentation relative de la durée médiane au-delà de laquelle une fonction est en régression", default=0.1, type=float)
+    args = parser.parse_args()
+
+    if args.commande == "lancer":
+        lancer(args.noyaux, args.repetitions, args.chantier, args.historique)
+    else:
+        sys.exit(1 if comparer(args.historique, args.reference, args.seuil) else 0)
@@ -0,0 +1,281 @@
+"""
+Vérifie que les noyaux numériques (v2/noyaux.py) donnent exactement les mêmes résultats que le code qu'ils remplacent, et mesure leur durée.
+
+Chaque noyau est comparé, bit à bit, à une copie du code d'origine sur des données aléatoires (avec des cas dégénérés : droites parallèles,
+points en double...). La version numpy est toujours vérifiée, la version numba si numba est installé.
+Le code de retour vaut 1 si au moins un noyau donne un résultat différent.
+
+Exemples :
+python benchmarks/noyaux.py
+python benchmarks/noyaux.py --nb_cas 1000 --repetitions 20
+"""
+import argparse
+import os
+import sys
+import time
+import statistics
+from typing import Callable, List
+
+import numpy as np
+from shapely import LineString, Point
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from v2 import noyaux
+
+
+# Code d'origine
+
+def reference_distances_droites(du1:np.ndarray, du2:np.ndarray, D:np.ndarray):
+    distances_min = []
+    j_mins = []
+    for i in range(du1.shape[1]):
+        v1 = du1[:,i].squeeze()
+        distance_min = 1e10
+        j_min = None
+        for j in range(du2.shape[1]):
+            v2 = du2[:,j].squeeze()
+            n = np.cross(v1, v2)
+            distance = np.abs(np.sum(n*D))/np.linalg.norm(n)
+            if distance < distance_min:
+                distance_min = distance
+                j_min = j
+        distances_min.append(distance_min)
+        j_mins.append(-1 if j_min is None else j_min)
+    return np.array(distances_min), np.array(j_mins)
+
+
+def reference_lissage(x, y, seuil_ps:float)->np.ndarray:
+    segments:List[LineString] = []
+    for i in range(len(x)-1):
+        ls = LineString([[x[i], y[i]], [x[i+1], y[i+1]]])
+        if ls.length!=0:
+            segments.append(LineString([[x[i], y[i]], [x[i+1], y[i+1]]]))
+
+    liste_segments_poly:List[LineString] = []
+    nb_segments = len(segments)
+    s0 = segments[0]
+    x0 = s0.xy[0][0]
+    y0 = s0.xy[1][0]
+    x1 = s0.xy[0][1]
+    y1 = s0.xy[1][1]
+    for i in range(1, nb_segments):
+        s1 = segments[i]
+        x2 = s1.xy[0][1]
+        y2 = s1.xy[1][1]
+        u1 = np.array([[x1-x0], [y1-y0]])
+        u1 = u1 / np.linalg.norm(u1)
+        u2 = np.array([[x2-x1], [y2-y1]])
+        u2 = u2 / np.linalg.norm(u2)
+        ps = np.sum(u1*u2)
+        if ps > seuil_ps:
+            x1 = x2
+            y1 = y2
+        else:
+            liste_segments_poly.append(LineString([[x0, y0], [x1, y1]]))
+            x0 = s1.xy[0][0]
+            y0 = s1.xy[1][0]
+            x1 = x2
+            y1 = y2
+
+    if len(liste_segments_poly)==0:
+        liste_segments_poly.append(LineString([[x0, y0], [x2, y2]]))
+    else:
+        x,y = liste_segments_poly[0].xy
+        x2 = x[1]
+        y2 = y[1]
+        u1 = np.array([[x1-x0], [y1-y0]])
+        u1 = u1 / np.linalg.norm(u1)
+        u2 = np.array([[x2-x1], [y2-y1]])
+        u2 = u2 / np.linalg.norm(u2)
+        ps = np.sum(u1*u2)
+        if ps > seuil_ps:
+            del(liste_segments_poly[0])
+            liste_segments_poly.append(LineString([[x0, y0], [x2, y2]]))
+        else:
+            liste_segments_poly.append(LineString([[x0, y0], [x1, y1]]))
+    return np.array([[ls.xy[0][0], ls.xy[1][0], ls.xy[0][1], ls.xy[1][1]] for ls in liste_segments_poly])
+
+
+def reference_distances_min_points(A:np.ndarray, B:np.ndarray)->np.ndarray:
+    return np.array([min(np.linalg.norm(a - b) for b in B) for a in A])
+
+
+def reference_residus_helmert(parametres, points)->np.ndarray:
+    TX = parametres[0]
+    TY = parametres[1]
+    a = parametres[2]
+    b = parametres[3]
+    distances = []
+    for point in points:
+        XB_chap = TX + b*point[1].x + a*point[1].y
+        YB_chap = TY - a*point[1].x + b*point[1].y
+        distances.append(np.sqrt((XB_chap-point[0].x)**2 + (YB_chap-point[0].y)**2))
+    return np.array(distances)
+
+
+def reference_intersection_plan(a0, a1, z0, z1, z):
+    lamb = (z - z0) / (z1 - z0)
+    return a0 + (a1 - a0) * lamb
+
+
+def reference_distance_3d(x0, y0, z0, x1, y1, z1):
+    return ((x1 - x0) ** 2 + (y1 - y0) ** 2 + (z1 - z0) ** 2) ** 0.5
+
+
+# Données aléatoires
+
+def generer_droites(rng:np.random.Generator):
+    """
+    Vecteurs directeurs normalisés comme dans Shot.image_to_bundle, vus depuis deux sommets de prise de vue distants de quelques centaines de mètres.
+    Quelques vecteurs sont en double pour avoir des droites parallèles
+    """
+    def vecteurs(n):
+        du = np.vstack([rng.normal(0, 0.2, n), rng.normal(0, 0.2, n), -np.ones(n)])
+        return du / np.linalg.norm(du)
+    du1 = vecteurs(int(rng.integers(1, 60)))
+    du2 = vecteurs(int(rng.integers(1, 60)))
+    if rng.uniform() < 0.3:
+        du2[:,0] = du1[:,0]
+    D = np.array([rng.uniform(-800, 800), rng.uniform(-800, 800), rng.uniform(-5, 5)])
+    if rng.uniform() < 0.1:
+        D = np.zeros(3)
+    return du1, du2, D
+
+
+def generer_contour(rng:np.random.Generator):
+    """
+    Contour d'un bâtiment en coordonnées image : rectangle tourné, avec des sommets intermédiaires presque alignés et des points en double
+    """
+    largeur, hauteur = rng.uniform(10, 200, 2)
+    coins = np.array([[0, 0], [largeur, 0], [largeur, hauteur], [0, hauteur]])
+    points = []
+    for i in range(4):
+        debut, fin = coins[i], coins[(i+1)%4]
+        for t in np.sort(rng.uniform(0, 1, int(rng.integers(0, 6)))):
+            points.append(debut + t*(fin - debut) + rng.normal(0, 0.3, 2))
+            if rng.uniform() < 0.1:
+                points.append(points[-1])
+        points.append(fin)
+    angle = rng.uniform(0, 2*np.pi)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    points = np.array(points) @ rotation.T + rng.uniform(0, 10000, 2)
+    points = np.vstack([points[-1:], points])
+    return points[:,0], -points[:,1]
+
+
+def generer_helmert(rng:np.random.Generator):
+    n = int(rng.integers(1, 200))
+    x, y = rng.uniform(0, 1000, n), rng.uniform(6e6, 6.001e6, n)
+    parametres = [np.float64(rng.normal(0, 2)), np.float64(rng.normal(0, 2)), np.float64(rng.normal(0, 1e-3)), np.float64(1 + rng.normal(0, 1e-3))]
+    X = parametres[0] + parametres[3]*x + parametres[2]*y + rng.normal(0, 0.5, n)
+    Y = parametres[1] - parametres[2]*x + parametres[3]*y + rng.normal(0, 0.5, n)
+    points = [(Point(X[i], Y[i]), Point(x[i], y[i])) for i in range(n)]
+    return parametres, points
+
+
+# Vérification
+
+def identiques(a, b)->bool:
+    a, b = np.asarray(a), np.asarray(b)
+    return a.shape == b.shape and np.array_equal(a, b, equal_nan=True)
+
+
+def mesurer(fonction:Callable, cas:List[tuple], repetitions:int)->float:
+    durees = []
+    for _ in range(repetitions):
+        tic = time.perf_counter()
+        for args in cas:
+            fonction(*args)
+        durees.append(time.perf_counter() - tic)
+    return statistics.median(durees)
+
+
+def verifier(nb_cas:int, repetitions:int, graine:int)->bool:
+    rng = np.random.default_rng(graine)
+    versions = ["numpy"] + (["numba"] if noyaux.numba is not None else [])
+    if noyaux.numba is None:
+        print("numba n'est pas installé : seule la version numpy est vérifiée")
+
+    droites = [generer_droites(rng) for _ in range(nb_cas)]
+    contours = [generer_contour(rng) for _ in range(nb_cas)]
+    nuages = [(rng.uniform(0, 50, (100, 2)), rng.uniform(0, 50, (100, 2))) for _ in range(max(nb_cas // 10, 1))]
+    helmert = [generer_helmert(rng) for _ in range(nb_cas)]
+    n = 10000
+    faisceaux = [tuple(rng.uniform(-1000, 1000, n) for _ in range(4)) + (rng.uniform(0, 300, n),)]
+    faisceaux[0][3][:10] = faisceaux[0][2][:10]
+    distances = [tuple(rng.uniform(0, 1000, n) + (rng.normal(0, 0.05, n) if i >= 3 else 0) for i in range(6))]
+
+    # (noyau, fonction d'origine, fonction d'une version, cas, comparaison des résultats)
+    def get_fonction(nom:str, version:str)->Callable:
+        return getattr(noyaux, f"{nom}_{version}")
+
+    noyaux_verifies = [
+        (
+            "distances_droites",
+            lambda du1, du2, D: reference_distances_droites(du1, du2, D),
+            lambda version: get_fonction("distances_droites", version),
+            droites
+        ),
+        (
+            "fusionner_segments",
+            lambda x, y: reference_lissage(x, y, 0.99),
+            lambda version: (lambda x, y: get_fonction("fusionner_segments", version)(noyaux.segments_non_nuls(x, y), 0.99)),
+            contours
+        ),
+        (
+            "distances_min_points",
+            reference_distances_min_points,
+            lambda version: get_fonction("distances_min_points", version),
+            nuages
+        ),
+        (
+            "residus_helmert",
+            reference_residus_helmert,
+            lambda version: (lambda parametres, points: get_fonction("residus_helmert", version)(*[float(p) for p in parametres], np.array([[p[1].x, p[1].y, p[0].x, p[0].y] for p in points]))),
+            helmert
+        ),
+        (
+            "intersection_plan",
+            reference_intersection_plan,
+            lambda version: get_fonction("intersection_plan", version),
+            faisceaux
+        ),
+        (
+            "distance_3d",
+            reference_distance_3d,
+            lambda version: get_fonction("distance_3d", version),
+            distances
+        )
+    ]
+
+    tout_identique = True
+    print(f"{'noyau':<24}{'version':<10}{'identique':>10}{'origine ms':>12}{'noyau ms':>12}{'gain':>8}")
+    for nom, reference, creer, cas in noyaux_verifies:
+        resultats_reference = [reference(*args) for args in cas]
+        duree_reference = mesurer(reference, cas, max(repetitions // 5, 1))
+        for version in versions:
+            fonction = creer(version)
+            # Premier appel non mesuré : compilation ou chargement du cache de numba
+            fonction(*cas[0])
+            identique = all(
+                all(identiques(a, b) for a, b in zip(attendu, obtenu)) if isinstance(attendu, tuple) else identiques(attendu, obtenu)
+                for attendu, obtenu in zip(resultats_reference, [fonction(*args) for args in cas])
+            )
+            tout_identique = tout_identique and identique
+            duree = mesurer(fonction, cas, repetitions)
+            print(f"{nom:<24}{version:<10}{'oui' if identique else 'NON':>10}{duree_reference*1000:>12.2f}{duree*1000:>12.2f}{duree_reference/duree:>7.1f}x")
+    return tout_identique
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Vérifie l'équivalence des noyaux numériques avec le code d'origine et mesure leur durée")
+    parser.add_argument('--nb_cas', help="Nombre de cas aléatoires par noyau", default=200, type=int)
+    parser.add_argument('--repetitions', help="Nombre de mesures de chaque version", default=5, type=int)
+    parser.add_argument('--graine', help="Graine des données aléatoires", default=0, type=int)
+    args = parser.parse_args()
+
+    # Les cas dégénérés (droites parallèles, faisceaux horizontaux) donnent des divisions par zéro, dans le code d'origine comme dans les noyaux
+    with np.errstate(divide="ignore", invalid="ignore"):
+        identique = verifier(args.nb_cas, args.repetitions, args.graine)
+    sys.exit(0 if identique else 1)
@@ -0,0 +1,178 @@
+"""
+Compromis durée / précision des préréglages (option --preset, voir v2/presets.py).
+
+Chaque chantier est traité avec chaque préréglage, dans un processus séparé et avec un cache des hauteurs vide.
+Les bâtiments fermés (batiments_fermes.gpkg) sont comparés à une référence :
+- pour un chantier synthétique (par défaut, généré avec benchmarks/chantier_synthetique.py), la vérité terrain verite_terrain.gpkg ;
+- pour un chantier réel (--chantiers, par exemple les zones d'étude), le résultat du préréglage le plus précis traité.
+
+Pour chaque bâtiment de la référence, on cherche le bâtiment calculé qui le recouvre le plus (IoU).
+Le résumé donne la durée, le temps CPU, la part des bâtiments de la référence retrouvés (IoU > seuil_iou),
+l'IoU moyen, et pour les bâtiments retrouvés l'erreur moyenne en altitude et la distance moyenne des sommets calculés au contour de la référence.
+
+Exemples :
+python benchmarks/presets.py --output benchmark_presets --echelle 4 --relief vallonne
+python benchmarks/presets.py --output benchmark_presets --chantiers [zone_1] [zone_2] --emprises [emprise_1] [emprise_2]
+"""
+import argparse
+import os
+import sys
+import json
+import time
+import subprocess
+from typing import List, Dict
+import numpy as np
+import geopandas as gpd
+from shapely import STRtree, Point
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from benchmarks.chantier_synthetique import ChantierSynthetique
+from v2.presets import PRESETS
+
+
+# IoU minimal pour qu'un bâtiment de la référence soit considéré comme retrouvé
+seuil_iou = 0.5
+
+
+def executer(path_chantier:str, path_emprise:str, path_resultats:str, preset:str, nb_cpus:int)->Dict:
+    commande = [
+        sys.executable, os.path.join(RACINE, "samonGouttiere.py"),
+        "--input", path_chantier,
+        "--output", path_resultats,
+        "--nb_cpus", str(nb_cpus),
+        "--preset", preset,
+        # Le cache des hauteurs d'une exécution précédente fausserait les mesures
+        "--cache", os.path.join(path_resultats, f"cache_{time.time_ns()}")
+    ]
+    if path_emprise is not None:
+        commande += ["--emprise", path_emprise]
+    tic = time.perf_counter()
+    subprocess.run(commande, check=True, cwd=RACINE)
+    duree = time.perf_counter() - tic
+    with open(os.path.join(path_resultats, "rapport_performances.json"), "r") as f:
+        rapport = json.load(f)
+    total = [ligne for ligne in rapport if ligne["etape"] == "total"][0]
+    return {"duree_processus_s":duree, "duree_s":total["duree_s"], "cpu_total_s":total["cpu_total_s"]}
+
+
+def lire_batiments(path_resultats:str)->gpd.GeoDataFrame:
+    path = os.path.join(path_resultats, "gouttieres", "batiments_fermes", "batiments_fermes.gpkg")
+    if not os.path.isfile(path):
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:2154")
+    gdf = gpd.read_file(path)
+    return gdf[~gdf.geometry.is_empty & gdf.geometry.is_valid]
+
+
+def z_moyen(geometrie)->float:
+    coordonnees = np.array(geometrie.exterior.coords)
+    if coordonnees.shape[1] < 3:
+        return np.nan
+    return float(np.mean(coordonnees[:,2]))
+
+
+def comparer(calcules:gpd.GeoDataFrame, reference:gpd.GeoDataFrame)->Dict:
+    """
+    Compare les bâtiments calculés aux bâtiments de référence
+    """
+    if len(reference) == 0:
+        return {"nb_batiments":len(calcules), "nb_reference":0}
+    ious = []
+    erreurs_z = []
+    distances = []
+    geometries = list(calcules.geometry)
+    arbre = STRtree(geometries)
+    for geometrie_reference in reference.geometry:
+        meilleur_iou = 0
+        meilleur = None
+        for i in arbre.query(geometrie_reference):
+            union = geometries[i].union(geometrie_reference).area
+            iou = geometries[i].intersection(geometrie_reference).area / union if union > 0 else 0
+            if iou > meilleur_iou:
+                meilleur_iou = iou
+                meilleur = geometries[i]
+        ious.append(meilleur_iou)
+        if meilleur is not None and meilleur_iou > seuil_iou:
+            erreurs_z.append(abs(z_moyen(meilleur) - z_moyen(geometrie_reference)))
+            contour = geometrie_reference.exterior
+            distances += [contour.distance(Point(x, y)) for x, y in np.array(meilleur.exterior.coords)[:,:2]]
+
+    ious = np.array(ious)
+    return {
+        "nb_batiments":len(calcules),
+        "nb_reference":len(reference),
+        "taux_retrouves":float(np.mean(ious > seuil_iou)),
+        "iou_moyen":float(np.mean(ious)),
+        "erreur_z_moyenne_m":float(np.nanmean(erreurs_z)) if len(erreurs_z) > 0 else None,
+        "distance_sommets_moyenne_m":float(np.mean(distances)) if len(distances) > 0 else None
+    }
+
+
+def afficher(resultats:List[Dict])->None:
+    print(f"{'chantier':<24}{'preset':<10}{'durée s':>10}{'CPU s':>10}{'bâtiments':>11}{'retrouvés':>11}{'IoU':>7}{'err. z m':>10}{'dist. m':>9}")
+    for resultat in resultats:
+        precision = resultat["precision"]
+        def formater(valeur, format_valeur:str)->str:
+            return "-" if valeur is None else format(valeur, format_valeur)
+        print(
+            f"{resultat['chantier'][:24]:<24}{resultat['preset']:<10}"
+            f"{resultat['duree_s']:>10.1f}{resultat['cpu_total_s']:>10.1f}{precision['nb_batiments']:>11}"
+            f"{formater(precision.get('taux_retrouves'), '.1%'):>11}{formater(precision.get('iou_moyen'), '.2f'):>7}"
+            f"{formater(precision.get('erreur_z_moyenne_m'), '.2f'):>10}{formater(precision.get('distance_sommets_moyenne_m'), '.2f'):>9}"
+        )
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Compromis durée / précision des préréglages")
+    parser.add_argument('--output', help='Répertoire des chantiers générés et des résultats', required=True)
+    parser.add_argument('--presets', help="Préréglages à comparer", nargs="+", default=list(PRESETS.keys()), choices=list(PRESETS.keys()))
+    parser.add_argument('--chantiers', help="Chantiers réels à traiter. Sans chantier, un chantier synthétique est généré", nargs="+", default=None)
+    parser.add_argument('--emprises', help="Emprise de chaque chantier réel", nargs="+", default=None)
+    parser.add_argument('--echelle', help="Echelle du chantier synthétique", default=1, type=float)
+    parser.add_argument('--relief', help='Relief du chantier synthétique', default="vallonne", choices=["plat", "vallonne"])
+    parser.add_argument('--graine', help='Graine du chantier synthétique', default=0, type=int)
+    parser.add_argument('--nb_cpus', help='Nombre de cpus pour la parallélisation', default=4, type=int)
+    args = parser.parse_args()
+
+    # (nom, chantier, emprise, vérité terrain)
+    chantiers = []
+    if args.chantiers is None:
+        nom = f"x{args.echelle:g}_{args.relief}_{args.graine}"
+        chantier = ChantierSynthetique(os.path.join(args.output, "chantiers", nom), args.echelle, args.relief, args.graine)
+        if not chantier.existe() or not os.path.isfile(chantier.get_path_verite_terrain()):
+            print(f"Génération du chantier synthétique dans {chantier.path}")
+            chantier.generer()
+        chantiers.append((nom, chantier.path, os.path.join(chantier.path, "emprise.gpkg"), chantier.get_path_verite_terrain()))
+    else:
+        emprises = args.emprises if args.emprises is not None else [None for _ in args.chantiers]
+        if len(emprises) != len(args.chantiers):
+            parser.error("--emprises doit donner une emprise par chantier")
+        for path_chantier, path_emprise in zip(args.chantiers, emprises):
+            chantiers.append((os.path.basename(os.path.normpath(path_chantier)), path_chantier, path_emprise, None))
+
+    # Du plus précis au plus rapide : sans vérité terrain, le premier sert de référence aux suivants
+    ordre = list(PRESETS.keys())
+    presets_traites = sorted(args.presets, key=lambda preset: -ordre.index(preset))
+
+    resultats = []
+    for nom, path_chantier, path_emprise, path_verite in chantiers:
+        reference = gpd.read_file(path_verite) if path_verite is not None else None
+        for preset in presets_traites:
+            print(f"Traitement de {nom} avec le préréglage {preset}")
+            path_resultats = os.path.join(args.output, "resultats", f"{nom}_{preset}")
+            resultat = executer(path_chantier, path_emprise, path_resultats, preset, args.nb_cpus)
+            batiments = lire_batiments(path_resultats)
+            if reference is None:
+                reference = batiments
+                resultat["reference"] = preset
+            else:
+                resultat["reference"] = "verite_terrain" if path_verite is not None else presets_traites[0]
+            resultat.update({"chantier":nom, "preset":preset, "precision":comparer(batiments, reference)})
+            resultats.append(resultat)
+
+    afficher(resultats)
+    path_resume = os.path.join(args.output, "benchmark_presets.json")
+    with open(path_resume, "w") as f:
+        json.dump({"parametres":vars(args), "seuil_iou":seuil_iou, "presets":{preset:PRESETS[preset] for preset in presets_traites}, "resultats":resultats}, f, indent=2)
+    print(f"Mesures enregistrées dans {path_resume}")
@@ -0,0 +1,150 @@
+"""
+Vérifie que l'association des segments sur les tranches de la table des segments (v2/tables.py) donne exactement les mêmes appariements
+que le calcul d'origine, segment par segment, et mesure leur durée.
+
+Les bâtiments sont des polygones aléatoires vus depuis deux images, avec un décalage de quelques mètres et un bruit sur les sommets.
+Le code de retour vaut 1 si au moins un appariement est différent.
+
+Exemples :
+python benchmarks/tables.py
+python benchmarks/tables.py --nb_paires 2000 --nb_segments_max 80
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from v2.tables import TableSegments
+from v2.association_segments_engine import AssociationSegmentsEngine
+
+
+# Code d'origine (Batiment.create_numpy_array et AssociationSegmentsEngine.premier_appariement)
+
+def reference_colonnes(extremites:np.ndarray, dx:float=0, dy:float=0):
+    nb_segments = extremites.shape[0]
+    array = np.zeros((nb_segments, 4))
+    for i in range(nb_segments):
+        world_line = extremites[i]
+        array[i,:] = np.array([world_line[0,0]+dx, world_line[0,1]+dy, world_line[1,0]+dx, world_line[1,1]+dy])
+    dx = (array[:,2]-array[:,0])
+    dy = (array[:,3]-array[:,1])
+    u = np.concatenate((dx.reshape((-1, 1)), dy.reshape((-1, 1))), axis=1)
+    norm = np.linalg.norm(u, axis=1)
+    u = u / np.tile(norm.reshape((-1, 1)), (1, 2))
+    barycentre_x = (array[:,2]+array[:,0])/2
+    barycentre_y = (array[:,3]+array[:,1])/2
+    barycentre = np.concatenate((barycentre_x.reshape((-1, 1)), barycentre_y.reshape((-1, 1))), axis=1)
+    a = dy
+    b = -dx
+    c = dx * array[:,1] - dy * array[:,0]
+    racine = np.sqrt(a**2 + b**2)
+    equation_droite = np.concatenate((a.reshape((-1, 1)), b.reshape((-1, 1)), c.reshape((-1, 1)), racine.reshape((-1, 1))), axis=1)
+    d_max = 0.5 * np.sqrt(dx**2+dy**2)
+    return array, u, barycentre, equation_droite, d_max
+
+
+def reference_appariement(extremites_1:np.ndarray, colonnes_2, seuil_distance_droite:float)->np.ndarray:
+    _, u, barycentre, equation_droite, d_max = colonnes_2
+    indices = []
+    for world_line in extremites_1:
+        u1 = world_line[0,:2] - world_line[1,:2]
+        u1 = (u1 / np.linalg.norm(u1)).reshape((1, 2))
+        barycentre_1 = ((world_line[0,:2] + world_line[1,:2]) / 2).reshape((1, 2))
+        ps = np.abs(np.sum(u1* u, axis=1))
+        d_droite = np.abs(equation_droite[:,0]*barycentre_1[0,0] + equation_droite[:,1]*barycentre_1[0,1] + equation_droite[:,2]) / equation_droite[:,3]
+        distance = np.sqrt(np.sum((barycentre - barycentre_1)**2, axis=1))
+        condition = np.where(np.logical_and(np.logical_and(ps > AssociationSegmentsEngine.seuil_ps, d_droite < seuil_distance_droite), distance < d_max))
+        if condition[0].shape[0] != 0:
+            barycentre_filtre_ps = barycentre[condition, :].squeeze()
+            distance = np.sqrt(np.sum((barycentre_filtre_ps - barycentre_1)**2, axis=1))
+            indices.append(condition[0][np.argmin(distance)])
+        else:
+            indices.append(-1)
+    return np.array(indices, dtype=np.int64)
+
+
+# Données aléatoires
+
+def generer_batiment(rng:np.random.Generator, nb_segments_max:int)->np.ndarray:
+    """
+    Contour d'un bâtiment au sol : polygone convexe de quelques dizaines de mètres, avec parfois des sommets en double (segments de longueur nulle)
+    """
+    n = int(rng.integers(3, nb_segments_max + 1))
+    angles = np.sort(rng.uniform(0, 2*np.pi, n))
+    rayon = rng.uniform(5, 30)
+    sommets = np.stack((rayon*np.cos(angles), rayon*np.sin(angles), rng.uniform(100, 120, n)), axis=1) + np.array([rng.uniform(0, 1e4), rng.uniform(6e6, 6.01e6), 0])
+    if rng.uniform() < 0.1:
+        sommets[1] = sommets[0]
+    return np.stack((sommets, np.roll(sommets, -1, axis=0)), axis=1)
+
+
+def generer_paire(rng:np.random.Generator, nb_segments_max:int)->Tuple[np.ndarray, np.ndarray]:
+    extremites_1 = generer_batiment(rng, nb_segments_max)
+    decalage = np.array([rng.normal(0, 2), rng.normal(0, 2), 0])
+    extremites_2 = extremites_1 + decalage + rng.normal(0, 0.3, extremites_1.shape)
+    return extremites_1, extremites_2
+
+
+def creer_table(extremites_1:np.ndarray, extremites_2:np.ndarray)->TableSegments:
+    table = TableSegments([extremites_1.shape[0], extremites_2.shape[0]])
+    table.extremites[:] = np.concatenate((extremites_1, extremites_2), axis=0)
+    table.calculer_colonnes()
+    return table
+
+
+# Vérification
+
+def verifier(paires:List[Tuple[np.ndarray, np.ndarray]])->bool:
+    identique = True
+    for extremites_1, extremites_2 in paires:
+        table = creer_table(extremites_1, extremites_2)
+        tranche_1, tranche_2 = table.get_tranche(0), table.get_tranche(1)
+        for dx, dy in [(0, 0), (1.5, -0.7)]:
+            table.calculer_colonnes(tranche_2, dx, dy)
+            colonnes = reference_colonnes(extremites_2, dx, dy)
+            obtenues = (table.array[tranche_2], table.u[tranche_2], table.barycentre[tranche_2], table.equation_droite[tranche_2], table.d_max[tranche_2])
+            identique = identique and all(np.array_equal(a, b, equal_nan=True) for a, b in zip(colonnes, obtenues))
+            for seuil in [AssociationSegmentsEngine.seuil_distance_droite_1, AssociationSegmentsEngine.seuil_distance_droite_2]:
+                attendus = reference_appariement(extremites_1, colonnes, seuil)
+                identique = identique and np.array_equal(attendus, table.apparier(tranche_1, tranche_2, AssociationSegmentsEngine.seuil_ps, seuil))
+    return identique
+
+
+def mesurer(paires:List[Tuple[np.ndarray, np.ndarray]])->Tuple[float, float]:
+    tables = [creer_table(extremites_1, extremites_2) for extremites_1, extremites_2 in paires]
+
+    tic = time.perf_counter()
+    for extremites_1, extremites_2 in paires:
+        reference_appariement(extremites_1, reference_colonnes(extremites_2), AssociationSegmentsEngine.seuil_distance_droite_1)
+    duree_reference = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    for table in tables:
+        table.calculer_colonnes(table.get_tranche(1))
+        table.apparier(table.get_tranche(0), table.get_tranche(1), AssociationSegmentsEngine.seuil_ps, AssociationSegmentsEngine.seuil_distance_droite_1)
+    duree_table = time.perf_counter() - tic
+    return duree_reference, duree_table
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Vérifie l'association des segments sur la table des segments et mesure sa durée")
+    parser.add_argument('--nb_paires', help="Nombre de paires de bâtiments", default=500, type=int)
+    parser.add_argument('--nb_segments_max', help="Nombre maximal de segments d'un bâtiment", default=40, type=int)
+    parser.add_argument('--graine', help="Graine des données aléatoires", default=0, type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.graine)
+    paires = [generer_paire(rng, args.nb_segments_max) for _ in range(args.nb_paires)]
+
+    # Les segments de longueur nulle donnent des divisions par zéro, dans le code d'origine comme dans la table
+    with np.errstate(divide="ignore", invalid="ignore"):
+        identique = verifier(paires)
+        duree_reference, duree_table = mesurer(paires)
+    print(f"Appariements identiques : {'oui' if identique else 'NON'}")
+    print(f"Code d'origine : {duree_reference*1000:.1f} ms, table des segments : {duree_table*1000:.1f} ms ({duree_reference/duree_table:.1f}x)")
+    sys.exit(0 if identique else 1)
@@ -0,0 +1,59 @@
+"""
+Taille des tâches envoyées aux workers : un groupe de bâtiments, avec ses segments, sérialisé comme pour le pool.
+
+Les données viennent du petit chantier synthétique des micro-benchmarks (benchmarks/micro.py) : un bâtiment vu dans plusieurs images.
+Pour chaque taille de groupe (nombre de bâtiments), on compare :
+- pool : taille avec le pickler de multiprocessing, où les clichés, les MNT et le chantier ne sont que des indices dans le contexte des workers ;
+- complet : taille avec pickle, qui contient les objets complets (clichés, MNT...), comme les checkpoints.
+
+Exemple :
+python benchmarks/taille_taches.py --nb_batiments 2 5 10
+"""
+import argparse
+import os
+import sys
+import pickle
+import tempfile
+from multiprocessing.reduction import ForkingPickler
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from benchmarks.micro import DonneesMicro
+
+
+def creer_groupe(donnees:DonneesMicro, nb_batiments:int, indice_chantier:int):
+    from v2 import contexte
+    from v2.groupe_batiments import GroupeBatiments
+    batiments = []
+    for i in range(nb_batiments):
+        batiment = donnees.creer_batiment(i % len(donnees.vues))
+        # Comme dans Prediction : le MNT du bâtiment est celui de son cliché, enregistré dans le contexte
+        batiment.mnt = contexte.get_mnt_shot(contexte.get_indice_shot(batiment.shot.image))
+        batiment.compute_ground_geometry(batiment.get_z_mean())
+        batiments.append(batiment)
+    groupe = GroupeBatiments(batiments, indice_chantier, batiments[0].mnt, False, 0)
+    groupe.premier_identifiant_segment = 0
+    groupe.create_segments()
+    return groupe
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Taille des tâches envoyées aux workers")
+    parser.add_argument('--chantier', help="Répertoire du chantier synthétique, généré s'il n'existe pas", default=os.path.join(tempfile.gettempdir(), "samon_chantier_micro"))
+    parser.add_argument('--nb_batiments', help="Nombres de bâtiments des groupes mesurés", nargs="+", default=[2, 5, 10, 20], type=int)
+    args = parser.parse_args()
+
+    from v2 import contexte
+    donnees = DonneesMicro(args.chantier)
+    contexte.initialiser(donnees.shots, donnees.mnt, donnees.raf, donnees.path_pvas, False)
+    indice_chantier = contexte.enregistrer_chantier(donnees.path_pvas, donnees.shots)
+
+    print(f"{len(donnees.shots)} clichés dans le contexte")
+    print(f"{'bâtiments':>10}{'segments':>10}{'pool ko':>10}{'complet ko':>12}{'rapport':>9}")
+    for nb_batiments in args.nb_batiments:
+        groupe = creer_groupe(donnees, nb_batiments, indice_chantier)
+        nb_segments = sum([len(batiment.get_segments()) for batiment in groupe.get_batiments()])
+        taille_pool = len(ForkingPickler.dumps(groupe))
+        taille_complete = len(pickle.dumps(groupe, protocol=pickle.HIGHEST_PROTOCOL))
+        print(f"{nb_batiments:>10}{nb_segments:>10}{taille_pool/1000:>10.1f}{taille_complete/1000:>12.1f}{taille_complete/taille_pool:>8.1f}x")
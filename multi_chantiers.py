@@ -0,0 +1,93 @@
+import argparse
+import os
+from typing import List, Dict
+
+
+def lister_travaux(chantiers:List[str], emprises:List[str], path_output:str)->List[Dict]:
+    """
+    Associe chaque emprise à son chantier. S'il n'y a qu'un chantier, toutes les emprises sont traitées avec ce chantier.
+    Les résultats de chaque travail sont écrits dans un sous-répertoire de path_output, nommé d'après l'emprise
+    """
+    if len(chantiers) == 1:
+        chantiers = chantiers * len(emprises)
+    if len(chantiers) != len(emprises):
+        raise ValueError(f"{len(chantiers)} chantiers pour {len(emprises)} emprises : il faut une emprise par chantier, ou un seul chantier")
+
+    travaux = []
+    noms = set()
+    for chantier, emprise in zip(chantiers, emprises):
+        nom = os.path.splitext(os.path.basename(emprise))[0]
+        if nom in noms:
+            raise ValueError(f"Plusieurs emprises s'appellent {nom}")
+        noms.add(nom)
+        travaux.append({"nom":nom, "input":chantier, "emprise":emprise, "output":os.path.join(path_output, nom)})
+    return travaux
+
+
+def executer(travaux:List[Dict], path_output:str, nb_cpus:int, pvas_dir:str, repertoire_mnt:str, pipeline:bool, streaming:bool, taille_lot:int, memoire_max:float):
+    """
+    Charge une seule fois le TA, la RAF et le MNT, puis traite les chantiers les uns après les autres avec le même pool de workers
+    """
+    # Import ici : v2.samon_gouttiere fixe la méthode de démarrage des processus, et les workers n'ont pas à importer tout le traitement
+    from v2.samon_gouttiere import SamonGouttiere
+    from v2.ressources_partagees import RessourcesPartagees, memes_fichiers
+
+    if repertoire_mnt is None:
+        repertoire_mnt = os.path.join(path_output, "data")
+
+    chantiers:List[SamonGouttiere] = []
+    ressources = None
+    for travail in travaux:
+        chantier = SamonGouttiere(travail["input"], travail["output"], travail["emprise"], False, nb_cpus, pvas_dir=pvas_dir, repertoire_mnt=repertoire_mnt, pipeline=pipeline, streaming=streaming, taille_lot=taille_lot, memoire_max=memoire_max)
+        if chantier.emprise is None:
+            raise ValueError(f"Impossible de lire l'emprise {travail['emprise']}")
+        if ressources is None:
+            ressources = RessourcesPartagees(chantier.get_ta_path(), chantier.get_raf_path(), chantier.get_mnt_path(), repertoire_mnt)
+        chantier.ressources = ressources
+        chantiers.append(chantier)
+
+    for nom, paths in [
+        ("TA", [chantier.get_ta_path() for chantier in chantiers]),
+        ("RAF", [chantier.get_raf_path() for chantier in chantiers]),
+        ("MNT", [chantier.get_mnt_path() for chantier in chantiers])
+    ]:
+        if not memes_fichiers(paths):
+            raise ValueError(f"Les chantiers n'utilisent pas le même {nom} : ils ne peuvent pas être traités ensemble")
+
+    images = set()
+    for chantier in chantiers:
+        images.update([i.split(".")[0] for i in chantier.get_predictions_ffl()])
+    ressources.charger([chantier.emprise for chantier in chantiers], list(images))
+
+    cache_z = {}
+    for chantier in chantiers:
+        cache_z.update(chantier.cache_z.resultats)
+    # Les groupes de bâtiments envoyés aux workers ne contiennent que l'indice de leur chantier dans le contexte
+    ressources.demarrer_pool(nb_cpus, cache_z, [(chantier.get_pva_path(), chantier.get_shots(chantier.get_predictions_ffl())) for chantier in chantiers])
+
+    try:
+        for i, travail in enumerate(travaux):
+            print(f"Traitement de {travail['nom']}")
+            chantiers[i].run()
+            # Les objets du chantier ne sont plus utiles : on libère la mémoire avant de passer au suivant
+            chantiers[i] = None
+    finally:
+        ressources.fermer_pool()
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Traitement de plusieurs chantiers voisins qui partagent le même TA, la même RAF et le même MNT")
+    parser.add_argument('--chantiers', help="Répertoires des chantiers. S'il n'y en a qu'un, il est utilisé pour toutes les emprises", nargs="+", required=True)
+    parser.add_argument('--emprises', help="Emprise de chaque chantier", nargs="+", required=True)
+    parser.add_argument('--output', help="Répertoire où enregistrer les résultats. Chaque chantier a son sous-répertoire, nommé d'après son emprise")
+    parser.add_argument('--nb_cpus', help='Nombre de cpus pour la parallélisation', default=4, type=int)
+    parser.add_argument('--pvas_dir', help='Répertoire des images, si différent de input/pvas', default=None)
+    parser.add_argument('--repertoire_mnt', help="Répertoire des tableaux partagés du MNT et de la RAF (par défaut : output/data)", default=None)
+    parser.add_argument('--pipeline', help="Chaque groupe de bâtiments enchaîne les étapes sans attendre les autres groupes", action="store_true")
+    parser.add_argument('--streaming', help="Traite les groupes de pâtés de maisons par lots pour limiter la mémoire", action="store_true")
+    parser.add_argument('--taille_lot', help="Nombre de groupes de pâtés de maisons par lot en mode streaming", default=1000, type=int)
+    parser.add_argument('--memoire_max', help="En mode streaming, mémoire (en Go) au-delà de laquelle les lots en attente sont écrits sur disque", default=None, type=float)
+    args = parser.parse_args()
+
+    travaux = lister_travaux(args.chantiers, args.emprises, args.output)
+    executer(travaux, args.output, args.nb_cpus, args.pvas_dir, args.repertoire_mnt, args.pipeline, args.streaming, args.taille_lot, args.memoire_max)
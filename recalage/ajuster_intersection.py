@@ -1,4 +1,5 @@
 import os
+import sys
 import geopandas as gpd
 from shapely import LineString, polygonize
 import numpy as np
@@ -7,6 +8,10 @@ import argparse
 from fermer_batiment import get_id_bati_max, charger_goutieres
 from typing import List
 
+# Les préréglages sont partagés avec le traitement principal (v2/presets.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from v2 import presets
+
 
 
 
@@ -22,7 +27,7 @@ def charger_emprise(chemin_emprise):
 
 def ajuster(batiment:Batiment):
     batiment.completer_voisins()
-    for i in range(25):
+    for i in range(presets.get("nb_iterations_ajustement")):
         
         # On supprime les segments avec un seul voisin
         batiment.supprimer_segment_zero_un_voisin()
@@ -96,7 +101,9 @@ if __name__=="__main__":
     parser.add_argument('--input', help='Répertoire où se trouvent le résultat de intersection_plan')
     parser.add_argument('--emprise', help='Répertoire où sauvegarder les résultats')
     parser.add_argument('--output', help='Répertoire où sauvegarder les résultats')
+    parser.add_argument('--preset', help="Préréglage vitesse / précision (voir v2/presets.py)", default="standard", choices=["draft", "standard", "precise"])
     args = parser.parse_args()
+    presets.definir_preset(args.preset)
 
     # répertoire contenant les résultats du script association_segments.py
     shapefileDir = args.input
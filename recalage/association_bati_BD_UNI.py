@@ -1,9 +1,14 @@
 import os
+import sys
 import geopandas as gpd
 from tqdm import tqdm
 import argparse
 from batiRecalage import charger_bati, charger_bati_gouttieres
 
+# Les composantes connexes sont calculées comme dans le traitement principal (v2/composantes.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from v2.composantes import composantes_objets
+
 
 
 
@@ -57,24 +62,10 @@ def association(batis_par_shapefile, geoseries):
 
 
 def graphe_connexe(batis_par_shapefile):
-    id_bati = 0
-    for shapefile in batis_par_shapefile:
-        for bati in tqdm(shapefile["batis"]):
-            if not bati.marque:
-                liste = [bati]
-                bati.id = id_bati
-                bati.marque = True
-
-                while len(liste) > 0:
-                    b = liste.pop()
-                    for homologue in b.homologue:
-                        if not homologue.marque:
-                            homologue.id = id_bati
-                            homologue.marque = True
-                            if homologue not in liste:
-                                liste.append(homologue)
-
-                id_bati += 1
+    batis = [bati for shapefile in batis_par_shapefile for bati in shapefile["batis"]]
+    for id_bati, composante in enumerate(tqdm(composantes_objets(batis, lambda b: b.homologue, "marque"))):
+        for bati in composante:
+            bati.id = id_bati
 
 
 def sauvegarde_projection(batis_par_shapefile, output):
@@ -10,6 +10,11 @@ import argparse
 from tools import get_mnt, get_raf, get_ta_xml, get_shots
 from sklearn.feature_extraction.image import extract_patches_2d
 from shot import MNT, RAF
+import sys
+
+# Les composantes connexes sont calculées comme dans le traitement principal (v2/composantes.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from v2.composantes import composantes_objets
 
 
 seuil_ps = 0.8
@@ -138,33 +143,11 @@ def deuxieme_appariement(b1:Bati, b2:Bati, dx, dy):
 
 
 def composante_connexe(b1, homologue_1=True):
-    composantes_connexes = []
-
-    
-    for goutiere in b1.goutieres:
-        if not goutiere.marque:
-            liste_connexe = [goutiere]
-            liste = [goutiere]
-            goutiere.marque = True
-            while len(liste) > 0:
-                g = liste.pop()
-
-                
-                if homologue_1:
-                    l = g.homologue_1
-                else:
-                    l = g.homologue_2
-                for homologue in l:
-                    if not homologue.marque:
-                        homologue.marque = True
-                        if homologue not in liste:
-                            liste.append(homologue)
-                        if homologue not in liste_connexe:
-                            liste_connexe.append(homologue)
-            
-            if len(liste_connexe) >= 2:
-                composantes_connexes.append(liste_connexe)
-    
+    if homologue_1:
+        voisins = lambda g: g.homologue_1
+    else:
+        voisins = lambda g: g.homologue_2
+    composantes_connexes = [composante for composante in composantes_objets(b1.goutieres, voisins, "marque") if len(composante) >= 2]
     return composantes_connexes
 
 
@@ -273,25 +256,8 @@ def demarque_goutieres(bati):
 
 
 def composante_connexe_bati(bati:List[Bati]):
-    composantes_connexes = []
-    for b in bati:
-        for goutiere in b.goutieres:
-            if not goutiere.marque:
-                liste_connexe = [goutiere]
-                liste = [goutiere]
-                goutiere.marque = True
-                while len(liste) > 0:
-                    g = liste.pop()
-                    for homologue in g.homologue_2:
-                        if not homologue.marque:
-                            homologue.marque = True
-                            if homologue not in liste:
-                                liste.append(homologue)
-                            if homologue not in liste_connexe:
-                                liste_connexe.append(homologue)
-                
-                if len(liste_connexe) >= 2:
-                    composantes_connexes.append(liste_connexe)
+    goutieres = [goutiere for b in bati for goutiere in b.goutieres]
+    composantes_connexes = [composante for composante in composantes_objets(goutieres, lambda g: g.homologue_2, "marque") if len(composante) >= 2]
     return composantes_connexes
 
 
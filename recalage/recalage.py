@@ -8,6 +8,11 @@ from bati import BatiProjete
 import random
 from shapely.geometry import MultiPoint
 from shapely import Polygon
+import sys
+
+# Les noyaux numériques sont partagés avec le traitement principal (v2/noyaux.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from v2 import noyaux
 
 
 def get_id_bati_max(input):
@@ -135,31 +140,34 @@ def analyse_residus(points, A, B, x_chap, V, P):
         return len(points), np.mean(np.abs(V)), np.max(np.abs(V)), None, np.argmax(np.abs(V))
 
 
-def calculer_inliers(parametres, points, seuil):
+def get_coordonnees(points):
+    """
+    Coordonnées (x, y, X, Y) de chaque couple de points, dans l'ordre attendu par noyaux.residus_helmert
+    """
+    return np.array([[point[1].x, point[1].y, point[0].x, point[0].y] for point in points], dtype=np.float64).reshape(-1, 4)
+
+
+def calculer_inliers(parametres, points, seuil, coordonnees=None):
     """
     On calcule le nombre d'inliers avec ces paramètres.
     Chaque ville ne peut être représentée qu'une seule fois dans les inliers
+
+    coordonnees (voir get_coordonnees) peut être calculé une seule fois pour plusieurs appels avec les mêmes points
     """
-    nb_inliers = 0
-    inliers = []
+    if coordonnees is None:
+        coordonnees = get_coordonnees(points)
 
     TX = parametres[0]
     TY = parametres[1]
     a = parametres[2]
     b = parametres[3]
 
-    # On parcourt tous les points
-    for point in points:
-        # On calcule le résidu entre le résultat de la transformation et la position "réelle" des points
-        XB_chap = TX + b*point[1].x + a*point[1].y
-        YB_chap = TY - a*point[1].x + b*point[1].y
-        distance = np.sqrt((XB_chap-point[0].x)**2 + (YB_chap-point[0].y)**2)
-        
-        # Si la distance est inférieure à un seuil, alors on conserve le point
-        if distance <= seuil:
-            nb_inliers += 1
-            inliers.append(point)
-    return nb_inliers, inliers
+    # On calcule le résidu entre le résultat de la transformation et la position "réelle" des points (voir v2/noyaux.py)
+    distances = noyaux.residus_helmert(float(TX), float(TY), float(a), float(b), coordonnees)
+
+    # Si la distance est inférieure à un seuil, alors on conserve le point
+    inliers = [point for point, distance in zip(points, distances) if distance <= seuil]
+    return len(inliers), inliers
 
 
 def compute_k(a, b):
@@ -173,6 +181,9 @@ def ransac(points, iteration, seuil):
     diff_k_max = 1e15
     inliers_max = []
 
+    # Les coordonnées des points ne changent pas d'une itération à l'autre
+    coordonnees = get_coordonnees(points)
+
     # pour chaque itération
     for i in range(iteration):
 
@@ -197,7 +208,7 @@ def ransac(points, iteration, seuil):
         parametres, _,_,_,_, _ = calculer_parametres_moindres_carres(points_numpy)
 
         # On calcule le nombre d'inliers à partir de ces paramètres
-        nb_inliers, inliers = calculer_inliers(parametres, points, seuil)
+        nb_inliers, inliers = calculer_inliers(parametres, points, seuil, coordonnees)
         
         # On calcule k, le facteur d'échelle
         k = compute_k(parametres[2], parametres[3])
@@ -1,6 +1,7 @@
 repertoire_chantier=$1
 repertoire_BD_Uni=${2}
 chemin_emprise=${3:-None}
+preset=${4:-standard}
 
 
 repertoire_goutiere=${repertoire_chantier}/gouttieres
@@ -11,7 +12,7 @@ python recalage/dissolve.py --input ${repertoire_BD_Uni} --output ${repertoire_g
 python recalage/nettoyage.py --input ${repertoire_goutiere}/BD_Uni_regroupee --output ${repertoire_goutiere}/BD_Uni_nettoyee
 
 echo "Ajustement des intersections sur les gouttières calculées"
-python recalage/ajuster_intersection.py --input ${repertoire_goutiere}/intersections --emprise ${chemin_emprise} --output ${repertoire_goutiere}/intersections_ajustees
+python recalage/ajuster_intersection.py --input ${repertoire_goutiere}/intersections --emprise ${chemin_emprise} --output ${repertoire_goutiere}/intersections_ajustees --preset ${preset}
 
 
 echo "Association des bâtiments gouttières / BD Uni"
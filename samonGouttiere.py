@@ -1,440 +1,42 @@
 import argparse
-import os
-from v2.shot import MNT, RAF, Shot, Calibration, ShotPompei, ShotOriente
-from v2.prediction import Prediction
-from typing import List
-from lxml import etree
-from v2.association_pate_maisons_engine import AssociationPateMaisonEngine
-from v2.association_batiment_engine import AssociationBatimentEngine
-from v2.association_segments_engine import AssociationSegmentsEngine
-from v2.groupe_batiments import GroupeBatiments
-from v2.groupe_segments import GroupeSegments
-from v2.calcul_intersection_engine import CalculIntersectionEngine
-from v2.fermer_batiment_engine import FermerBatimentEngine
-from v2.parallelisation import traiter_lissage, create_predictions
-from v2.pateMaison import PateMaison
-from v2.batiment import Batiment
-import geopandas as gpd
-from shapely import Polygon
-from tqdm import tqdm
-import time
-import warnings
-import os
-import multiprocessing
-from osgeo import gdal
-gdal.DontUseExceptions()
-multiprocessing.set_start_method('spawn', force=True)
-os.environ["OMP_NUM_THREADS"] = "1"
-os.environ["MKL_NUM_THREADS"] = "1"
-os.environ["OPENBLAS_NUM_THREADS"] = "1"
-
-warnings.filterwarnings("ignore", message="'crs' was not provided")
-
-class SamonGouttiere:
-
-    def __init__(self, path_chantier:str, path_output:str, path_emprise:str, pompei:bool, nb_cpus:int, pvas_dir = None):
-        
-        # Chemin où se trouve le chantier
-        if not os.path.isdir(path_chantier):
-            return ValueError(f"{path_chantier} n'est pas un répertoire")
-        self.path_chantier = path_chantier
-        self.path_output = path_output
-        os.makedirs(os.path.join(self.path_output, "gouttieres"), exist_ok=True)
-        self.nb_cpus = nb_cpus
-
-        self.mnt:MNT = None
-        self.raf:RAF = None
-        self.shots:List[Shot] = []
-        self.predictions:List[Prediction] = []
-
-        self.groupe_batiments:List[GroupeBatiments] = []
-        self.groupe_segments:List[GroupeSegments] = []
-
-        self.pompei = pompei
-
-        self.emprise:gpd.GeoDataFrame = self.charger_emprise(path_emprise)
-        self.pvas_dir = pvas_dir
-
-
-    def charger_emprise(self, chemin_emprise)->gpd.GeoDataFrame:
-        gdf = None
-        if chemin_emprise is not None and chemin_emprise is not None:
-            gdf = gpd.read_file(chemin_emprise).geometry
-        return gdf
-
-    
-    def get_mnt_path(self) -> str:
-        """
-        Renvoie le chemin vers le mnt
-        """
-        path = os.path.join(self.path_chantier, "mnt", "mnt.vrt")
-        if not os.path.isfile(path):
-            return ValueError(f"{path} n'existe pas")
-        return path
-    
-    def get_pva_path(self)->str:
-        if self.pvas_dir is not None:
-            path = self.pvas_dir
-        else:
-            path = os.path.join(self.path_chantier, "pvas")
-        if not os.path.isdir(path):
-            return ValueError(f"{path} n'existe pas")
-        return path
-    
-    
-    def get_raf_path(self) -> str:
-        """
-        Renvoie le chemin vers la grille raf
-        """
-        path = os.path.join(self.path_chantier, "raf", "raf2020_2154.tif")
-        if not os.path.isfile(path):
-            return ValueError(f"{path} n'existe pas")
-        return path
-
-
-    def get_predictions_ffl_dir(self) -> str:
-        """
-        Renvoie le répertoire avec les prédictions du frame field learning
-        """
-        path = os.path.join(self.path_chantier, "gouttieres", "predictions_FFL")
-        if not os.path.isdir(path):
-            return ValueError(f"{path} n'existe pas")
-        return path
-
-    def get_predictions_ffl(self) -> List[str]:
-        """
-        Renvoie les prédictions ffl sous format shapefile
-        """
-        predictions = [i for i in os.listdir(self.get_predictions_ffl_dir()) if i[-4:]==".shp" or i[-5:]==".gpkg"]
-        return predictions
-    
-    def get_ta_path(self):
-        """
-        Renvoie le fichier ta.xml
-        """
-        dir_path = os.path.join(self.path_chantier, "orientation")
-        if not os.path.isdir(dir_path):
-            return ValueError(f"{dir_path} n'existe pas")
-        files = [i for i in os.listdir(dir_path) if i[-4:]==".XML"]
-        if len(files)!=1:
-            raise ValueError(f"Il ne faut qu'un seul fichier orientation dans {dir_path}")
-        return os.path.join(dir_path, files[0])
-
-
-    def get_shots(self, predictions_ffl:List[str]) -> List[ShotOriente]:
-        """
-        Renvoie les objets shots pour chaque image orientée pour lesquelles on dispose des prédictions ffl
-        """
-        tree = etree.parse(self.get_ta_path())
-        root = tree.getroot()
-
-        centre_rep_local = root.find(".//centre_rep_local")
-        centre_rep_local_x = float(centre_rep_local.find(".//x").text)
-        centre_rep_local_y = float(centre_rep_local.find(".//y").text)
-        centre_rep_local = [centre_rep_local_x, centre_rep_local_y]
-        
-        pvas = [i.split(".")[0] for i in predictions_ffl]
-        shots = []
-        for vol in root.getiterator("vol"):
-
-            sensors = vol.findall(".//sensor")
-
-            for cliche in vol.getiterator("cliche"):
-                image = cliche.find("image").text.strip()
-                if image in pvas:
-                    shot = ShotOriente.createShot(cliche, self.raf, centre_rep_local, sensors)
-                    emprise:Polygon = shot.emprise
-                    if (self.emprise is not None and emprise.intersects(self.emprise).any()) or self.emprise is None:
-                        shots.append(shot)
-        return shots
-    
-
-    def get_cameras_pompei(self)->List[Calibration]:
-        """
-        Lit les fichiers de calibration Micmac
-        """
-        dir_path = os.path.join(self.path_chantier, "orientation")
-        calib_files = [i for i in os.listdir(dir_path) if i[-4:]==".xml" and "AutoCal" in i]
-        calibrations = {}
-        for calib_file in calib_files:
-            calib = Calibration.createCalibration(os.path.join(dir_path, calib_file))
-            calibrations[calib_file] = calib
-        return calibrations
-    
-    def get_shots_pompei(self, calibrations:List[Calibration], predictions_ffl:List[str], mnt:MNT):
-        """
-        Crée les objets Shot à partir des fichiers d'orientation Micmac
-        """
-        dir_path = os.path.join(self.path_chantier, "orientation")
-        ori_files = [i for i in os.listdir(dir_path) if i[-4:]==".xml" and "Orientation" in i]
-        shots = []
-        for ori_file in ori_files:
-            if not ori_file.replace("Orientation-", "").replace(".tif.xml", ".shp") in predictions_ffl:
-                continue
-                
-            shot = ShotPompei.createShot(os.path.join(dir_path, ori_file), calibrations)
-            shot.compute_emprise(mnt)
-            shots.append(shot)  
-        return shots
-    
-
-    def get_images_pompei(self, predictions_ffl:List[str], mnt:MNT)-> List[ShotPompei]:
-        """
-        Récupère les objets Shot à partir d'orientations Micmac
-        """
-        calibrations = self.get_cameras_pompei()
-        shots = self.get_shots_pompei(calibrations, predictions_ffl, mnt)
-        return shots
-
-    
-
-    def run(self):
-        tic = time.time()
-        self.load()
-        self.lisser_geometries()
-        self.association_pate_maisons()
-        self.association_bati()
-        self.association_segments()
-        self.calculer_intersections()
-        self.fermer_batiment()
-        print(f"Durée du traitement : {time.time() - tic} secondes")
-
-
-
-    def load(self):
-        """
-        Charge les données
-        """
-        print("Chargement du MNT...")
-        self.mnt = MNT.load_mnt(self.get_mnt_path(), self.emprise)
-        print("Chargement du MNT terminé")
-        self.raf = RAF(self.get_raf_path())
-        predictions_ffl = self.get_predictions_ffl()
-        if self.pompei:
-            self.shots = self.get_images_pompei(predictions_ffl, self.mnt)
-        else:
-            self.shots = self.get_shots(predictions_ffl)
-
-        arguments = []
-        for prediction_ffl in tqdm(predictions_ffl, desc="Chargement des images"):
-            for shot in self.shots:
-                if shot.image+".shp" == prediction_ffl or shot.image+".gpkg" == prediction_ffl:
-                    arguments.append([shot, os.path.join(self.get_predictions_ffl_dir(), prediction_ffl), self.mnt, self.emprise])
-
-        
-        cs = int(len(arguments)/(10*self.nb_cpus)+1)
-            
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-            pool.imap_unordered(create_predictions, arguments, chunksize=cs), 
-            total=len(arguments),
-            desc="Chargement des prédictions"
-        ))
-                
-        # On met à jour la liste des prédictions avec les versions lissées
-        self.predictions = results
-        compte_pm = 0
-        compte_bati = 0
-        for prediction in self.predictions:
-            for pm in prediction.pates_maisons:
-                pm.identifiant = compte_pm
-                compte_pm += 1
-                for bati in pm.batiments:
-                    bati.identifiant = compte_bati
-                    compte_bati += 1
-        PateMaison.identifiant_global = compte_pm
-        Batiment.identifiant_global = compte_bati
-
-
-    def lisser_geometries(self):
-        """
-        Lisse les géométries de chaque polygone en parallèle
-        """
-        os.makedirs(os.path.join(self.path_output, "gouttieres", "nettoyage"), exist_ok=True)
-
-        cs = int(len(self.predictions)/(10*self.nb_cpus)+1)
-            
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-            pool.imap_unordered(traiter_lissage, self.predictions, chunksize=cs), 
-            total=len(self.predictions),
-            desc="Lissage des géométries"
-        ))
-                
-        # On met à jour la liste des prédictions avec les versions lissées
-        self.predictions = results
-
-    
-    def association_pate_maisons(self):
-        association_pate_maison_engine = AssociationPateMaisonEngine(self.predictions, self.emprise, self.nb_cpus)
-        self.groupes_pates_maisons, self.predictions = association_pate_maison_engine.run()
-
-        os.makedirs(os.path.join(self.path_output, "gouttieres", "association_pate_maisons"), exist_ok=True)
-        for prediction in self.predictions:
-            prediction.export_pate_maison_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_pate_maisons"))
-
-
-    def association_bati(self):
-        """
-        Associer les bâtiments entre eux
-        """
-        association_batiments_engine = AssociationBatimentEngine(self.groupes_pates_maisons, self.emprise, self.pompei, self.nb_cpus, self.get_pva_path(), self.mnt, self.raf, self.shots)
-        self.groupe_batiments = association_batiments_engine.run()
-
-        batiments = [None for i in range(Batiment.identifiant_global)]
-        for groupe_batiment in self.groupe_batiments:
-            for batiment in groupe_batiment.batiments:
-                batiments[batiment.identifiant] = batiment
-
-        for prediction in self.predictions:
-            new_batiments = []
-            for batiment in prediction.batiments:
-                new_batiment = batiments[batiment.identifiant]
-                if new_batiment is not None:
-                    new_batiments.append(new_batiment)
-            prediction.batiments = new_batiments
-
-        os.makedirs(os.path.join(self.path_output, "gouttieres", "association_batiment"), exist_ok=True)
-        for prediction in self.predictions:
-            prediction.export_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_batiment"))
-
-    
-    def association_segments(self):
-        print("Association des segments")
-        association_segments_engine = AssociationSegmentsEngine(self.groupe_batiments, self.nb_cpus)
-        self.groupe_segments, self.groupe_batiments = association_segments_engine.run()
-
-        
-        batiments = [None for i in range(Batiment.identifiant_global)]
-        for groupe_batiment in self.groupe_batiments:
-            for batiment in groupe_batiment.batiments:
-                batiments[batiment.identifiant] = batiment
-
-        for prediction in self.predictions:
-            new_batiments = []
-            for batiment in prediction.batiments:
-                new_batiments.append(batiments[batiment.identifiant])
-            prediction.batiments = new_batiments
-        
-        os.makedirs(os.path.join(self.path_output, "gouttieres", "association_segments"), exist_ok=True)
-        for prediction in self.predictions:
-            prediction.export_segment_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_segments"))
-
-
-    def calculer_intersections(self):
-        """
-        On calcule les intersections de plans dans l'espace 
-        """
-        calcule_intersection_engine = CalculIntersectionEngine(self.groupe_segments)
-        calcule_intersection_engine.run()
-        self.export_intersections()
-
-
-    def export_intersections(self):
-        geometries = []
-        nb_segments = []
-        d_mean = []
-        residus = []
-        identifiant = []
-        id_bati = []
-        dict_voisins = {}
-        for i in range(8):
-            dict_voisins[f"v_{i}"] = []
-
-
-        for groupe_segments in self.groupe_segments:
-            if not groupe_segments._supprime:
-                geometries.append(groupe_segments.get_geometrie())
-                nb_segments.append(groupe_segments.get_nb_segments())
-                d_mean.append(groupe_segments.get_d_mean())
-                residus.append(groupe_segments.get_residu_moyen())
-                identifiant.append(groupe_segments.get_identifiant())
-                id_bati.append(groupe_segments.id_batiment)
-                for i in range(8):
-                    if i<len(groupe_segments.voisins):
-                        dict_voisins[f"v_{i}"].append(groupe_segments.voisins[i].get_identifiant())
-                    else:
-                        dict_voisins[f"v_{i}"].append(None)
-
-        os.makedirs(os.path.join(self.path_output, "gouttieres", "intersections"), exist_ok=True)
-        dict = {"id":identifiant, "residus":residus, "d_mean":d_mean, "nb_segments":nb_segments, "id_bati":id_bati, "geometry":geometries}
-        for i in range(8):
-            dict[f"v_{i}"] = dict_voisins[f"v_{i}"]
-        gdf = gpd.GeoDataFrame(dict, crs="EPSG:2154")
-        gdf.to_file(os.path.join(self.path_output, "gouttieres", "intersections", "intersections.gpkg"))
-
-
-    def fermer_batiment(self):
-        fermer_batiment_engine = FermerBatimentEngine(self.groupe_batiments)
-        fermer_batiment_engine.run()
-        self.export_batiments_fermes()
-        self.export_intersections_ajustees()
-
-    def export_batiments_fermes(self):
-        geometries = []
-        identifiant = []
-        methode = []
-        methode_estimation_alti = []
-        estimation_z = []
-        delta_estim = []
-        score = []
-
-
-        for groupe_batiment in self.groupe_batiments:
-            geometrie = groupe_batiment.get_geometrie_fermee()
-            for geom in geometrie.geoms:
-                geometries.append(geom)
-                identifiant.append(groupe_batiment.get_identifiant())
-                methode.append(groupe_batiment.get_methode_fermeture())
-                methode_estimation_alti.append(groupe_batiment.get_methode_estimation_hauteur())
-                estimation_z.append(groupe_batiment.estim_z)
-                score.append(groupe_batiment.score)
-
-                delta_estim.append(0)
-        d = {"id_bati":identifiant, "methode":methode, "estim_alti":methode_estimation_alti, "estim_z":estimation_z, "delta_estim":delta_estim, "score":score, "geometry":geometries}
-        
-        os.makedirs(os.path.join(self.path_output, "gouttieres", "batiments_fermes"), exist_ok=True)
-        gdf = gpd.GeoDataFrame(d, crs="EPSG:2154")
-        gdf.to_file(os.path.join(self.path_output, "gouttieres", "batiments_fermes", "batiments_fermes.gpkg"))
-
-    def export_intersections_ajustees(self):
-        geometries = []
-        nb_segments = []
-        d_mean = []
-        residus = []
-        identifiant = []
-        identifiant_bati = []
-
-        for groupe_batiments in self.groupe_batiments:
-            for groupe_segments in groupe_batiments.groupes_segments:
-            
-                if groupe_segments.is_valid():
-                    
-                    geometries.append(groupe_segments.get_geometrie())
-                    nb_segments.append(groupe_segments.get_nb_segments())
-                    d_mean.append(groupe_segments.get_d_mean())
-                    residus.append(groupe_segments.get_residu_moyen())
-                    identifiant.append(groupe_segments.get_identifiant())
-                    identifiant_bati.append(groupe_batiments.get_identifiant())
-
-        os.makedirs(os.path.join(self.path_output, "gouttieres", "batiments_fermes"), exist_ok=True)
-        gdf = gpd.GeoDataFrame({"id":identifiant, "residus":residus, "d_mean":d_mean, "nb_segments":nb_segments, "id_bati":identifiant_bati, "geometry":geometries}, crs="EPSG:2154")
-        gdf.to_file(os.path.join(self.path_output, "gouttieres", "batiments_fermes", "intersections.gpkg"))
-        
-
-
-
-
 
 
+# Les imports lourds sont faits dans le bloc principal : avec la méthode de démarrage spawn,
+# chaque worker du pool réimporte ce module et ne doit pas recharger tout le traitement
 if __name__=="__main__":
+    from v2.samon_gouttiere import SamonGouttiere
+
     parser = argparse.ArgumentParser(description="On calcule la position des goutières")
     parser.add_argument('--input', help='Répertoire où se trouve le chantier')
     parser.add_argument('--output', help='Répertoire où enregistrer les résultats')
     parser.add_argument('--emprise', help='Emprise au sol des zones où il faut reconstruire les bâtiments', default=None)
     parser.add_argument('--pompei', help='True si le chantier a été produit avec Pompei', default=False, type=bool)
     parser.add_argument('--nb_cpus', help='Nombre de cpus pour la parallélisation', default=4, type=int)
+    parser.add_argument('--resume_from', '--resume-from', help="Etape à partir de laquelle reprendre le traitement, à partir du checkpoint de l'étape précédente", default=None, choices=SamonGouttiere.ETAPES + ["pipeline_groupes", "traitement_par_lots"])
+    parser.add_argument('--cache', help="Répertoire du cache des hauteurs estimées, réutilisées si les données d'un groupe de bâtiments n'ont pas changé (par défaut : output/cache)", default=None)
+    parser.add_argument('--pipeline', help="Chaque groupe de bâtiments enchaîne les étapes sans attendre les autres groupes", action="store_true")
+    parser.add_argument('--streaming', help="Traite les groupes de pâtés de maisons par lots pour limiter la mémoire", action="store_true")
+    parser.add_argument('--taille_lot', help="Nombre de groupes de pâtés de maisons par lot en mode streaming", default=1000, type=int)
+    parser.add_argument('--memoire_max', help="En mode streaming, mémoire (en Go) au-delà de laquelle les lots en attente sont écrits sur disque", default=None, type=float)
+    parser.add_argument('--dry_run', '--dry-run', help="N'exécute pas le traitement : estime le nombre de bâtiments, la taille des groupes, la durée et la mémoire de chaque étape", action="store_true")
+    parser.add_argument('--calibration', help="Rapports de performances (ou répertoires qui en contiennent) de traitements précédents, pour calibrer l'estimation de --dry_run", nargs="+", default=None)
+    parser.add_argument('--executeur', help="Exécuteur des tâches parallèles : processus (workers), threads, serie (sans parallélisation) ou distribue (workers de plusieurs noeuds)", default="processus", choices=["processus", "threads", "serie", "distribue"])
+    parser.add_argument('--executeur_etape', help="Exécuteur d'une étape, qui remplace --executeur pour cette étape, par exemple lisser_geometries=threads fermer_batiment=serie", nargs="+", default=[])
+    parser.add_argument('--adresse', help="Adresse (hôte:port) de la file des tâches de l'exécuteur distribue, à donner aux noeuds lancés avec python -m v2.executeur", default=None)
+    parser.add_argument('--preset', help="Préréglage vitesse / précision : draft (rapide), standard ou precise (lent). Enregistré dans output/preset.json", default="standard", choices=["draft", "standard", "precise"])
+    parser.add_argument('--budget_tache', help="Budget de temps (en secondes) de l'estimation de la hauteur d'un groupe de bâtiments. Au-delà, on passe à une méthode moins coûteuse, et les groupes sans hauteur sont enregistrés dans output/groupes_differes.json", default=None, type=float)
+    parser.add_argument('--profilage', help="Profile le traitement par échantillonnage (processus principal et workers) et écrit output/profilage.folded", action="store_true")
     args = parser.parse_args()
 
-    samonGouttiere =  SamonGouttiere(args.input, args.output, args.emprise, args.pompei, args.nb_cpus)
-    samonGouttiere.run()
\ No newline at end of file
+    executeurs_etapes = {}
+    for executeur_etape in args.executeur_etape:
+        if "=" not in executeur_etape:
+            parser.error(f"--executeur_etape : {executeur_etape} n'est pas de la forme etape=executeur")
+        etape, executeur = executeur_etape.split("=", 1)
+        executeurs_etapes[etape] = executeur
+
+    samonGouttiere =  SamonGouttiere(args.input, args.output, args.emprise, args.pompei, args.nb_cpus, path_cache=args.cache, pipeline=args.pipeline, streaming=args.streaming, taille_lot=args.taille_lot, memoire_max=args.memoire_max, profilage=args.profilage, executeur=args.executeur, executeurs_etapes=executeurs_etapes, adresse=args.adresse, preset=args.preset, budget_tache=args.budget_tache)
+    if args.dry_run:
+        samonGouttiere.estimer_cout(args.calibration)
+    else:
+        samonGouttiere.run(resume_from=args.resume_from)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import argparse
+import os
+import geopandas as gpd
+from v2.tuilage import decouper_emprise, ecrire_tuiles, ecrire_script_slurm, lire_parametres, get_repertoire_tuile, fusionner
+
+
+def decouper(path_chantier:str, path_output:str, path_emprise:str, taille:float, halo:float, pompei:bool, nb_cpus:int, pvas_dir:str):
+    """
+    Découpe l'emprise du chantier en tuiles et prépare le script SLURM pour les traiter
+    """
+    emprise = gpd.read_file(path_emprise).geometry
+    tuiles = decouper_emprise(emprise, taille, halo)
+    parametres = {
+        "input":os.path.abspath(path_chantier),
+        "pompei":pompei,
+        "nb_cpus":nb_cpus,
+        "pvas_dir":os.path.abspath(pvas_dir) if pvas_dir is not None else None,
+        "taille":taille,
+        "halo":halo
+    }
+    ecrire_tuiles(path_output, tuiles, parametres)
+    path_slurm = ecrire_script_slurm(path_output, tuiles.shape[0], nb_cpus, __file__)
+    print(f"{tuiles.shape[0]} tuiles créées dans {os.path.join(path_output, 'tuiles')}")
+    print(f"Script SLURM : {path_slurm}")
+
+
+def executer(path_output:str, indice:int=None, resume_from:str=None):
+    """
+    Traite une tuile, ou toutes les tuiles les unes après les autres si indice est None
+    """
+    # Import ici : v2.samon_gouttiere fixe la méthode de démarrage des processus, et les workers n'ont pas à importer tout le traitement
+    from v2.samon_gouttiere import SamonGouttiere
+
+    parametres = lire_parametres(path_output)
+    if indice is None:
+        indices = list(range(parametres["nb_tuiles"]))
+    else:
+        indices = [indice]
+
+    for i in indices:
+        print(f"Traitement de la tuile {i}")
+        repertoire = get_repertoire_tuile(path_output, i)
+        samonGouttiere = SamonGouttiere(parametres["input"], repertoire, os.path.join(repertoire, "emprise.gpkg"), parametres["pompei"], parametres["nb_cpus"], pvas_dir=parametres["pvas_dir"], repertoire_mnt=os.path.join(repertoire, "data"))
+        samonGouttiere.run(resume_from=resume_from)
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Traitement d'un chantier par tuiles")
+    subparsers = parser.add_subparsers(dest="commande", required=True)
+
+    parser_decouper = subparsers.add_parser("decouper", help="Découpe l'emprise en tuiles avec un halo")
+    parser_decouper.add_argument('--input', help='Répertoire où se trouve le chantier')
+    parser_decouper.add_argument('--output', help='Répertoire où enregistrer les résultats')
+    parser_decouper.add_argument('--emprise', help='Emprise au sol des zones où il faut reconstruire les bâtiments')
+    parser_decouper.add_argument('--taille', help='Côté des tuiles en mètres', default=2000, type=float)
+    parser_decouper.add_argument('--halo', help="Largeur en mètres du halo autour de chaque tuile. Il doit être plus grand que les plus grands bâtiments", default=100, type=float)
+    parser_decouper.add_argument('--pompei', help='True si le chantier a été produit avec Pompei', default=False, type=bool)
+    parser_decouper.add_argument('--nb_cpus', help='Nombre de cpus par tuile', default=4, type=int)
+    parser_decouper.add_argument('--pvas_dir', help='Répertoire des images, si différent de input/pvas', default=None)
+
+    parser_executer = subparsers.add_parser("executer", help="Traite une tuile (ou toutes, l'une après l'autre)")
+    parser_executer.add_argument('--output', help='Répertoire où enregistrer les résultats')
+    parser_executer.add_argument('--indice', help="Indice de la tuile à traiter. Si absent, toutes les tuiles sont traitées", default=None, type=int)
+    parser_executer.add_argument('--resume_from', '--resume-from', help="Etape à partir de laquelle reprendre le traitement", default=None)
+
+    parser_fusionner = subparsers.add_parser("fusionner", help="Fusionne les résultats des tuiles")
+    parser_fusionner.add_argument('--output', help='Répertoire où enregistrer les résultats')
+
+    args = parser.parse_args()
+
+    if args.commande == "decouper":
+        decouper(args.input, args.output, args.emprise, args.taille, args.halo, args.pompei, args.nb_cpus, args.pvas_dir)
+    elif args.commande == "executer":
+        executer(args.output, args.indice, args.resume_from)
+    elif args.commande == "fusionner":
+        fusionner(args.output)
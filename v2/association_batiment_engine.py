@@ -3,10 +3,15 @@ from tqdm import tqdm
 import geopandas as gpd
 from v2.groupe_batiments import GroupeBatiments
 from v2.groupe_pate_maisons import GroupePatesMaisons
-from v2.batiment import Batiment
 from v2.shot import MNT, RAF, Shot
-from v2.parallelisation import compute_ground_geometrie, compute_estim_z, compute_batiment_association
-import multiprocessing
+from v2.parallelisation import compute_ground_geometrie, compute_estim_z, compute_batiment_association, map_pool
+from v2.rapport_performances import get_rapport
+from v2.empreintes import CacheEstimationZ
+from v2.identifiants import reserver
+from v2.composantes import composantes_objets
+from v2.index_spatial import IndexSpatial
+from v2.executeur import Executeur
+from v2 import contexte
 
 class AssociationBatimentEngine:
 
@@ -14,7 +19,7 @@ class AssociationBatimentEngine:
     Algorithme pour associer les bâtiments entre eux
     """
 
-    def __init__(self, groupes_pates_maisons:List[GroupePatesMaisons], emprise:gpd.GeoDataFrame, pompei:bool, nb_cpus:int, pva_path:str, mnt:MNT, raf:RAF, shots:List[Shot]):
+    def __init__(self, groupes_pates_maisons:List[GroupePatesMaisons], emprise:gpd.GeoDataFrame, pompei:bool, nb_cpus:int, pva_path:str, mnt:MNT, raf:RAF, shots:List[Shot], pool:Executeur, cache_z:CacheEstimationZ=None):
         self.groupes_pates_maisons:List[GroupePatesMaisons] = groupes_pates_maisons
 
         self.groupe_batiments:List[GroupeBatiments] = None
@@ -30,59 +35,40 @@ class AssociationBatimentEngine:
         self.raf = raf
         self.shots = shots
 
+        self.pool = pool
+        # Les groupes de bâtiments ne contiennent que l'indice du chantier : le contexte doit être initialisé, ce que fait la création du pool
+        self.indice_chantier = contexte.enregistrer_chantier(pva_path, shots)
+        self.cache_z = cache_z
+        self.index:IndexSpatial = None
 
 
-    def run(self)->List[GroupeBatiments]:
+    def run(self, estimer_z:bool=True)->List[GroupeBatiments]:
+        """
+        Associe les bâtiments entre eux. Si estimer_z est False, la hauteur des groupes de bâtiments sera estimée plus tard (voir SamonGouttiere.pipeline_groupes)
+        """
 
-        cs = int(len(self.groupes_pates_maisons)/(10*self.nb_cpus)+1)
-            
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-            pool.imap_unordered(compute_ground_geometrie, self.groupes_pates_maisons, chunksize=cs), 
-            total=len(self.groupes_pates_maisons),
-            desc="Calcul des géométries terrain"
-        ))
-        self.groupes_pates_maisons = results
+        self.groupes_pates_maisons = map_pool(self.pool, compute_ground_geometrie, self.groupes_pates_maisons, self.nb_cpus, "Calcul des géométries terrain")
 
         if self.emprise is not None:
             print("On ne conserve que les bâtiments à l'intérieur de l'emprise")
             for gpm in tqdm(self.groupes_pates_maisons):
                 gpm.check_in_emprise(self.emprise)
 
-        
-        # Pour chaque prédictions du FFL, on crée des tableaux numpy qui permettront d'accélérer le calcul pour associer des bâtiments
-        for gpm in tqdm(self.groupes_pates_maisons, desc="Calcul des géoséries"):
-            gpm.create_geodataframe()
+
+        # Index spatial des bâtiments de tous les groupes de pâtés de maisons, interrogé en une seule fois pour l'association
+        self.index = IndexSpatial.depuis_batiments(self.groupes_pates_maisons)
 
         # Pour chaque bâtiment, on cherche sur les autres prédictions le bâtiment avec lequel il se superpose le plus
+        # Les homologues d'un bâtiment sont dans le même groupe de pâtés de maisons : ils reviennent du worker avec lui
         self.association()
 
-        batiments = [None for i in range(Batiment.identifiant_global+1)]
-        for gpm in self.groupes_pates_maisons:
-            for pm in gpm.pates_maisons:
-                for batiment in pm.batiments:
-                    if batiments[batiment.identifiant] is None:
-                        batiments[batiment.identifiant] = batiment
-                    else:
-                        batiment0 = batiments[batiment.identifiant]
-                        for homologue_id in batiment.get_homologues():
-                            if homologue_id not in batiment0.get_homologues():
-                                batiment0.add_homologue(homologue_id)
-        
-        for batiment in batiments:
-            if batiment is None:
-                continue
-            new_homologues = []
-            for homologue_id in batiment.get_homologues():
-                new_homologues.append(batiments[homologue_id])
-            batiment.batiments_homologues = new_homologues
-
         # On crée le graphe connexe qui regroupe tous les bâtiments qui ont été associés
         self.groupe_batiments = self.graphe_connexe()
 
-        print("Calcul du z moyen du bâtiment")
-        # On calcule une estimation de la hauteur du bâtiment
-        self.compute_z_mean()
+        if estimer_z:
+            print("Calcul du z moyen du bâtiment")
+            # On calcule une estimation de la hauteur du bâtiment
+            self.compute_z_mean()
 
         for gb in self.groupe_batiments:
             for batiment in gb.batiments:
@@ -99,14 +85,14 @@ class AssociationBatimentEngine:
 
 
     def association(self):
-        cs = int(len(self.groupes_pates_maisons)/(10*self.nb_cpus)+1)
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-            pool.imap_unordered(compute_batiment_association, self.groupes_pates_maisons, chunksize=cs), 
-            total=len(self.groupes_pates_maisons),
-            desc="Calcul des associations de batiments"
-        ))        
-        self.groupes_pates_maisons = results
+        """
+        Les paires de bâtiments candidates (d'un même groupe de pâtés de maisons et dont les géométries terrain s'intersectent) sont obtenues en une seule requête sur l'index.
+        Chaque groupe reçoit les siennes, et les workers calculent les aires communes et choisissent les homologues (voir GroupePatesMaisons.association)
+        """
+        candidats = self.index.candidats_par_groupe(*self.index.paires("intersects"), len(self.groupes_pates_maisons))
+        for gpm, candidats_gpm in zip(self.groupes_pates_maisons, candidats):
+            gpm.candidats = candidats_gpm
+        self.groupes_pates_maisons = map_pool(self.pool, compute_batiment_association, self.groupes_pates_maisons, self.nb_cpus, "Calcul des associations de batiments")
 
 
     def graphe_connexe(self)->List[GroupeBatiments]:
@@ -114,25 +100,18 @@ class AssociationBatimentEngine:
         On réunit tous les bâtiments qui représentent un même bâtiment dans la réalité
         """
         groupe_batiments = []
+        batiments = []
+        # Pâté de maisons de chaque bâtiment : le groupe prend le MNT du pâté de son premier bâtiment
+        pates_maisons = {}
         for gpm in self.groupes_pates_maisons:
             for pm in gpm.pates_maisons:
                 for bati in pm.batiments:
-                    if not bati._marque:
-                        batis = [bati]
-                        liste = [bati]
-                        bati._marque = True
-
-                        while len(liste) > 0:
-                            b = liste.pop()
-                            for homologue in b.get_homologues():
-                                if not homologue._marque:
-                                    homologue._marque = True
-                                    if homologue not in liste:
-                                        batis.append(homologue)
-                                        liste.append(homologue)
-
-                        if len(batis)>1:
-                            groupe_batiments.append(GroupeBatiments(batis, self.pva_path, pm.mnt, self.raf, self.shots, self.pompei))
+                    batiments.append(bati)
+                    pates_maisons[id(bati)] = pm
+
+        for batis in composantes_objets(batiments, lambda b: b.get_homologues(), "_marque"):
+            if len(batis)>1:
+                groupe_batiments.append(GroupeBatiments(batis, self.indice_chantier, pates_maisons[id(batis[0])].mnt, self.pompei, reserver(GroupeBatiments, 1)))
         
         return groupe_batiments
     
@@ -145,17 +124,20 @@ class AssociationBatimentEngine:
         On calcule le z moyen de chaque groupe de bâtiment, et on met à jour la projection au sol des bâtiments
         """
 
-        cs = int(len(self.groupe_batiments)/(self.nb_cpus)+1)
-            
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-            pool.imap_unordered(compute_estim_z, self.groupe_batiments, chunksize=cs), 
-            total=len(self.groupe_batiments),
-            desc="Estimation des hauteurs de bâtiment"
-        ))
+        self.preparer_estimation_z()
+        self.groupe_batiments = map_pool(self.pool, compute_estim_z, self.groupe_batiments, self.nb_cpus, "Estimation des hauteurs de bâtiment")
+        self.bilan_estimation_z()
 
-        self.groupe_batiments = results
 
+    def preparer_estimation_z(self):
+        if self.cache_z is not None:
+            self.cache_z.calculer_empreintes_entrees(self.groupe_batiments, self.shots)
+
+
+    def bilan_estimation_z(self):
+        """
+        Statistiques sur les méthodes d'estimation de la hauteur et mise à jour du cache
+        """
         statistiques = {
             "Barycentre":0,
             "Points":0,
@@ -163,10 +145,42 @@ class AssociationBatimentEngine:
             "Echec":0
         }
 
+        durees = {}
+        nb_tentatives = {}
+        # Nombre de groupes dont le budget de temps a été dépassé, par méthode interrompue
+        budgets_depasses = {}
+        nb_differes = 0
         for groupe in tqdm(self.groupe_batiments):
             statistiques[groupe.get_methode_estimation_hauteur()] += 1
+            for methode, duree in groupe.durees_estimation_z.items():
+                durees[methode] = durees.get(methode, 0) + duree
+                nb_tentatives[methode] = nb_tentatives.get(methode, 0) + 1
+            for methode in groupe.budget_depasse:
+                budgets_depasses[methode] = budgets_depasses.get(methode, 0) + 1
+            if groupe.differe:
+                nb_differes += 1
+
+        if self.cache_z is not None:
+            nb_reutilisees = len([groupe for groupe in self.groupe_batiments if groupe.estimation_z_reutilisee])
+            print(f"Hauteurs réutilisées depuis le cache : {nb_reutilisees} / {len(self.groupe_batiments)}")
+            self.cache_z.mettre_a_jour(self.groupe_batiments)
+            self.cache_z.sauvegarder()
+
+        rapport = get_rapport()
+        if rapport is not None:
+            for methode in durees.keys():
+                rapport.ajouter(f"compute_z {methode}", durees[methode], nb_tentatives[methode])
+            for methode, nombre in budgets_depasses.items():
+                rapport.ajouter(f"budget dépassé {methode}", 0, nombre)
+            if nb_differes > 0:
+                rapport.ajouter("groupes différés", 0, nb_differes)
             
         print("Méthode utilisée pour estimer la hauteur des bâtiments")
         for key, value in statistiques.items():
             print(f"{key} : {value}")
+        if len(budgets_depasses) > 0:
+            print("Budget de temps dépassé, par méthode interrompue")
+            for key, value in budgets_depasses.items():
+                print(f"{key} : {value}")
+            print(f"Groupes différés : {nb_differes}")
 
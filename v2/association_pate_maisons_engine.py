@@ -1,11 +1,15 @@
-from typing import List
+from typing import List, Dict
 from v2.prediction import Prediction
 from tqdm import tqdm
+import numpy as np
 import geopandas as gpd
 from v2.groupe_pate_maisons import GroupePatesMaisons
-from v2.parallelisation import compute_pate_maison_ground_geometrie
+from v2.parallelisation import compute_pate_maison_ground_geometrie, map_pool
 from v2.pateMaison import PateMaison
-import multiprocessing
+from v2.identifiants import reserver
+from v2.composantes import composantes_objets
+from v2.index_spatial import IndexSpatial
+from v2.executeur import Executeur
 
 class AssociationPateMaisonEngine:
 
@@ -13,42 +17,35 @@ class AssociationPateMaisonEngine:
     Algorithme pour associer les bâtiments entre eux
     """
 
-    def __init__(self, predictions:List[Prediction], emprise:gpd.GeoDataFrame, nb_cpus:int):
+    def __init__(self, predictions:List[Prediction], emprise:gpd.GeoDataFrame, nb_cpus:int, pool:Executeur):
         self.predictions:List[Prediction] = predictions
         self.groupe_pates_maisons:List[GroupePatesMaisons] = None
         self.emprise = emprise
         self.nb_cpus = nb_cpus
+        self.pool = pool
+        self.index:IndexSpatial = None
 
 
 
 
     def run(self)->List[GroupePatesMaisons]:
 
-        cs = int(len(self.predictions)/(10*self.nb_cpus)+1)
-            
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-            pool.imap_unordered(compute_pate_maison_ground_geometrie, self.predictions, chunksize=cs), 
-            total=len(self.predictions),
-            desc="Calcul des géométries terrain"
-        ))        
-        self.predictions = results
+        self.predictions = map_pool(self.pool, compute_pate_maison_ground_geometrie, self.predictions, self.nb_cpus, "Calcul des géométries terrain")
 
         if self.emprise is not None:
             for prediction in tqdm(self.predictions, desc="Filtrage des pâtés de maisons par emprise terrain"):
                 prediction.check_in_emprise_pate_maisons(self.emprise)
 
-        
-        # Pour chaque prédictions du FFL, on crée des tableaux numpy qui permettront d'accélérer le calcul pour associer des bâtiments
-        for prediction in tqdm(self.predictions, desc="Calcul des géoséries"):
-            prediction.create_geodataframe_pates_maisons()
+
+        # Index spatial des pâtés de maisons de toutes les prédictions, interrogé en une seule fois pour l'association
+        self.index = IndexSpatial.depuis_pates_maisons(self.predictions)
 
         # Pour chaque bâtiment, on cherche sur les autres prédictions le bâtiment avec lequel il se superpose le plus
         self.association()
-        pms = [None for i in range(PateMaison.identifiant_global+1)]
+        pms:Dict[int, PateMaison] = {}
         for prediction in self.predictions:
             for pm in prediction.pates_maisons:
-                if pms[pm.identifiant] is None:
+                if pm.identifiant not in pms:
                     pms[pm.identifiant] = pm
                 else:
                     pm0 = pms[pm.identifiant]
@@ -56,9 +53,7 @@ class AssociationPateMaisonEngine:
                         if homologue_id not in pm0.get_homologues():
                             pm0.add_homologue(homologue_id)
         
-        for pm in pms:
-            if pm is None:
-                continue
+        for pm in pms.values():
             new_homologues = []
             for homologue_id in pm.get_homologues():
                 new_homologues.append(pms[homologue_id])
@@ -90,13 +85,27 @@ class AssociationPateMaisonEngine:
 
 
     def association(self):
+        """
+        Pour chaque pâté de maisons et chaque autre prédiction dont le cliché recouvre le sien, on garde le pâté de maisons avec lequel il partage la plus grande aire.
 
-        for p1 in tqdm(self.predictions, desc="Appariement des pâtés de maisons"):
-            for p2 in self.predictions:
-                if p1==p2:
-                    continue
-                if p1.shot.emprise.intersects(p2.shot.emprise):
-                    p1.association_pates_maisons(p2)
+        Les candidats sont les paires de pâtés de maisons de clichés différents dont les géométries terrain s'intersectent, obtenues en une seule requête sur l'index.
+        Les homologues sont ajoutés dans le même ordre que le parcours par paire de prédictions (voir Prediction.association_pates_maisons)
+        """
+        a, b = self.index.paires("intersects", images_differentes=True)
+
+        # On ne garde que les paires de prédictions dont les emprises des clichés s'intersectent
+        paires_predictions = np.unique(np.stack((self.index.source[a], self.index.source[b]), axis=1), axis=0)
+        emprises = np.zeros((len(self.predictions), len(self.predictions)), dtype=bool)
+        for i, j in paires_predictions:
+            emprises[i, j] = self.predictions[i].shot.emprise.intersects(self.predictions[j].shot.emprise)
+        garder = emprises[self.index.source[a], self.index.source[b]]
+        a, b = self.index.associer(a[garder], b[garder])
+
+        for i, j in tqdm(zip(a, b), total=a.shape[0], desc="Appariement des pâtés de maisons"):
+            pm_1 = self.predictions[self.index.source[i]].get_pate_maison_i(self.index.indice[i])
+            pm_2 = self.predictions[self.index.source[j]].get_pate_maison_i(self.index.indice[j])
+            pm_1.add_homologue(pm_2.identifiant)
+            pm_2.add_homologue(pm_1.identifiant)
 
 
     def graphe_connexe(self)->List[GroupePatesMaisons]:
@@ -104,23 +113,9 @@ class AssociationPateMaisonEngine:
         On réunit tous les bâtiments qui représentent un même bâtiment dans la réalité
         """
         groupe_pates_maisons = []
-        for prediction in self.predictions:
-            for pm in prediction.get_pates_maisons():
-                if not pm._marque:
-                    pms = [pm]
-                    liste = [pm]
-                    pm._marque = True
-
-                    while len(liste) > 0:
-                        b = liste.pop()
-                        for homologue in b.get_homologues():
-                            if not homologue._marque:
-                                homologue._marque = True
-                                if homologue not in liste:
-                                    pms.append(homologue)
-                                    liste.append(homologue)
-
-                    groupe_pates_maisons.append(GroupePatesMaisons(pms))
+        pates_maisons = [pm for prediction in self.predictions for pm in prediction.get_pates_maisons()]
+        for pms in composantes_objets(pates_maisons, lambda pm: pm.get_homologues(), "_marque"):
+            groupe_pates_maisons.append(GroupePatesMaisons(pms, reserver(GroupePatesMaisons, 1)))
         
         return groupe_pates_maisons
 
@@ -1,14 +1,14 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from v2.groupe_batiments import GroupeBatiments
 from v2.batiment import Batiment
-from tqdm import tqdm
 import numpy as np
 from v2.segments import Segment
 import statistics
 from v2.groupe_segments import GroupeSegments
 from shapely import Point
-from v2.parallelisation import create_segments
-import multiprocessing
+from v2.parallelisation import create_segments, map_pool
+from v2.executeur import Executeur
+from v2.composantes import composantes_objets
 
 
 def association_parallele(groupe_batiment:GroupeBatiments):
@@ -16,32 +16,41 @@ def association_parallele(groupe_batiment:GroupeBatiments):
     groupes_segments = []
     # Il faut au moins deux bâtiments dans le groupe de bâtiments
     if len(batiments) >= 2:
-        # on parcourt les paires de bâtiments
-        for i in range(len(batiments)):
+        # on parcourt les paires de bâtiments issus d'images différentes dont les emprises se recouvrent (voir TableBatiments.paires_candidates)
+        for i, j in groupe_batiment.table_batiments.paires_candidates():
             bati_1 = batiments[i]
-            for j in range(i+1, len(batiments)):
-                bati_2 = batiments[j]
-                # Il faut que la projection au sol des deux bâtiments se recouvre suffisamment (IoU > 0.5)
-                if bati_1.get_image()!=bati_2.get_image() and bati_1.compute_iou(bati_2)>0.5:
-                    
-                    # On effectue un premier appariement grossier
-                    AssociationSegmentsEngine.premier_appariement(bati_1, bati_2)
-                    AssociationSegmentsEngine.premier_appariement(bati_2, bati_1)
-                    # On recherche les composantes connexes
-                    composantes_connexes = AssociationSegmentsEngine.composante_connexe(bati_1)
-                    # On calcule la translation médiane entre les deux bâtiments
-                    dx, dy = AssociationSegmentsEngine.calculer_translation(composantes_connexes)
-                    AssociationSegmentsEngine.demarque_goutieres(bati_1)
-                    AssociationSegmentsEngine.demarque_goutieres(bati_2)
-                    # On effectue un deuxième appariement plus fin, en tenant compte de la translation
-                    AssociationSegmentsEngine.deuxieme_appariement(bati_1, bati_2, dx, dy)
-                    AssociationSegmentsEngine.deuxieme_appariement(bati_2, bati_1, dx, dy)
-                    AssociationSegmentsEngine.demarque_goutieres(bati_1)
-                    AssociationSegmentsEngine.demarque_goutieres(bati_2)
+            bati_2 = batiments[j]
+            # Il faut que la projection au sol des deux bâtiments se recouvre suffisamment (IoU > 0.5)
+            if bati_1.compute_iou(bati_2)>0.5:
+                
+                # On effectue un premier appariement grossier
+                AssociationSegmentsEngine.premier_appariement(bati_1, bati_2)
+                AssociationSegmentsEngine.premier_appariement(bati_2, bati_1)
+                # On recherche les composantes connexes
+                composantes_connexes = AssociationSegmentsEngine.composante_connexe(bati_1)
+                # On calcule la translation médiane entre les deux bâtiments
+                dx, dy = AssociationSegmentsEngine.calculer_translation(composantes_connexes)
+                AssociationSegmentsEngine.demarque_goutieres(bati_1)
+                AssociationSegmentsEngine.demarque_goutieres(bati_2)
+                # On effectue un deuxième appariement plus fin, en tenant compte de la translation
+                AssociationSegmentsEngine.deuxieme_appariement(bati_1, bati_2, dx, dy)
+                AssociationSegmentsEngine.deuxieme_appariement(bati_2, bati_1, dx, dy)
+                AssociationSegmentsEngine.demarque_goutieres(bati_1)
+                AssociationSegmentsEngine.demarque_goutieres(bati_2)
         # On récupère les composantes connexes pour tous les segments du groupe
         groupes_segments = AssociationSegmentsEngine.composante_connexe_bati(groupe_batiment)
     return groupes_segments
 
+
+def association_segments_groupe(groupe_batiment:GroupeBatiments)->GroupeBatiments:
+    """
+    Association des segments d'un groupe de bâtiments. Les groupes de segments sont renvoyés avec le groupe de bâtiments
+    pour que les segments restent les mêmes objets dans les bâtiments et dans les groupes de segments
+    """
+    groupe_batiment.groupes_segments = association_parallele(groupe_batiment)
+    groupe_batiment.update_table_segments()
+    return groupe_batiment
+
     
 
 class AssociationSegmentsEngine:
@@ -50,24 +59,19 @@ class AssociationSegmentsEngine:
     seuil_distance_droite_1:float = 1.5
     seuil_distance_droite_2:float = 1
 
-    def __init__(self, groupes_batiments:List[GroupeBatiments], nb_cpus:int):
+    def __init__(self, groupes_batiments:List[GroupeBatiments], nb_cpus:int, pool:Executeur):
         self.groupes_batiments:List[GroupeBatiments] = groupes_batiments
         self.groupes_segments:List[GroupeSegments] = []
         self.nb_cpus = nb_cpus
+        self.pool = pool
 
 
     def run(self):
         # pour chaque bâtiment, on crée un objet Segment pour chaque côté du polygone
+        for groupe_batiment in self.groupes_batiments:
+            groupe_batiment.reserver_identifiants_segments()
 
-        cs = int(len(self.groupes_batiments)/(10*self.nb_cpus)+1)
-            
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-            pool.imap_unordered(create_segments, self.groupes_batiments, chunksize=cs), 
-            total=len(self.groupes_batiments),
-            desc="Création des segments pour chaque batiment"
-        ))
-        self.groupes_batiments = results
+        self.groupes_batiments = map_pool(self.pool, create_segments, self.groupes_batiments, self.nb_cpus, "Création des segments pour chaque batiment")
 
         self.association()
         return self.groupes_segments, self.groupes_batiments
@@ -78,102 +82,48 @@ class AssociationSegmentsEngine:
         Effectue l'association entre les segments appartenant à un même groupe de bâtiments
         """
 
-        cs = int(len(self.groupes_batiments)/(10*self.nb_cpus)+1)
-            
-        with multiprocessing.Pool(processes=self.nb_cpus) as pool:
-            results = list(tqdm(
-                pool.imap_unordered(association_parallele, self.groupes_batiments, chunksize=cs), 
-                total=len(self.groupes_batiments),
-                desc="Association des segments"
-            ))
+        # Les groupes de segments sont renvoyés avec leur groupe de bâtiments : les segments des bâtiments et des groupes de segments restent les mêmes objets
+        self.groupes_batiments = map_pool(self.pool, association_segments_groupe, self.groupes_batiments, self.nb_cpus, "Association des segments")
         groupes_segments = []
-        for r in results:
-            groupes_segments += r
+        for groupe_batiment in self.groupes_batiments:
+            groupes_segments += groupe_batiment.groupes_segments
         self.groupes_segments = groupes_segments
 
-        dict_groupe_segments = [[] for i in range(GroupeBatiments.identifiant_global)]
-        for groupe_segments in self.groupes_segments:
-            dict_groupe_segments[groupe_segments.id_groupe_batiment].append(groupe_segments)
+    @staticmethod
+    def appariement(b1:Batiment, b2:Batiment, seuil_distance_droite:float)->List[Tuple[Segment, Segment]]:
+        """
+        Renvoie les couples (segment de b1, segment homologue de b2), calculés sur les tranches des deux bâtiments dans la table des segments.
+        Les colonnes de b2 sont utilisées telles qu'elles ont été calculées par le dernier appel à create_numpy_array
+        """
+        table = b1.table_segments
+        indices = table.apparier(b1.get_tranche_segments(), b2.get_tranche_segments(), AssociationSegmentsEngine.seuil_ps, seuil_distance_droite)
+        couples = []
+        for segment, indice in zip(b1.get_segments(), indices):
+            if indice >= 0:
+                couples.append((segment, b2.get_segment_i(indice)))
+        return couples
 
-        
-        print("On reconstruit les associations cassées par la parallélisation")
-        for groupe_batiment in tqdm(self.groupes_batiments):
-            for groupe_segments in dict_groupe_segments[groupe_batiment.get_identifiant()]:
-                for batiment in groupe_batiment.batiments:
-                    for segment_gr in groupe_segments.segments:
-                        for i, segment_bat in enumerate(batiment.segments):
-                            if segment_gr.identifiant==segment_bat.identifiant:
-                                batiment.segments[i] = segment_gr
 
     @staticmethod
     def premier_appariement(b1:Batiment, b2:Batiment):
         """
         Premier appariement grossier
         """
-        for segment in b1.get_segments():
-            u1 = segment.u_directeur_world().reshape((1, 2))
-            barycentre_1 = segment.barycentre_world().reshape((1, 2))
-            
-            # On calcule le produit scalaire
-            u = b2.u
-            ps = np.abs(np.sum(u1* u, axis=1))
-
-            # On calcule la distance du barycentre à la droite
-            equation_droite = b2.equation_droite
-            d_droite = np.abs(equation_droite[:,0]*barycentre_1[0,0] + equation_droite[:,1]*barycentre_1[0,1] + equation_droite[:,2]) / equation_droite[:,3]
-
-            # Calcule de la distance entre les deux barycentres 
-            barycentre = b2.barycentre
-            d_max = b2.d_max
-            distance = np.sqrt(np.sum((barycentre - barycentre_1)**2, axis=1))
-
-            condition = np.where(np.logical_and(np.logical_and(ps > AssociationSegmentsEngine.seuil_ps, d_droite <AssociationSegmentsEngine.seuil_distance_droite_1), distance < d_max))
-                    
-            if condition[0].shape[0] != 0:
-
-                # Parmi les goutières qui restent, on prend celle pour laquelle la distance entre les deux barycentres est la plus petite
-                barycentre_filtre_ps = barycentre[condition, :].squeeze()
-                distance = np.sqrt(np.sum((barycentre_filtre_ps - barycentre_1)**2, axis=1))
-                segment_homologue = b2.get_segment_i(condition[0][np.argmin(distance)])
-
-                segment_homologue.add_homologue_1(segment)
-                segment.add_homologue_1(segment_homologue)
+        for segment, segment_homologue in AssociationSegmentsEngine.appariement(b1, b2, AssociationSegmentsEngine.seuil_distance_droite_1):
+            segment_homologue.add_homologue_1(segment)
+            segment.add_homologue_1(segment_homologue)
 
     
+    @staticmethod
     def deuxieme_appariement(b1:Batiment, b2:Batiment, dx:float, dy:float):
         """
         Deuxième appariement plus fin
         """
         b2.create_numpy_array(dx=dx, dy=dy)
         
-        for segment in b1.get_segments():
-            u1 = segment.u_directeur_world().reshape((1, 2))
-            barycentre_1 = segment.barycentre_world().reshape((1, 2))
-            
-            # On calcule le produit scalaire
-            u = b2.u
-            ps = np.abs(np.sum(u1* u, axis=1))
-
-            # On calcule la distance du barycentre à la droite
-            equation_droite = b2.equation_droite
-            d_droite = np.abs(equation_droite[:,0]*barycentre_1[0,0] + equation_droite[:,1]*barycentre_1[0,1] + equation_droite[:,2]) / equation_droite[:,3]
-
-            # Calcule de la distance entre les deux barycentres 
-            barycentre = b2.barycentre
-            d_max = b2.d_max
-            distance = np.sqrt(np.sum((barycentre - barycentre_1)**2, axis=1))
-
-            condition = np.where(np.logical_and(np.logical_and(ps > AssociationSegmentsEngine.seuil_ps, d_droite <AssociationSegmentsEngine.seuil_distance_droite_2), distance < d_max))
-                    
-            if condition[0].shape[0] != 0:
-
-                # Parmi les goutières qui restent, on prend celle pour laquelle la distance entre les deux barycentres est la plus petite
-                barycentre_filtre_ps = barycentre[condition, :].squeeze()
-                distance = np.sqrt(np.sum((barycentre_filtre_ps - barycentre_1)**2, axis=1))
-                segment_homologue = b2.get_segment_i(condition[0][np.argmin(distance)])
-
-                segment_homologue.add_homologue_2(segment)
-                segment.add_homologue_2(segment_homologue)
+        for segment, segment_homologue in AssociationSegmentsEngine.appariement(b1, b2, AssociationSegmentsEngine.seuil_distance_droite_2):
+            segment_homologue.add_homologue_2(segment)
+            segment.add_homologue_2(segment_homologue)
 
     
     @staticmethod
@@ -181,28 +131,8 @@ class AssociationSegmentsEngine:
         """
         On récupère les composantes connexes pour chaque segment sur la relation : le segment est homologue avec cet autre segment
         """
-        composantes_connexes:List[List[Segment]] = []
-        for segment in b1.get_segments():
-            if not segment._marque:
-                liste_connexe = [segment]
-                liste:List[Segment] = [segment]
-                segment._marque = True
-                while len(liste) > 0:
-                    g = liste.pop()
-
-                    
-                    l = g.segments_homologues_1
-                    for homologue in l:
-                        if not homologue._marque:
-                            homologue._marque = True
-                            if homologue not in liste:
-                                liste.append(homologue)
-                            if homologue not in liste_connexe:
-                                liste_connexe.append(homologue)
-                
-                if len(liste_connexe) >= 2:
-                    composantes_connexes.append(liste_connexe)
-        
+        composantes = composantes_objets(b1.get_segments(), lambda segment: segment.segments_homologues_1, "_marque")
+        composantes_connexes:List[List[Segment]] = [composante for composante in composantes if len(composante) >= 2]
         return composantes_connexes
     
     @staticmethod
@@ -290,23 +220,11 @@ class AssociationSegmentsEngine:
         Calcule les composantes connexes au niveau du bati
         """
         groupes_segments = []
-        for batiment in groupe_batiment.get_batiments():
-            for segment in batiment.get_segments():
-                if not segment._marque:
-                    liste_connexe = [segment]
-                    liste = [segment]
-                    segment._marque = True
-                    while len(liste) > 0:
-                        g = liste.pop()
-                        for homologue in g.segments_homologues_2:
-                            if not homologue._marque:
-                                homologue._marque = True
-                                if homologue not in liste:
-                                    liste.append(homologue)
-                                if homologue not in liste_connexe:
-                                    liste_connexe.append(homologue)
-                    
-                    if len(liste_connexe) >= 2:
-                        groupe_segments = GroupeSegments(liste_connexe)
-                        groupes_segments.append(groupe_segments)
+        identifiant = groupe_batiment.premier_identifiant_groupe_segments
+        segments = [segment for batiment in groupe_batiment.get_batiments() for segment in batiment.get_segments()]
+        for liste_connexe in composantes_objets(segments, lambda segment: segment.segments_homologues_2, "_marque"):
+            if len(liste_connexe) >= 2:
+                groupe_segments = GroupeSegments(liste_connexe, identifiant)
+                identifiant += 1
+                groupes_segments.append(groupe_segments)
         return groupes_segments
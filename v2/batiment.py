@@ -6,18 +6,19 @@ from v2.shot import Shot, MNT
 from numpy import linalg as LA
 from shapely.validation import make_valid
 from v2.segments import Segment
+from v2 import noyaux
 
 class Batiment:
 
     identifiant_global = 0
     seuil_ps = 0.99
 
-    def __init__(self, geometrie:Polygon, shot:Shot, mnt:MNT):
+    def __init__(self, geometrie:Polygon, shot:Shot, mnt:MNT, identifiant:int=None):
         self.geometrie_image:Polygon = geometrie
-        self.identifiant:int = Batiment.identifiant_global
+        # Les bâtiments sont créés dans les workers : l'identifiant est attribué ensuite par le processus principal (voir v2/identifiants.py)
+        self.identifiant:int = identifiant
         self.shot:Shot = shot
         self.mnt:MNT = mnt
-        Batiment.identifiant_global += 1
 
         self.valide:bool = True # Indique si le bâtiment est utilisable
         self.geometrie_terrain:Polygon = None # Géométrie du bâtiment projetée sur le mnt
@@ -29,12 +30,9 @@ class Batiment:
 
         self._marque = False
 
-        # tableau numpy contenant les informations relatives aux segments
-        self.array:np.ndarray = None
-        self.u:np.ndarray = None
-        self.barycentre:np.ndarray = None
-        self.equation_droite:np.ndarray = None
-        self.d_max:np.ndarray = None
+        # Table des segments du groupe de bâtiments (voir v2/tables.py) et indice du bâtiment dans cette table
+        self.table_segments = None
+        self.indice_table:int = None
 
         self.groupe_batiment_identifiant = None
         self.groupe_batiment_estim_z = None
@@ -75,72 +73,18 @@ class Batiment:
         Lisse les polygones pour qu'un segment corresponde à un côté de bâtiment (et non pas à un morceau de côté de bâtiment)
         """
 
-        # On divise le polygone en un ensemble de lignes
+        # On divise le polygone en un ensemble de segments de longueur non nulle
         x, y = self.geometrie_image.exterior.xy
-        segments:List[LineString] = []
-        for i in range(len(x)-1):
-            ls = LineString([[x[i], y[i]], [x[i+1], y[i+1]]])
-            if ls.length!=0:
-                segments.append(LineString([[x[i], y[i]], [x[i+1], y[i+1]]]))
+        segments = noyaux.segments_non_nuls(np.asarray(x), np.asarray(y))
+        if segments.shape[0] < 2:
+            self.valide = False
+            return False
 
+        # On fusionne les segments successifs dont le produit scalaire est supérieur au seuil, car ils sont presque alignés,
+        # puis le dernier segment avec le premier s'ils sont alignés (voir v2/noyaux.py)
         liste_segments_poly:List[LineString] = []
-        nb_segments = len(segments)
-        
-        s0 = segments[0]
-        x0 = s0.xy[0][0]
-        y0 = s0.xy[1][0]
-        x1 = s0.xy[0][1]
-        y1 = s0.xy[1][1]
-        
-        # On parcourt tous les segments
-        for i in range(1, nb_segments):
-            
-            # On calcule le produit scalaire entre le segment et le segment précédent
-            s1 = segments[i]
-            x2 = s1.xy[0][1]
-            y2 = s1.xy[1][1]
-            u1 = np.array([[x1-x0], [y1-y0]])
-            u1 = u1 / np.linalg.norm(u1)
-            u2 = np.array([[x2-x1], [y2-y1]])
-            u2 = u2 / np.linalg.norm(u2)
-            ps = np.sum(u1*u2)
-            
-            # Si le prduit scalaire est supérieur au seuil, alors on fusionne les deux segments car ils sont presque alignés
-            if ps > Batiment.seuil_ps:
-                x1 = x2
-                y1 = y2
-            else:
-                # Sinon, on enregistre le segment précédent
-                linestring = LineString([[x0, y0], [x1, y1]])
-                liste_segments_poly.append(linestring)
-                x0 = s1.xy[0][0]
-                y0 = s1.xy[1][0]
-                x1 = x2
-                y1 = y2
-                s0 = segments[i]
-        
-        # Si on n'a aucun segment reconstruit (est-ce possible ?)
-        if len(liste_segments_poly)==0:
-            linestring = LineString([[x0, y0], [x2, y2]])
-            liste_segments_poly.append(linestring)
-        # Sinon, on regarde si le dernier segment est aligné avec le premier segment
-        else:
-            x,y = liste_segments_poly[0].xy
-            x2 = x[1]
-            y2 = y[1]
-            u1 = np.array([[x1-x0], [y1-y0]])
-            u1 = u1 / np.linalg.norm(u1)
-            u2 = np.array([[x2-x1], [y2-y1]])
-            u2 = u2 / np.linalg.norm(u2)
-            ps = np.sum(u1*u2)
-            if ps > Batiment.seuil_ps:
-                del(liste_segments_poly[0])
-                linestring = LineString([[x0, y0], [x2, y2]])
-                liste_segments_poly.append(linestring)
-            else:
-                linestring = LineString([[x0, y0], [x1, y1]])
-                liste_segments_poly.append(linestring)
-
+        for x0, y0, x1, y1 in noyaux.fusionner_segments(segments, Batiment.seuil_ps):
+            liste_segments_poly.append(LineString([[x0, y0], [x1, y1]]))
 
         if len(liste_segments_poly)<=3:
             self.valide = False
@@ -256,35 +200,19 @@ class Batiment:
         # Vecteur entre les deux sommets de prise de vue
         D = p2-p1
 
-        # Pour chaque couple de points
+        # Pour chaque point i, on récupère la distance minimale entre sa droite et les droites des points de b2 (voir v2/noyaux.py)
+        distances_min, j_min = noyaux.distances_droites(self.du, b2.du, D)
         for i in range(self.du.shape[1]):
             
             # Premier vecteur directeur
             v1 = self.du[:,i].squeeze()
-            
-            distance_min = 1e10
-            j_min = None
-            
-            for j in range(b2.du.shape[1]):
-                
-                # Second vecteur directeur
-                v2 = b2.du[:,j].squeeze()
-                
-                # On calcule la distance entre les deux droites
-                n = np.cross(v1, v2)
-                distance = np.abs(np.sum(n*D))/np.linalg.norm(n)
-                
-                # Pour chaque point i, on récupère la distance minimale
-                if distance < distance_min:
-                    distance_min = distance
-                    j_min = j
-                    
+            distance_min = distances_min[i]
 
             # Si la distance minimale est inférieure à 0.5 m
             if distance_min < 0.5:
                 
                 # On calcule la pseudo-intersection
-                v2 = b2.du[:,j_min].squeeze()
+                v2 = b2.du[:,j_min[i]].squeeze()
                 v1v2 = np.sum(v1*v2)
                 v1v1 = np.sum(v1*v1)
                 v2v2 = np.sum(v2*v2)
@@ -422,14 +350,22 @@ class Batiment:
         segments[-1].voisin_2 = segments[0]
 
 
-    def create_segments(self)->None:
+    def get_nb_segments(self)->int:
+        return len(self.geometrie_image.exterior.coords) - 1
+
+
+    def create_segments(self, premier_identifiant:int)->int:
+        """
+        Crée les segments du bâtiment, numérotés à partir de premier_identifiant. Renvoie le prochain identifiant libre
+        """
         x, y = self.geometrie_image.exterior.xy
         segments:List[LineString] = []
         for i in range(len(x)-1):
             linestring = LineString([[x[i], y[i]], [x[i+1], y[i+1]]])
-            segments.append(Segment(linestring, self.mnt, self.shot, self))
+            segments.append(Segment(linestring, self, premier_identifiant+i))
         self.segments = segments
         self.set_voisins()
+        return premier_identifiant + len(segments)
 
 
     def get_image(self)->str:
@@ -446,45 +382,46 @@ class Batiment:
         return self.segments
     
 
+    def attacher(self, table_segments, indice:int)->None:
+        """
+        Rattache le bâtiment à la table des segments de son groupe, dont il occupe la tranche indice
+        """
+        self.table_segments = table_segments
+        self.indice_table = indice
+
+
+    def get_tranche_segments(self)->slice:
+        return self.table_segments.get_tranche(self.indice_table)
+
+
     def create_numpy_array(self, dx:float=0, dy:float=0):
+        """
+        Calcule, dans la table des segments, les colonnes utilisées pour l'association : extrémités (translatées de (dx, dy)),
+        vecteur directeur normalisé, barycentre, équation de la droite et moitié de la longueur de chaque goutière
+        """
+        self.table_segments.calculer_colonnes(self.get_tranche_segments(), dx=dx, dy=dy)
 
-        nb_segments = len(self.segments)
+    # Vues sur la tranche du bâtiment dans la table des segments
 
-        
-        # Dans un premier tableau numpy, on met les coordonnées des extrémités des goutières en coordonnées du monde
-        array = np.zeros((nb_segments, 4))
-        for i, segment in enumerate(self.segments):
-            world_line = segment.world_line
-            array[i,:] = np.array([world_line[0,0]+dx, world_line[0,1]+dy, world_line[1,0]+dx, world_line[1,1]+dy])
-            
-        # On calcule le vecteur directeur normalisé des goutières (en 2d)
-        dx = (array[:,2]-array[:,0])
-        dy = (array[:,3]-array[:,1])
-        u = np.concatenate((dx.reshape((-1, 1)), dy.reshape((-1, 1))), axis=1)
-        norm = np.linalg.norm(u, axis=1)
-        u = u / np.tile(norm.reshape((-1, 1)), (1, 2))
-        
-        # On calcule le barycentre de la goutière (en 2d)
-        barycentre_x = (array[:,2]+array[:,0])/2
-        barycentre_y = (array[:,3]+array[:,1])/2
-        barycentre = np.concatenate((barycentre_x.reshape((-1, 1)), barycentre_y.reshape((-1, 1))), axis=1)
-        
-        # On calcule les paramètres de la droite de la goutière (en 2d)
-        a = dy
-        b = -dx
-        c = dx * array[:,1] - dy * array[:,0]
-        racine = np.sqrt(a**2 + b**2)
-        equation_droite = np.concatenate((a.reshape((-1, 1)), b.reshape((-1, 1)), c.reshape((-1, 1)), racine.reshape((-1, 1))), axis=1)
-        
-        # On calcule la moitié de la longueur de la goutière
-        d_max = 0.5 * np.sqrt(dx**2+dy**2)
-        
-        # On réunit tous les tableaux dans un dictionnaire
-        self.array = array
-        self.u = u
-        self.barycentre = barycentre
-        self.equation_droite = equation_droite
-        self.d_max = d_max
+    @property
+    def array(self)->np.ndarray:
+        return self.table_segments.array[self.get_tranche_segments()]
+
+    @property
+    def u(self)->np.ndarray:
+        return self.table_segments.u[self.get_tranche_segments()]
+
+    @property
+    def barycentre(self)->np.ndarray:
+        return self.table_segments.barycentre[self.get_tranche_segments()]
+
+    @property
+    def equation_droite(self)->np.ndarray:
+        return self.table_segments.equation_droite[self.get_tranche_segments()]
+
+    @property
+    def d_max(self)->np.ndarray:
+        return self.table_segments.d_max[self.get_tranche_segments()]
 
     def get_segment_i(self, i:int)->Segment:
         return self.segments[i]
@@ -0,0 +1,20 @@
+"""
+Budget de temps d'une tâche exécutée dans un worker (option --budget_tache).
+
+Une tâche qui dépasse son budget n'est pas interrompue : elle vérifie son budget entre deux calculs (par exemple entre deux paires de bâtiments
+ou deux tentatives de Samon) et passe alors à une méthode moins coûteuse. Le budget est donné en secondes de temps réel, sans budget la tâche n'est jamais limitée
+"""
+import time
+
+
+class Budget:
+
+    def __init__(self, duree_s:float=None):
+        self.duree_s = duree_s
+        self.debut = time.perf_counter()
+
+    def depasse(self)->bool:
+        return self.duree_s is not None and time.perf_counter() - self.debut > self.duree_s
+
+    def get_duree(self)->float:
+        return time.perf_counter() - self.debut
@@ -13,18 +13,7 @@ class CalculIntersectionEngine:
         incorrect = 0
         print("On calcule les intersections pour chaque groupe de segments")
         for groupe_segment in tqdm(self.groupe_segments):
-            # Pour chaque côté de bâtiment de prédictions FFL, on calcule les paramètres du plan qui passent par le sommet de prise de vue et par ce segment
-            groupe_segment.compute_equations_plans()
-            # On vérifie la configuration des sommets de prise de vue
-            groupe_segment.check_configurations()
-
-            if groupe_segment.is_valid():
-                # On calcule l'intersection des plans d'un même groupe de segments par moindres carrés. On obtient une droite
-                groupe_segment.moindres_carres()
-                # On calcule le distance moyenne entre la droite et les plans
-                groupe_segment.distance_moyenne()
-                # On vérifie que le résultat est valide (pas aberrant en altitude par exemple)
-                groupe_segment.verifier_resultat_valide()
+            CalculIntersectionEngine.calculer_intersection(groupe_segment)
             if groupe_segment.is_valid():
                 correct += 1
             else:
@@ -37,3 +26,31 @@ class CalculIntersectionEngine:
             if groupe_segment.is_valid():
                 groupe_segment.update_voisins()
 
+
+    @staticmethod
+    def calculer_intersection(groupe_segment:GroupeSegments)->None:
+        # Pour chaque côté de bâtiment de prédictions FFL, on calcule les paramètres du plan qui passent par le sommet de prise de vue et par ce segment
+        groupe_segment.compute_equations_plans()
+        # On vérifie la configuration des sommets de prise de vue
+        groupe_segment.check_configurations()
+
+        if groupe_segment.is_valid():
+            # On calcule l'intersection des plans d'un même groupe de segments par moindres carrés. On obtient une droite
+            groupe_segment.moindres_carres()
+            # On calcule le distance moyenne entre la droite et les plans
+            groupe_segment.distance_moyenne()
+            # On vérifie que le résultat est valide (pas aberrant en altitude par exemple)
+            groupe_segment.verifier_resultat_valide()
+
+
+    @staticmethod
+    def calculer_groupe_batiments(groupes_segments:List[GroupeSegments])->None:
+        """
+        Calcule les intersections des groupes de segments d'un seul groupe de bâtiments.
+        Les voisins d'un groupe de segments appartiennent au même groupe de bâtiments : on peut donc mettre à jour les voisins sans attendre les autres groupes de bâtiments
+        """
+        for groupe_segment in groupes_segments:
+            CalculIntersectionEngine.calculer_intersection(groupe_segment)
+        for groupe_segment in groupes_segments:
+            if groupe_segment.is_valid():
+                groupe_segment.update_voisins()
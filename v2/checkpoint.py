@@ -0,0 +1,158 @@
+"""
+Sauvegarde de l'état du traitement à la fin de chaque étape de SamonGouttiere.run, et des lots en attente du mode streaming.
+
+Les objets du traitement (prédictions, pâtés de maisons, bâtiments, segments et leurs groupes) se référencent les uns les autres
+(segments d'un bâtiment, voisins d'un groupe de segments...). Sérialisés directement avec pickle, ils seraient écrits en suivant ces références,
+avec une profondeur de récursion qui croît avec la longueur des chaînes d'objets.
+Ils sont donc écrits à plat : chaque objet est remplacé par une référence (numéro, classe) là où il apparaît,
+puis ses attributs sont écrits à part, objet par objet. Chaque objet n'est écrit qu'une fois, et la profondeur ne dépend plus du graphe.
+
+Les tableaux partagés (MNT, grille RAF, voir v2/memoire_partagee.py) ne sont pas copiés : seul le chemin de leur fichier .npy,
+dans le répertoire repertoire_mnt de SamonGouttiere, est enregistré. Ces fichiers doivent donc toujours exister lors de la reprise.
+Les chemins sont enregistrés à la fin du fichier et vérifiés au chargement
+"""
+import os
+import pickle
+from typing import Any, Dict, List, Set, Tuple
+from v2.memoire_partagee import TableauPartage
+from v2.prediction import Prediction
+from v2.pateMaison import PateMaison
+from v2.groupe_pate_maisons import GroupePatesMaisons
+from v2.batiment import Batiment
+from v2.segments import Segment
+from v2.groupe_batiments import GroupeBatiments
+from v2.groupe_segments import GroupeSegments
+
+
+# Classes dont les objets sont écrits à plat. On compare la classe exacte, plus rapide à tester que isinstance pour chaque objet écrit
+CLASSES_A_PLAT = frozenset([Prediction, PateMaison, GroupePatesMaisons, Batiment, Segment, GroupeBatiments, GroupeSegments])
+
+
+class PicklerAPlat(pickle.Pickler):
+
+    def __init__(self, f):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.objets:List = []
+        self.numeros:Dict[int, int] = {}
+        # Fichiers des tableaux partagés référencés par les objets écrits
+        self.tableaux:Set[str] = set()
+
+
+    def persistent_id(self, obj)->Tuple[int, type]:
+        classe = type(obj)
+        if classe in CLASSES_A_PLAT:
+            numero = self.numeros.get(id(obj))
+            if numero is None:
+                numero = len(self.objets)
+                self.numeros[id(obj)] = numero
+                self.objets.append(obj)
+            return numero, classe
+        if classe is TableauPartage:
+            self.tableaux.add(obj.path)
+        return None
+
+
+    def ecrire(self, racine:Any)->None:
+        """
+        Ecrit racine, puis les attributs des objets qu'elle référence, par lots : l'écriture d'un lot peut référencer de nouveaux objets, écrits dans le lot suivant.
+        Le mémo du pickler est conservé d'un lot à l'autre, un objet partagé (cliché, MNT...) n'est donc écrit qu'une fois
+        """
+        self.dump(racine)
+        debut = 0
+        while debut < len(self.objets):
+            fin = len(self.objets)
+            self.dump([objet.__dict__ for objet in self.objets[debut:fin]])
+            debut = fin
+        self.dump(None)
+        self.dump(sorted(self.tableaux))
+
+
+class UnpicklerAPlat(pickle.Unpickler):
+
+    def __init__(self, f):
+        super().__init__(f)
+        self.objets:Dict[int, Any] = {}
+
+
+    def persistent_load(self, pid:Tuple[int, type]):
+        numero, classe = pid
+        objet = self.objets.get(numero)
+        if objet is None:
+            # Les attributs sont lus plus tard, dans un des lots qui suivent
+            objet = classe.__new__(classe)
+            self.objets[numero] = objet
+        return objet
+
+
+    def lire(self)->Tuple[Any, List[str]]:
+        """
+        Renvoie la racine et les fichiers des tableaux partagés qu'elle référence
+        """
+        racine = self.load()
+        numero = 0
+        lot = self.load()
+        while lot is not None:
+            for attributs in lot:
+                self.objets[numero].__dict__.update(attributs)
+                numero += 1
+            lot = self.load()
+        return racine, self.load()
+
+
+def ecrire(path:str, racine:Any)->None:
+    """
+    Ecrit racine dans path. On écrit d'abord dans un fichier temporaire pour ne jamais laisser un fichier incomplet
+    """
+    path_tmp = path + ".tmp"
+    with open(path_tmp, "wb") as f:
+        PicklerAPlat(f).ecrire(racine)
+    os.replace(path_tmp, path)
+
+
+def lire(path:str)->Any:
+    """
+    Relit l'objet écrit par ecrire, après avoir vérifié que les fichiers des tableaux partagés qu'il référence existent toujours
+    """
+    with open(path, "rb") as f:
+        racine, tableaux = UnpicklerAPlat(f).lire()
+    manquants = [tableau for tableau in tableaux if not os.path.isfile(tableau)]
+    if len(manquants) > 0:
+        raise FileNotFoundError(
+            f"{path} référence des tableaux partagés (MNT, RAF) qui n'existent plus : {', '.join(manquants)}. "
+            f"Ils sont écrits dans repertoire_mnt (relatif au répertoire courant) par l'étape load : il faut relancer le traitement depuis le début"
+        )
+    return racine
+
+
+class Checkpoint:
+    """
+    Sauvegarde l'état du traitement à la fin de chaque étape de SamonGouttiere.run
+
+    L'état est écrit à plat (voir ci-dessus) : les géométries terrain déjà calculées sont conservées telles quelles,
+    il n'est donc pas nécessaire de reprojeter les polygones avec Shot.image_to_world lors de la reprise.
+    Le MNT et la grille RAF ne sont pas copiés dans le checkpoint : la reprise a besoin de leurs fichiers .npy dans repertoire_mnt
+    """
+
+    def __init__(self, path_output:str):
+        self.path = os.path.join(path_output, "checkpoints")
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_path(self, etape:str)->str:
+        return os.path.join(self.path, f"{etape}.pkl")
+
+    def existe(self, etape:str)->bool:
+        return os.path.isfile(self.get_path(etape))
+
+    def sauvegarder(self, etape:str, etat:Dict)->None:
+        """
+        Sauvegarde l'état à la fin de l'étape
+        """
+        ecrire(self.get_path(etape), etat)
+
+    def charger(self, etape:str)->Dict:
+        """
+        Charge l'état sauvegardé à la fin de l'étape
+        """
+        if not self.existe(etape):
+            raise ValueError(f"Pas de checkpoint pour l'étape {etape} dans {self.path}")
+        return lire(self.get_path(etape))
@@ -0,0 +1,82 @@
+"""
+Composantes connexes des graphes d'homologues (pâtés de maisons, bâtiments, segments, bâtiments du recalage).
+
+Les sommets sont numérotés en un seul parcours des listes d'homologues, puis les composantes sont calculées sur le graphe creux
+(scipy.sparse.csgraph.connected_components), en temps linéaire, au lieu des parcours qui testaient l'appartenance d'un sommet à une liste Python.
+
+Les composantes sont renvoyées dans l'ordre de leur premier sommet, et les sommets de chaque composante dans l'ordre où ils ont été rencontrés :
+d'abord les éléments dans l'ordre donné, puis les voisins qui n'en font pas partie, dans l'ordre du parcours.
+Le premier sommet de chaque composante est donc celui à partir duquel les anciens parcours la construisaient.
+Les relations d'homologie étant symétriques (chaque homologue est ajouté des deux côtés), les composantes sont les mêmes que celles des anciens parcours
+"""
+from typing import List, Callable, Iterable, Any, Dict
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+def composantes_connexes(nb_sommets:int, i:np.ndarray, j:np.ndarray)->List[np.ndarray]:
+    """
+    Composantes connexes du graphe dont les sommets sont numérotés de 0 à nb_sommets-1 et dont les arêtes relient i[k] et j[k].
+
+    Renvoie les numéros des sommets de chaque composante, dans l'ordre croissant, les composantes étant dans l'ordre de leur plus petit sommet
+    """
+    if nb_sommets == 0:
+        return []
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    graphe = coo_matrix((np.ones(i.shape[0], dtype=np.int8), (i, j)), shape=(nb_sommets, nb_sommets)).tocsr()
+    _, etiquettes = connected_components(graphe, directed=False)
+
+    # On renumérote les composantes dans l'ordre de leur plus petit sommet
+    _, premiers = np.unique(etiquettes, return_index=True)
+    rangs = np.empty(premiers.shape[0], dtype=np.int64)
+    rangs[np.argsort(premiers, kind="stable")] = np.arange(premiers.shape[0])
+    etiquettes = rangs[etiquettes]
+
+    ordre = np.argsort(etiquettes, kind="stable")
+    debuts = np.searchsorted(etiquettes[ordre], np.arange(premiers.shape[0] + 1))
+    return [ordre[debuts[k]:debuts[k+1]] for k in range(premiers.shape[0])]
+
+
+def composantes_objets(elements:Iterable[Any], voisins:Callable[[Any], Iterable[Any]], attribut_marque:str=None)->List[List[Any]]:
+    """
+    Composantes connexes d'un graphe d'objets : voisins(objet) renvoie les objets reliés à objet (ses homologues).
+    Les voisins qui ne font pas partie de elements sont aussi parcourus.
+
+    Si attribut_marque est donné, les objets déjà marqués sont ignorés, et tous les objets des composantes sont marqués ensuite,
+    comme le faisaient les parcours remplacés
+    """
+    def marque(objet)->bool:
+        return attribut_marque is not None and getattr(objet, attribut_marque)
+
+    # Numéro de chaque objet, par identité
+    objets:List[Any] = []
+    numeros:Dict[int, int] = {}
+    for element in elements:
+        if id(element) not in numeros and not marque(element):
+            numeros[id(element)] = len(objets)
+            objets.append(element)
+
+    aretes_i:List[int] = []
+    aretes_j:List[int] = []
+    # Les objets découverts comme voisins sont ajoutés à la fin de objets : la boucle les parcourt aussi
+    k = 0
+    while k < len(objets):
+        for voisin in voisins(objets[k]):
+            numero = numeros.get(id(voisin))
+            if numero is None:
+                if marque(voisin):
+                    continue
+                numero = len(objets)
+                numeros[id(voisin)] = numero
+                objets.append(voisin)
+            aretes_i.append(k)
+            aretes_j.append(numero)
+        k += 1
+
+    composantes = [[objets[n] for n in composante.tolist()] for composante in composantes_connexes(len(objets), aretes_i, aretes_j)]
+    if attribut_marque is not None:
+        for objet in objets:
+            setattr(objet, attribut_marque, True)
+    return composantes
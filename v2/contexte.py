@@ -0,0 +1,166 @@
+"""
+Contexte en lecture seule partagé par le processus principal et les workers du pool.
+
+Les clichés, le MNT global, la grille RAF, le préréglage vitesse / précision et le budget de temps des tâches sont envoyés une seule fois à chaque worker, au démarrage du pool.
+Ensuite, lorsqu'un objet (prédiction, bâtiment, groupe de bâtiments...) qui les référence est envoyé à un worker ou renvoyé par un worker,
+ils sont remplacés par une simple référence, résolue dans le contexte du processus qui reçoit l'objet :
+* un cliché par son indice dans la liste des clichés du contexte ;
+* le MNT d'un cliché (fenêtre sur le MNT global autour de son emprise, voir get_mnt_shot) par l'indice du cliché.
+
+Les chantiers (répertoire des PVA et clichés utilisés) sont aussi enregistrés dans le contexte : un groupe de bâtiments ne contient que l'indice de son chantier.
+Un chantier doit être enregistré avant le démarrage du pool pour être connu des workers.
+
+Les références ne sont utilisées que par le pickler de multiprocessing : les checkpoints, écrits avec pickle, contiennent toujours les objets complets.
+Seul l'indice du chantier d'un groupe de bâtiments est aussi enregistré dans les checkpoints : il reste valable car les chantiers sont enregistrés dans le même ordre à chaque exécution
+"""
+import pickle
+from typing import Dict, List, Tuple
+import numpy as np
+from multiprocessing.reduction import ForkingPickler
+from v2.shot import Shot, ShotOriente, ShotPompei, MNT, RAF
+from v2 import presets
+
+
+_shots:Dict[str, Shot] = {}
+# Indice de chaque cliché dans la liste des clichés, qui est dans le même ordre dans tous les processus
+_liste_shots:List[Shot] = []
+_indices_shots:Dict[str, int] = {}
+# MNT de chaque cliché, créés à la demande, par indice de cliché, et indice du cliché de chaque MNT (par identifiant de l'objet)
+_mnts_shots:Dict[int, MNT] = {}
+_indices_mnts:Dict[int, int] = {}
+# Chantiers : répertoire des PVA et indices des clichés utilisés
+_chantiers:List[Tuple[str, np.ndarray]] = []
+_mnt:MNT = None
+_raf:RAF = None
+_pva_path:str = None
+_pompei:bool = False
+# Hauteurs déjà estimées lors d'un traitement précédent, par empreinte de groupe de bâtiments
+_cache_z:Dict[str, tuple] = {}
+# Budget de temps (en secondes) de l'estimation de la hauteur d'un groupe de bâtiments, None pour ne pas la limiter
+_budget_tache:float = None
+
+
+def initialiser(shots:List[Shot], mnt:MNT, raf:RAF, pva_path:str, pompei:bool, cache_z:Dict[str, tuple]=None, preset:str=None, budget_tache:float=None, chantiers:List[Tuple[str, np.ndarray]]=None)->None:
+    """
+    Initialise le contexte du processus courant. Sans preset, le préréglage déjà défini dans le processus est conservé.
+    Sans chantiers, le seul chantier enregistré utilise pva_path et tous les clichés
+    """
+    global _shots, _liste_shots, _indices_shots, _mnts_shots, _indices_mnts, _chantiers, _mnt, _raf, _pva_path, _pompei, _cache_z, _budget_tache
+    if preset is not None:
+        presets.definir_preset(preset)
+    _shots = {shot.image:shot for shot in shots}
+    _liste_shots = list(_shots.values())
+    _indices_shots = {shot.image:i for i, shot in enumerate(_liste_shots)}
+    _mnts_shots = {}
+    _indices_mnts = {}
+    if chantiers is None:
+        chantiers = [(pva_path, np.arange(len(_liste_shots), dtype=np.int32))]
+    _chantiers = list(chantiers)
+    _mnt = mnt
+    _raf = raf
+    _pva_path = pva_path
+    _pompei = pompei
+    _cache_z = cache_z if cache_z is not None else {}
+    _budget_tache = budget_tache
+
+    ForkingPickler.register(ShotOriente, reduire_shot)
+    ForkingPickler.register(ShotPompei, reduire_shot)
+    ForkingPickler.register(MNT, reduire_mnt)
+    ForkingPickler.register(RAF, reduire_raf)
+
+
+def serialiser()->bytes:
+    """
+    Sérialise le contexte du processus courant pour l'envoyer aux workers.
+
+    On utilise pickle et non le pickler de multiprocessing pour envoyer les objets complets et pas des références
+    """
+    return pickle.dumps((_liste_shots, _mnt, _raf, _pva_path, _pompei, _cache_z, presets.get_preset(), _budget_tache, _chantiers), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def initialiser_worker(contexte:bytes)->None:
+    """
+    Initializer des workers du pool
+    """
+    initialiser(*pickle.loads(contexte))
+
+
+def get_shot(image:str)->Shot:
+    return _shots[image]
+
+def shot_enregistre(shot:Shot)->bool:
+    return _shots.get(shot.image) is shot
+
+def get_shot_indice(indice:int)->Shot:
+    return _liste_shots[indice]
+
+def get_indice_shot(image:str)->int:
+    return _indices_shots[image]
+
+def get_shots()->List[Shot]:
+    return list(_shots.values())
+
+def get_mnt()->MNT:
+    return _mnt
+
+def get_mnt_shot(indice:int)->MNT:
+    """
+    Renvoie le MNT du cliché d'indice indice : fenêtre sur le MNT global autour de l'emprise du cliché, créée au premier appel dans chaque processus
+    """
+    if indice not in _mnts_shots:
+        mnt = MNT.from_mnt(_mnt, _liste_shots[indice].emprise, f"shot_{_liste_shots[indice].image}")
+        _mnts_shots[indice] = mnt
+        _indices_mnts[id(mnt)] = indice
+    return _mnts_shots[indice]
+
+def get_raf()->RAF:
+    return _raf
+
+def get_pva_path()->str:
+    return _pva_path
+
+def get_pompei()->bool:
+    return _pompei
+
+def get_cache_z()->Dict[str, tuple]:
+    return _cache_z
+
+def get_budget_tache()->float:
+    return _budget_tache
+
+
+def enregistrer_chantier(pva_path:str, shots:List[Shot])->int:
+    """
+    Renvoie l'indice du chantier qui utilise pva_path et les clichés shots, après l'avoir enregistré s'il ne l'était pas encore
+    """
+    indices = np.array([_indices_shots[shot.image] for shot in shots], dtype=np.int32)
+    for i, (pva_path_chantier, indices_chantier) in enumerate(_chantiers):
+        if pva_path_chantier == pva_path and np.array_equal(indices_chantier, indices):
+            return i
+    _chantiers.append((pva_path, indices))
+    return len(_chantiers) - 1
+
+def get_pva_path_chantier(indice:int)->str:
+    return _chantiers[indice][0]
+
+def get_shots_chantier(indice:int)->List[Shot]:
+    return [_liste_shots[i] for i in _chantiers[indice][1]]
+
+
+def reduire_shot(shot:Shot):
+    if shot_enregistre(shot):
+        return (get_shot_indice, (_indices_shots[shot.image],))
+    return shot.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+
+def reduire_mnt(mnt:MNT):
+    if mnt is _mnt:
+        return (get_mnt, ())
+    if id(mnt) in _indices_mnts and _mnts_shots.get(_indices_mnts[id(mnt)]) is mnt:
+        return (get_mnt_shot, (_indices_mnts[id(mnt)],))
+    # Autres fenêtres sur le MNT global : elles sont en mémoire partagée, donc légères, et envoyées telles quelles
+    return mnt.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+
+def reduire_raf(raf:RAF):
+    if raf is _raf:
+        return (get_raf, ())
+    return raf.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,174 @@
+import os
+import json
+import pickle
+import hashlib
+from typing import List, Dict
+import numpy as np
+import geopandas as gpd
+from shapely import STRtree, to_wkb
+from v2.shot import MNT, Shot
+from v2 import presets
+
+
+# Fichiers qui accompagnent un shapefile et qui font partie de la prédiction
+EXTENSIONS_SHAPEFILE = [".shx", ".dbf", ".prj", ".cpg"]
+
+
+def empreinte_textes(textes:List[str])->str:
+    h = hashlib.sha256()
+    for texte in textes:
+        h.update(texte.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def empreinte_fichier(path:str)->str:
+    """
+    Empreinte du contenu d'un fichier. Pour un shapefile, on prend aussi en compte les fichiers qui l'accompagnent
+    """
+    paths = [path]
+    if path[-4:]==".shp":
+        paths += [path[:-4]+extension for extension in EXTENSIONS_SHAPEFILE if os.path.isfile(path[:-4]+extension)]
+
+    h = hashlib.sha256()
+    for p in paths:
+        with open(p, "rb") as f:
+            for bloc in iter(lambda: f.read(1<<20), b""):
+                h.update(bloc)
+    return h.hexdigest()
+
+
+def empreinte_tableau(array:np.ndarray)->str:
+    h = hashlib.sha256()
+    h.update(str(array.shape).encode("utf-8"))
+    h.update(str(array.dtype).encode("utf-8"))
+    h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def empreinte_mnt(mnt:MNT, nb_lignes:int=1000)->str:
+    """
+    Empreinte de la fenêtre du MNT chargée pour le chantier. On lit le MNT par blocs de lignes pour ne pas le charger entièrement en mémoire
+    """
+    h = hashlib.sha256()
+    h.update(str(mnt.gt).encode("utf-8"))
+    for i in range(0, mnt.ysize, nb_lignes):
+        h.update(np.ascontiguousarray(mnt.mnt[i:i+nb_lignes,:]).tobytes())
+    return h.hexdigest()
+
+
+def empreinte_emprise(emprise:gpd.GeoSeries)->str:
+    if emprise is None:
+        return None
+    return hashlib.sha256(to_wkb(emprise.union_all())).hexdigest()
+
+
+class CacheEstimationZ:
+    """
+    Cache des hauteurs estimées pour chaque groupe de bâtiments, d'un traitement à l'autre.
+
+    La clé d'un groupe de bâtiments est l'empreinte des données qui ont servi à estimer sa hauteur :
+    - le TA et le type de chantier,
+    - pour chaque bâtiment du groupe, le fichier de prédiction dont il est issu et sa géométrie image,
+    - les images dont l'emprise contient le bâtiment, car Samon peut les utiliser,
+    - les valeurs du MNT autour du bâtiment (complétées par le worker, voir GroupeBatiments.get_estimation_z_cache).
+
+    Si l'une de ces données change, la hauteur du groupe est recalculée. Sinon, on réutilise la hauteur estimée lors d'un traitement précédent
+    """
+
+    def __init__(self, path_cache:str):
+        self.path = path_cache
+        os.makedirs(self.path, exist_ok=True)
+        self.path_resultats = os.path.join(self.path, "estimation_z.pkl")
+        self.path_entrees = os.path.join(self.path, "empreintes.json")
+
+        # Empreinte des données communes à tous les groupes de bâtiments
+        self.empreinte_globale:str = None
+        # Empreinte de chaque fichier de prédiction, par nom d'image
+        self.empreintes_predictions:Dict[str, str] = {}
+
+        self.resultats:Dict[str, tuple] = {}
+        if os.path.isfile(self.path_resultats):
+            with open(self.path_resultats, "rb") as f:
+                self.resultats = pickle.load(f)
+
+
+    def definir_entrees(self, path_ta:str, mnt:MNT, emprise:gpd.GeoSeries, paths_predictions:Dict[str, str], pompei:bool)->None:
+        """
+        Calcule l'empreinte des données d'entrée et affiche ce qui a changé depuis le traitement précédent
+        """
+        entrees = {
+            "ta":empreinte_fichier(path_ta) if path_ta is not None else None,
+            "mnt":empreinte_mnt(mnt),
+            "emprise":empreinte_emprise(emprise),
+            "pompei":pompei,
+            # La hauteur estimée dépend du préréglage vitesse / précision
+            "preset":presets.get_preset(),
+            "predictions":{image:empreinte_fichier(path) for image, path in paths_predictions.items()}
+        }
+
+        if os.path.isfile(self.path_entrees):
+            with open(self.path_entrees, "r") as f:
+                precedentes = json.load(f)
+            for cle in ["ta", "mnt", "emprise", "pompei", "preset"]:
+                if precedentes.get(cle) != entrees[cle]:
+                    print(f"Données modifiées depuis le traitement précédent : {cle}")
+            anciennes = precedentes.get("predictions", {})
+            nouvelles = entrees["predictions"]
+            modifiees = [image for image in nouvelles.keys() if image in anciennes and anciennes[image]!=nouvelles[image]]
+            ajoutees = [image for image in nouvelles.keys() if image not in anciennes]
+            supprimees = [image for image in anciennes.keys() if image not in nouvelles]
+            print(f"Prédictions modifiées : {len(modifiees)}, ajoutées : {len(ajoutees)}, supprimées : {len(supprimees)}")
+
+        with open(self.path_entrees, "w") as f:
+            json.dump(entrees, f, indent=2)
+
+        textes = [str(entrees["ta"]), f"pompei={pompei}"]
+        # Avec le préréglage standard, les hauteurs estimées avant l'introduction des préréglages restent valides
+        if entrees["preset"] != "standard":
+            textes.append(f"preset={entrees['preset']}")
+        self.empreinte_globale = empreinte_textes(textes)
+        self.empreintes_predictions = entrees["predictions"]
+
+
+    def get_entrees(self)->Dict:
+        return {"empreinte_globale":self.empreinte_globale, "empreintes_predictions":self.empreintes_predictions}
+
+    def restaurer_entrees(self, entrees:Dict)->None:
+        if entrees is not None:
+            self.empreinte_globale = entrees["empreinte_globale"]
+            self.empreintes_predictions = entrees["empreintes_predictions"]
+
+
+    def calculer_empreintes_entrees(self, groupes_batiments:List, shots:List[Shot])->None:
+        """
+        Calcule pour chaque groupe de bâtiments l'empreinte des données qui ne dépendent pas du MNT
+        """
+        if self.empreinte_globale is None:
+            return
+
+        # Images dont l'emprise contient le centre du groupe de bâtiments
+        tree = STRtree([shot.emprise for shot in shots])
+        centres = [groupe.batiments[0].geometrie_terrain.centroid for groupe in groupes_batiments]
+        indices_groupes, indices_shots = tree.query(centres, predicate="within")
+        images = [[] for i in range(len(groupes_batiments))]
+        for i, j in zip(indices_groupes, indices_shots):
+            images[i].append(shots[j].image)
+
+        for i, groupe in enumerate(groupes_batiments):
+            batiments = sorted([f"{batiment.shot.image} {self.empreintes_predictions.get(batiment.shot.image)} {hashlib.sha256(to_wkb(batiment.geometrie_image)).hexdigest()}" for batiment in groupe.batiments])
+            groupe.empreinte_entrees = empreinte_textes([self.empreinte_globale] + batiments + sorted(images[i]))
+
+
+    def mettre_a_jour(self, groupes_batiments:List)->None:
+        for groupe in groupes_batiments:
+            # Une hauteur obtenue avec un budget de temps dépassé n'est pas conservée : elle sera recalculée au prochain traitement
+            if groupe.empreinte is not None and len(groupe.budget_depasse) == 0:
+                self.resultats[groupe.empreinte] = (groupe.estim_z, groupe.nb_images_z_estim, groupe.get_methode_estimation_hauteur())
+
+
+    def sauvegarder(self)->None:
+        path_tmp = self.path_resultats + ".tmp"
+        with open(path_tmp, "wb") as f:
+            pickle.dump(self.resultats, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path_tmp, self.path_resultats)
@@ -0,0 +1,262 @@
+"""
+Estimation du coût d'un chantier avant son lancement (option --dry_run).
+
+Seuls l'emprise, l'emprise au sol des clichés dans le TA et le nombre d'objets de chaque fichier de prédiction sont lus :
+l'estimation ne prend que quelques secondes, même sur un chantier national.
+
+Le temps CPU et la mémoire de chaque étape sont extrapolés, proportionnellement au nombre de bâtiments prédits, à partir des rapports de performances
+(rapport_performances.json) de traitements précédents. Sans rapport, des valeurs par défaut ne donnent qu'un ordre de grandeur
+"""
+import os
+import json
+from typing import List, Dict
+import numpy as np
+import geopandas as gpd
+from shapely import Polygon, STRtree, points, area, intersection, union_all, contains_xy
+
+
+def lire_emprises_ta(path_ta:str, images:set)->Dict[str, Polygon]:
+    """
+    Lit l'emprise au sol des clichés du TA dont l'image fait partie de images, sans créer les clichés.
+    Le TA est lu cliché par cliché pour ne pas le charger entièrement en mémoire
+    """
+    from lxml import etree
+    emprises = {}
+    for _, cliche in etree.iterparse(path_ta, tag="cliche"):
+        image = cliche.find("image").text.strip()
+        if image in images:
+            polygon2d = cliche.find(".//polygon2d")
+            x = [float(element.text) for element in polygon2d.findall(".//x")]
+            y = [float(element.text) for element in polygon2d.findall(".//y")]
+            emprises[image] = Polygon(list(zip(x, y)))
+        cliche.clear()
+    return emprises
+
+
+def compter_objets(path:str)->int:
+    """
+    Nombre d'objets d'un fichier de prédiction, lu dans les métadonnées du fichier (gpkg) ou dans son en-tête (shapefile)
+    """
+    from osgeo import ogr
+    ds = ogr.Open(path)
+    if ds is None:
+        raise ValueError(f"Impossible d'ouvrir {path}")
+    nb_objets = ds.GetLayer(0).GetFeatureCount()
+    ds = None
+    return nb_objets
+
+
+def trouver_rapports(paths:List[str])->List[str]:
+    """
+    Les rapports de performances donnés, et ceux trouvés dans les répertoires donnés (par exemple les tuiles d'un traitement découpé)
+    """
+    rapports = []
+    for path in paths:
+        if os.path.isdir(path):
+            for repertoire, _, fichiers in os.walk(path):
+                if "rapport_performances.json" in fichiers:
+                    rapports.append(os.path.join(repertoire, "rapport_performances.json"))
+        elif os.path.isfile(path):
+            rapports.append(path)
+        else:
+            raise ValueError(f"{path} n'existe pas")
+    return sorted(rapports)
+
+
+class EstimationCout:
+
+    # Nombre de points tirés dans l'emprise pour estimer le nombre d'images qui voient chaque point
+    nb_points_echantillon = 20000
+
+    # Valeurs utilisées sans rapport de calibration : temps CPU par bâtiment prédit (processus principal, workers) en secondes,
+    # mémoire du processus principal (base et par bâtiment prédit) et d'un worker, en Mo
+    cpu_principal_par_batiment = 0.002
+    cpu_workers_par_batiment = 0.05
+    rss_principal_base_mo = 500
+    rss_principal_par_batiment_mo = 0.05
+    rss_worker_mo = 400
+
+    def __init__(self, emprise:gpd.GeoSeries, emprises_cliches:Dict[str, Polygon], nb_objets:Dict[str, int], nb_cpus:int, etapes:List[str]):
+        self.emprise = emprise
+        self.emprises_cliches = emprises_cliches
+        self.nb_objets = nb_objets
+        self.nb_cpus = nb_cpus
+        self.etapes = etapes
+
+        # Coefficients de chaque étape : par défaut, le coût est réparti de la même façon entre les étapes
+        self.calibration:Dict[str, Dict] = {}
+        self.rapports:List[str] = []
+
+
+    def calibrer(self, paths:List[str])->None:
+        """
+        Calcule pour chaque étape le temps CPU par bâtiment prédit, et la mémoire en fonction du nombre de bâtiments prédits,
+        à partir des rapports de performances de traitements précédents
+        """
+        self.rapports = trouver_rapports(paths)
+        mesures:Dict[str, List[Dict]] = {}
+        for path in self.rapports:
+            with open(path, "r") as f:
+                lignes = json.load(f)
+            # Nombre de bâtiments prédits dans l'emprise, compté à la fin du chargement
+            nb_batiments = [ligne.get("nb_batiments") for ligne in lignes if ligne["etape"] == "load"]
+            if len(nb_batiments) == 0 or not nb_batiments[0]:
+                print(f"{path} ne contient pas l'étape load : il n'est pas utilisé pour la calibration")
+                continue
+            for ligne in lignes:
+                if ligne["niveau"] != 1 or ligne["duree_s"] is None:
+                    continue
+                mesures.setdefault(ligne["etape"], []).append({
+                    "nb_batiments":nb_batiments[0],
+                    "cpu_principal_s":ligne["cpu_principal_s"],
+                    "cpu_workers_s":ligne["cpu_workers_s"],
+                    "rss_max_principal_mo":ligne["rss_max_principal_mo"],
+                    "rss_max_workers_mo":ligne["rss_max_workers_mo"]
+                })
+
+        for etape, mesures_etape in mesures.items():
+            nb_batiments = np.array([mesure["nb_batiments"] for mesure in mesures_etape], dtype=np.float64)
+            rss = np.array([mesure["rss_max_principal_mo"] for mesure in mesures_etape])
+            # Avec des traitements de tailles différentes, la mémoire est une droite base + pente * nb_batiments.
+            # Avec une seule taille, on garde la base par défaut
+            if len(np.unique(nb_batiments)) >= 2:
+                pente, base = np.polyfit(nb_batiments, rss, 1)
+                base = max(base, 0)
+            else:
+                base = min(EstimationCout.rss_principal_base_mo, float(np.mean(rss)))
+                pente = float(np.mean((rss - base) / nb_batiments))
+            self.calibration[etape] = {
+                "cpu_principal_par_batiment":sum([mesure["cpu_principal_s"] for mesure in mesures_etape]) / nb_batiments.sum(),
+                "cpu_workers_par_batiment":sum([mesure["cpu_workers_s"] for mesure in mesures_etape]) / nb_batiments.sum(),
+                "rss_principal_base_mo":float(base),
+                "rss_principal_par_batiment_mo":float(pente),
+                "rss_worker_mo":max([mesure["rss_max_workers_mo"] for mesure in mesures_etape])
+            }
+
+
+    def get_coefficients(self, etape:str)->Dict:
+        coefficients = self.calibration.get(etape)
+        if coefficients is not None:
+            return coefficients
+        nb_etapes = len(self.etapes)
+        return {
+            "cpu_principal_par_batiment":EstimationCout.cpu_principal_par_batiment / nb_etapes,
+            "cpu_workers_par_batiment":EstimationCout.cpu_workers_par_batiment / nb_etapes,
+            "rss_principal_base_mo":EstimationCout.rss_principal_base_mo,
+            "rss_principal_par_batiment_mo":EstimationCout.rss_principal_par_batiment_mo,
+            "rss_worker_mo":EstimationCout.rss_worker_mo
+        }
+
+
+    def get_zone(self):
+        if self.emprise is not None:
+            return union_all(np.asarray(self.emprise.values))
+        return union_all(list(self.emprises_cliches.values()))
+
+
+    def compter_batiments_predits(self, zone)->float:
+        """
+        Nombre de bâtiments prédits dans l'emprise : les objets de chaque prédiction, au prorata de la part du cliché dans l'emprise
+        """
+        images = list(self.emprises_cliches.keys())
+        emprises = np.array([self.emprises_cliches[image] for image in images])
+        nb_objets = np.array([self.nb_objets[image] for image in images], dtype=np.float64)
+        fractions = area(intersection(emprises, zone)) / np.maximum(area(emprises), 1e-9)
+        return float(np.sum(nb_objets * fractions))
+
+
+    def compter_recouvrement(self, zone)->Dict[int, float]:
+        """
+        Proportion de l'emprise vue par k images, pour chaque k. Un groupe de bâtiments contient un bâtiment par image qui le voit :
+        c'est aussi la distribution attendue de la taille des groupes de bâtiments
+        """
+        rng = np.random.default_rng(0)
+        xmin, ymin, xmax, ymax = zone.bounds
+        x = rng.uniform(xmin, xmax, EstimationCout.nb_points_echantillon)
+        y = rng.uniform(ymin, ymax, EstimationCout.nb_points_echantillon)
+        dans_zone = contains_xy(zone, x, y)
+        x, y = x[dans_zone], y[dans_zone]
+        if x.shape[0] == 0:
+            return {}
+
+        arbre = STRtree(list(self.emprises_cliches.values()))
+        indices_points, _ = arbre.query(points(x, y), predicate="within")
+        nb_images = np.bincount(indices_points, minlength=x.shape[0])
+        valeurs, nombres = np.unique(nb_images, return_counts=True)
+        return {int(valeur):float(nombre / x.shape[0]) for valeur, nombre in zip(valeurs, nombres)}
+
+
+    def estimer(self)->Dict:
+        zone = self.get_zone()
+        nb_batiments_predits = self.compter_batiments_predits(zone)
+        recouvrement = self.compter_recouvrement(zone)
+
+        # Chaque bâtiment est prédit une fois dans chaque image qui le voit
+        recouvrement_vu = {k:p for k, p in recouvrement.items() if k > 0}
+        somme = sum(recouvrement_vu.values())
+        nb_images_moyen = sum([k*p for k, p in recouvrement_vu.items()]) / somme if somme > 0 else 0
+        nb_batiments = nb_batiments_predits / nb_images_moyen if nb_images_moyen > 0 else 0
+
+        etapes = []
+        for etape in self.etapes:
+            coefficients = self.get_coefficients(etape)
+            cpu_principal = coefficients["cpu_principal_par_batiment"] * nb_batiments_predits
+            cpu_workers = coefficients["cpu_workers_par_batiment"] * nb_batiments_predits
+            rss_principal = coefficients["rss_principal_base_mo"] + coefficients["rss_principal_par_batiment_mo"] * nb_batiments_predits
+            etapes.append({
+                "etape":etape,
+                "calibree":etape in self.calibration,
+                "cpu_principal_s":cpu_principal,
+                "cpu_workers_s":cpu_workers,
+                # Le processus principal est séquentiel, le travail des workers est réparti sur nb_cpus
+                "duree_s":cpu_principal + cpu_workers / self.nb_cpus,
+                "rss_max_principal_mo":rss_principal,
+                "rss_max_total_mo":rss_principal + self.nb_cpus * coefficients["rss_worker_mo"]
+            })
+
+        return {
+            "nb_pvas":sum([1 for emprise in self.emprises_cliches.values() if emprise.intersects(zone)]),
+            "nb_predictions":len(self.nb_objets),
+            "nb_objets_predictions":int(sum(self.nb_objets.values())),
+            "nb_batiments_predits_emprise":nb_batiments_predits,
+            "nb_batiments_estime":nb_batiments,
+            "nb_images_par_batiment_moyen":nb_images_moyen,
+            "distribution_taille_groupes":{str(k):p/somme for k, p in sorted(recouvrement_vu.items())} if somme > 0 else {},
+            "part_emprise_non_couverte":recouvrement.get(0, 0),
+            "nb_cpus":self.nb_cpus,
+            "rapports_calibration":self.rapports,
+            "etapes":etapes,
+            "duree_totale_s":sum([etape["duree_s"] for etape in etapes]),
+            "rss_max_total_mo":max([etape["rss_max_total_mo"] for etape in etapes]) if len(etapes) > 0 else 0
+        }
+
+
+    def afficher(self, estimation:Dict)->None:
+        print(f"PVAs dans l'emprise : {estimation['nb_pvas']}")
+        print(f"Prédictions : {estimation['nb_predictions']} ({estimation['nb_objets_predictions']} objets)")
+        print(f"Bâtiments prédits dans l'emprise : {estimation['nb_batiments_predits_emprise']:.0f}")
+        print(f"Bâtiments estimés : {estimation['nb_batiments_estime']:.0f} (vus en moyenne dans {estimation['nb_images_par_batiment_moyen']:.1f} images)")
+        if estimation["part_emprise_non_couverte"] > 0:
+            print(f"Part de l'emprise vue par aucune image : {100*estimation['part_emprise_non_couverte']:.1f} %")
+        print("Taille des groupes de bâtiments :")
+        for taille, proportion in estimation["distribution_taille_groupes"].items():
+            print(f"    {taille:>3} bâtiments : {100*proportion:5.1f} %")
+        if len(self.rapports) == 0:
+            print("Aucun rapport de performances pour la calibration (--calibration) : les durées et la mémoire ne sont qu'un ordre de grandeur")
+        else:
+            print(f"Calibration sur {len(self.rapports)} rapport(s) de performances")
+        print(f"{'étape':<28}{'durée':>14}{'mémoire max':>16}")
+        for etape in estimation["etapes"]:
+            calibree = "" if etape["calibree"] else " (non calibrée)"
+            print(f"{etape['etape']:<28}{formater_duree(etape['duree_s']):>14}{etape['rss_max_total_mo']/1024:>13.1f} Go{calibree}")
+        print(f"{'total':<28}{formater_duree(estimation['duree_totale_s']):>14}{estimation['rss_max_total_mo']/1024:>13.1f} Go")
+
+
+def formater_duree(secondes:float)->str:
+    heures, reste = divmod(int(round(secondes)), 3600)
+    minutes, secondes = divmod(reste, 60)
+    if heures > 0:
+        return f"{heures} h {minutes:02d} min"
+    if minutes > 0:
+        return f"{minutes} min {secondes:02d} s"
+    return f"{secondes} s"
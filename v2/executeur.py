@@ -0,0 +1,325 @@
+"""
+Exécuteurs des tâches parallèles du traitement.
+
+Tous les exécuteurs ont l'interface du pool de multiprocessing utilisée par map_pool et GrapheTaches (imap_unordered, apply_async, close, join) :
+* processus : pool de workers démarrés avec spawn, qui reçoivent le contexte (clichés, MNT, RAF) au démarrage. C'est l'exécuteur par défaut
+* threads : threads du processus principal, qui utilisent directement son contexte. Adapté aux étapes dont le temps est passé dans GDAL ou numpy, qui libèrent le GIL
+* serie : les tâches sont exécutées une par une dans le processus principal, par exemple pour profiler ou déboguer une étape
+* distribue : les tâches sont placées dans une file servie sur le réseau, et exécutées par les workers de plusieurs noeuds.
+  Chaque noeud est lancé avec python -m v2.executeur --adresse [hôte:port] --nb_cpus [nb_cpus] et doit voir les mêmes fichiers que le processus principal
+  (chantier et tableaux partagés du MNT). Le noeud local en fait partie si nb_cpus > 0.
+  Les tâches et les résultats sont des pickles : la clé d'authentification (variable d'environnement SAMON_CLE, sinon une clé aléatoire affichée au démarrage)
+  est la seule protection contre l'exécution de code arbitraire. L'adresse ne doit être accessible que depuis un réseau de confiance
+
+Ce module n'importe rien de lourd : il est réimporté par les workers et par le serveur de la file des tâches
+"""
+import os
+import abc
+import time
+import queue
+import pickle
+import secrets
+import argparse
+import itertools
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from multiprocessing.managers import BaseManager, DictProxy
+from multiprocessing.reduction import ForkingPickler
+from typing import Callable, Dict, Iterable, Tuple
+
+
+EXECUTEURS = ["processus", "threads", "serie", "distribue"]
+
+
+class Executeur(abc.ABC):
+    """
+    Interface commune des exécuteurs
+    """
+
+    @abc.abstractmethod
+    def imap_unordered(self, fonction:Callable, taches:Iterable, chunksize:int=1):
+        pass
+
+    @abc.abstractmethod
+    def apply_async(self, fonction:Callable, args:Tuple=(), callback:Callable=None, error_callback:Callable=None)->None:
+        pass
+
+    def close(self)->None:
+        pass
+
+    def join(self)->None:
+        pass
+
+
+class ExecuteurProcessus(Executeur):
+
+    def __init__(self, nb_cpus:int, repertoire_profilage:str=None):
+        from v2 import contexte, worker
+        self.pool = multiprocessing.Pool(processes=nb_cpus, initializer=worker.initialiser_worker, initargs=(contexte.serialiser(), repertoire_profilage))
+
+    def imap_unordered(self, fonction:Callable, taches:Iterable, chunksize:int=1):
+        return self.pool.imap_unordered(fonction, taches, chunksize=chunksize)
+
+    def apply_async(self, fonction:Callable, args:Tuple=(), callback:Callable=None, error_callback:Callable=None)->None:
+        self.pool.apply_async(fonction, args, callback=callback, error_callback=error_callback)
+
+    def close(self)->None:
+        self.pool.close()
+
+    def join(self)->None:
+        self.pool.join()
+
+
+class ExecuteurThreads(ExecuteurProcessus):
+    """
+    Les objets ne sont pas copiés : une tâche modifie directement les objets du processus principal
+    """
+
+    def __init__(self, nb_cpus:int):
+        self.pool = ThreadPool(processes=nb_cpus)
+
+
+class ExecuteurSerie(Executeur):
+
+    def imap_unordered(self, fonction:Callable, taches:Iterable, chunksize:int=1):
+        for tache in taches:
+            yield fonction(tache)
+
+    def apply_async(self, fonction:Callable, args:Tuple=(), callback:Callable=None, error_callback:Callable=None)->None:
+        try:
+            resultat = fonction(*args)
+        except Exception as erreur:
+            if error_callback is None:
+                raise
+            error_callback(erreur)
+            return
+        if callback is not None:
+            callback(resultat)
+
+
+# File des tâches, file des résultats et paramètres (contexte sérialisé, arrêt) du serveur de l'exécuteur distribué.
+# Elles ne sont créées que dans le processus du serveur
+_taches:queue.Queue = None
+_resultats:queue.Queue = None
+_parametres:Dict = None
+
+def get_taches()->queue.Queue:
+    global _taches
+    if _taches is None:
+        _taches = queue.Queue()
+    return _taches
+
+def get_resultats()->queue.Queue:
+    global _resultats
+    if _resultats is None:
+        _resultats = queue.Queue()
+    return _resultats
+
+def get_parametres()->Dict:
+    global _parametres
+    if _parametres is None:
+        _parametres = {}
+    return _parametres
+
+
+class GestionnaireTaches(BaseManager):
+    pass
+
+GestionnaireTaches.register("get_taches", callable=get_taches)
+GestionnaireTaches.register("get_resultats", callable=get_resultats)
+GestionnaireTaches.register("get_parametres", callable=get_parametres, proxytype=DictProxy)
+
+
+def lire_adresse(adresse:str)->Tuple[str, int]:
+    hote, port = adresse.rsplit(":", 1)
+    return hote, int(port)
+
+
+def get_cle(cle:str=None)->bytes:
+    """
+    Clé d'authentification des noeuds auprès du serveur : par défaut, la variable d'environnement SAMON_CLE.
+    Il n'y a pas de clé par défaut : les données reçues sont désérialisées avec pickle, une clé connue permettrait d'exécuter du code sur le serveur ou les noeuds
+    """
+    if cle is None:
+        cle = os.environ.get("SAMON_CLE")
+    if cle is None or cle == "":
+        raise ValueError("Pas de clé d'authentification pour l'exécuteur distribue : utiliser --cle ou la variable d'environnement SAMON_CLE")
+    return cle.encode()
+
+
+class ExecuteurDistribue(Executeur):
+    """
+    Les tâches et leurs résultats sont sérialisés avec le pickler de multiprocessing : les clichés, le MNT et la RAF
+    n'y sont que des références, résolues avec le contexte reçu par les workers de chaque noeud au démarrage
+    """
+
+    def __init__(self, nb_cpus:int, adresse:str, cle:str=None, repertoire_profilage:str=None):
+        from v2 import contexte
+        hote, port = lire_adresse(adresse)
+        if cle is None and not os.environ.get("SAMON_CLE"):
+            # Clé aléatoire, à donner aux noeuds supplémentaires
+            cle = secrets.token_hex(16)
+            print(f"Clé d'authentification de la file des tâches (à donner aux noeuds avec --cle ou SAMON_CLE) : {cle}")
+        self.cle = get_cle(cle)
+        self.gestionnaire = GestionnaireTaches(address=(hote, port), authkey=self.cle)
+        self.gestionnaire.start()
+        self.parametres = self.gestionnaire.get_parametres()
+        self.parametres.update({"contexte":contexte.serialiser(), "repertoire_profilage":repertoire_profilage, "arret":False})
+        self.taches = self.gestionnaire.get_taches()
+        self.resultats = self.gestionnaire.get_resultats()
+        print(f"File des tâches servie sur {hote}:{port}. Noeuds supplémentaires : python -m v2.executeur --adresse [hôte]:{port} --nb_cpus [nb_cpus] --cle [clé]")
+
+        # Callbacks des tâches en cours, par numéro de tâche
+        self.en_attente:Dict[int, Tuple[Callable, Callable]] = {}
+        self.verrou = threading.Lock()
+        self.numeros = itertools.count()
+        self.reception = threading.Thread(target=self.recevoir, daemon=True)
+        self.reception.start()
+
+        # Noeud local
+        self.noeud_local = None
+        if nb_cpus > 0:
+            hote_local = "127.0.0.1" if hote in ["", "0.0.0.0"] else hote
+            self.noeud_local = multiprocessing.Process(target=executer_noeud, args=(f"{hote_local}:{port}", self.cle.decode(), nb_cpus))
+            self.noeud_local.start()
+
+
+    def recevoir(self)->None:
+        """
+        Thread qui reçoit les résultats et appelle les callbacks des tâches
+        """
+        resultats = self.gestionnaire.get_resultats()
+        while True:
+            numero, succes, donnees = resultats.get()
+            if numero is None:
+                break
+            with self.verrou:
+                callback, error_callback = self.en_attente.pop(numero)
+            resultat = pickle.loads(donnees)
+            if succes:
+                if callback is not None:
+                    callback(resultat)
+            elif error_callback is not None:
+                error_callback(resultat)
+
+
+    def apply_async(self, fonction:Callable, args:Tuple=(), callback:Callable=None, error_callback:Callable=None)->None:
+        numero = next(self.numeros)
+        with self.verrou:
+            self.en_attente[numero] = (callback, error_callback)
+        self.taches.put((numero, bytes(ForkingPickler.dumps((fonction, args)))))
+
+
+    def imap_unordered(self, fonction:Callable, taches:Iterable, chunksize:int=1):
+        terminees = queue.Queue()
+        nb_taches = 0
+        for tache in taches:
+            self.apply_async(
+                fonction,
+                (tache,),
+                callback=lambda resultat: terminees.put((True, resultat)),
+                error_callback=lambda erreur: terminees.put((False, erreur))
+            )
+            nb_taches += 1
+        for _ in range(nb_taches):
+            succes, resultat = terminees.get()
+            if not succes:
+                raise resultat
+            yield resultat
+
+
+    def close(self)->None:
+        self.parametres["arret"] = True
+
+
+    def join(self)->None:
+        if self.noeud_local is not None:
+            self.noeud_local.join()
+        self.gestionnaire.get_resultats().put((None, None, None))
+        self.reception.join()
+        self.gestionnaire.shutdown()
+
+
+def executer_tache_serialisee(donnees:bytes)->bytes:
+    """
+    Exécute une tâche de l'exécuteur distribué dans un worker d'un noeud
+    """
+    fonction, args = pickle.loads(donnees)
+    return bytes(ForkingPickler.dumps(fonction(*args)))
+
+
+def executer_noeud(adresse:str, cle:str, nb_cpus:int)->None:
+    """
+    Exécute les tâches de la file servie à adresse avec nb_cpus workers, jusqu'à l'arrêt de l'exécuteur distribué.
+    Un noeud ne prend pas plus de tâches qu'il n'a de workers, pour que les autres noeuds reçoivent aussi des tâches
+    """
+    from v2 import worker
+    worker.configurer_processus()
+    hote, port = lire_adresse(adresse)
+    gestionnaire = GestionnaireTaches(address=(hote, port), authkey=get_cle(cle))
+    gestionnaire.connect()
+    parametres = gestionnaire.get_parametres()
+    taches = gestionnaire.get_taches()
+    resultats = gestionnaire.get_resultats()
+
+    pool = multiprocessing.Pool(processes=nb_cpus, initializer=worker.initialiser_worker, initargs=(parametres.get("contexte"), parametres.get("repertoire_profilage")))
+    places = threading.Semaphore(nb_cpus)
+
+    def terminer(numero:int, succes:bool, donnees:bytes)->None:
+        resultats.put((numero, succes, donnees))
+        places.release()
+
+    while True:
+        places.acquire()
+        try:
+            numero, donnees = taches.get(timeout=1)
+        except queue.Empty:
+            places.release()
+            if parametres.get("arret"):
+                break
+            continue
+        pool.apply_async(
+            executer_tache_serialisee,
+            (donnees,),
+            callback=lambda resultat, numero=numero: terminer(numero, True, resultat),
+            error_callback=lambda erreur, numero=numero: terminer(numero, False, pickle.dumps(erreur))
+        )
+    pool.close()
+    pool.join()
+
+
+def creer_executeur(nom:str, nb_cpus:int, repertoire_profilage:str=None, adresse:str=None)->Executeur:
+    """
+    Crée un exécuteur. Le contexte du processus principal doit déjà être initialisé
+    """
+    if nom == "processus":
+        return ExecuteurProcessus(nb_cpus, repertoire_profilage)
+    if nom == "threads":
+        return ExecuteurThreads(nb_cpus)
+    if nom == "serie":
+        return ExecuteurSerie()
+    if nom == "distribue":
+        if adresse is None:
+            raise ValueError("L'exécuteur distribue a besoin d'une adresse (hôte:port)")
+        return ExecuteurDistribue(nb_cpus, adresse, repertoire_profilage=repertoire_profilage)
+    raise ValueError(f"{nom} n'est pas un exécuteur. Exécuteurs possibles : {EXECUTEURS}")
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Noeud de l'exécuteur distribué : exécute les tâches d'un traitement lancé avec --executeur distribue")
+    parser.add_argument('--adresse', help="Adresse (hôte:port) de la file des tâches du traitement, sur un réseau de confiance", required=True)
+    parser.add_argument('--nb_cpus', help='Nombre de workers du noeud', default=4, type=int)
+    parser.add_argument('--cle', help="Clé d'authentification, affichée par le traitement au démarrage de la file des tâches (par défaut : variable d'environnement SAMON_CLE)", default=None)
+    args = parser.parse_args()
+    # Erreur tout de suite s'il n'y a pas de clé, plutôt qu'à chaque tentative de connexion
+    get_cle(args.cle)
+
+    # Le traitement n'a peut-être pas encore démarré sa file des tâches
+    while True:
+        try:
+            executer_noeud(args.adresse, args.cle, args.nb_cpus)
+            break
+        except ConnectionRefusedError:
+            print(f"En attente de la file des tâches sur {args.adresse}...")
+            time.sleep(5)
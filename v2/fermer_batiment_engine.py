@@ -2,10 +2,11 @@ from typing import List
 from v2.groupe_batiments import GroupeBatiments, id_debug
 from tqdm import tqdm
 from v2.segments import Segment
-from shapely import Polygon, GeometryCollection, LineString, make_valid, MultiPolygon
+from shapely import Polygon, GeometryCollection, LineString, make_valid, MultiPolygon, area, intersection, union
 from shapely.ops import polygonize_full
 from shapely.geometry.base import BaseGeometry
 import numpy as np
+from v2 import noyaux
 
 
 class FermerBatimentEngine:
@@ -82,15 +83,16 @@ class FermerBatimentEngine:
 
             polygones.append(geometrie_fermee)
 
-            ious = []
+            ground_geometries = []
             for batiment in groupe_batiment.batiments:
                 if batiment==batiment_principal:
                     continue
-                ground_geometry = batiment.compute_ground_geometry_with_alti(altitude_moyenne_bati)        
-                intersection = geometrie_fermee.intersection(ground_geometry).area
-                union = geometrie_fermee.union(ground_geometry).area
-                #ious.append(self.chamfer(geometrie_fermee, ground_geometry))
-                ious.append(intersection/union)
+                ground_geometries.append(batiment.compute_ground_geometry_with_alti(altitude_moyenne_bati))
+            # Intersections et unions avec tous les autres bâtiments du groupe en un seul appel
+            intersections = area(intersection(geometrie_fermee, ground_geometries)).tolist()
+            unions = area(union(geometrie_fermee, ground_geometries)).tolist()
+            #ious = [self.chamfer(geometrie_fermee, ground_geometry) for ground_geometry in ground_geometries]
+            ious = [aire_intersection/aire_union for aire_intersection, aire_union in zip(intersections, unions)]
             #scores.append(sum(ious)/len(ious))
             scores.append(max(ious))
         
@@ -121,7 +123,8 @@ class FermerBatimentEngine:
         pts2 = self.sample_boundary(poly2, n)
 
         def dist(A, B):
-            return np.mean([min(np.linalg.norm(a - b) for b in B) for a in A])
+            # Pour chaque point de A, distance au point le plus proche de B (voir v2/noyaux.py)
+            return np.mean(noyaux.distances_min_points(A, B))
 
         return dist(pts1, pts2) + dist(pts2, pts1)
 
@@ -159,22 +162,27 @@ class FermerBatimentEngine:
         print("On ajuste pour chaque bâtiment les intersections des bords de toit")
         fermeture_valide = [0,0]
         for groupe_batiment in tqdm(self.groupes_batiments):
-            for groupe_segment in groupe_batiment.groupes_segments:
-                if groupe_segment.is_valid():
-                    # Deux segments ne doivent pas être presque parallèle pour être considérés comme voisins par la suite
-                    groupe_segment.update_voisins_ps(FermerBatimentEngine.seuil_ps)
-            
-            self.fermer_deuxieme_tentative(groupe_batiment)
-            if groupe_batiment.geometrie_fermee_valide():
-                groupe_batiment.set_methode_fermeture("Photogrammetrie")
+            if self.fermer(groupe_batiment):
                 fermeture_valide[0]+=1
             else:
                 fermeture_valide[1]+=1
-                groupe_batiment.projection_FFL()
 
         print(f"Fermeture projection : {fermeture_valide[0]}")
         print(f"Fermeture ratée : {fermeture_valide[1]}")
 
-            
-            
-    
\ No newline at end of file
+
+    def fermer(self, groupe_batiment:GroupeBatiments)->bool:
+        """
+        Ferme un groupe de bâtiments dont les groupes de segments sont à jour. Renvoie True si la fermeture par photogrammétrie a réussi
+        """
+        for groupe_segment in groupe_batiment.groupes_segments:
+            if groupe_segment.is_valid():
+                # Deux segments ne doivent pas être presque parallèle pour être considérés comme voisins par la suite
+                groupe_segment.update_voisins_ps(FermerBatimentEngine.seuil_ps)
+        
+        self.fermer_deuxieme_tentative(groupe_batiment)
+        if groupe_batiment.geometrie_fermee_valide():
+            groupe_batiment.set_methode_fermeture("Photogrammetrie")
+            return True
+        groupe_batiment.projection_FFL()
+        return False
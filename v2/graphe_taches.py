@@ -0,0 +1,131 @@
+import heapq
+import queue
+from typing import Callable, Dict, List, Hashable
+from tqdm import tqdm
+from v2.rapport_performances import tache_mesuree, mesurer, get_rapport
+from v2.executeur import Executeur
+
+
+class Tache:
+
+    def __init__(self, cle:Hashable, fonction:Callable, argument, dependances:List[Hashable], priorite:int, nom:str):
+        self.cle = cle
+        self.fonction = fonction
+        self.argument = argument
+        self.dependances = dependances
+        self.priorite = priorite
+        self.nom = nom
+
+        self.dependants:List[Hashable] = []
+        self.nb_dependances_restantes = len(dependances)
+        # Nombre de tâches dépendantes pas encore soumises : quand il atteint 0, le résultat de la tâche n'est plus utile
+        self.nb_dependants_a_soumettre = 0
+
+
+class GrapheTaches:
+    """
+    Ordonnanceur de tâches avec dépendances, exécutées avec le pool de workers.
+
+    Une tâche est soumise dès que toutes ses dépendances sont terminées, sans attendre les autres tâches.
+    Sa fonction reçoit le résultat de sa dépendance (ou la liste des résultats s'il y en a plusieurs), ou son argument si elle n'a pas de dépendance.
+
+    Parmi les tâches prêtes, on soumet d'abord celles de plus grande priorité : en donnant aux étapes les plus avancées une priorité plus grande,
+    chaque objet traverse toutes les étapes le plus vite possible au lieu que toutes les tâches d'une étape soient exécutées avant la suivante.
+    Le nombre de tâches en cours est limité pour que cet ordre soit respecté
+    """
+
+    def __init__(self, pool:Executeur, nb_taches_max:int):
+        self.pool = pool
+        self.nb_taches_max = nb_taches_max
+        self.taches:Dict[Hashable, Tache] = {}
+        self.ordre = 0
+
+
+    def ajouter(self, cle:Hashable, fonction:Callable, argument=None, dependances:List[Hashable]=[], priorite:int=0, nom:str="")->None:
+        tache = Tache(cle, fonction, argument, list(dependances), priorite, nom)
+        self.taches[cle] = tache
+        for dependance in dependances:
+            self.taches[dependance].dependants.append(cle)
+            self.taches[dependance].nb_dependants_a_soumettre += 1
+
+
+    def run(self, desc:str)->Dict[Hashable, object]:
+        """
+        Exécute toutes les tâches et renvoie les résultats des tâches dont aucune autre tâche ne dépend
+        """
+        terminees:queue.Queue = queue.Queue()
+        pretes = []
+        for tache in self.taches.values():
+            if tache.nb_dependances_restantes == 0:
+                self.ajouter_prete(pretes, tache)
+
+        resultats = {}
+        resultats_finaux = {}
+        cpu_par_etape = {}
+        nb_par_etape = {}
+        nb_en_cours = 0
+        with mesurer(desc, len(self.taches)) as mesure:
+            with tqdm(total=len(self.taches), desc=desc) as barre:
+                while len(pretes) > 0 or nb_en_cours > 0:
+                    while len(pretes) > 0 and nb_en_cours < self.nb_taches_max:
+                        _, _, cle = heapq.heappop(pretes)
+                        self.soumettre(self.taches[cle], resultats, terminees)
+                        nb_en_cours += 1
+
+                    cle, succes, resultat = terminees.get()
+                    nb_en_cours -= 1
+                    if not succes:
+                        raise resultat
+                    resultat, cpu, rss = resultat
+                    mesure.ajouter_worker(cpu, rss)
+                    barre.update(1)
+
+                    tache = self.taches[cle]
+                    cpu_par_etape[tache.nom] = cpu_par_etape.get(tache.nom, 0) + cpu
+                    nb_par_etape[tache.nom] = nb_par_etape.get(tache.nom, 0) + 1
+                    if len(tache.dependants) == 0:
+                        resultats_finaux[cle] = resultat
+                    else:
+                        resultats[cle] = resultat
+                    for cle_dependant in tache.dependants:
+                        dependant = self.taches[cle_dependant]
+                        dependant.nb_dependances_restantes -= 1
+                        if dependant.nb_dependances_restantes == 0:
+                            self.ajouter_prete(pretes, dependant)
+
+            rapport = get_rapport()
+            if rapport is not None:
+                for nom in cpu_par_etape.keys():
+                    rapport.ajouter(nom, cpu_par_etape[nom], nb_par_etape[nom])
+
+        return resultats_finaux
+
+
+    def ajouter_prete(self, pretes:List, tache:Tache)->None:
+        # heapq renvoie le plus petit élément : on prend l'opposé de la priorité, puis l'ordre d'arrivée
+        heapq.heappush(pretes, (-tache.priorite, self.ordre, tache.cle))
+        self.ordre += 1
+
+
+    def soumettre(self, tache:Tache, resultats:Dict, terminees:queue.Queue)->None:
+        if len(tache.dependances) == 0:
+            argument = tache.argument
+        elif len(tache.dependances) == 1:
+            argument = resultats[tache.dependances[0]]
+        else:
+            argument = [resultats[dependance] for dependance in tache.dependances]
+
+        # On libère les résultats intermédiaires dès que toutes les tâches qui en dépendent ont été soumises
+        for dependance in tache.dependances:
+            self.taches[dependance].nb_dependants_a_soumettre -= 1
+            if self.taches[dependance].nb_dependants_a_soumettre == 0:
+                del resultats[dependance]
+
+        self.pool.apply_async(
+            tache_mesuree,
+            ((tache.fonction, argument),),
+            callback=lambda resultat, cle=tache.cle: terminees.put((cle, True, resultat)),
+            error_callback=lambda erreur, cle=tache.cle: terminees.put((cle, False, erreur))
+        )
+        # L'argument a été envoyé au worker : on ne le garde pas en mémoire
+        tache.argument = None
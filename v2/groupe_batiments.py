@@ -5,10 +5,15 @@ from v2.segments import Segment
 import numpy as np
 from shapely import Point, Polygon, make_valid, GeometryCollection, LineString, MultiPolygon
 from v2.shot import Shot, MNT, RAF
-from v2.samon.monoscopie import Monoscopie, InfosResultats
+from v2.empreintes import empreinte_textes, empreinte_tableau
+from v2 import contexte, presets
+from v2.identifiants import reserver
+from v2.budget import Budget
+from v2.tables import TableBatiments, TableSegments
 import statistics
 from shapely.ops import polygonize_full
 import geopandas as gpd
+import time
 
 
 id_debug = 359
@@ -18,17 +23,20 @@ class GroupeBatiments:
 
     identifiant_global = 0
 
-    def __init__(self, batiments:List[Batiment], pva_path:str, mnt:MNT, raf:RAF, shots:List[Shot], pompei):
+    def __init__(self, batiments:List[Batiment], indice_chantier:int, mnt:MNT, pompei, identifiant:int):
         self.batiments = batiments
 
-        self.pva_path = pva_path
+        # Indice du chantier dans le contexte, qui donne le répertoire des PVA et les clichés (voir contexte.enregistrer_chantier)
+        self.indice_chantier:int = indice_chantier
+        # MNT du cliché d'un pâté de maisons du groupe : il est envoyé aux workers sous la forme de l'indice du cliché
         self.mnt = mnt
-        self.raf = raf
-        self.shots = shots
         self.pompei = pompei
 
-        self.identifiant:int = GroupeBatiments.identifiant_global
-        GroupeBatiments.identifiant_global += 1
+        self.identifiant:int = identifiant
+
+        # Plages d'identifiants réservées par le processus principal pour les segments et les groupes de segments créés dans les workers
+        self.premier_identifiant_segment:int = None
+        self.premier_identifiant_groupe_segments:int = None
 
 
         self.estim_z:float=None
@@ -43,6 +51,10 @@ class GroupeBatiments:
 
         self.groupes_segments:List[GroupeSegments] = []
 
+        # Tables en colonnes des bâtiments et des segments du groupe, créées avec les segments (voir v2/tables.py)
+        self.table_batiments:TableBatiments = None
+        self.table_segments:TableSegments = None
+
         self.geometrie_fermee:Polygon = None
 
         self.nb_images_z_estim = -1 # Nombre d'images utilisées par Samon pour déterminer la hauteur du bâtiment
@@ -52,6 +64,24 @@ class GroupeBatiments:
 
         self.score = 0
 
+        # Temps CPU passé dans chaque méthode d'estimation de la hauteur, pour le rapport de performances
+        self.durees_estimation_z = {}
+
+        # Empreinte des données utilisées pour estimer la hauteur (voir CacheEstimationZ)
+        self.empreinte_entrees:str = None
+        self.empreinte:str = None
+        self.estimation_z_reutilisee = False
+
+        # Méthodes d'estimation de la hauteur interrompues parce que le budget de temps de la tâche était dépassé (voir v2/budget.py)
+        self.budget_depasse:List[str] = []
+        # Vrai si le budget a été dépassé avant qu'une méthode ne donne une hauteur : la hauteur est celle de la méthode Echec,
+        # et le groupe est enregistré dans [output]/groupes_differes.json pour être traité à nouveau
+        self.differe = False
+
+        # Position au sol du bâtiment avant l'estimation de sa hauteur. Elle ne dépend que des prédictions et du MNT,
+        # et décide de la tuile qui conserve le bâtiment lors de la fusion (voir v2/tuilage.py)
+        self.position_terrain:Tuple[float, float] = self.compute_position_terrain()
+
 
     def set_methode_fermeture(self, methode:str):
         """
@@ -71,11 +101,16 @@ class GroupeBatiments:
     def get_methode_estimation_hauteur(self)->str:
         return self.methode_estimation_hauteur
 
-    def compute_z_mean(self):
+    def compute_z_mean(self, budget:Budget=None):
+        """
+        Si le budget est dépassé, l'estimation utilise les paires de bâtiments déjà comparées
+        """
         estim_z_sum = 0
         compte = 0
-        i_max = min(100, len(self.batiments)) # Pour certains groupes, on peut avoir 2000 bâtiments, ce qui est très long à traiter... 
+        i_max = min(presets.get("nb_batiments_max_paires"), len(self.batiments)) # Pour certains groupes, on peut avoir 2000 bâtiments, ce qui est très long à traiter... 
         for i1 in range(i_max):
+            if self.verifier_budget(budget, "Barycentre"):
+                break
             for i2 in range(i1+1, i_max):
                 b1 = self.batiments[i1]
                 b2 = self.batiments[i2]
@@ -97,8 +132,8 @@ class GroupeBatiments:
         return estim_z_final + z
 
 
-    def compute_z_mean_v2(self)->Tuple[float, int]:
-        i_max = min(100, len(self.batiments)) # Pour certains groupes, on peut avoir 2000 bâtiments, ce qui est très long à traiter... 
+    def compute_z_mean_v2(self, budget:Budget=None)->Tuple[float, int]:
+        i_max = min(presets.get("nb_batiments_max_paires"), len(self.batiments)) # Pour certains groupes, on peut avoir 2000 bâtiments, ce qui est très long à traiter... 
         distances = []
         z_mean = []
 
@@ -107,6 +142,8 @@ class GroupeBatiments:
 
         # Pour chaque couple de bâtiments
         for i1 in range(i_max):
+            if self.verifier_budget(budget, "Points"):
+                break
             for i2 in range(i1+1, i_max):
                 b1 = self.batiments[i1]
                 b2 = self.batiments[i2]
@@ -154,6 +191,16 @@ class GroupeBatiments:
 
 
 
+    def compute_position_terrain(self)->Tuple[float, float]:
+        """
+        Renvoie la moyenne des centres des bâtiments projetés sur le MNT
+        """
+        centres = [batiment.geometrie_terrain.centroid for batiment in self.batiments if batiment.geometrie_terrain is not None]
+        if len(centres) == 0:
+            return None
+        return float(np.mean([c.x for c in centres])), float(np.mean([c.y for c in centres]))
+
+
     def get_nb_shots(self)->int:
         """
         Renvoie le nombre de pva sur lesquelles se trouvent le bâtiment
@@ -170,14 +217,51 @@ class GroupeBatiments:
         for batiment in self.batiments:
             batiment.compute_ground_geometry(estim_z=self.estim_z)
 
+    @property
+    def pva_path(self)->str:
+        return contexte.get_pva_path_chantier(self.indice_chantier)
+
+    @property
+    def shots(self)->List[Shot]:
+        return contexte.get_shots_chantier(self.indice_chantier)
+
+    @property
+    def raf(self)->RAF:
+        return contexte.get_raf()
+
+
     def get_identifiant(self)->int:
         return self.identifiant
 
 
+    def reserver_identifiants_segments(self)->None:
+        """
+        A appeler dans le processus principal, avant la création des segments. Un groupe de segments contient au moins deux segments
+        et un segment n'appartient qu'à un seul groupe : il y a au plus deux fois moins de groupes de segments que de segments
+        """
+        nb_segments = sum([batiment.get_nb_segments() for batiment in self.batiments])
+        self.premier_identifiant_segment = reserver(Segment, nb_segments)
+        self.premier_identifiant_groupe_segments = reserver(GroupeSegments, nb_segments // 2)
+
+
     def create_segments(self)->None:
+        identifiant = self.premier_identifiant_segment
         for batiment in self.batiments:
-            batiment.create_segments()
-            batiment.create_numpy_array()
+            identifiant = batiment.create_segments(identifiant)
+        self.table_batiments = TableBatiments(self.batiments)
+        self.table_segments = TableSegments.depuis_batiments(self.batiments)
+        self.table_segments.calculer_colonnes()
+
+
+    def update_table_segments(self)->None:
+        """
+        Recopie dans la table des segments l'identifiant du groupe de segments de chaque segment
+        """
+        if self.table_segments is None:
+            return
+        for batiment in self.batiments:
+            tranche = batiment.get_tranche_segments()
+            self.table_segments.groupe[tranche] = [segment.get_identifiant_groupe() for segment in batiment.get_segments()]
 
     def get_batiments(self)->List[Batiment]:
         return self.batiments
@@ -424,14 +508,16 @@ class GroupeBatiments:
         return gdf_max
     
 
-    def compute_z_mean_samon(self, dictionnaires, nb_shots:int):
+    def compute_z_mean_samon(self, dictionnaires, nb_shots:int, budget:Budget=None):
         """
         On calcule tous les points contenus dans dictionnaire avec Samon. On s'arrête dès qu'un point semble satisfaisant (suffisamment d'images utilisées pour le calculer)
         """
+        # Import ici : Samon (et GDAL) ne sont importés que par les workers qui en ont besoin
+        from v2.samon.monoscopie import Monoscopie, InfosResultats
         monoscopie = Monoscopie(self.pva_path, self.mnt, self.raf, self.shots)
 
         for i, dictionnaire in enumerate(dictionnaires):
-            if i > 4:
+            if i >= presets.get("nb_tentatives_samon") or self.verifier_budget(budget, "Samon"):
                 break
             infos_resultats:InfosResultats = monoscopie.run(dictionnaire["point"], dictionnaire["shot"])
             if infos_resultats.reussi:
@@ -443,12 +529,61 @@ class GroupeBatiments:
         return None, None
 
 
+    def estimer_z_echec(self):
+        """
+        Si aucune méthode n'a marché, alors on fixe arbitrairement la hauteur du bâtiment à 10 mètres
+        """
+        centroid = self.batiments[0].geometrie_terrain.centroid
+        z = self.batiments[0].mnt.get(centroid.x, centroid.y)+10
+        self.estim_z = z
+        self.nb_images_z_estim = -1
+        self.set_methode_estimation_hauteur("Echec")
+
+
+    def get_estimation_z_cache(self):
+        """
+        Renvoie la hauteur estimée lors d'un traitement précédent avec les mêmes données, ou None.
+
+        On complète l'empreinte calculée dans le processus principal avec les valeurs du MNT autour du groupe de bâtiments
+        """
+        if self.empreinte_entrees is None:
+            return None
+        bounds = np.array([batiment.geometrie_terrain.bounds for batiment in self.batiments])
+        fenetre = self.batiments[0].mnt.get_fenetre(np.min(bounds[:,0])-10, np.min(bounds[:,1])-10, np.max(bounds[:,2])+10, np.max(bounds[:,3])+10)
+        self.empreinte = empreinte_textes([self.empreinte_entrees, empreinte_tableau(fenetre)])
+        return contexte.get_cache_z().get(self.empreinte)
+
+
+    def verifier_budget(self, budget:Budget, methode:str)->bool:
+        """
+        Renvoie vrai si le budget est dépassé, et note que la méthode a été interrompue
+        """
+        if budget is None or not budget.depasse():
+            return False
+        if methode not in self.budget_depasse:
+            self.budget_depasse.append(methode)
+        return True
+
+
     def compute_z(self):
-        if len(self.batiments)<=1:
+        """
+        Estime la hauteur avec la première méthode qui réussit parmi Barycentre, Points (Pompei) et Samon, ou à défaut Echec.
+        Une fois le budget de temps de la tâche dépassé, la méthode en cours s'arrête avec les calculs déjà faits,
+        et les méthodes suivantes, plus coûteuses, sont remplacées par Echec
+        """
+        budget = Budget(contexte.get_budget_tache())
+        resultat_cache = self.get_estimation_z_cache()
+        if resultat_cache is not None:
+            self.estim_z, self.nb_images_z_estim, methode = resultat_cache
+            self.set_methode_estimation_hauteur(methode)
+            self.estimation_z_reutilisee = True
+        elif len(self.batiments)<=1:
             self.set_methode_estimation_hauteur("Echec")
         else:
         
-            estim_z = self.compute_z_mean()
+            tic = time.process_time()
+            estim_z = self.compute_z_mean(budget)
+            self.durees_estimation_z["Barycentre"] = time.process_time() - tic
             if estim_z is not None:
                 self.estim_z = estim_z
                 self.set_methode_estimation_hauteur("Barycentre")
@@ -456,8 +591,10 @@ class GroupeBatiments:
             
             else:
                 # Estimation rapide de la hauteur du bâtiment, seulement dans le cas de Pompei
-                if self.pompei:
-                    estim_z, nb_points = self.compute_z_mean_v2()
+                if self.pompei and not self.verifier_budget(budget, "Points"):
+                    tic = time.process_time()
+                    estim_z, nb_points = self.compute_z_mean_v2(budget)
+                    self.durees_estimation_z["Points"] = time.process_time() - tic
                 else:
                     nb_points = 0
                 
@@ -466,24 +603,26 @@ class GroupeBatiments:
                     self.estim_z = estim_z
                     self.nb_images_z_estim = nb_points
                     self.set_methode_estimation_hauteur("Points")
+                elif self.verifier_budget(budget, "Samon"):
+                    self.estimer_z_echec()
+                    self.differe = True
                 else:
                     # On récupère tous les points qui se trouvent sur le bâtiment
                     # Pour cela, sur chaque polygone issus de pvas différentes, on applique un buffer de -2 mètres et on récupère tous les sommets du polygones
+                    tic = time.process_time()
                     dictionnaires = self.get_point_samon()
                     # On récupère une estimation de la hauteur du bâtiment
-                    z_mean, nb_images = self.compute_z_mean_samon(dictionnaires, self.get_nb_shots())
+                    z_mean, nb_images = self.compute_z_mean_samon(dictionnaires, self.get_nb_shots(), budget)
+                    self.durees_estimation_z["Samon"] = time.process_time() - tic
                     #z_mean, nb_images = 10, -1 # Cette ligne est utile pour les tests si on ne veut pas utiliser Samon qui rallonge sensiblement les calculs
                     if z_mean is not None:
                         self.estim_z = z_mean
                         self.nb_images_z_estim = nb_images
                         self.set_methode_estimation_hauteur("Samon")
                     else:
-                        # Si cela n'a pas marché, alors on fixe arbitrairement la hauteur du bâtiment à 10 mètres
-                        centroid = self.batiments[0].geometrie_terrain.centroid
-                        z = self.batiments[0].mnt.get(centroid.x, centroid.y)+10
-                        self.estim_z = z
-                        self.nb_images_z_estim = -1
-                        self.set_methode_estimation_hauteur("Echec")
+                        self.estimer_z_echec()
+                        # Samon n'a pas pu essayer tous ses points
+                        self.differe = "Samon" in self.budget_depasse
                 
         
         self.update_geometry_terrain()
@@ -1,20 +1,23 @@
 from v2.pateMaison import PateMaison
+from v2.index_spatial import IndexSpatial
 from typing import List
+from shapely import area, intersection
 import numpy as np
 
 class GroupePatesMaisons:
 
     identifiant_global = 0
 
-    def __init__(self, pates_maisons:List[PateMaison]):
+    def __init__(self, pates_maisons:List[PateMaison], identifiant:int):
         self.pates_maisons = pates_maisons
 
-        self.identifiant:int = PateMaison.identifiant_global
-        PateMaison.identifiant_global += 1
+        self.identifiant:int = identifiant
 
         for pm in self.pates_maisons:
             pm.set_id_groupe_pate_maison(self.identifiant)
         self.gdf = None
+        # Paires de bâtiments candidates à l'association (voir IndexSpatial.candidats_par_groupe)
+        self.candidats:np.ndarray = None
 
     def create_geodataframe(self):
         for pm in self.pates_maisons:
@@ -38,36 +41,23 @@ class GroupePatesMaisons:
 
 
     def association(self):
-        for pm1 in self.pates_maisons:
-            geoserie_1 = pm1.get_geodataframe().geometry
-            if geoserie_1.shape[0]==0:
-                continue
-            for pm2 in self.pates_maisons:
-                if pm1.identifiant == pm2.identifiant:
-                    continue
-            
-                geoserie_2 = pm2.get_geodataframe().geometry
-                if geoserie_2.shape[0]==0:
-                    continue
-
-                intersections = geoserie_2.sindex.query(geoserie_1, predicate="intersects")
-                for i in range(geoserie_1.shape[0]):
-                    # Pour chaque bâtiment, on récupère parmi les bâtiments qu'il intersecte celui avec lequel il partage la plus grande aire
-                    bati_1 = pm1.get_batiment_i(i)
-                        
-                    bati_1_emprise = bati_1.get_geometrie_terrain()
-                    area_max = 0
-                    bati_max = None
-
-                    indices = np.where(intersections[0,:]==i)[0]
-                    for j in range(indices.shape[0]):
-                        indice = indices[j]                                
-                        bati_2 = pm2.get_batiment_i(intersections[1,indice])
-                        aire_commune = bati_1_emprise.intersection(bati_2.get_geometrie_terrain()).area
-                        if aire_commune > area_max:
-                            area_max = aire_commune
-                            bati_max = bati_2
-                    if bati_max is not None:
-                        bati_1.add_homologue(bati_max.identifiant)
-                        bati_max.add_homologue(bati_1.identifiant)
-        
\ No newline at end of file
+        """
+        Pour chaque bâtiment et chaque autre pâté de maisons du groupe, on garde le bâtiment avec lequel il partage la plus grande aire.
+
+        Les candidats sont ceux obtenus par l'index spatial de tous les bâtiments (voir AssociationBatimentEngine.association).
+        S'ils n'ont pas été donnés, on les calcule avec un index des bâtiments du groupe
+        """
+        candidats = self.candidats
+        if candidats is None:
+            index = IndexSpatial.depuis_batiments([self])
+            candidats = index.candidats_par_groupe(*index.paires("intersects"), 1)[0]
+        self.candidats = None
+
+        batiments_1 = [self.pates_maisons[pm].get_batiment_i(i) for pm, i in candidats[:,:2].tolist()]
+        batiments_2 = [self.pates_maisons[pm].get_batiment_i(i) for pm, i in candidats[:,2:].tolist()]
+        aires = area(intersection([bati.get_geometrie_terrain() for bati in batiments_1], [bati.get_geometrie_terrain() for bati in batiments_2]))
+        for k in IndexSpatial.meilleures_paires([candidats[:,0], candidats[:,1], candidats[:,2]], aires).tolist():
+            # Les deux bâtiments font partie du même groupe de pâtés de maisons, envoyé en entier au worker :
+            # on peut garder directement les objets, ils seront renvoyés ensemble au processus principal
+            batiments_1[k].add_homologue(batiments_2[k])
+            batiments_2[k].add_homologue(batiments_1[k])
@@ -9,10 +9,9 @@ class GroupeSegments:
     identifiant_global = 0
 
 
-    def __init__(self, segments:List[Segment]):
+    def __init__(self, segments:List[Segment], identifiant:int):
         self.segments = segments
-        self.identifiant:int = GroupeSegments.identifiant_global
-        GroupeSegments.identifiant_global += 1
+        self.identifiant:int = identifiant
 
         for segment in self.segments:
             segment.groupe_segments = self
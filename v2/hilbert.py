@@ -0,0 +1,52 @@
+"""
+Ordre le long d'une courbe de Hilbert.
+
+Deux points proches sur la courbe sont proches sur le terrain : des tâches envoyées dans cet ordre lisent les mêmes zones du MNT et des PVA
+au même moment, et trouvent leurs pages dans le cache du système (commun à tous les workers d'un noeud)
+"""
+from typing import List, Tuple
+import numpy as np
+
+
+def indices_hilbert(x:np.ndarray, y:np.ndarray, ordre:int=16)->np.ndarray:
+    """
+    Position de chaque point (x, y) sur la courbe de Hilbert d'ordre ordre (grille de 2**ordre x 2**ordre cases) qui couvre l'emprise des points
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = 2**ordre
+    if x.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Coordonnées entières dans la grille
+    etendue = max(np.max(x) - np.min(x), np.max(y) - np.min(y), 1e-9)
+    xi = np.minimum(((x - np.min(x)) / etendue * n).astype(np.int64), n - 1)
+    yi = np.minimum(((y - np.min(y)) / etendue * n).astype(np.int64), n - 1)
+
+    indices = np.zeros(x.shape[0], dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = ((xi & s) > 0).astype(np.int64)
+        ry = ((yi & s) > 0).astype(np.int64)
+        indices += s * s * ((3 * rx) ^ ry)
+        # Rotation du quadrant pour que la courbe reste continue
+        tourner = ry == 0
+        inverser = tourner & (rx == 1)
+        xi = np.where(inverser, n - 1 - xi, xi)
+        yi = np.where(inverser, n - 1 - yi, yi)
+        xi, yi = np.where(tourner, yi, xi), np.where(tourner, xi, yi)
+        s //= 2
+    return indices
+
+
+def ordonner_hilbert(positions:List[Tuple[float, float]])->List[int]:
+    """
+    Renvoie les indices des positions dans l'ordre de la courbe de Hilbert. Les positions inconnues (None) sont placées à la fin, dans leur ordre initial
+    """
+    connues = [i for i, position in enumerate(positions) if position is not None]
+    inconnues = [i for i, position in enumerate(positions) if position is None]
+    if len(connues) == 0:
+        return inconnues
+    xy = np.array([positions[i] for i in connues], dtype=np.float64)
+    indices = indices_hilbert(xy[:,0], xy[:,1])
+    ordre = np.argsort(indices, kind="stable")
+    return [connues[i] for i in ordre] + inconnues
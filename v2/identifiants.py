@@ -0,0 +1,21 @@
+"""
+Attribution des identifiants.
+
+Le compteur identifiant_global de chaque classe (PateMaison, Batiment, GroupePatesMaisons, GroupeBatiments, Segment, GroupeSegments)
+est le prochain identifiant libre. Il n'est modifié que dans le processus principal : les compteurs des workers divergeraient.
+
+Les objets créés dans les workers reçoivent leur identifiant du processus principal :
+- les pâtés de maisons et les bâtiments sont renumérotés après le chargement, dans l'ordre des prédictions,
+- avant la création des segments, chaque groupe de bâtiments réserve une plage d'identifiants pour ses segments et ses groupes de segments.
+
+Les identifiants ne dépendent donc ni du nombre de workers, ni de l'ordre dans lequel les tâches se terminent
+"""
+
+
+def reserver(classe, nb:int)->int:
+    """
+    Réserve nb identifiants consécutifs pour classe et renvoie le premier
+    """
+    premier = classe.identifiant_global
+    classe.identifiant_global += nb
+    return premier
@@ -0,0 +1,136 @@
+"""
+Index spatial (STRtree) des géométries terrain du chantier.
+
+Les pâtés de maisons de toutes les prédictions sont rangés dans un seul index dès que leurs géométries terrain sont calculées,
+puis les bâtiments de tous les groupes de pâtés de maisons, quand leurs géométries terrain sont calculées à leur tour.
+Chaque géométrie est étiquetée par :
+* source : liste dont elle vient (prédiction pour un pâté de maisons, pâté de maisons pour un bâtiment), et indice dans cette liste
+* groupe : groupe de pâtés de maisons du bâtiment (0 pour les pâtés de maisons)
+* image : cliché de la prédiction ou du bâtiment
+
+Les candidats des associations sont obtenus par une seule requête sur l'index (STRtree.query avec un prédicat),
+au lieu d'un index par paire de prédictions ou de pâtés de maisons. Les aires communes sont calculées sur toutes les paires à la fois
+"""
+from __future__ import annotations
+from typing import List, Tuple
+import numpy as np
+from shapely import STRtree, area, intersection
+
+
+class IndexSpatial:
+
+    def __init__(self, geometries:List, source:List[int], source_locale:List[int], indice:List[int], groupe:List[int], images:List[str], image:List[int]):
+        # Tableau d'objets, pour pouvoir indexer les géométries par un tableau d'indices
+        self.geometries:np.ndarray = np.empty(len(geometries), dtype=object)
+        self.geometries[:] = geometries
+        self.arbre:STRtree = STRtree(self.geometries)
+
+        # Numéro de la source dans tout l'index, numéro de la source dans son groupe, et indice de la géométrie dans sa source
+        self.source:np.ndarray = np.asarray(source, dtype=np.int64)
+        self.source_locale:np.ndarray = np.asarray(source_locale, dtype=np.int64)
+        self.indice:np.ndarray = np.asarray(indice, dtype=np.int64)
+        self.groupe:np.ndarray = np.asarray(groupe, dtype=np.int64)
+        self.images:List[str] = images
+        self.image:np.ndarray = np.asarray(image, dtype=np.int64)
+
+
+    @staticmethod
+    def depuis_pates_maisons(predictions:List) -> IndexSpatial:
+        """
+        Index des géométries terrain des pâtés de maisons de toutes les prédictions
+        """
+        geometries, source, indice, images, image = [], [], [], [], []
+        for i, prediction in enumerate(predictions):
+            if prediction.shot.image not in images:
+                images.append(prediction.shot.image)
+            for j, pm in enumerate(prediction.get_pates_maisons()):
+                geometries.append(pm.get_geometrie_terrain())
+                source.append(i)
+                indice.append(j)
+                image.append(images.index(prediction.shot.image))
+        return IndexSpatial(geometries, source, source, indice, [0]*len(geometries), images, image)
+
+
+    @staticmethod
+    def depuis_batiments(groupes_pates_maisons:List) -> IndexSpatial:
+        """
+        Index des géométries terrain des bâtiments de tous les groupes de pâtés de maisons. Les bâtiments sans géométrie terrain ne sont jamais candidats
+        """
+        geometries, source, source_locale, indice, groupe, images, image = [], [], [], [], [], [], []
+        numero_source = 0
+        for i, gpm in enumerate(groupes_pates_maisons):
+            for j, pm in enumerate(gpm.pates_maisons):
+                for k, batiment in enumerate(pm.batiments):
+                    if batiment.shot.image not in images:
+                        images.append(batiment.shot.image)
+                    geometries.append(batiment.get_geometrie_terrain())
+                    source.append(numero_source)
+                    source_locale.append(j)
+                    indice.append(k)
+                    groupe.append(i)
+                    image.append(images.index(batiment.shot.image))
+                numero_source += 1
+        return IndexSpatial(geometries, source, source_locale, indice, groupe, images, image)
+
+
+    def paires(self, predicat:str="intersects", images_differentes:bool=False)->Tuple[np.ndarray, np.ndarray]:
+        """
+        Renvoie les paires (a, b) de géométries de l'index qui vérifient le prédicat, d'un même groupe mais de sources différentes,
+        et éventuellement de clichés différents.
+
+        Les paires sont dans l'ordre des anciens parcours : source de a, source de b, puis a et b
+        """
+        a, b = self.arbre.query(self.geometries, predicate=predicat)
+        garder = np.logical_and(self.groupe[a] == self.groupe[b], self.source[a] != self.source[b])
+        if images_differentes:
+            garder = np.logical_and(garder, self.image[a] != self.image[b])
+        a, b = a[garder], b[garder]
+        ordre = np.lexsort((b, a, self.source[b], self.source[a]))
+        return a[ordre], b[ordre]
+
+
+    def aires_communes(self, a:np.ndarray, b:np.ndarray)->np.ndarray:
+        return area(intersection(self.geometries[a], self.geometries[b]))
+
+
+    def associer(self, a:np.ndarray, b:np.ndarray)->Tuple[np.ndarray, np.ndarray]:
+        """
+        Parmi les paires (a, b) données par paires(), garde pour chaque géométrie a et chaque source la géométrie b avec laquelle a partage la plus grande aire
+        """
+        retenues = IndexSpatial.meilleures_paires([a, self.source[b]], self.aires_communes(a, b))
+        return a[retenues], b[retenues]
+
+
+    def candidats_par_groupe(self, a:np.ndarray, b:np.ndarray, nb_groupes:int)->List[np.ndarray]:
+        """
+        Répartit les paires (a, b) données par paires() entre les groupes.
+        Pour chaque groupe, renvoie un tableau (n, 4) : numéro de la source de a dans le groupe, indice de a dans sa source, puis la même chose pour b
+        """
+        candidats = np.stack((self.source_locale[a], self.indice[a], self.source_locale[b], self.indice[b]), axis=1)
+        groupes = self.groupe[a]
+        # Les paires sont triées par source, donc par groupe
+        debuts = np.searchsorted(groupes, np.arange(nb_groupes + 1))
+        return [candidats[debuts[i]:debuts[i+1]] for i in range(nb_groupes)]
+
+
+    @staticmethod
+    def meilleures_paires(cles:List[np.ndarray], aires:np.ndarray)->np.ndarray:
+        """
+        Les paires sont regroupées par valeurs consécutives identiques des clés. Pour chaque groupe, on garde la première paire dont l'aire commune est la plus grande,
+        si cette aire est strictement positive, comme le faisaient les anciens parcours.
+
+        Renvoie les indices des paires retenues, dans l'ordre
+        """
+        nb_paires = aires.shape[0]
+        if nb_paires == 0:
+            return np.zeros(0, dtype=np.int64)
+        change = np.zeros(nb_paires, dtype=bool)
+        change[0] = True
+        for cle in cles:
+            change[1:] = np.logical_or(change[1:], cle[1:] != cle[:-1])
+        debuts = np.flatnonzero(change)
+        # fmax ignore les aires nan, qui n'étaient jamais retenues
+        maximums = np.fmax.reduceat(aires, debuts)
+        groupe = np.cumsum(change) - 1
+        premiers = np.minimum.reduceat(np.where(aires == maximums[groupe], np.arange(nb_paires), nb_paires), debuts)
+        return premiers[maximums > 0]
@@ -0,0 +1,78 @@
+import os
+import gc
+from typing import List, Dict
+from v2.groupe_pate_maisons import GroupePatesMaisons
+from v2 import checkpoint
+from v2.rapport_performances import get_rss_mo
+from v2.hilbert import ordonner_hilbert
+from v2.ordonnancement import get_position
+
+
+class GestionnaireLots:
+    """
+    Découpe les groupes de pâtés de maisons en lots spatialement cohérents, traités les uns après les autres.
+
+    Les lots pas encore traités sont gardés en mémoire tant que la mémoire résidente du processus reste sous memoire_max (en Go).
+    Au-delà, ils sont écrits sur disque et relus au moment de leur traitement
+    """
+
+    def __init__(self, path_output:str, memoire_max:float=None):
+        self.path = os.path.join(path_output, "lots")
+        self.memoire_max = memoire_max
+        self.lots:List[List[GroupePatesMaisons]] = []
+        self.fichiers:Dict[int, str] = {}
+
+
+    def decouper(self, groupes_pates_maisons:List[GroupePatesMaisons], taille_lot:int)->None:
+        """
+        Ordonne les groupes de pâtés de maisons le long d'une courbe de Hilbert, pour que deux groupes consécutifs soient proches
+        et que chaque lot couvre une zone compacte, puis les découpe en lots de taille_lot groupes
+        """
+        indices = ordonner_hilbert([get_position(gpm) for gpm in groupes_pates_maisons])
+        groupes_pates_maisons = [groupes_pates_maisons[i] for i in indices]
+        self.lots = [groupes_pates_maisons[i:i+taille_lot] for i in range(0, len(groupes_pates_maisons), taille_lot)]
+        self.fichiers = {}
+        self.controler_memoire()
+
+
+    def get_nb_lots(self)->int:
+        return len(self.lots)
+
+
+    def get_lot(self, i:int)->List[GroupePatesMaisons]:
+        if i in self.fichiers:
+            lot = checkpoint.lire(self.fichiers[i])
+            os.remove(self.fichiers[i])
+            del self.fichiers[i]
+            return lot
+        return self.lots[i]
+
+
+    def liberer(self, i:int)->None:
+        """
+        Le lot i a été traité : on ne garde plus de référence vers ses objets
+        """
+        self.lots[i] = None
+        gc.collect()
+        self.controler_memoire()
+
+
+    def controler_memoire(self)->None:
+        """
+        Si la mémoire résidente dépasse le budget, on écrit sur disque les lots encore en mémoire
+        """
+        if self.memoire_max is None or get_rss_mo() < self.memoire_max * 1024:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        nb_ecrits = 0
+        for i, lot in enumerate(self.lots):
+            if lot is None or i in self.fichiers:
+                continue
+            path = os.path.join(self.path, f"lot_{i}.pkl")
+            checkpoint.ecrire(path, lot)
+            self.fichiers[i] = path
+            self.lots[i] = None
+            nb_ecrits += 1
+        gc.collect()
+        if nb_ecrits > 0:
+            print(f"Mémoire au-delà de {self.memoire_max} Go : {nb_ecrits} lots écrits sur disque")
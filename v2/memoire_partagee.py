@@ -0,0 +1,101 @@
+"""
+Tableaux en lecture seule (MNT, grille RAF) partagés par tous les processus d'un noeud.
+
+Un tableau est écrit une seule fois, par le processus principal, dans un fichier .npy projeté en mémoire (memmap).
+Les processus qui l'utilisent ne reçoivent que son chemin, sa forme et éventuellement une fenêtre :
+ils l'ouvrent en lecture seule et partagent les mêmes pages du cache du système, sans copie.
+Le MNT de chaque cliché est une fenêtre sur le MNT global, il n'est donc pas réécrit sur disque.
+
+Placer le répertoire dans /dev/shm garde les tableaux en mémoire vive
+"""
+import os
+from typing import Dict, Tuple
+import numpy as np
+
+
+# Tableaux déjà ouverts dans le processus courant, par chemin
+_tableaux:Dict[str, np.ndarray] = {}
+
+
+def ouvrir(path:str)->np.ndarray:
+    tableau = _tableaux.get(path)
+    if tableau is None:
+        tableau = np.load(path, mmap_mode="r")
+        _tableaux[path] = tableau
+    return tableau
+
+
+class TableauPartage:
+    """
+    Référence légère vers un tableau 2D écrit dans un fichier .npy, ou vers une fenêtre (lignes, colonnes) de ce tableau.
+
+    S'utilise comme un tableau numpy en lecture seule (indexation, shape, np.asarray).
+    Seule la référence est sérialisée : elle peut être envoyée aux workers et écrite dans les checkpoints,
+    tant que le fichier existe
+    """
+
+    def __init__(self, path:str, shape:Tuple[int, int], dtype:str, fenetre:Tuple[int, int, int, int]=None):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        # Fenêtre (ligne min, ligne max, colonne min, colonne max) dans le tableau du fichier
+        if fenetre is None:
+            fenetre = (0, shape[0], 0, shape[1])
+        self.fenetre = fenetre
+        self.shape = (fenetre[1] - fenetre[0], fenetre[3] - fenetre[2])
+
+
+    @staticmethod
+    def ecrire(path:str, array:np.ndarray, dtype:str="f4"):
+        """
+        Ecrit le tableau dans path et renvoie une référence vers lui.
+        Le fichier est écrit sous un nom temporaire puis renommé, pour qu'un autre processus ne l'ouvre jamais incomplet
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        path_temporaire = f"{path}.{os.getpid()}.tmp"
+        tableau = np.lib.format.open_memmap(path_temporaire, mode="w+", dtype=dtype, shape=array.shape)
+        tableau[:,:] = array
+        tableau.flush()
+        del tableau
+        os.replace(path_temporaire, path)
+        # Le fichier a peut-être été réécrit depuis sa dernière ouverture dans ce processus
+        _tableaux.pop(path, None)
+        return TableauPartage(path, array.shape, dtype)
+
+
+    def get_fenetre(self, ligne_min:int, ligne_max:int, colonne_min:int, colonne_max:int):
+        """
+        Renvoie une référence vers une fenêtre de ce tableau, sans copie. Les indices sont relatifs à ce tableau
+        """
+        ligne_min = min(max(ligne_min, 0), self.shape[0])
+        ligne_max = min(max(ligne_max, ligne_min), self.shape[0])
+        colonne_min = min(max(colonne_min, 0), self.shape[1])
+        colonne_max = min(max(colonne_max, colonne_min), self.shape[1])
+        fenetre = (
+            self.fenetre[0] + ligne_min,
+            self.fenetre[0] + ligne_max,
+            self.fenetre[2] + colonne_min,
+            self.fenetre[2] + colonne_max
+        )
+        return TableauPartage(self.path, None, self.dtype.str, fenetre)
+
+
+    def get_array(self)->np.ndarray:
+        """
+        Vue en lecture seule sur le fichier, limitée à la fenêtre
+        """
+        return ouvrir(self.path)[self.fenetre[0]:self.fenetre[1], self.fenetre[2]:self.fenetre[3]]
+
+
+    def __getitem__(self, key):
+        return self.get_array()[key]
+
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.get_array()
+        if dtype is not None:
+            return array.astype(dtype)
+        return array
+
+
+    def __reduce__(self):
+        return (TableauPartage, (self.path, None, self.dtype.str, self.fenetre))
@@ -0,0 +1,261 @@
+"""
+Noyaux numériques des boucles les plus coûteuses du traitement.
+
+Si numba est installé, les noyaux sont compilés à la volée (une fois par machine : la compilation est mise en cache dans v2/__pycache__).
+Sinon, on utilise leur version numpy. La variable d'environnement SAMON_NOYAUX=numpy force la version numpy.
+
+Les deux versions donnent exactement les mêmes résultats que le code qu'elles remplacent, y compris les arrondis.
+Pour cela, elles font les opérations dans le même ordre, et les normes, que np.linalg.norm calcule avec le produit scalaire de BLAS
+(qui peut utiliser des FMA), sont aussi calculées avec BLAS : np.dot dans numba, np.matmul avec numpy.
+benchmarks/noyaux.py vérifie cette équivalence et mesure les deux versions
+"""
+import os
+import math
+import itertools
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Vrai si les noyaux compilés avec numba sont utilisés
+NUMBA = numba is not None and os.environ.get("SAMON_NOYAUX", "numba") != "numpy"
+
+# Distance initiale de la recherche de la droite la plus proche (voir Batiment.compute_z_mean)
+distance_max = 1e10
+
+
+def compiler(fonction):
+    # error_model="numpy" : une division par zéro donne inf ou nan au lieu de lever une exception, comme avec numpy
+    return numba.njit(cache=True, error_model="numpy")(fonction)
+
+
+def compiler_ufunc(fonction):
+    return numba.vectorize(["float64(float64, float64, float64, float64, float64)"], cache=True)(fonction)
+
+
+def compiler_ufunc_distance(fonction):
+    return numba.vectorize(["float64(float64, float64, float64, float64, float64, float64)"], cache=True)(fonction)
+
+
+# Distance entre droites (Batiment.compute_z_mean)
+
+def distances_droites_numpy(du1:np.ndarray, du2:np.ndarray, D:np.ndarray):
+    """
+    Pour chaque droite de vecteur directeur du1[:,i] passant par le premier sommet de prise de vue, renvoie la distance minimale
+    aux droites de vecteur directeur du2[:,j] passant par le second sommet (D est le vecteur entre les deux sommets), et l'indice j de la plus proche.
+    Si aucune distance n'est inférieure à distance_max, la distance est distance_max et l'indice -1
+    """
+    n = du1.shape[1]
+    if du2.shape[1] == 0:
+        return np.full(n, distance_max), np.full(n, -1, dtype=np.int64)
+    a0, a1, a2 = du1[0][:,None], du1[1][:,None], du1[2][:,None]
+    b0, b1, b2 = du2[0][None,:], du2[1][None,:], du2[2][None,:]
+    # Produit vectoriel, dans l'ordre de np.cross
+    n0 = a1*b2 - a2*b1
+    n1 = a2*b0 - a0*b2
+    n2 = a0*b1 - a1*b0
+    produit_scalaire = n0*D[0] + n1*D[1] + n2*D[2]
+    normales = np.stack([n0, n1, n2], axis=-1)
+    normes = np.sqrt(np.matmul(normales[...,None,:], normales[...,:,None])[...,0,0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distances = np.abs(produit_scalaire) / normes
+    distances = np.where(np.isnan(distances), np.inf, distances)
+    j_min = np.argmin(distances, axis=1)
+    distances_min = distances[np.arange(n), j_min]
+    trouvees = distances_min < distance_max
+    return np.where(trouvees, distances_min, distance_max), np.where(trouvees, j_min, -1)
+
+
+def distances_droites_boucle(du1:np.ndarray, du2:np.ndarray, D:np.ndarray):
+    n = du1.shape[1]
+    distances_min = np.full(n, distance_max)
+    j_min = np.full(n, -1, dtype=np.int64)
+    normale = np.empty(3)
+    for i in range(n):
+        for j in range(du2.shape[1]):
+            normale[0] = du1[1,i]*du2[2,j] - du1[2,i]*du2[1,j]
+            normale[1] = du1[2,i]*du2[0,j] - du1[0,i]*du2[2,j]
+            normale[2] = du1[0,i]*du2[1,j] - du1[1,i]*du2[0,j]
+            produit_scalaire = normale[0]*D[0] + normale[1]*D[1] + normale[2]*D[2]
+            distance = np.abs(produit_scalaire) / np.sqrt(np.dot(normale, normale))
+            if distance < distances_min[i]:
+                distances_min[i] = distance
+                j_min[i] = j
+    return distances_min, j_min
+
+
+# Lissage des polygones (Batiment.lisser_geometries)
+
+def segments_non_nuls(x:np.ndarray, y:np.ndarray)->np.ndarray:
+    """
+    Renvoie les segments (x0, y0, x1, y1) de longueur non nulle entre les points successifs d'un contour
+    """
+    dx = x[1:] - x[:-1]
+    dy = y[1:] - y[:-1]
+    garder = dx*dx + dy*dy != 0
+    return np.ascontiguousarray(np.stack([x[:-1], y[:-1], x[1:], y[1:]], axis=1)[garder])
+
+
+def produit_scalaire_directions(x0:float, y0:float, x1:float, y1:float, x2:float, y2:float, u:np.ndarray)->float:
+    """
+    Produit scalaire entre les directions unitaires (x0, y0) -> (x1, y1) et (x1, y1) -> (x2, y2). u est un tableau de travail de deux éléments
+    """
+    u[0] = x1 - x0
+    u[1] = y1 - y0
+    norme_1 = np.sqrt(np.dot(u, u))
+    u[0] = x2 - x1
+    u[1] = y2 - y1
+    norme_2 = np.sqrt(np.dot(u, u))
+    return (x1 - x0) / norme_1 * ((x2 - x1) / norme_2) + (y1 - y0) / norme_1 * ((y2 - y1) / norme_2)
+
+
+def fusionner_segments_boucle(segments:np.ndarray, seuil_ps:float, produit_scalaire)->np.ndarray:
+    """
+    Fusionne les segments successifs presque alignés (produit scalaire des directions supérieur à seuil_ps),
+    puis le dernier segment avec le premier. Renvoie les segments fusionnés (x0, y0, x1, y1)
+    """
+    u = np.empty(2)
+    resultat = np.empty((segments.shape[0]+1, 4))
+    nb_resultats = 0
+    x0, y0, x1, y1 = segments[0,0], segments[0,1], segments[0,2], segments[0,3]
+    for i in range(1, segments.shape[0]):
+        x2 = segments[i,2]
+        y2 = segments[i,3]
+        if produit_scalaire(x0, y0, x1, y1, x2, y2, u) > seuil_ps:
+            x1 = x2
+            y1 = y2
+        else:
+            resultat[nb_resultats,0] = x0
+            resultat[nb_resultats,1] = y0
+            resultat[nb_resultats,2] = x1
+            resultat[nb_resultats,3] = y1
+            nb_resultats += 1
+            x0 = segments[i,0]
+            y0 = segments[i,1]
+            x1 = x2
+            y1 = y2
+
+    # Le premier segment est remplacé par la fusion du dernier et du premier s'ils sont presque alignés
+    debut = 0
+    if nb_resultats > 0:
+        x2 = resultat[0,2]
+        y2 = resultat[0,3]
+        if produit_scalaire(x0, y0, x1, y1, x2, y2, u) > seuil_ps:
+            debut = 1
+            x1 = x2
+            y1 = y2
+    resultat[nb_resultats,0] = x0
+    resultat[nb_resultats,1] = y0
+    resultat[nb_resultats,2] = x1
+    resultat[nb_resultats,3] = y1
+    return resultat[debut:nb_resultats+1]
+
+
+def fusionner_segments_numpy(segments:np.ndarray, seuil_ps:float)->np.ndarray:
+    # La fusion est séquentielle : sans numba, c'est la même boucle, mais sur des tableaux et non sur des objets shapely
+    return fusionner_segments_boucle(segments, seuil_ps, produit_scalaire_directions)
+
+
+# Chamfer (FermerBatimentEngine.chamfer)
+
+def distances_min_points_numpy(A:np.ndarray, B:np.ndarray)->np.ndarray:
+    """
+    Pour chaque point de A, distance au point le plus proche de B
+    """
+    ecarts = np.ascontiguousarray(A[:,None,:] - B[None,:,:])
+    return np.min(np.sqrt(np.matmul(ecarts[...,None,:], ecarts[...,:,None])[...,0,0]), axis=1)
+
+
+def distances_min_points_boucle(A:np.ndarray, B:np.ndarray)->np.ndarray:
+    distances = np.empty(A.shape[0])
+    ecart = np.empty(A.shape[1])
+    for i in range(A.shape[0]):
+        distance_min = np.inf
+        for j in range(B.shape[0]):
+            for k in range(A.shape[1]):
+                ecart[k] = A[i,k] - B[j,k]
+            distance = np.sqrt(np.dot(ecart, ecart))
+            if distance < distance_min:
+                distance_min = distance
+        distances[i] = distance_min
+    return distances
+
+
+# Résidus de la transformation de Helmert (recalage/recalage.py, calculer_inliers)
+
+def residus_helmert_numpy(TX:float, TY:float, a:float, b:float, coordonnees:np.ndarray)->np.ndarray:
+    """
+    Distance entre la transformation de chaque point (x, y) et sa position de référence (X, Y). coordonnees a pour colonnes x, y, X, Y.
+
+    Les carrés sont calculés avec pow, comme pour des scalaires numpy : pow(d, 2) peut différer d'un ulp de d*d, que numpy utilise pour les tableaux
+    """
+    x, y = coordonnees[:,0], coordonnees[:,1]
+    dx = TX + b*x + a*y - coordonnees[:,2]
+    dy = TY - a*x + b*y - coordonnees[:,3]
+    carres_x = np.fromiter(map(math.pow, dx.tolist(), itertools.repeat(2.0)), dtype=np.float64, count=dx.shape[0])
+    carres_y = np.fromiter(map(math.pow, dy.tolist(), itertools.repeat(2.0)), dtype=np.float64, count=dy.shape[0])
+    return np.sqrt(carres_x + carres_y)
+
+
+def residus_helmert_boucle(TX:float, TY:float, a:float, b:float, coordonnees:np.ndarray, exposant:float)->np.ndarray:
+    # exposant vaut 2 : il est passé en argument pour que numba appelle pow au lieu de le remplacer par une multiplication
+    residus = np.empty(coordonnees.shape[0])
+    for i in range(coordonnees.shape[0]):
+        dx = TX + b*coordonnees[i,0] + a*coordonnees[i,1] - coordonnees[i,2]
+        dy = TY - a*coordonnees[i,0] + b*coordonnees[i,1] - coordonnees[i,3]
+        residus[i] = np.sqrt(dx**exposant + dy**exposant)
+    return residus
+
+
+# Point fixe de Shot.image_to_world
+
+def intersection_plan_numpy(a0, a1, z0, z1, z):
+    """
+    Coordonnée (x ou y) de l'intersection du faisceau (a0, z0) -> (a1, z1) avec le plan d'altitude z
+    """
+    return a0 + (a1 - a0) * ((z - z0) / (z1 - z0))
+
+
+def distance_3d_numpy(x0, y0, z0, x1, y1, z1):
+    return ((x1 - x0) ** 2 + (y1 - y0) ** 2 + (z1 - z0) ** 2) ** 0.5
+
+
+def distance_3d_scalaire(x0, y0, z0, x1, y1, z1):
+    return np.sqrt((x1 - x0) * (x1 - x0) + (y1 - y0) * (y1 - y0) + (z1 - z0) * (z1 - z0))
+
+
+if numba is not None:
+    distances_droites_numba = compiler(distances_droites_boucle)
+    produit_scalaire_directions_numba = compiler(produit_scalaire_directions)
+    fusionner_segments_boucle_numba = compiler(fusionner_segments_boucle)
+
+    def fusionner_segments_numba(segments:np.ndarray, seuil_ps:float)->np.ndarray:
+        return fusionner_segments_boucle_numba(segments, seuil_ps, produit_scalaire_directions_numba)
+
+    distances_min_points_numba = compiler(distances_min_points_boucle)
+    residus_helmert_boucle_numba = compiler(residus_helmert_boucle)
+
+    def residus_helmert_numba(TX:float, TY:float, a:float, b:float, coordonnees:np.ndarray)->np.ndarray:
+        return residus_helmert_boucle_numba(TX, TY, a, b, coordonnees, 2.0)
+
+    intersection_plan_numba = compiler_ufunc(intersection_plan_numpy)
+    distance_3d_numba = compiler_ufunc_distance(distance_3d_scalaire)
+
+
+if NUMBA:
+    distances_droites = distances_droites_numba
+    fusionner_segments = fusionner_segments_numba
+    distances_min_points = distances_min_points_numba
+    residus_helmert = residus_helmert_numba
+    intersection_plan = intersection_plan_numba
+    distance_3d = distance_3d_numba
+else:
+    distances_droites = distances_droites_numpy
+    fusionner_segments = fusionner_segments_numpy
+    distances_min_points = distances_min_points_numpy
+    residus_helmert = residus_helmert_numpy
+    intersection_plan = intersection_plan_numpy
+    distance_3d = distance_3d_numpy
@@ -0,0 +1,137 @@
+"""
+Estimation du coût et ordre des tâches envoyées au pool de workers.
+
+Les tâches sont envoyées une par une : chaque worker prend la tâche suivante dès qu'il a terminé la précédente.
+Les tâches les plus longues sont envoyées en premier, de la plus coûteuse à la moins coûteuse : elles commencent ainsi au début de l'étape au lieu de se retrouver à la fin.
+Les autres suivent la courbe de Hilbert de leur position (voir v2/hilbert.py) : les tâches en cours au même moment sont proches sur le terrain
+et lisent les mêmes zones du MNT et des PVA, déjà dans le cache du système
+"""
+
+import os
+from typing import List, Callable, Tuple
+from shapely import Polygon, get_num_coordinates
+from v2 import contexte
+from v2.hilbert import ordonner_hilbert
+from v2.prediction import Prediction
+from v2.groupe_pate_maisons import GroupePatesMaisons
+from v2.groupe_batiments import GroupeBatiments
+
+
+# Une tâche est envoyée en premier si son coût dépasse le coût total divisé par nb_taches_par_worker * nb_cpus
+nb_taches_par_worker = 8
+
+
+def nb_sommets(geometrie:Polygon)->int:
+    if geometrie is None:
+        return 0
+    return int(get_num_coordinates(geometrie))
+
+
+def cout_prediction(prediction:Prediction)->float:
+    """
+    Lissage et projection au sol : proportionnel au nombre de sommets des bâtiments et des pâtés de maisons
+    """
+    cout = 0
+    for batiment in prediction.batiments:
+        cout += nb_sommets(batiment.geometrie_image)
+    for pm in prediction.pates_maisons:
+        cout += nb_sommets(pm.geometrie_image)
+    return cout
+
+
+def cout_groupe_pates_maisons(groupe_pates_maisons:GroupePatesMaisons)->float:
+    """
+    L'association des bâtiments compare chaque pâté de maisons à tous les autres pâtés du groupe
+    """
+    sommets = 0
+    for pm in groupe_pates_maisons.pates_maisons:
+        for batiment in pm.batiments:
+            sommets += nb_sommets(batiment.geometrie_image)
+    return len(groupe_pates_maisons.pates_maisons) * max(sommets, 1)
+
+
+def cout_groupe_batiments(groupe_batiments:GroupeBatiments)->float:
+    """
+    L'estimation de la hauteur et l'association des segments comparent les bâtiments du groupe deux à deux, segment par segment
+    """
+    sommets = 0
+    for batiment in groupe_batiments.batiments:
+        if len(batiment.segments) > 0:
+            sommets += len(batiment.segments)
+        else:
+            sommets += nb_sommets(batiment.geometrie_image)
+    return len(groupe_batiments.batiments) * max(sommets, 1)
+
+
+def estimer_cout(tache)->float:
+    if isinstance(tache, GroupeBatiments):
+        return cout_groupe_batiments(tache)
+    if isinstance(tache, GroupePatesMaisons):
+        return cout_groupe_pates_maisons(tache)
+    if isinstance(tache, Prediction):
+        return cout_prediction(tache)
+    if isinstance(tache, (list, tuple)):
+        # Chargement d'une prédiction : (image, chemin du fichier)
+        for element in tache:
+            if isinstance(element, str) and os.path.isfile(element):
+                return os.path.getsize(element)
+    return 1
+
+
+def centre(geometrie)->Tuple[float, float]:
+    if geometrie is None or geometrie.is_empty:
+        return None
+    point = geometrie.centroid
+    return (point.x, point.y)
+
+
+def get_position(tache)->Tuple[float, float]:
+    """
+    Position sur le terrain d'une tâche, ou None si elle n'est pas connue
+    """
+    if isinstance(tache, GroupeBatiments):
+        if len(tache.batiments) > 0 and tache.batiments[0].geometrie_terrain is not None:
+            return centre(tache.batiments[0].geometrie_terrain)
+        return None
+    if isinstance(tache, GroupePatesMaisons):
+        if len(tache.pates_maisons) == 0:
+            return None
+        pate_maison = tache.pates_maisons[0]
+        # Avant le calcul des géométries terrain, on prend le centre de l'emprise du cliché
+        if pate_maison.geometrie_terrain is not None:
+            return centre(pate_maison.geometrie_terrain)
+        return centre(getattr(pate_maison.shot, "emprise", None))
+    if isinstance(tache, Prediction):
+        return centre(getattr(tache.shot, "emprise", None))
+    if isinstance(tache, (list, tuple)):
+        # Chargement d'une prédiction : (image, chemin du fichier)
+        for element in tache:
+            if isinstance(element, str):
+                try:
+                    return centre(getattr(contexte.get_shot(element), "emprise", None))
+                except KeyError:
+                    continue
+    return None
+
+
+def ordonner(taches:List, cout:Callable=estimer_cout, nb_cpus:int=None, position:Callable=get_position)->List:
+    """
+    Envoie d'abord les tâches les plus coûteuses, de la plus coûteuse à la moins coûteuse, puis les autres le long de la courbe de Hilbert de leur position.
+
+    Sans nb_cpus, ou si aucune position n'est connue, toutes les tâches sont triées de la plus coûteuse à la moins coûteuse.
+    Les tris sont stables : à coût égal, l'ordre initial est conservé
+    """
+    couts = [cout(tache) for tache in taches]
+    lourdes = sorted(range(len(taches)), key=lambda i: -couts[i])
+    if nb_cpus is None or len(taches) == 0:
+        return [taches[i] for i in lourdes]
+
+    positions = [position(tache) for tache in taches]
+    if all([p is None for p in positions]):
+        return [taches[i] for i in lourdes]
+
+    seuil = sum(couts) / (nb_taches_par_worker * nb_cpus)
+    lourdes = [i for i in lourdes if couts[i] > seuil]
+    est_lourde = set(lourdes)
+    autres = [i for i in ordonner_hilbert(positions) if i not in est_lourde]
+    return [taches[i] for i in lourdes + autres]
@@ -1,7 +1,51 @@
 from v2.prediction import Prediction
 from v2.groupe_batiments import GroupeBatiments
 from v2.groupe_pate_maisons import GroupePatesMaisons
-from typing import List
+from v2.calcul_intersection_engine import CalculIntersectionEngine
+from v2.fermer_batiment_engine import FermerBatimentEngine
+from v2 import contexte
+from v2.executeur import Executeur, creer_executeur
+from v2.rapport_performances import tache_mesuree, mesurer
+from v2.ordonnancement import ordonner, estimer_cout, get_position
+from typing import List, Callable
+from tqdm import tqdm
+
+
+def creer_pool(nb_cpus:int, repertoire_profilage:str=None, executeur:str="processus", adresse:str=None)->Executeur:
+    """
+    Crée l'exécuteur des tâches parallèles (voir v2/executeur.py). Avec l'exécuteur processus, le contexte (clichés, MNT, RAF...)
+    du processus principal est envoyé une seule fois à chaque worker
+    """
+    return creer_executeur(executeur, nb_cpus, repertoire_profilage, adresse)
+
+
+def map_pool(pool, fonction:Callable, taches:List, nb_cpus:int, desc:str)->List:
+    """
+    Applique fonction à chaque tâche avec le pool. Les résultats sont renvoyés dans l'ordre des tâches,
+    pour que la suite du traitement (et les identifiants attribués ensuite) ne dépende pas de l'ordre dans lequel les workers terminent.
+
+    Les tâches sont envoyées une par une, les plus coûteuses en premier puis les autres le long d'une courbe de Hilbert (voir v2/ordonnancement.py) :
+    un worker qui a fini sa tâche prend la suivante, ce qui évite qu'un paquet de gros groupes ne retarde la fin de l'étape,
+    et les workers lisent au même moment les mêmes zones du MNT et des PVA.
+
+    La sous-étape est ajoutée au rapport de performances : chaque worker renvoie le temps CPU de la tâche et son pic de mémoire
+    """
+    indices = ordonner(list(range(len(taches))), cout=lambda i: estimer_cout(taches[i]), nb_cpus=nb_cpus, position=lambda i: get_position(taches[i]))
+    resultats = [None for i in range(len(taches))]
+    with mesurer(desc, len(taches)) as mesure:
+        for i, (resultat, cpu, rss) in tqdm(
+            pool.imap_unordered(tache_indexee, [(i, (fonction, taches[i])) for i in indices], chunksize=1),
+            total=len(taches),
+            desc=desc
+        ):
+            mesure.ajouter_worker(cpu, rss)
+            resultats[i] = resultat
+    return resultats
+
+
+def tache_indexee(args):
+    i, tache = args
+    return i, tache_mesuree(tache)
 
 
 def traiter_lissage(prediction:Prediction)->Prediction:
@@ -22,13 +66,23 @@ def create_segments(groupe_batiment:GroupeBatiments)->GroupeBatiments:
     return groupe_batiment
 
 
+def calculer_intersections_groupe(groupe_batiment:GroupeBatiments)->GroupeBatiments:
+    CalculIntersectionEngine.calculer_groupe_batiments(groupe_batiment.groupes_segments)
+    return groupe_batiment
+
+def fermer_groupe(groupe_batiment:GroupeBatiments)->GroupeBatiments:
+    groupe_batiment.update_groupe_segments()
+    FermerBatimentEngine([]).fermer(groupe_batiment)
+    return groupe_batiment
+
+
 def load_predictions(prediction:Prediction)->Prediction:
     prediction.read_file()
     return prediction
 
 def create_predictions(args)->Prediction:
-    shot, path, mnt, emprise = args
-    prediction = Prediction(shot, path, mnt, emprise)
+    image, path, emprise = args
+    prediction = Prediction(contexte.get_shot(image), path, contexte.get_mnt(), emprise)
     prediction.associate_batiment_pate()
     return prediction
 
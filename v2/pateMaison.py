@@ -13,12 +13,12 @@ class PateMaison:
 
     identifiant_global = 0
 
-    def __init__(self, geometrie:Polygon, shot:Shot, mnt:MNT):
+    def __init__(self, geometrie:Polygon, shot:Shot, mnt:MNT, identifiant:int=None):
         self.geometrie_image = geometrie
         self.shot = shot
         self.mnt = mnt
-        self.identifiant:int = PateMaison.identifiant_global
-        PateMaison.identifiant_global += 1
+        # Les pâtés de maisons sont créés dans les workers : l'identifiant est attribué ensuite par le processus principal (voir v2/identifiants.py)
+        self.identifiant:int = identifiant
 
         self.batiments:List[Batiment] = []
         self.geometrie_terrain:Polygon = None
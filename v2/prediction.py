@@ -2,9 +2,10 @@ from __future__ import annotations
 from v2.shot import Shot, MNT
 from v2.batiment import Batiment
 from v2.pateMaison import PateMaison
+from v2 import contexte
 import geopandas as gpd
 from typing import List
-from shapely import Polygon
+from shapely import Polygon, STRtree
 import os
 import numpy as np
 from shapely.ops import unary_union
@@ -22,7 +23,11 @@ class Prediction:
         """
         self.shot:Shot = shot
         self.path_predictions:str = path_predictions
-        self.mnt:MNT = MNT.from_mnt(mnt_global, shot.emprise, f"shot_{shot.image}")
+        if mnt_global is contexte.get_mnt() and contexte.shot_enregistre(shot):
+            # MNT du cliché enregistré dans le contexte : il est envoyé aux workers sous la forme de l'indice du cliché
+            self.mnt:MNT = contexte.get_mnt_shot(contexte.get_indice_shot(shot.image))
+        else:
+            self.mnt:MNT = MNT.from_mnt(mnt_global, shot.emprise, f"shot_{shot.image}")
         self.batiments:List[Batiment] = []
         self.pates_maisons:List[PateMaison] = []
         self.emprise = emprise
@@ -82,13 +87,15 @@ class Prediction:
 
     def associate_batiment_pate(self):
         geometries = [pm.geometrie_image.buffer(0.1) for pm in self.pates_maisons]
-        gdf_pates_maisons = gpd.GeoDataFrame({"geometry":geometries, "id":range(len(geometries))})
-        for batiment in self.batiments:
-            pate_maison = gdf_pates_maisons[gdf_pates_maisons.contains(batiment.get_image_geometrie())]
-            if pate_maison.shape[0]!=1:
-                raise ValueError(f"Pas un seul bâtiment : {pate_maison.shape[0]}")
-            pate_maison = pate_maison.iloc[0]
-            self.pates_maisons[pate_maison["id"]].add_batiment(batiment)
+        # Une seule requête sur un index des pâtés de maisons : pour chaque bâtiment, les pâtés de maisons qui le contiennent
+        batiments, pates_maisons = STRtree(geometries).query([batiment.get_image_geometrie() for batiment in self.batiments], predicate="within")
+        nb_pates_maisons = np.bincount(batiments, minlength=len(self.batiments))
+        pate_maison = np.zeros(len(self.batiments), dtype=np.int64)
+        pate_maison[batiments] = pates_maisons
+        for i, batiment in enumerate(self.batiments):
+            if nb_pates_maisons[i]!=1:
+                raise ValueError(f"Pas un seul bâtiment : {nb_pates_maisons[i]}")
+            self.pates_maisons[pate_maison[i]].add_batiment(batiment)
     
 
     def lisser_geometries(self):
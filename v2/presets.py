@@ -0,0 +1,77 @@
+"""
+Préréglages vitesse / précision du traitement (option --preset).
+
+Chaque préréglage fixe de façon cohérente tous les paramètres qui déterminent la durée du traitement :
+* precision_image_to_world, iter_max_image_to_world : précision (en mètres) et nombre maximal d'itérations de la projection d'un point image sur le MNT
+* nb_batiments_max_paires : nombre maximal de bâtiments d'un groupe comparés deux à deux pour estimer la hauteur
+* nb_tentatives_samon : nombre de points essayés avec Samon avant d'abandonner l'estimation de la hauteur
+* pas_z_droite : pas (en mètres) de l'échantillonnage de la droite de recherche de Samon
+* sous_echantillonnage_correlation : facteur du sous-échantillonnage de la première corrélation de Samon
+* nb_iterations_ajustement : nombre d'itérations du nettoyage des segments avant l'ajustement des intersections (recalage)
+
+standard correspond aux valeurs utilisées avant l'introduction des préréglages.
+Le préréglage est défini dans le processus principal, envoyé aux workers avec le contexte, et enregistré dans [output]/preset.json
+"""
+import json
+from typing import Dict
+
+
+PRESETS:Dict[str, Dict[str, float]] = {
+    "draft":{
+        "precision_image_to_world":0.5,
+        "iter_max_image_to_world":2,
+        "nb_batiments_max_paires":30,
+        "nb_tentatives_samon":2,
+        "pas_z_droite":0.5,
+        "sous_echantillonnage_correlation":8,
+        "nb_iterations_ajustement":10
+    },
+    "standard":{
+        "precision_image_to_world":0.1,
+        "iter_max_image_to_world":3,
+        "nb_batiments_max_paires":100,
+        "nb_tentatives_samon":5,
+        "pas_z_droite":0.1,
+        "sous_echantillonnage_correlation":4,
+        "nb_iterations_ajustement":25
+    },
+    "precise":{
+        "precision_image_to_world":0.02,
+        "iter_max_image_to_world":6,
+        "nb_batiments_max_paires":300,
+        "nb_tentatives_samon":10,
+        "pas_z_droite":0.05,
+        "sous_echantillonnage_correlation":2,
+        "nb_iterations_ajustement":50
+    }
+}
+
+
+_preset:str = "standard"
+
+
+def definir_preset(nom:str)->None:
+    global _preset
+    if nom not in PRESETS:
+        raise ValueError(f"{nom} n'est pas un préréglage. Préréglages possibles : {list(PRESETS.keys())}")
+    _preset = nom
+
+
+def get_preset()->str:
+    return _preset
+
+
+def get(parametre:str):
+    return PRESETS[_preset][parametre]
+
+
+def get_parametres()->Dict[str, float]:
+    return dict(PRESETS[_preset])
+
+
+def sauvegarder(path:str)->None:
+    """
+    Enregistre le préréglage utilisé et la valeur de chacun de ses paramètres
+    """
+    with open(path, "w") as f:
+        json.dump({"preset":_preset, "parametres":get_parametres()}, f, indent=2)
@@ -0,0 +1,141 @@
+"""
+Profileur par échantillonnage, activé avec l'option --profilage.
+
+Un thread relève à intervalle régulier la pile d'appels du thread principal du processus (processus principal et chaque worker du pool),
+et compte chaque pile avec l'étiquette courante : l'étape du rapport de performances dans le processus principal, la fonction de la tâche dans un worker.
+Chaque processus écrit ses piles dans un fichier, puis ces fichiers sont fusionnés en un seul fichier au format "folded"
+(une ligne par pile : "etiquette;appelant;...;appelé nombre"), lisible par flamegraph.pl ou speedscope.
+
+Le coût d'un échantillon est de quelques dizaines de microsecondes : avec l'intervalle par défaut de 10 ms, le surcoût reste de l'ordre du pourcent
+"""
+import os
+import sys
+import threading
+from typing import Dict, Tuple
+
+
+class Profileur:
+
+    # Intervalle entre deux échantillons, en secondes
+    intervalle = 0.01
+    # Nombre maximum d'appels conservés par pile, en partant de l'appel le plus récent
+    profondeur_max = 200
+
+    def __init__(self, path:str, prefixe:str, ignorer_sans_etiquette:bool=False):
+        self.path = path
+        self.prefixe = prefixe
+        # Dans un worker, il n'y a pas d'étiquette entre deux tâches : le worker attend, ces échantillons ne sont pas utiles
+        self.ignorer_sans_etiquette = ignorer_sans_etiquette
+        self.echantillons:Dict[Tuple[str, str], int] = {}
+        self.etiquette = ""
+        self.identifiant_thread = threading.main_thread().ident
+        self.arret = threading.Event()
+        self.thread:threading.Thread = None
+        # Libellé de chaque code déjà rencontré, pour ne pas reconstruire les chaînes à chaque échantillon
+        self.libelles:Dict[object, str] = {}
+
+
+    def demarrer(self)->None:
+        self.thread = threading.Thread(target=self.echantillonner, name="profilage", daemon=True)
+        self.thread.start()
+
+
+    def arreter(self)->None:
+        if self.thread is None:
+            return
+        self.arret.set()
+        self.thread.join()
+        self.thread = None
+        self.ecrire()
+
+
+    def echantillonner(self)->None:
+        while not self.arret.wait(Profileur.intervalle):
+            if self.ignorer_sans_etiquette and self.etiquette == "":
+                continue
+            frame = sys._current_frames().get(self.identifiant_thread)
+            if frame is None:
+                continue
+            appels = []
+            while frame is not None and len(appels) < Profileur.profondeur_max:
+                appels.append(self.get_libelle(frame.f_code))
+                frame = frame.f_back
+            appels.reverse()
+            cle = (self.etiquette, ";".join(appels))
+            self.echantillons[cle] = self.echantillons.get(cle, 0) + 1
+
+
+    def get_libelle(self, code)->str:
+        libelle = self.libelles.get(code)
+        if libelle is None:
+            libelle = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            # ";" sépare les appels dans le format folded
+            libelle = libelle.replace(";", ",")
+            self.libelles[code] = libelle
+        return libelle
+
+
+    def ecrire(self)->None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            for (etiquette, pile), nombre in self.echantillons.items():
+                racine = self.prefixe if etiquette == "" else f"{self.prefixe};{etiquette}"
+                f.write(f"{racine};{pile} {nombre}\n")
+
+
+# Profileur du processus courant, s'il y en a un
+_profileur:Profileur = None
+
+
+def demarrer(path:str, prefixe:str, ignorer_sans_etiquette:bool=False)->None:
+    global _profileur
+    _profileur = Profileur(path, prefixe, ignorer_sans_etiquette)
+    _profileur.demarrer()
+
+
+def arreter()->None:
+    global _profileur
+    if _profileur is not None:
+        _profileur.arreter()
+        _profileur = None
+
+
+def definir_etiquette(etiquette:str)->None:
+    """
+    Les échantillons suivants sont rattachés à etiquette, dont les niveaux sont séparés par ";". Ne fait rien si le profilage n'est pas actif
+    """
+    if _profileur is not None:
+        _profileur.etiquette = etiquette
+
+
+def get_etiquette()->str:
+    if _profileur is None:
+        return ""
+    return _profileur.etiquette
+
+
+def demarrer_worker(repertoire:str)->None:
+    """
+    Démarre le profilage dans un worker du pool. Les échantillons sont écrits quand le worker s'arrête, à la fermeture du pool
+    """
+    from multiprocessing.util import Finalize
+    demarrer(os.path.join(repertoire, f"worker_{os.getpid()}.txt"), "workers", ignorer_sans_etiquette=True)
+    Finalize(None, arreter, exitpriority=10)
+
+
+def fusionner(repertoire:str, path_sortie:str)->None:
+    """
+    Fusionne les fichiers du processus principal et des workers en un seul fichier folded
+    """
+    piles:Dict[str, int] = {}
+    for nom in sorted(os.listdir(repertoire)):
+        if not nom.endswith(".txt"):
+            continue
+        with open(os.path.join(repertoire, nom), "r") as f:
+            for ligne in f:
+                pile, nombre = ligne.rstrip("\n").rsplit(" ", 1)
+                piles[pile] = piles.get(pile, 0) + int(nombre)
+    with open(path_sortie, "w") as f:
+        for pile in sorted(piles.keys()):
+            f.write(f"{pile} {piles[pile]}\n")
+    print(f"Profilage : {sum(piles.values())} échantillons dans {path_sortie}")
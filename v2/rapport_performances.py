@@ -0,0 +1,188 @@
+import os
+import sys
+import csv
+import json
+import time
+import resource
+import multiprocessing
+from contextlib import contextmanager
+from typing import List, Dict
+from v2 import profilage
+
+
+def get_rss_max_mo()->float:
+    """
+    Renvoie le pic de mémoire résidente du processus courant, en Mo
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS et en kilo-octets sous Linux
+    if sys.platform == "darwin":
+        return rss / (1024*1024)
+    return rss / 1024
+
+
+def get_rss_mo()->float:
+    """
+    Renvoie la mémoire résidente actuelle du processus courant, en Mo. A défaut (hors Linux), renvoie le pic de mémoire
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024*1024)
+    except (OSError, ValueError):
+        return get_rss_max_mo()
+
+
+def tache_mesuree(args):
+    """
+    Exécute une tâche dans un worker et renvoie, en plus du résultat, le temps CPU consommé et le pic de mémoire du worker
+    """
+    fonction, tache = args
+    # Avec les exécuteurs threads et serie (voir v2/executeur.py), la tâche est exécutée dans le processus principal :
+    # on ne compte que le temps CPU du thread, et l'étiquette du profilage reste celle de l'étape
+    if multiprocessing.parent_process() is None:
+        cpu = time.thread_time()
+        resultat = fonction(tache)
+        return resultat, time.thread_time() - cpu, get_rss_max_mo()
+    profilage.definir_etiquette(fonction.__name__)
+    cpu = time.process_time()
+    try:
+        resultat = fonction(tache)
+    finally:
+        profilage.definir_etiquette("")
+    return resultat, time.process_time() - cpu, get_rss_max_mo()
+
+
+class Mesure:
+    """
+    Mesures d'une étape ou d'une sous-étape du traitement
+    """
+
+    def __init__(self, nom:str, niveau:int, nb_elements:int=None):
+        self.nom = nom
+        self.niveau = niveau
+        self.nb_elements = nb_elements
+        self.duree:float = None
+        self.cpu_principal:float = 0
+        self.cpu_workers:float = 0
+        self.rss_principal:float = 0
+        self.rss_workers:float = 0
+        self.compteurs:Dict[str, int] = {}
+
+    def ajouter_worker(self, cpu:float, rss:float)->None:
+        self.cpu_workers += cpu
+        self.rss_workers = max(self.rss_workers, rss)
+
+    def to_dict(self)->Dict:
+        d = {
+            "etape":self.nom,
+            "niveau":self.niveau,
+            "duree_s":self.duree,
+            "cpu_principal_s":self.cpu_principal,
+            "cpu_workers_s":self.cpu_workers,
+            "cpu_total_s":self.cpu_principal + self.cpu_workers,
+            "rss_max_principal_mo":self.rss_principal,
+            "rss_max_workers_mo":self.rss_workers,
+            "nb_elements":self.nb_elements,
+            "elements_par_s":None
+        }
+        if self.nb_elements is not None and self.duree:
+            d["elements_par_s"] = self.nb_elements / self.duree
+        d.update(self.compteurs)
+        return d
+
+
+class MesureVide(Mesure):
+    """
+    Utilisée quand aucun rapport n'est actif
+    """
+
+    def __init__(self):
+        super().__init__("", 0)
+
+
+class RapportPerformances:
+    """
+    Rapport de performances de SamonGouttiere : pour chaque étape et sous-étape, durée, temps CPU du processus principal et des workers,
+    pic de mémoire résidente, nombre d'éléments traités et débit.
+
+    Le rapport est écrit en json et en csv dans le répertoire de sortie
+    """
+
+    def __init__(self, path_output:str):
+        self.path_json = os.path.join(path_output, "rapport_performances.json")
+        self.path_csv = os.path.join(path_output, "rapport_performances.csv")
+        self.mesures:List[Mesure] = []
+        # Etapes en cours : à la fin d'une sous-étape, le temps CPU de ses workers est ajouté à l'étape qui la contient
+        self.pile:List[Mesure] = []
+
+    @contextmanager
+    def etape(self, nom:str, nb_elements:int=None):
+        mesure = Mesure(nom, len(self.pile), nb_elements)
+        self.mesures.append(mesure)
+        self.pile.append(mesure)
+        # Les échantillons du profileur sont rattachés à l'étape en cours
+        etiquette = profilage.get_etiquette()
+        profilage.definir_etiquette(";".join([m.nom.replace(";", ",") for m in self.pile]))
+        tic = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield mesure
+        finally:
+            mesure.duree = time.perf_counter() - tic
+            mesure.cpu_principal = time.process_time() - cpu
+            mesure.rss_principal = get_rss_max_mo()
+            self.pile.pop()
+            profilage.definir_etiquette(etiquette)
+            if len(self.pile)>0:
+                self.pile[-1].ajouter_worker(mesure.cpu_workers, mesure.rss_workers)
+            # Le rapport est réécrit à chaque fois pour être disponible même si le traitement s'interrompt
+            self.ecrire()
+
+    def ajouter(self, nom:str, cpu_workers:float, nb_elements:int)->None:
+        """
+        Ajoute le détail d'une sous-étape exécutée dans les workers, sans durée propre (par exemple une méthode d'estimation de la hauteur).
+        Son temps CPU est déjà compté dans l'étape en cours
+        """
+        mesure = Mesure(nom, len(self.pile), nb_elements)
+        mesure.cpu_workers = cpu_workers
+        self.mesures.append(mesure)
+
+    def ecrire(self)->None:
+        lignes = [mesure.to_dict() for mesure in self.mesures]
+        with open(self.path_json, "w") as f:
+            json.dump(lignes, f, indent=2)
+
+        colonnes = []
+        for ligne in lignes:
+            for colonne in ligne.keys():
+                if colonne not in colonnes:
+                    colonnes.append(colonne)
+        with open(self.path_csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=colonnes)
+            writer.writeheader()
+            writer.writerows(lignes)
+
+
+# Rapport du traitement en cours dans le processus principal
+_rapport:RapportPerformances = None
+
+
+def definir_rapport(rapport:RapportPerformances)->None:
+    global _rapport
+    _rapport = rapport
+
+def get_rapport()->RapportPerformances:
+    return _rapport
+
+
+@contextmanager
+def mesurer(nom:str, nb_elements:int=None):
+    """
+    Mesure une sous-étape dans le rapport courant, s'il existe
+    """
+    if _rapport is None:
+        yield MesureVide()
+    else:
+        with _rapport.etape(nom, nb_elements) as mesure:
+            yield mesure
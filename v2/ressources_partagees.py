@@ -0,0 +1,107 @@
+import os
+from typing import List, Dict, Tuple
+from lxml import etree
+import pandas as pd
+import geopandas as gpd
+from v2.shot import MNT, RAF, ShotOriente
+from v2.empreintes import empreinte_fichier
+from v2.parallelisation import creer_pool
+from v2 import contexte
+
+
+def lire_shots_ta(path_ta:str, raf:RAF, images:List[str])->Dict[str, ShotOriente]:
+    """
+    Crée les clichés du tableau d'assemblage dont l'image fait partie de images, dans l'ordre du TA
+    """
+    tree = etree.parse(path_ta)
+    root = tree.getroot()
+
+    centre_rep_local = root.find(".//centre_rep_local")
+    centre_rep_local_x = float(centre_rep_local.find(".//x").text)
+    centre_rep_local_y = float(centre_rep_local.find(".//y").text)
+    centre_rep_local = [centre_rep_local_x, centre_rep_local_y]
+
+    images = set(images)
+    shots = {}
+    for vol in root.getiterator("vol"):
+
+        sensors = vol.findall(".//sensor")
+
+        for cliche in vol.getiterator("cliche"):
+            image = cliche.find("image").text.strip()
+            if image in images:
+                shots[image] = ShotOriente.createShot(cliche, raf, centre_rep_local, sensors)
+    return shots
+
+
+def memes_fichiers(paths:List[str])->bool:
+    """
+    Vérifie que les chemins désignent le même fichier, ou des copies identiques
+    """
+    if len(set([os.path.realpath(path) for path in paths])) <= 1:
+        return True
+    return len(set([empreinte_fichier(path) for path in paths])) == 1
+
+
+class RessourcesPartagees:
+    """
+    Données communes à plusieurs chantiers voisins : tableau d'assemblage, grille RAF et MNT.
+
+    Elles sont chargées une seule fois pour tous les chantiers : le MNT est lu sur l'union des emprises,
+    et les clichés de toutes les images des chantiers sont créés à partir d'une seule lecture du TA.
+    Un seul pool de workers, qui reçoit ces données au démarrage, est utilisé pour tous les chantiers
+    """
+
+    def __init__(self, path_ta:str, path_raf:str, path_mnt:str, repertoire_mnt:str):
+        self.path_ta = path_ta
+        self.path_raf = path_raf
+        self.path_mnt = path_mnt
+        # Répertoire des tableaux partagés (MNT, RAF), commun à tous les chantiers
+        self.repertoire_mnt = repertoire_mnt
+
+        self.mnt:MNT = None
+        self.raf:RAF = None
+        self.shots:Dict[str, ShotOriente] = {}
+        self.pool = None
+
+
+    def charger(self, emprises:List[gpd.GeoSeries], images:List[str])->None:
+        os.makedirs(self.repertoire_mnt, exist_ok=True)
+        print("Chargement du MNT sur l'union des emprises...")
+        emprise = gpd.GeoSeries(pd.concat(emprises, ignore_index=True))
+        self.mnt = MNT.load_mnt(self.path_mnt, emprise, self.repertoire_mnt)
+        print("Chargement du MNT terminé")
+        self.raf = RAF(self.path_raf, self.repertoire_mnt)
+        self.shots = lire_shots_ta(self.path_ta, self.raf, images)
+        print(f"{len(self.shots)} clichés créés pour l'ensemble des chantiers")
+
+
+    def get_shots(self, images:List[str])->List[ShotOriente]:
+        """
+        Renvoie les clichés déjà créés pour les images, dans l'ordre du TA
+        """
+        images = set(images)
+        return [shot for image, shot in self.shots.items() if image in images]
+
+
+    def demarrer_pool(self, nb_cpus:int, cache_z:Dict[str, tuple], chantiers:List[Tuple[str, List[ShotOriente]]]=None)->None:
+        """
+        Crée le pool partagé par tous les chantiers. cache_z contient les hauteurs déjà estimées de tous les chantiers :
+        les clés sont des empreintes des données d'entrée, on peut donc les réunir sans conflit.
+        chantiers donne le répertoire des PVA et les clichés de chaque chantier : ils sont enregistrés dans le contexte avant le démarrage des workers
+        """
+        contexte.initialiser(list(self.shots.values()), self.mnt, self.raf, None, False, cache_z, chantiers=[])
+        for pva_path, shots in (chantiers if chantiers is not None else []):
+            contexte.enregistrer_chantier(pva_path, shots)
+        self.pool = creer_pool(nb_cpus)
+
+
+    def get_pool(self):
+        return self.pool
+
+
+    def fermer_pool(self)->None:
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
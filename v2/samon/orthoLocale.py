@@ -11,6 +11,7 @@ from typing import Tuple
 from v2.samon.tool import print_log, save_image
 from v2.samon.pva import Pva
 from v2.shot import Shot
+from v2 import presets
 
 class OrthoLocale:
 
@@ -18,7 +19,7 @@ class OrthoLocale:
     Création d'une ortho construite à partir d'une pva
     """
 
-    def __init__(self, resolution: float, center: Point, shot: Shot, size: int, pva_path: str, projet, path_save_pi: str, path_save_dec: str, dz=0.1) -> None:
+    def __init__(self, resolution: float, center: Point, shot: Shot, size: int, pva_path: str, projet, path_save_pi: str, path_save_dec: str, dz=None) -> None:
         self.resolution = resolution
         self.center = center
         self.shot:Shot = shot
@@ -36,7 +37,8 @@ class OrthoLocale:
         self.path_save_pi = path_save_pi
         self.path_save_dec = path_save_dec
         self.projet = projet
-        self.dz = dz
+        # Pas de l'échantillonnage de la droite de recherche : par défaut, celui du préréglage (voir v2/presets.py)
+        self.dz = dz if dz is not None else presets.get("pas_z_droite")
 
         self.calcul_valide = True
 
@@ -128,27 +130,30 @@ class OrthoLocale:
     def compute_correlation(self, bd_ortho: np.array) -> None:
         """
         Calcule la corrélation entre l'extrait de BD Ortho et l'ortho locale.
-        On fait d'abord la corrélation sur un sous-échantillonnage 4;  puis on affine la corrélation à la résolution initiale.
+        On fait d'abord la corrélation sur un sous-échantillonnage (d'un facteur 4 avec le préréglage standard);  puis on affine la corrélation à la résolution initiale.
         Passer par le sous-échantillonnage permet d'accélérer sensiblement le temps de calcul
         """
 
-        # On fait une première recherche sur un sous-échantillonnage d'un facteur 4
-        # On sous-échantillonne la bd ortho par 4
-        bd_ortho_sous_ech4 = bd_ortho[0,::4,::4]
-        size_bd_ortho_sous_ech4 = bd_ortho_sous_ech4.shape[1]
-
-        #On sous-échantillonne l'ortho de la pva par 4 par 4
-        ortho_pva_sous_ech4 = self.ortho[0, ::4, ::4]
-        orthos_pva = extract_patches_2d(ortho_pva_sous_ech4, (size_bd_ortho_sous_ech4, size_bd_ortho_sous_ech4))
-        i, j, correlation_max = self.compute_correlation_2(bd_ortho_sous_ech4, orthos_pva, ortho_pva_sous_ech4.shape[1])
-        self.i_j = (i*4, j*4)
+        # On fait une première recherche sur un sous-échantillonnage d'un facteur f
+        # On sous-échantillonne la bd ortho par f
+        f = presets.get("sous_echantillonnage_correlation")
+        bd_ortho_sous_ech = bd_ortho[0,::f,::f]
+        size_bd_ortho_sous_ech = bd_ortho_sous_ech.shape[1]
+
+        #On sous-échantillonne l'ortho de la pva par f par f
+        ortho_pva_sous_ech = self.ortho[0, ::f, ::f]
+        orthos_pva = extract_patches_2d(ortho_pva_sous_ech, (size_bd_ortho_sous_ech, size_bd_ortho_sous_ech))
+        i, j, correlation_max = self.compute_correlation_2(bd_ortho_sous_ech, orthos_pva, ortho_pva_sous_ech.shape[1])
+        self.i_j = (i*f, j*f)
         self.correlation = correlation_max
-            
+
+        # On affine dans une fenêtre de 2f-1 pixels autour du maximum trouvé (7 pixels pour un facteur 4)
+        marge = 2*f - 1
         size_bd_ortho = bd_ortho.shape[1]
-        i_haut_gauche = int(i*4 - (size_bd_ortho-1)/2 - 7)
-        j_haut_gauche = int(j*4 - (size_bd_ortho-1)/2 - 7)
-        i_bas_droit = int(i_haut_gauche + size_bd_ortho + 14)
-        j_bas_droit = int(j_haut_gauche + size_bd_ortho + 14)
+        i_haut_gauche = int(i*f - (size_bd_ortho-1)/2 - marge)
+        j_haut_gauche = int(j*f - (size_bd_ortho-1)/2 - marge)
+        i_bas_droit = int(i_haut_gauche + size_bd_ortho + 2*marge)
+        j_bas_droit = int(j_haut_gauche + size_bd_ortho + 2*marge)
 
         if i_haut_gauche < 0 or i_bas_droit > self.ortho.shape[1] or j_haut_gauche < 0 or j_bas_droit > self.ortho.shape[2]:
             self.i_j = (0, 0)
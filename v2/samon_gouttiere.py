@@ -0,0 +1,791 @@
+from v2.worker import configurer_processus
+configurer_processus()
+
+import os
+from v2.shot import MNT, RAF, Shot, Calibration, ShotPompei, ShotOriente
+from v2.prediction import Prediction
+from typing import List, Dict
+from v2.association_pate_maisons_engine import AssociationPateMaisonEngine
+from v2.association_batiment_engine import AssociationBatimentEngine
+from v2.association_segments_engine import AssociationSegmentsEngine
+from v2.groupe_batiments import GroupeBatiments
+from v2.groupe_segments import GroupeSegments
+from v2.groupe_pate_maisons import GroupePatesMaisons
+from v2.identifiants import reserver
+from v2.calcul_intersection_engine import CalculIntersectionEngine
+from v2.fermer_batiment_engine import FermerBatimentEngine
+from v2.executeur import Executeur, EXECUTEURS
+from v2.parallelisation import traiter_lissage, create_predictions, creer_pool, map_pool, compute_estim_z, create_segments, calculer_intersections_groupe, fermer_groupe
+from v2.association_segments_engine import association_segments_groupe
+from v2.graphe_taches import GrapheTaches
+from v2.ordonnancement import ordonner
+from v2.lots import GestionnaireLots
+from v2 import contexte, profilage, presets
+from v2.rapport_performances import RapportPerformances, definir_rapport
+from v2.empreintes import CacheEstimationZ
+from v2.ressources_partagees import RessourcesPartagees, lire_shots_ta
+from v2.estimation_cout import EstimationCout, lire_emprises_ta, compter_objets
+from v2.pateMaison import PateMaison
+from v2.batiment import Batiment
+from v2.segments import Segment
+from v2.checkpoint import Checkpoint
+import geopandas as gpd
+from shapely import Polygon
+from tqdm import tqdm
+import time
+import json
+import warnings
+from osgeo import gdal
+gdal.DontUseExceptions()
+
+warnings.filterwarnings("ignore", message="'crs' was not provided")
+
+class SamonGouttiere:
+
+    # Etapes du traitement, dans l'ordre. A la fin de chacune d'elles, sauf la dernière dont l'état ne sert à aucune reprise, on sauvegarde un checkpoint
+    ETAPES = ["load", "lisser_geometries", "association_pate_maisons", "association_bati", "association_segments", "calculer_intersections", "fermer_batiment"]
+    # Avec l'option pipeline, chaque groupe de bâtiments enchaîne les étapes suivant l'association des bâtiments sans attendre les autres groupes
+    ETAPES_PIPELINE = ["load", "lisser_geometries", "association_pate_maisons", "pipeline_groupes"]
+    # Avec l'option streaming, les étapes suivant l'association des pâtés de maisons sont exécutées par lots de groupes de pâtés de maisons
+    ETAPES_STREAMING = ["load", "lisser_geometries", "association_pate_maisons", "traitement_par_lots"]
+
+    def __init__(self, path_chantier:str, path_output:str, path_emprise:str, pompei:bool, nb_cpus:int, pvas_dir = None, repertoire_mnt:str = "data", path_cache:str = None, pipeline:bool = False, streaming:bool = False, taille_lot:int = 1000, memoire_max:float = None, ressources:RessourcesPartagees = None, profilage:bool = False, executeur:str = "processus", executeurs_etapes:Dict[str, str] = None, adresse:str = None, preset:str = "standard", budget_tache:float = None):
+        
+        # Chemin où se trouve le chantier
+        if not os.path.isdir(path_chantier):
+            return ValueError(f"{path_chantier} n'est pas un répertoire")
+        self.path_chantier = path_chantier
+        self.path_output = path_output
+        os.makedirs(os.path.join(self.path_output, "gouttieres"), exist_ok=True)
+        self.nb_cpus = nb_cpus
+
+        self.mnt:MNT = None
+        self.raf:RAF = None
+        self.shots:List[Shot] = []
+        self.predictions:List[Prediction] = []
+
+        self.groupes_pates_maisons = []
+        self.groupe_batiments:List[GroupeBatiments] = []
+        self.groupe_segments:List[GroupeSegments] = []
+
+        self.pompei = pompei
+        self.pipeline = pipeline
+        self.streaming = streaming
+        self.taille_lot = taille_lot
+        self.memoire_max = memoire_max
+
+        # Préréglage vitesse / précision (voir v2/presets.py), envoyé aux workers avec le contexte
+        presets.definir_preset(preset)
+
+        # Budget de temps (en secondes) de l'estimation de la hauteur de chaque groupe de bâtiments (voir v2/budget.py), envoyé aux workers avec le contexte.
+        # Les groupes dont le budget est dépassé avant toute estimation sont enregistrés dans [output]/groupes_differes.json
+        self.budget_tache = budget_tache
+        self.groupes_differes:List[dict] = []
+
+        self.emprise:gpd.GeoDataFrame = self.charger_emprise(path_emprise)
+        self.pvas_dir = pvas_dir
+        # Répertoire des tableaux partagés (MNT, RAF). Il doit être propre à chaque exécution si plusieurs tournent en même temps (tuilage)
+        self.repertoire_mnt = repertoire_mnt
+
+        self.checkpoint = Checkpoint(self.path_output)
+
+        self.rapport = RapportPerformances(self.path_output)
+
+        # Cache des hauteurs estimées, réutilisées lors d'un nouveau traitement si les données d'entrée d'un groupe de bâtiments n'ont pas changé
+        if path_cache is None:
+            path_cache = os.path.join(self.path_output, "cache")
+        self.cache_z = CacheEstimationZ(path_cache)
+
+        # Exécuteurs des tâches parallèles (voir v2/executeur.py), par nom, créés une fois les clichés, le MNT et la RAF chargés.
+        # Chaque étape utilise l'exécuteur donné dans executeurs_etapes, ou à défaut executeur. Un même exécuteur est partagé par toutes les étapes qui l'utilisent
+        self.executeur = executeur
+        self.executeurs_etapes:Dict[str, str] = executeurs_etapes if executeurs_etapes is not None else {}
+        for etape, nom in self.executeurs_etapes.items():
+            if etape not in SamonGouttiere.ETAPES + SamonGouttiere.ETAPES_PIPELINE + SamonGouttiere.ETAPES_STREAMING:
+                raise ValueError(f"{etape} n'est pas une étape")
+            if nom not in EXECUTEURS:
+                raise ValueError(f"{nom} n'est pas un exécuteur. Exécuteurs possibles : {EXECUTEURS}")
+        # Adresse (hôte:port) de la file des tâches de l'exécuteur distribue
+        self.adresse = adresse
+        self.executeurs:Dict[str, Executeur] = {}
+        self.etape_courante:str = None
+
+        # Traitement de plusieurs chantiers (voir multi_chantiers.py) : le TA, la RAF et le MNT sont chargés une seule fois pour tous les chantiers,
+        # et le pool des ressources partagées est utilisé par tous les chantiers. Il n'est pas fermé à la fin du traitement d'un chantier
+        self.ressources = ressources
+
+        # Avec l'option profilage, le processus principal et les workers sont profilés par échantillonnage (voir v2/profilage.py)
+        self.repertoire_profilage:str = os.path.join(self.path_output, "profilage") if profilage else None
+
+
+    def charger_emprise(self, chemin_emprise)->gpd.GeoDataFrame:
+        gdf = None
+        if chemin_emprise is not None and chemin_emprise is not None:
+            gdf = gpd.read_file(chemin_emprise).geometry
+        return gdf
+
+    
+    def get_mnt_path(self) -> str:
+        """
+        Renvoie le chemin vers le mnt
+        """
+        path = os.path.join(self.path_chantier, "mnt", "mnt.vrt")
+        if not os.path.isfile(path):
+            return ValueError(f"{path} n'existe pas")
+        return path
+    
+    def get_pva_path(self)->str:
+        if self.pvas_dir is not None:
+            path = self.pvas_dir
+        else:
+            path = os.path.join(self.path_chantier, "pvas")
+        if not os.path.isdir(path):
+            return ValueError(f"{path} n'existe pas")
+        return path
+    
+    
+    def get_raf_path(self) -> str:
+        """
+        Renvoie le chemin vers la grille raf
+        """
+        path = os.path.join(self.path_chantier, "raf", "raf2020_2154.tif")
+        if not os.path.isfile(path):
+            return ValueError(f"{path} n'existe pas")
+        return path
+
+
+    def get_predictions_ffl_dir(self) -> str:
+        """
+        Renvoie le répertoire avec les prédictions du frame field learning
+        """
+        path = os.path.join(self.path_chantier, "gouttieres", "predictions_FFL")
+        if not os.path.isdir(path):
+            return ValueError(f"{path} n'existe pas")
+        return path
+
+    def get_predictions_ffl(self) -> List[str]:
+        """
+        Renvoie les prédictions ffl sous format shapefile
+        """
+        # Triées pour que l'ordre des prédictions, et donc les identifiants, ne dépendent pas du système de fichiers
+        predictions = sorted([i for i in os.listdir(self.get_predictions_ffl_dir()) if i[-4:]==".shp" or i[-5:]==".gpkg"])
+        return predictions
+    
+    def get_ta_path(self):
+        """
+        Renvoie le fichier ta.xml
+        """
+        dir_path = os.path.join(self.path_chantier, "orientation")
+        if not os.path.isdir(dir_path):
+            return ValueError(f"{dir_path} n'existe pas")
+        files = [i for i in os.listdir(dir_path) if i[-4:]==".XML"]
+        if len(files)!=1:
+            raise ValueError(f"Il ne faut qu'un seul fichier orientation dans {dir_path}")
+        return os.path.join(dir_path, files[0])
+
+
+    def get_shots(self, predictions_ffl:List[str]) -> List[ShotOriente]:
+        """
+        Renvoie les objets shots pour chaque image orientée pour lesquelles on dispose des prédictions ffl
+        """
+        pvas = [i.split(".")[0] for i in predictions_ffl]
+        if self.ressources is not None:
+            candidats = self.ressources.get_shots(pvas)
+        else:
+            candidats = lire_shots_ta(self.get_ta_path(), self.raf, pvas).values()
+        shots = []
+        for shot in candidats:
+            emprise:Polygon = shot.emprise
+            if (self.emprise is not None and emprise.intersects(self.emprise).any()) or self.emprise is None:
+                shots.append(shot)
+        return shots
+    
+
+    def get_cameras_pompei(self)->List[Calibration]:
+        """
+        Lit les fichiers de calibration Micmac
+        """
+        dir_path = os.path.join(self.path_chantier, "orientation")
+        calib_files = [i for i in os.listdir(dir_path) if i[-4:]==".xml" and "AutoCal" in i]
+        calibrations = {}
+        for calib_file in calib_files:
+            calib = Calibration.createCalibration(os.path.join(dir_path, calib_file))
+            calibrations[calib_file] = calib
+        return calibrations
+    
+    def get_shots_pompei(self, calibrations:List[Calibration], predictions_ffl:List[str], mnt:MNT):
+        """
+        Crée les objets Shot à partir des fichiers d'orientation Micmac
+        """
+        dir_path = os.path.join(self.path_chantier, "orientation")
+        ori_files = [i for i in os.listdir(dir_path) if i[-4:]==".xml" and "Orientation" in i]
+        shots = []
+        for ori_file in ori_files:
+            if not ori_file.replace("Orientation-", "").replace(".tif.xml", ".shp") in predictions_ffl:
+                continue
+                
+            shot = ShotPompei.createShot(os.path.join(dir_path, ori_file), calibrations)
+            shot.compute_emprise(mnt)
+            shots.append(shot)  
+        return shots
+    
+
+    def get_images_pompei(self, predictions_ffl:List[str], mnt:MNT)-> List[ShotPompei]:
+        """
+        Récupère les objets Shot à partir d'orientations Micmac
+        """
+        calibrations = self.get_cameras_pompei()
+        shots = self.get_shots_pompei(calibrations, predictions_ffl, mnt)
+        return shots
+
+    
+
+    def run(self, resume_from:str=None):
+        tic = time.time()
+        etapes = self.get_etapes()
+        indice_debut = 0
+        if resume_from is not None:
+            if resume_from not in etapes:
+                raise ValueError(f"{resume_from} n'est pas une étape. Etapes possibles : {etapes}")
+            indice_debut = etapes.index(resume_from)
+            if indice_debut > 0:
+                etape_precedente = etapes[indice_debut-1]
+                print(f"Reprise à partir du checkpoint de l'étape {etape_precedente}")
+                self.restaurer_etat(self.checkpoint.charger(etape_precedente))
+
+        if self.repertoire_profilage is not None:
+            self.demarrer_profilage()
+        presets.sauvegarder(os.path.join(self.path_output, "preset.json"))
+        self.groupes_differes = []
+        definir_rapport(self.rapport)
+        try:
+            with self.rapport.etape("total") as mesure_totale:
+                for etape in etapes[indice_debut:]:
+                    self.etape_courante = etape
+                    with self.rapport.etape(etape) as mesure:
+                        getattr(self, etape)()
+                        mesure.compteurs = self.compter_objets()
+                    if etape != etapes[-1]:
+                        self.checkpoint.sauvegarder(etape, self.get_etat())
+                mesure_totale.compteurs = self.compter_objets()
+        finally:
+            # Les workers écrivent leurs échantillons en s'arrêtant : on ferme le pool avant de fusionner les profils
+            self.fermer_pool()
+            definir_rapport(None)
+            if self.repertoire_profilage is not None:
+                profilage.arreter()
+                profilage.fusionner(self.repertoire_profilage, os.path.join(self.path_output, "profilage.folded"))
+        if self.budget_tache is not None:
+            self.sauvegarder_groupes_differes()
+        print(f"Durée du traitement : {time.time() - tic} secondes")
+        print(f"Rapport de performances : {self.rapport.path_json}")
+
+
+    def noter_groupes_differes(self, groupes_batiments:List[GroupeBatiments])->None:
+        """
+        Note les groupes de bâtiments dont la hauteur n'a pas pu être estimée dans le budget de temps
+        """
+        for groupe_batiment in groupes_batiments:
+            if groupe_batiment.differe:
+                centroid = groupe_batiment.batiments[0].geometrie_terrain.centroid
+                self.groupes_differes.append({
+                    "id_bati":groupe_batiment.get_identifiant(),
+                    "nb_batiments":len(groupe_batiment.batiments),
+                    "x":centroid.x,
+                    "y":centroid.y,
+                    "methodes_interrompues":groupe_batiment.budget_depasse
+                })
+
+
+    def sauvegarder_groupes_differes(self)->None:
+        path = os.path.join(self.path_output, "groupes_differes.json")
+        with open(path, "w") as f:
+            json.dump({"budget_tache_s":self.budget_tache, "groupes":self.groupes_differes}, f, indent=2)
+        print(f"Groupes de bâtiments différés (budget de temps dépassé) : {len(self.groupes_differes)}, enregistrés dans {path}")
+
+
+    def estimer_cout(self, calibration:List[str]=None)->dict:
+        """
+        Estime le coût du traitement sans le lancer (option --dry_run), à partir de l'emprise, de l'emprise des clichés dans le TA
+        et du nombre d'objets des prédictions. Sans rapport de calibration, on utilise le rapport d'un traitement précédent dans path_output s'il existe
+        """
+        if self.pompei:
+            raise ValueError("L'estimation du coût n'est pas disponible pour les chantiers Pompei : l'emprise des clichés est calculée avec le MNT")
+        paths_predictions = {}
+        for prediction_ffl in self.get_predictions_ffl():
+            paths_predictions[prediction_ffl.split(".")[0]] = os.path.join(self.get_predictions_ffl_dir(), prediction_ffl)
+        emprises_cliches = lire_emprises_ta(self.get_ta_path(), set(paths_predictions.keys()))
+        nb_objets = {image:compter_objets(paths_predictions[image]) for image in emprises_cliches.keys()}
+
+        if calibration is None:
+            calibration = [self.rapport.path_json] if os.path.isfile(self.rapport.path_json) else []
+        estimation_cout = EstimationCout(self.emprise, emprises_cliches, nb_objets, self.nb_cpus, self.get_etapes())
+        estimation_cout.calibrer(calibration)
+        estimation = estimation_cout.estimer()
+        estimation_cout.afficher(estimation)
+
+        path = os.path.join(self.path_output, "estimation_cout.json")
+        with open(path, "w") as f:
+            json.dump(estimation, f, indent=2)
+        print(f"Estimation enregistrée dans {path}")
+        return estimation
+
+
+    def demarrer_profilage(self):
+        # On supprime les profils d'un traitement précédent
+        if os.path.isdir(self.repertoire_profilage):
+            for nom in os.listdir(self.repertoire_profilage):
+                if nom.endswith(".txt"):
+                    os.remove(os.path.join(self.repertoire_profilage, nom))
+        os.makedirs(self.repertoire_profilage, exist_ok=True)
+        profilage.demarrer(os.path.join(self.repertoire_profilage, "principal.txt"), "principal")
+
+
+    def compter_objets(self)->dict:
+        """
+        Nombre d'objets de chaque type à la fin d'une étape, pour le rapport de performances
+        """
+        nb_pates_maisons = 0
+        nb_batiments = 0
+        nb_segments = 0
+        for prediction in self.predictions:
+            nb_pates_maisons += len(prediction.pates_maisons)
+            nb_batiments += len(prediction.batiments)
+            for batiment in prediction.batiments:
+                nb_segments += len(batiment.segments)
+        return {
+            "nb_predictions":len(self.predictions),
+            "nb_pates_maisons":nb_pates_maisons,
+            "nb_batiments":nb_batiments,
+            "nb_segments":nb_segments,
+            "nb_groupes_pates_maisons":len(self.groupes_pates_maisons),
+            "nb_groupes_batiments":len(self.groupe_batiments),
+            "nb_groupes_segments":len(self.groupe_segments)
+        }
+
+
+    def get_etapes(self)->List[str]:
+        if self.streaming:
+            return SamonGouttiere.ETAPES_STREAMING
+        if self.pipeline:
+            return SamonGouttiere.ETAPES_PIPELINE
+        return SamonGouttiere.ETAPES
+
+
+    def get_pool(self)->Executeur:
+        """
+        Renvoie l'exécuteur de l'étape en cours. Il est créé au premier appel : avec l'exécuteur processus, les workers reçoivent alors une seule fois les clichés, le MNT et la RAF
+        """
+        if self.ressources is not None:
+            return self.ressources.get_pool()
+        nom = self.executeurs_etapes.get(self.etape_courante, self.executeur)
+        if nom not in self.executeurs:
+            if len(self.executeurs) == 0:
+                contexte.initialiser(self.shots, self.mnt, self.raf, self.get_pva_path(), self.pompei, self.cache_z.resultats, budget_tache=self.budget_tache)
+            self.executeurs[nom] = creer_pool(self.nb_cpus, self.repertoire_profilage, nom, self.adresse)
+        return self.executeurs[nom]
+
+
+    def fermer_pool(self):
+        for executeur in self.executeurs.values():
+            executeur.close()
+            executeur.join()
+        self.executeurs = {}
+
+
+    def get_etat(self)->dict:
+        """
+        Renvoie l'état du traitement à sauvegarder dans un checkpoint
+        """
+        return {
+            "mnt":self.mnt,
+            "raf":self.raf,
+            "shots":self.shots,
+            "predictions":self.predictions,
+            "groupes_pates_maisons":self.groupes_pates_maisons,
+            "groupe_batiments":self.groupe_batiments,
+            "groupe_segments":self.groupe_segments,
+            "empreintes":self.cache_z.get_entrees(),
+            "identifiants":{
+                "PateMaison":PateMaison.identifiant_global,
+                "GroupePatesMaisons":GroupePatesMaisons.identifiant_global,
+                "Batiment":Batiment.identifiant_global,
+                "Segment":Segment.identifiant_global,
+                "GroupeBatiments":GroupeBatiments.identifiant_global,
+                "GroupeSegments":GroupeSegments.identifiant_global,
+            }
+        }
+
+
+    def restaurer_etat(self, etat:dict)->None:
+        """
+        Restaure l'état du traitement à partir d'un checkpoint. Le MNT et la grille RAF sont relus dans les fichiers .npy de repertoire_mnt écrits par l'étape load
+        """
+        self.mnt = etat["mnt"]
+        self.raf = etat["raf"]
+        self.shots = etat["shots"]
+        self.predictions = etat["predictions"]
+        self.groupes_pates_maisons = etat["groupes_pates_maisons"]
+        self.groupe_batiments = etat["groupe_batiments"]
+        self.groupe_segments = etat["groupe_segments"]
+        self.cache_z.restaurer_entrees(etat.get("empreintes"))
+
+        # Les compteurs d'identifiants sont des attributs de classe : ils ne sont pas sérialisés avec les objets
+        PateMaison.identifiant_global = etat["identifiants"]["PateMaison"]
+        GroupePatesMaisons.identifiant_global = etat["identifiants"].get("GroupePatesMaisons", 0)
+        Batiment.identifiant_global = etat["identifiants"]["Batiment"]
+        Segment.identifiant_global = etat["identifiants"]["Segment"]
+        GroupeBatiments.identifiant_global = etat["identifiants"]["GroupeBatiments"]
+        GroupeSegments.identifiant_global = etat["identifiants"]["GroupeSegments"]
+
+
+
+    def load(self):
+        """
+        Charge les données
+        """
+        if self.ressources is not None:
+            self.mnt = self.ressources.mnt
+            self.raf = self.ressources.raf
+        else:
+            print("Chargement du MNT...")
+            self.mnt = MNT.load_mnt(self.get_mnt_path(), self.emprise, self.repertoire_mnt)
+            print("Chargement du MNT terminé")
+            self.raf = RAF(self.get_raf_path(), self.repertoire_mnt)
+        predictions_ffl = self.get_predictions_ffl()
+        if self.pompei:
+            self.shots = self.get_images_pompei(predictions_ffl, self.mnt)
+        else:
+            self.shots = self.get_shots(predictions_ffl)
+
+        arguments = []
+        paths_predictions = {}
+        for prediction_ffl in tqdm(predictions_ffl, desc="Chargement des images"):
+            for shot in self.shots:
+                if shot.image+".shp" == prediction_ffl or shot.image+".gpkg" == prediction_ffl:
+                    # Le cliché et le MNT sont déjà dans le contexte des workers. L'emprise est propre à chaque chantier
+                    arguments.append([shot.image, os.path.join(self.get_predictions_ffl_dir(), prediction_ffl), self.emprise])
+                    paths_predictions[shot.image] = os.path.join(self.get_predictions_ffl_dir(), prediction_ffl)
+
+        self.cache_z.definir_entrees(None if self.pompei else self.get_ta_path(), self.mnt, self.emprise, paths_predictions, self.pompei)
+
+        self.predictions = map_pool(self.get_pool(), create_predictions, arguments, self.nb_cpus, "Chargement des prédictions")
+        # Les pâtés de maisons et les bâtiments ont été créés dans les workers : on les numérote ici, dans l'ordre des prédictions
+        for prediction in self.predictions:
+            premier_pm = reserver(PateMaison, len(prediction.pates_maisons))
+            for i, pm in enumerate(prediction.pates_maisons):
+                pm.identifiant = premier_pm + i
+            premier_bati = reserver(Batiment, len(prediction.batiments))
+            for i, bati in enumerate(prediction.batiments):
+                bati.identifiant = premier_bati + i
+
+
+    def lisser_geometries(self):
+        """
+        Lisse les géométries de chaque polygone en parallèle
+        """
+        os.makedirs(os.path.join(self.path_output, "gouttieres", "nettoyage"), exist_ok=True)
+
+        # On met à jour la liste des prédictions avec les versions lissées
+        self.predictions = map_pool(self.get_pool(), traiter_lissage, self.predictions, self.nb_cpus, "Lissage des géométries")
+
+    
+    def association_pate_maisons(self):
+        association_pate_maison_engine = AssociationPateMaisonEngine(self.predictions, self.emprise, self.nb_cpus, self.get_pool())
+        self.groupes_pates_maisons, self.predictions = association_pate_maison_engine.run()
+
+        os.makedirs(os.path.join(self.path_output, "gouttieres", "association_pate_maisons"), exist_ok=True)
+        for prediction in self.predictions:
+            prediction.export_pate_maison_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_pate_maisons"))
+
+
+    def association_bati(self):
+        """
+        Associer les bâtiments entre eux
+        """
+        association_batiments_engine = AssociationBatimentEngine(self.groupes_pates_maisons, self.emprise, self.pompei, self.nb_cpus, self.get_pva_path(), self.mnt, self.raf, self.shots, self.get_pool(), self.cache_z)
+        self.groupe_batiments = association_batiments_engine.run()
+        self.noter_groupes_differes(self.groupe_batiments)
+
+        batiments:Dict[int, Batiment] = {}
+        for groupe_batiment in self.groupe_batiments:
+            for batiment in groupe_batiment.batiments:
+                batiments[batiment.identifiant] = batiment
+
+        for prediction in self.predictions:
+            new_batiments = []
+            for batiment in prediction.batiments:
+                new_batiment = batiments.get(batiment.identifiant)
+                if new_batiment is not None:
+                    new_batiments.append(new_batiment)
+            prediction.batiments = new_batiments
+
+        os.makedirs(os.path.join(self.path_output, "gouttieres", "association_batiment"), exist_ok=True)
+        for prediction in self.predictions:
+            prediction.export_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_batiment"))
+
+    
+    def pipeline_groupes(self):
+        """
+        Associe les bâtiments entre eux, puis chaque groupe de bâtiments enchaîne estimation de la hauteur, création des segments, association des segments,
+        calcul des intersections et fermeture dès que l'étape précédente est terminée pour lui, sans attendre les autres groupes de bâtiments
+        """
+        association_batiments_engine = AssociationBatimentEngine(self.groupes_pates_maisons, self.emprise, self.pompei, self.nb_cpus, self.get_pva_path(), self.mnt, self.raf, self.shots, self.get_pool(), self.cache_z)
+        self.groupe_batiments = association_batiments_engine.run(estimer_z=False)
+        association_batiments_engine.preparer_estimation_z()
+
+        etapes = [
+            ("Estimation des hauteurs de bâtiment", compute_estim_z),
+            ("Création des segments pour chaque batiment", create_segments),
+            ("Association des segments", association_segments_groupe),
+            ("Calcul des intersections", calculer_intersections_groupe),
+            ("Fermeture des bâtiments", fermer_groupe)
+        ]
+        # Les identifiants des segments et des groupes de segments sont réservés avant l'envoi aux workers
+        for groupe_batiment in self.groupe_batiments:
+            groupe_batiment.reserver_identifiants_segments()
+
+        graphe = GrapheTaches(self.get_pool(), 2*self.nb_cpus)
+        # Les groupes les plus coûteux sont ajoutés en premier, puis les autres le long d'une courbe de Hilbert : à priorité égale, ils démarrent dans cet ordre
+        for groupe_batiment in ordonner(self.groupe_batiments, nb_cpus=self.nb_cpus):
+            identifiant = groupe_batiment.get_identifiant()
+            for i, (nom, fonction) in enumerate(etapes):
+                if i==0:
+                    graphe.ajouter((identifiant, i), fonction, argument=groupe_batiment, priorite=i, nom=nom)
+                else:
+                    graphe.ajouter((identifiant, i), fonction, dependances=[(identifiant, i-1)], priorite=i, nom=nom)
+        resultats = graphe.run("Traitement des groupes de bâtiments")
+        self.groupe_batiments = [resultats[(groupe_batiment.get_identifiant(), len(etapes)-1)] for groupe_batiment in self.groupe_batiments]
+
+        association_batiments_engine.groupe_batiments = self.groupe_batiments
+        association_batiments_engine.bilan_estimation_z()
+        self.noter_groupes_differes(self.groupe_batiments)
+
+        self.groupe_segments = []
+        for groupe_batiment in self.groupe_batiments:
+            self.groupe_segments += groupe_batiment.groupes_segments
+
+        batiments:Dict[int, Batiment] = {}
+        for groupe_batiment in self.groupe_batiments:
+            for batiment in groupe_batiment.batiments:
+                batiments[batiment.identifiant] = batiment
+
+        for prediction in self.predictions:
+            new_batiments = []
+            for batiment in prediction.batiments:
+                new_batiment = batiments.get(batiment.identifiant)
+                if new_batiment is not None:
+                    new_batiments.append(new_batiment)
+            prediction.batiments = new_batiments
+
+        for repertoire in ["association_batiment", "association_segments"]:
+            os.makedirs(os.path.join(self.path_output, "gouttieres", repertoire), exist_ok=True)
+        for prediction in self.predictions:
+            prediction.export_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_batiment"))
+            prediction.export_segment_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_segments"))
+
+        self.export_intersections()
+        self.export_batiments_fermes()
+        self.export_intersections_ajustees()
+
+
+    def traitement_par_lots(self):
+        """
+        Traite les groupes de pâtés de maisons par lots spatialement cohérents : association des bâtiments, estimation des hauteurs, association des segments,
+        intersections et fermeture. Les résultats de chaque lot sont ajoutés aux fichiers de sortie, puis le lot est libéré.
+
+        Les fichiers intermédiaires par image (association_batiment, association_segments) ne sont pas écrits dans ce mode
+        """
+        gestionnaire_lots = GestionnaireLots(self.path_output, self.memoire_max)
+        gestionnaire_lots.decouper(self.groupes_pates_maisons, self.taille_lot)
+
+        # Les objets ne sont plus référencés que par les lots, pour pouvoir être libérés une fois le lot traité
+        self.groupes_pates_maisons = []
+        self.groupe_batiments = []
+        self.groupe_segments = []
+        for prediction in self.predictions:
+            prediction.pates_maisons = []
+            prediction.batiments = []
+            prediction.gdf = None
+            prediction.gdf_pate_maisons = None
+
+        for path in [os.path.join("intersections", "intersections.gpkg"), os.path.join("batiments_fermes", "batiments_fermes.gpkg"), os.path.join("batiments_fermes", "intersections.gpkg")]:
+            path = os.path.join(self.path_output, "gouttieres", path)
+            if os.path.isfile(path):
+                os.remove(path)
+
+        for i in range(gestionnaire_lots.get_nb_lots()):
+            print(f"Lot {i+1} / {gestionnaire_lots.get_nb_lots()}")
+            with self.rapport.etape(f"lot_{i}"):
+                groupes_pates_maisons = gestionnaire_lots.get_lot(i)
+                association_batiments_engine = AssociationBatimentEngine(groupes_pates_maisons, self.emprise, self.pompei, self.nb_cpus, self.get_pva_path(), self.mnt, self.raf, self.shots, self.get_pool(), self.cache_z)
+                groupes_batiments = association_batiments_engine.run()
+                self.noter_groupes_differes(groupes_batiments)
+                del groupes_pates_maisons, association_batiments_engine
+
+                association_segments_engine = AssociationSegmentsEngine(groupes_batiments, self.nb_cpus, self.get_pool())
+                groupes_segments, groupes_batiments = association_segments_engine.run()
+                del association_segments_engine
+
+                CalculIntersectionEngine(groupes_segments).run()
+                self.export_intersections(groupes_segments, ajouter=True)
+
+                FermerBatimentEngine(groupes_batiments).run()
+                self.export_batiments_fermes(groupes_batiments, ajouter=True)
+                self.export_intersections_ajustees(groupes_batiments, ajouter=True)
+
+                del groupes_batiments, groupes_segments
+                gestionnaire_lots.liberer(i)
+
+
+    def association_segments(self):
+        print("Association des segments")
+        association_segments_engine = AssociationSegmentsEngine(self.groupe_batiments, self.nb_cpus, self.get_pool())
+        self.groupe_segments, self.groupe_batiments = association_segments_engine.run()
+
+        
+        batiments:Dict[int, Batiment] = {}
+        for groupe_batiment in self.groupe_batiments:
+            for batiment in groupe_batiment.batiments:
+                batiments[batiment.identifiant] = batiment
+
+        for prediction in self.predictions:
+            new_batiments = []
+            for batiment in prediction.batiments:
+                new_batiments.append(batiments.get(batiment.identifiant))
+            prediction.batiments = new_batiments
+        
+        os.makedirs(os.path.join(self.path_output, "gouttieres", "association_segments"), exist_ok=True)
+        for prediction in self.predictions:
+            prediction.export_segment_geometry_terrain(os.path.join(self.path_output, "gouttieres", "association_segments"))
+
+
+    def calculer_intersections(self):
+        """
+        On calcule les intersections de plans dans l'espace 
+        """
+        calcule_intersection_engine = CalculIntersectionEngine(self.groupe_segments)
+        calcule_intersection_engine.run()
+        self.export_intersections()
+
+
+    def ecrire_gpkg(self, gdf:gpd.GeoDataFrame, path:str, ajouter:bool=False, colonnes_entieres:List[str]=None)->None:
+        """
+        Ecrit gdf dans path. Si ajouter est True, les entités sont ajoutées au fichier s'il existe déjà (traitement par lots).
+
+        Le premier lot écrit fixe le schéma du fichier : les colonnes_entieres sont converties en entiers qui acceptent les valeurs manquantes (Int64),
+        pour qu'une colonne vide dans un lot ne soit pas créée comme une chaîne de caractères. Un lot vide ne crée pas le fichier
+        """
+        if colonnes_entieres is None:
+            colonnes_entieres = []
+        for colonne in colonnes_entieres:
+            gdf[colonne] = gdf[colonne].astype("Int64")
+        if ajouter and os.path.isfile(path):
+            if gdf.shape[0] > 0:
+                gdf.to_file(path, mode="a")
+        elif not ajouter or gdf.shape[0] > 0:
+            gdf.to_file(path)
+
+
+    def export_intersections(self, groupes_segments:List[GroupeSegments]=None, ajouter:bool=False):
+        if groupes_segments is None:
+            groupes_segments = self.groupe_segments
+        geometries = []
+        nb_segments = []
+        d_mean = []
+        residus = []
+        identifiant = []
+        id_bati = []
+        dict_voisins = {}
+        for i in range(8):
+            dict_voisins[f"v_{i}"] = []
+
+
+        for groupe_segments in groupes_segments:
+            if not groupe_segments._supprime:
+                geometries.append(groupe_segments.get_geometrie())
+                nb_segments.append(groupe_segments.get_nb_segments())
+                d_mean.append(groupe_segments.get_d_mean())
+                residus.append(groupe_segments.get_residu_moyen())
+                identifiant.append(groupe_segments.get_identifiant())
+                id_bati.append(groupe_segments.id_batiment)
+                for i in range(8):
+                    if i<len(groupe_segments.voisins):
+                        dict_voisins[f"v_{i}"].append(groupe_segments.voisins[i].get_identifiant())
+                    else:
+                        dict_voisins[f"v_{i}"].append(None)
+
+        os.makedirs(os.path.join(self.path_output, "gouttieres", "intersections"), exist_ok=True)
+        dict = {"id":identifiant, "residus":residus, "d_mean":d_mean, "nb_segments":nb_segments, "id_bati":id_bati, "geometry":geometries}
+        for i in range(8):
+            dict[f"v_{i}"] = dict_voisins[f"v_{i}"]
+        gdf = gpd.GeoDataFrame(dict, crs="EPSG:2154")
+        self.ecrire_gpkg(gdf, os.path.join(self.path_output, "gouttieres", "intersections", "intersections.gpkg"), ajouter, ["id", "nb_segments", "id_bati"] + [f"v_{i}" for i in range(8)])
+
+
+    def fermer_batiment(self):
+        fermer_batiment_engine = FermerBatimentEngine(self.groupe_batiments)
+        fermer_batiment_engine.run()
+        self.export_batiments_fermes()
+        self.export_intersections_ajustees()
+
+    def export_batiments_fermes(self, groupes_batiments:List[GroupeBatiments]=None, ajouter:bool=False):
+        if groupes_batiments is None:
+            groupes_batiments = self.groupe_batiments
+        geometries = []
+        identifiant = []
+        methode = []
+        methode_estimation_alti = []
+        estimation_z = []
+        delta_estim = []
+        score = []
+        differe = []
+        x_position = []
+        y_position = []
+
+
+        for groupe_batiment in groupes_batiments:
+            geometrie = groupe_batiment.get_geometrie_fermee()
+            for geom in geometrie.geoms:
+                geometries.append(geom)
+                identifiant.append(groupe_batiment.get_identifiant())
+                methode.append(groupe_batiment.get_methode_fermeture())
+                methode_estimation_alti.append(groupe_batiment.get_methode_estimation_hauteur())
+                estimation_z.append(groupe_batiment.estim_z)
+                score.append(groupe_batiment.score)
+                differe.append(groupe_batiment.differe)
+                x_position.append(groupe_batiment.position_terrain[0] if groupe_batiment.position_terrain is not None else float("nan"))
+                y_position.append(groupe_batiment.position_terrain[1] if groupe_batiment.position_terrain is not None else float("nan"))
+
+                delta_estim.append(0)
+        d = {"id_bati":identifiant, "methode":methode, "estim_alti":methode_estimation_alti, "estim_z":estimation_z, "delta_estim":delta_estim, "score":score, "differe":differe, "x_position":x_position, "y_position":y_position, "geometry":geometries}
+        
+        os.makedirs(os.path.join(self.path_output, "gouttieres", "batiments_fermes"), exist_ok=True)
+        gdf = gpd.GeoDataFrame(d, crs="EPSG:2154")
+        self.ecrire_gpkg(gdf, os.path.join(self.path_output, "gouttieres", "batiments_fermes", "batiments_fermes.gpkg"), ajouter, ["id_bati"])
+
+    def export_intersections_ajustees(self, groupes_batiments:List[GroupeBatiments]=None, ajouter:bool=False):
+        if groupes_batiments is None:
+            groupes_batiments = self.groupe_batiments
+        geometries = []
+        nb_segments = []
+        d_mean = []
+        residus = []
+        identifiant = []
+        identifiant_bati = []
+
+        for groupe_batiments in groupes_batiments:
+            for groupe_segments in groupe_batiments.groupes_segments:
+            
+                if groupe_segments.is_valid():
+                    
+                    geometries.append(groupe_segments.get_geometrie())
+                    nb_segments.append(groupe_segments.get_nb_segments())
+                    d_mean.append(groupe_segments.get_d_mean())
+                    residus.append(groupe_segments.get_residu_moyen())
+                    identifiant.append(groupe_segments.get_identifiant())
+                    identifiant_bati.append(groupe_batiments.get_identifiant())
+
+        os.makedirs(os.path.join(self.path_output, "gouttieres", "batiments_fermes"), exist_ok=True)
+        gdf = gpd.GeoDataFrame({"id":identifiant, "residus":residus, "d_mean":d_mean, "nb_segments":nb_segments, "id_bati":identifiant_bati, "geometry":geometries}, crs="EPSG:2154")
+        self.ecrire_gpkg(gdf, os.path.join(self.path_output, "gouttieres", "batiments_fermes", "intersections.gpkg"), ajouter, ["id", "nb_segments", "id_bati"])
@@ -8,16 +8,17 @@ class Segment:
 
     identifiant_global = 0
 
-    def __init__(self, geometrie_image:LineString, mnt:MNT, shot:Shot, batiment):
+    def __init__(self, geometrie_image:LineString, batiment, identifiant:int):
         self.geometrie_image:LineString = geometrie_image
-        self.mnt:MNT = mnt
-        self.shot:Shot = shot
+        # Le cliché et le MNT sont ceux du bâtiment : le segment ne les référence pas lui-même
         self.batiment = batiment
-        self.identifiant:int = Segment.identifiant_global
-        Segment.identifiant_global += 1
+        # Identifiant pris dans la plage réservée par le groupe de bâtiments (voir GroupeBatiments.reserver_identifiants_segments)
+        self.identifiant:int = identifiant
 
-        self.geometrie_terrain:LineString = None
-        self.world_line:np.array = None
+        # Sans table (voir v2/tables.py), les extrémités du segment en coordonnées du monde sont dans _world_line
+        self.table = None
+        self.indice_table:int = None
+        self._world_line:np.array = None
 
         self.segments_homologues_1:List[Segment] = [] # Liste des segments homologues
         self.segments_homologues_2:List[Segment] = [] # Liste des segments homologues
@@ -34,6 +35,46 @@ class Segment:
 
         self.compute_ground_geometry()
 
+    @property
+    def world_line(self)->np.array:
+        """
+        Extrémités du segment en coordonnées du monde, tableau de taille (2, 3). Vue sur la ligne de la table si le segment y est rangé
+        """
+        if self.table is not None:
+            return self.table.extremites[self.indice_table]
+        return self._world_line
+
+    @world_line.setter
+    def world_line(self, world_line:np.array)->None:
+        if self.table is not None:
+            self.table.extremites[self.indice_table] = world_line
+        else:
+            self._world_line = world_line
+
+    @property
+    def shot(self)->Shot:
+        return self.batiment.shot
+
+    @property
+    def mnt(self)->MNT:
+        return self.batiment.mnt
+
+    @property
+    def geometrie_terrain(self)->LineString:
+        if self.world_line is None:
+            return None
+        return LineString(self.world_line)
+
+
+    def attacher(self, table, indice:int)->None:
+        """
+        Range le segment dans la ligne indice de la table des segments
+        """
+        self.table = table
+        self.indice_table = indice
+        self._world_line = None
+
+
     def get_estim_z(self)->float:
         return self.batiment.get_z_mean()
 
@@ -52,10 +93,6 @@ class Segment:
             l.append(-y[i])
 
         x, y, z = self.shot.image_to_world(np.array(c), np.array(l), self.mnt, estim_z=self.get_estim_z())
-        ground_points = []
-        for i in range(len(x)):
-            ground_points.append([x[i], y[i], z[i]])
-        self.geometrie_terrain = LineString(ground_points)
         self.world_line = np.array([[x[0], y[0], z[0]], [x[1], y[1], z[1]]])
 
 
@@ -91,10 +128,6 @@ class Segment:
                     estim_z = altitude_moyenne_bati
 
         x, y, z = self.shot.image_to_world(np.array(c), np.array(l), self.mnt, estim_z=estim_z)
-        ground_points = []
-        for i in range(len(x)):
-            ground_points.append([x[i], y[i], z[i]])
-        self.geometrie_terrain = LineString(ground_points)
         self.world_line = np.array([[x[0], y[0], z[0]], [x[1], y[1], z[1]]])
 
 
@@ -1,14 +1,12 @@
 import numpy as np
 import pyproj
 from scipy.spatial.transform import Rotation as R
-from osgeo import gdal
 from scipy import ndimage
 from shapely import Polygon, Point
-from lxml import etree
 import os
 from typing import List
-from scipy.interpolate import LinearNDInterpolator
-import zarr
+from v2.memoire_partagee import TableauPartage
+from v2 import presets, noyaux
 
 
 class Shot:
@@ -66,11 +64,15 @@ class Shot:
         return self.geoc_to_carto(point_geoc[0], point_geoc[1], point_geoc[2])
     
 
-    def image_z_to_local(self, c, l, z):
-        x_local_0, y_local_0, z_local_0, x_local_1, y_local_1, z_local_1 = self.image_to_local_vec(c, l)
-        lamb = (z - z_local_0) / (z_local_1 - z_local_0)
-        x_local = x_local_0 + (x_local_1 - x_local_0) * lamb
-        y_local = y_local_0 + (y_local_1 - y_local_0) * lamb
+    def image_z_to_local(self, c, l, z, faisceau=None):
+        """
+        faisceau est le résultat de image_to_local_vec(c, l) : il ne dépend pas de z et peut être calculé une seule fois pour plusieurs altitudes
+        """
+        if faisceau is None:
+            faisceau = self.image_to_local_vec(c, l)
+        x_local_0, y_local_0, z_local_0, x_local_1, y_local_1, z_local_1 = faisceau
+        x_local = noyaux.intersection_plan(x_local_0, x_local_1, z_local_0, z_local_1, z)
+        y_local = noyaux.intersection_plan(y_local_0, y_local_1, z_local_0, z_local_1, z)
         return x_local, y_local, z
     
 
@@ -302,7 +304,7 @@ class ShotOriente(Shot):
             return self.convertback(type_input, c, l)
 
     
-    def image_to_world(self, c, l, dem, prec=0.1, iter_max=3, estim_z=None):
+    def image_to_world(self, c, l, dem, prec=None, iter_max=None, estim_z=None):
         """
         Compute the world coordinates of (a) image point(s).
         A Dem must be used.
@@ -310,13 +312,17 @@ class ShotOriente(Shot):
         :param c: column coordinates of image point(s)
         :param l: line coordinates of image point(s)
         :param dem: Dem of the area or constant value
-        :param prec: accuracy
-        :param iter_max: maximum number of iterations
+        :param prec: accuracy (by default, from the preset, see v2/presets.py)
+        :param iter_max: maximum number of iterations (by default, from the preset)
 
         Attention, la distorsion n'est pas corrigée ici !!! 
 
         :return: x, y, z World coordinates
         """
+        if prec is None:
+            prec = presets.get("precision_image_to_world")
+        if iter_max is None:
+            iter_max = presets.get("iter_max_image_to_world")
         # initialisation
         # passage en local en faisant l'approximation z "local" a partir du z "world"
         # La fonction calcule le x et y euclidien correspondant à une coordonnées image et un Z local
@@ -329,7 +335,8 @@ class ShotOriente(Shot):
             z_world = estim_z
         
         z_world = np.full_like(c, z_world)
-        x_local, y_local, z_local = self.image_z_to_local(c, l, z_world)
+        faisceau = self.image_to_local_vec(c, l)
+        x_local, y_local, z_local = self.image_z_to_local(c, l, z_world, faisceau)
         # On a les coordonnées locales approchées (car z non local) on passe en world
         x_world, y_world, _ = self.euclidean_to_world(x_local, y_local, z_local)
         precision_reached = False
@@ -345,12 +352,12 @@ class ShotOriente(Shot):
             x_local, y_local, z_local = self.world_to_euclidean(x_world, y_world, z_world)
 
             # nouvelle transfo avec un zLocal plus precis
-            x_local, y_local, z_local = self.image_z_to_local(c, l, z_local)
+            x_local, y_local, z_local = self.image_z_to_local(c, l, z_local, faisceau)
 
             # passage en terrain (normalement le zw obtenu devrait être quasiment identique au Z initial)
             x_world_new, y_world_new, z_world_new = self.euclidean_to_world(x_local, y_local, z_local)
 
-            dist = ((x_world_new - x_world) ** 2 + (y_world_new - y_world) ** 2 + (z_world_new - z_world) ** 2) ** 0.5
+            dist = noyaux.distance_3d(x_world, y_world, z_world, x_world_new, y_world_new, z_world_new)
             if np.any(dist < prec):
                 precision_reached = True
             x_world, y_world, z_world = x_world_new, y_world_new, z_world_new
@@ -359,7 +366,7 @@ class ShotOriente(Shot):
         return self.convertback(type_input, x_world, y_world, z_world)
     
 
-    def image_to_world_alti(self, c, l, alti, prec=0.1, iter_max=3, estim_z=None):
+    def image_to_world_alti(self, c, l, alti, prec=None, iter_max=None, estim_z=None):
         """
         Compute the world coordinates of (a) image point(s).
         A Dem must be used.
@@ -367,13 +374,17 @@ class ShotOriente(Shot):
         :param c: column coordinates of image point(s)
         :param l: line coordinates of image point(s)
         :param dem: Dem of the area or constant value
-        :param prec: accuracy
-        :param iter_max: maximum number of iterations
+        :param prec: accuracy (by default, from the preset, see v2/presets.py)
+        :param iter_max: maximum number of iterations (by default, from the preset)
 
         Attention, la distorsion n'est pas corrigée ici !!! 
 
         :return: x, y, z World coordinates
         """
+        if prec is None:
+            prec = presets.get("precision_image_to_world")
+        if iter_max is None:
+            iter_max = presets.get("iter_max_image_to_world")
         # initialisation
         # passage en local en faisant l'approximation z "local" a partir du z "world"
         # La fonction calcule le x et y euclidien correspondant à une coordonnées image et un Z local
@@ -382,7 +393,8 @@ class ShotOriente(Shot):
 
 
         z_world = np.full_like(c, alti)
-        x_local, y_local, z_local = self.image_z_to_local(c, l, z_world)
+        faisceau = self.image_to_local_vec(c, l)
+        x_local, y_local, z_local = self.image_z_to_local(c, l, z_world, faisceau)
         # On a les coordonnées locales approchées (car z non local) on passe en world
         x_world, y_world, _ = self.euclidean_to_world(x_local, y_local, z_local)
         precision_reached = False
@@ -394,12 +406,12 @@ class ShotOriente(Shot):
             x_local, y_local, z_local = self.world_to_euclidean(x_world, y_world, z_world)
 
             # nouvelle transfo avec un zLocal plus precis
-            x_local, y_local, z_local = self.image_z_to_local(c, l, z_local)
+            x_local, y_local, z_local = self.image_z_to_local(c, l, z_local, faisceau)
 
             # passage en terrain (normalement le zw obtenu devrait être quasiment identique au Z initial)
             x_world_new, y_world_new, z_world_new = self.euclidean_to_world(x_local, y_local, z_local)
 
-            dist = ((x_world_new - x_world) ** 2 + (y_world_new - y_world) ** 2 + (z_world_new - z_world) ** 2) ** 0.5
+            dist = noyaux.distance_3d(x_world, y_world, z_world, x_world_new, y_world_new, z_world_new)
             if np.any(dist < prec):
                 precision_reached = True
             x_world, y_world, z_world = x_world_new, y_world_new, z_world_new
@@ -436,21 +448,24 @@ class ShotOriente(Shot):
 
 class MNT:
 
-    def __init__(self, mnt:np.ndarray, gt) -> None:
+    def __init__(self, mnt:np.ndarray, gt, repertoire:str="data") -> None:
         self.mnt = mnt
         self.gt = gt
+        # Répertoire où sont écrits les tableaux partagés (voir v2/memoire_partagee.py)
+        self.repertoire = repertoire
         self.xsize = mnt.shape[1]
         self.ysize = mnt.shape[0]
 
     @staticmethod
-    def load_mnt(path, emprise):
+    def load_mnt(path, emprise, repertoire="data"):
         # buffer de 1 km
         gdf_buffer = emprise.buffer(1000)
 
         # bounding box
         xmin, ymin, xmax, ymax = gdf_buffer.total_bounds
 
-        # ouverture du raster
+        # ouverture du raster. GDAL n'est importé que dans le processus principal, les workers n'en ont pas besoin
+        from osgeo import gdal
         ds = gdal.Open(path)
 
         gt = ds.GetGeoTransform()
@@ -473,14 +488,8 @@ class MNT:
 
         array = band.ReadAsArray(px_min, py_min, xsize, ysize)
 
-        mnt = zarr.create_array(
-            store="data/mnt_global.zarr",
-            overwrite=True,
-            shape=array.shape,
-            chunks=(100, 100),
-            dtype="f4"
-        )
-        mnt[:,:] = array
+        # Le MNT est écrit une seule fois : les workers l'ouvrent en mémoire partagée, et le MNT de chaque cliché n'en est qu'une fenêtre
+        mnt = TableauPartage.ecrire(os.path.join(repertoire, "mnt_global.npy"), array)
 
         gt = (
             gt[0] + px_min * gt[1],
@@ -493,7 +502,7 @@ class MNT:
 
         ds = None
         band = None
-        return MNT(mnt, gt)
+        return MNT(mnt, gt, repertoire)
 
 
 
@@ -511,16 +520,11 @@ class MNT:
         py_min = max(0, py_min)
         py_max = min(mnt_global.mnt.shape[0], py_max)
 
-        array = mnt_global.mnt[py_min:py_max,px_min:px_max]
-
-        mnt = zarr.create_array(
-            store=f"data/mnt_{shot}.zarr",
-            overwrite=True,
-            shape=array.shape,
-            chunks=(100, 100),
-            dtype="f4"
-        )
-        mnt[:,:] = array
+        # Fenêtre sur le MNT global, sans copie
+        if isinstance(mnt_global.mnt, TableauPartage):
+            mnt = mnt_global.mnt.get_fenetre(py_min, py_max, px_min, px_max)
+        else:
+            mnt = mnt_global.mnt[py_min:py_max,px_min:px_max]
 
         gt = (
             mnt_global.gt[0] + px_min * mnt_global.gt[1],
@@ -530,7 +534,7 @@ class MNT:
             mnt_global.gt[4],
             mnt_global.gt[5],
         )
-        return MNT(mnt, gt)
+        return MNT(mnt, gt, mnt_global.repertoire)
 
     def world_to_image(self, x, y):
         """
@@ -557,6 +561,21 @@ class MNT:
         return x, y
 
 
+    def get_fenetre(self, xmin, ymin, xmax, ymax)->np.ndarray:
+        """
+            Extract the Dem values inside a bounding box
+
+            :return: 2D array
+        """
+        imin, jmin = np.floor(self.world_to_image(xmin, ymax))
+        imax, jmax = np.ceil(self.world_to_image(xmax, ymin))
+        imin = int(min(max(imin, 0), self.xsize))
+        imax = int(min(max(imax, 0), self.xsize))
+        jmin = int(min(max(jmin, 0), self.ysize))
+        jmax = int(min(max(jmax, 0), self.ysize))
+        return self.mnt[jmin:jmax,imin:imax]
+
+
     def get(self, x, y):
         """
             Extract value in the Dem
@@ -588,10 +607,14 @@ class MNT:
 
 class RAF:
 
-    def __init__(self, path) -> None:
+    def __init__(self, path, repertoire:str=None) -> None:
+        from osgeo import gdal
         src = gdal.Open(path)
         self.gt = src.GetGeoTransform()
         self.raf = src.ReadAsArray()
+        # Avec un répertoire, la grille est partagée par les workers au lieu d'être copiée dans chacun d'eux
+        if repertoire is not None:
+            self.raf = TableauPartage.ecrire(os.path.join(repertoire, "raf.npy"), self.raf, self.raf.dtype.str)
 
     def get(self, x, y):
         c = (x - self.gt[0]) / self.gt[1]
@@ -608,6 +631,7 @@ class Calibration:
     
     @staticmethod
     def createCalibration(path):
+        from lxml import etree
         tree = etree.parse(path)
         root = tree.getroot()
         calibration = Calibration()
@@ -658,6 +682,7 @@ class ShotPompei(Shot):
     @staticmethod
     def createShot(path, calibrations:List[Calibration]):
         shot = ShotPompei()
+        from lxml import etree
         tree = etree.parse(path)
         root = tree.getroot()
 
@@ -732,7 +757,7 @@ class ShotPompei(Shot):
             return self.convertback(type_input, c, l)
 
     
-    def image_to_world(self, c, l, dem, prec=0.1, iter_max=3, estim_z=None):
+    def image_to_world(self, c, l, dem, prec=None, iter_max=None, estim_z=None):
         """
         Compute the world coordinates of (a) image point(s).
         A Dem must be used.
@@ -740,13 +765,17 @@ class ShotPompei(Shot):
         :param c: column coordinates of image point(s)
         :param l: line coordinates of image point(s)
         :param dem: Dem of the area or constant value
-        :param prec: accuracy
-        :param iter_max: maximum number of iterations
+        :param prec: accuracy (by default, from the preset, see v2/presets.py)
+        :param iter_max: maximum number of iterations (by default, from the preset)
 
         Attention, la distorsion n'est pas corrigée ici !!! 
 
         :return: x, y, z World coordinates
         """
+        if prec is None:
+            prec = presets.get("precision_image_to_world")
+        if iter_max is None:
+            iter_max = presets.get("iter_max_image_to_world")
         # initialisation
         # passage en local en faisant l'approximation z "local" a partir du z "world"
         # La fonction calcule le x et y euclidien correspondant à une coordonnées image et un Z local
@@ -760,7 +789,8 @@ class ShotPompei(Shot):
         z_world = np.full_like(c, z_world)
 
 
-        x_local, y_local, z_local = self.image_z_to_local(c, l, z_world)
+        faisceau = self.image_to_local_vec(c, l)
+        x_local, y_local, z_local = self.image_z_to_local(c, l, z_world, faisceau)
         # On a les coordonnées locales approchées (car z non local) on passe en world
         x_world, y_world, _ = self.euclidean_to_world(x_local, y_local, z_local)
         precision_reached = False
@@ -775,11 +805,11 @@ class ShotPompei(Shot):
             # On repasse en euclidien avec le bon Zworld , l'approximation plani ayant un impact minime
             x_local, y_local, z_local = self.world_to_euclidean(x_world, y_world, z_world)
             # nouvelle transfo avec un zLocal plus precis
-            x_local, y_local, z_local = self.image_z_to_local(c, l, z_local)
+            x_local, y_local, z_local = self.image_z_to_local(c, l, z_local, faisceau)
             # passage en terrain (normalement le zw obtenu devrait être quasiment identique au Z initial)
             x_world_new, y_world_new, z_world_new = self.euclidean_to_world(x_local, y_local, z_local)
 
-            dist = ((x_world_new - x_world) ** 2 + (y_world_new - y_world) ** 2 + (z_world_new - z_world) ** 2) ** 0.5
+            dist = noyaux.distance_3d(x_world, y_world, z_world, x_world_new, y_world_new, z_world_new)
             if np.any(dist < prec):
                 precision_reached = True
             x_world, y_world, z_world = x_world_new, y_world_new, z_world_new
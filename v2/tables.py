@@ -0,0 +1,165 @@
+"""
+Tables en colonnes des bâtiments et des segments d'un groupe de bâtiments.
+
+Les objets Batiment et Segment restent utilisés partout, mais leurs données numériques sont rangées dans des tableaux numpy communs au groupe :
+* TableSegments : extrémités en coordonnées du monde, vecteur directeur, barycentre, équation de la droite, demi-longueur, bâtiment et groupe de segments
+* TableBatiments : image et emprise au sol, pour la recherche des paires de bâtiments de l'association des segments
+
+Les segments d'un même bâtiment sont consécutifs dans la table : un bâtiment correspond à une tranche de lignes.
+Segment.world_line et les tableaux Batiment.u, Batiment.barycentre... sont des vues sur ces tables.
+L'association des segments travaille directement sur les tranches, pour toutes les paires de segments de deux bâtiments à la fois
+"""
+from __future__ import annotations
+from typing import Iterator, List, Tuple
+import numpy as np
+
+
+class TableSegments:
+
+    def __init__(self, nb_segments_batiments:List[int]):
+        nb_segments = sum(nb_segments_batiments)
+        # Début des segments de chaque bâtiment, les segments du bâtiment i sont dans [debuts[i], debuts[i+1][
+        self.debuts:np.ndarray = np.concatenate(([0], np.cumsum(nb_segments_batiments, dtype=np.int64))).astype(np.int64)
+
+        self.extremites:np.ndarray = np.zeros((nb_segments, 2, 3))
+        self.batiment:np.ndarray = np.repeat(np.arange(len(nb_segments_batiments), dtype=np.int64), nb_segments_batiments)
+        self.identifiant:np.ndarray = np.zeros(nb_segments, dtype=np.int64)
+        # Identifiant du groupe de segments, -1 si le segment n'est associé à aucun autre
+        self.groupe:np.ndarray = np.full(nb_segments, -1, dtype=np.int64)
+
+        # Colonnes utilisées pour l'association, éventuellement translatées (voir calculer_colonnes)
+        self.array:np.ndarray = np.zeros((nb_segments, 4))
+        self.u:np.ndarray = np.zeros((nb_segments, 2))
+        self.barycentre:np.ndarray = np.zeros((nb_segments, 2))
+        self.equation_droite:np.ndarray = np.zeros((nb_segments, 4))
+        self.d_max:np.ndarray = np.zeros(nb_segments)
+
+
+    @staticmethod
+    def depuis_batiments(batiments:List) -> TableSegments:
+        """
+        Range dans une table les segments des bâtiments, et rattache chaque bâtiment et chaque segment à la table
+        """
+        table = TableSegments([len(batiment.get_segments()) for batiment in batiments])
+        for i, batiment in enumerate(batiments):
+            debut = table.debuts[i]
+            for j, segment in enumerate(batiment.get_segments()):
+                table.extremites[debut+j] = segment.world_line
+                table.identifiant[debut+j] = segment.get_identifiant()
+                segment.attacher(table, debut+j)
+            batiment.attacher(table, i)
+        return table
+
+
+    def get_tranche(self, indice_batiment:int)->slice:
+        return slice(int(self.debuts[indice_batiment]), int(self.debuts[indice_batiment+1]))
+
+
+    def calculer_colonnes(self, tranche:slice=slice(None), dx:float=0, dy:float=0)->None:
+        """
+        Calcule les colonnes utilisées pour l'association des segments de la tranche, après une translation (dx, dy) des extrémités
+        """
+        extremites = self.extremites[tranche]
+        # Coordonnées des extrémités des goutières en coordonnées du monde
+        array = np.stack((extremites[:,0,0]+dx, extremites[:,0,1]+dy, extremites[:,1,0]+dx, extremites[:,1,1]+dy), axis=1)
+
+        # Vecteur directeur normalisé des goutières (en 2d)
+        dx = (array[:,2]-array[:,0])
+        dy = (array[:,3]-array[:,1])
+        u = np.stack((dx, dy), axis=1)
+        norm = np.linalg.norm(u, axis=1)
+
+        # Paramètres de la droite de la goutière (en 2d)
+        a = dy
+        b = -dx
+        c = dx * array[:,1] - dy * array[:,0]
+
+        self.array[tranche] = array
+        self.u[tranche] = u / norm.reshape((-1, 1))
+        self.barycentre[tranche] = np.stack(((array[:,2]+array[:,0])/2, (array[:,3]+array[:,1])/2), axis=1)
+        self.equation_droite[tranche] = np.stack((a, b, c, np.sqrt(a**2 + b**2)), axis=1)
+        # Moitié de la longueur de la goutière
+        self.d_max[tranche] = 0.5 * np.sqrt(dx**2+dy**2)
+
+
+    def get_directions(self, tranche:slice)->Tuple[np.ndarray, np.ndarray]:
+        """
+        Renvoie le vecteur directeur normalisé (de la deuxième extrémité vers la première) et le barycentre en 2d des segments de la tranche, sans translation.
+        Ce sont les mêmes valeurs que Segment.u_directeur_world et Segment.barycentre_world
+        """
+        extremites = self.extremites[tranche]
+        u = extremites[:,0,:2] - extremites[:,1,:2]
+        # Même calcul de la norme que np.linalg.norm sur un vecteur (produit scalaire)
+        norm = np.sqrt(np.matmul(u[:,np.newaxis,:], u[:,:,np.newaxis])[:,0,0])
+        return u / norm.reshape((-1, 1)), (extremites[:,0,:2] + extremites[:,1,:2]) / 2
+
+
+    def apparier(self, tranche_1:slice, tranche_2:slice, seuil_ps:float, seuil_distance_droite:float)->np.ndarray:
+        """
+        Pour chaque segment de la tranche 1, cherche parmi les segments de la tranche 2 (avec leurs colonnes courantes) ceux qui sont presque parallèles,
+        dont la droite passe près du barycentre du segment, et dont le barycentre est à moins de la demi-longueur du segment. Parmi eux, on garde celui dont le barycentre est le plus proche.
+
+        Renvoie pour chaque segment de la tranche 1 l'indice dans la tranche 2 du segment apparié, ou -1
+        """
+        u1, barycentre_1 = self.get_directions(tranche_1)
+        u = self.u[tranche_2]
+        equation_droite = self.equation_droite[tranche_2]
+        barycentre = self.barycentre[tranche_2]
+        d_max = self.d_max[tranche_2]
+
+        # Produit scalaire
+        ps = np.abs(np.sum(u1[:,np.newaxis,:] * u[np.newaxis,:,:], axis=2))
+        # Distance du barycentre à la droite
+        d_droite = np.abs(equation_droite[np.newaxis,:,0]*barycentre_1[:,0,np.newaxis] + equation_droite[np.newaxis,:,1]*barycentre_1[:,1,np.newaxis] + equation_droite[np.newaxis,:,2]) / equation_droite[np.newaxis,:,3]
+        # Distance entre les deux barycentres
+        distance = np.sqrt(np.sum((barycentre[np.newaxis,:,:] - barycentre_1[:,np.newaxis,:])**2, axis=2))
+
+        condition = np.logical_and(np.logical_and(ps > seuil_ps, d_droite < seuil_distance_droite), distance < d_max[np.newaxis,:])
+        if condition.shape[1] == 0:
+            return np.full(condition.shape[0], -1, dtype=np.int64)
+        indices = np.argmin(np.where(condition, distance, np.inf), axis=1)
+        return np.where(np.any(condition, axis=1), indices, -1)
+
+
+class TableBatiments:
+    """
+    Seules les données utiles à la recherche des paires de bâtiments sont copiées : les contours restent les géométries shapely des bâtiments
+    """
+
+    def __init__(self, batiments:List):
+        nb_batiments = len(batiments)
+
+        # Images des bâtiments, et indice de l'image de chaque bâtiment dans cette liste
+        self.images:List[str] = []
+        self.image:np.ndarray = np.zeros(nb_batiments, dtype=np.int64)
+        for i, batiment in enumerate(batiments):
+            if batiment.get_image() not in self.images:
+                self.images.append(batiment.get_image())
+            self.image[i] = self.images.index(batiment.get_image())
+
+        # Emprise au sol (xmin, ymin, xmax, ymax), nan si le bâtiment n'a pas de géométrie terrain
+        self.emprise:np.ndarray = np.full((nb_batiments, 4), np.nan)
+        for i, batiment in enumerate(batiments):
+            if batiment.get_geometrie_terrain() is not None:
+                self.emprise[i] = batiment.get_geometrie_terrain().bounds
+
+
+    def paires_candidates(self)->Iterator[Tuple[int, int]]:
+        """
+        Renvoie les paires (i, j), i < j, de bâtiments issus d'images différentes dont les emprises se recouvrent, dans l'ordre de parcours des paires.
+        Les paires sont calculées ligne par ligne, pour ne pas créer de tableaux de la taille du nombre de paires.
+
+        Deux bâtiments dont les emprises sont disjointes ont un IoU nul : seules ces paires peuvent avoir un IoU suffisant
+        """
+        for i in range(self.image.shape[0] - 1):
+            emprise_i = self.emprise[i]
+            emprises = self.emprise[i+1:]
+            candidates = np.logical_and(
+                np.logical_and(
+                    np.logical_and(emprise_i[0] <= emprises[:,2], emprises[:,0] <= emprise_i[2]),
+                    np.logical_and(emprise_i[1] <= emprises[:,3], emprises[:,1] <= emprise_i[3])
+                ),
+                self.image[i+1:] != self.image[i]
+            )
+            for j in (np.flatnonzero(candidates) + i + 1).tolist():
+                yield i, j
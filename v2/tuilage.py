@@ -0,0 +1,179 @@
+import os
+import json
+import math
+from typing import List, Dict
+import geopandas as gpd
+import pandas as pd
+from shapely import Polygon, box
+
+
+# Couches produites par SamonGouttiere qu'il faut fusionner, relativement au répertoire de sortie d'une tuile
+COUCHES_A_FUSIONNER = [
+    os.path.join("gouttieres", "batiments_fermes", "batiments_fermes.gpkg"),
+    os.path.join("gouttieres", "batiments_fermes", "intersections.gpkg"),
+    os.path.join("gouttieres", "intersections", "intersections.gpkg"),
+]
+
+
+def get_repertoire_tuile(path_output:str, indice:int)->str:
+    return os.path.join(path_output, "tuiles", f"tuile_{indice}")
+
+
+def decouper_emprise(emprise:gpd.GeoSeries, taille:float, halo:float)->gpd.GeoDataFrame:
+    """
+    Découpe l'emprise en tuiles carrées de côté taille.
+
+    La grille est alignée sur les multiples de taille pour que le découpage soit le même quelle que soit l'emprise.
+    Chaque tuile possède un coeur (la case de la grille) et une emprise de traitement (le coeur agrandi du halo, intersecté avec l'emprise du chantier)
+    """
+    xmin, ymin, xmax, ymax = emprise.total_bounds
+    emprise_union = emprise.union_all()
+
+    i_min = math.floor(xmin / taille)
+    i_max = math.ceil(xmax / taille)
+    j_min = math.floor(ymin / taille)
+    j_max = math.ceil(ymax / taille)
+
+    indices = []
+    coeurs = []
+    emprises_traitement = []
+    indice = 0
+    for j in range(j_min, j_max):
+        for i in range(i_min, i_max):
+            coeur = box(i*taille, j*taille, (i+1)*taille, (j+1)*taille)
+            if not coeur.intersects(emprise_union):
+                continue
+            emprise_traitement = box(i*taille-halo, j*taille-halo, (i+1)*taille+halo, (j+1)*taille+halo).intersection(emprise_union)
+            indices.append(indice)
+            coeurs.append(coeur)
+            emprises_traitement.append(emprise_traitement)
+            indice += 1
+
+    return gpd.GeoDataFrame({"indice":indices, "emprise_traitement":gpd.GeoSeries(emprises_traitement, crs="EPSG:2154"), "geometry":coeurs}, crs="EPSG:2154")
+
+
+def ecrire_tuiles(path_output:str, tuiles:gpd.GeoDataFrame, parametres:Dict)->None:
+    """
+    Sauvegarde le découpage, les emprises de traitement de chaque tuile et les paramètres du chantier
+    """
+    os.makedirs(os.path.join(path_output, "tuiles"), exist_ok=True)
+    tuiles[["indice", "geometry"]].to_file(os.path.join(path_output, "tuiles", "tuiles.gpkg"))
+    for _, tuile in tuiles.iterrows():
+        repertoire = get_repertoire_tuile(path_output, tuile["indice"])
+        os.makedirs(repertoire, exist_ok=True)
+        gpd.GeoDataFrame({"geometry":[tuile["emprise_traitement"]]}, crs="EPSG:2154").to_file(os.path.join(repertoire, "emprise.gpkg"))
+
+    parametres = dict(parametres)
+    parametres["nb_tuiles"] = int(tuiles.shape[0])
+    with open(os.path.join(path_output, "tuiles", "tuiles.json"), "w") as f:
+        json.dump(parametres, f, indent=2)
+
+
+def lire_parametres(path_output:str)->Dict:
+    with open(os.path.join(path_output, "tuiles", "tuiles.json"), "r") as f:
+        return json.load(f)
+
+
+def ecrire_script_slurm(path_output:str, nb_tuiles:int, nb_cpus:int, chemin_script:str)->str:
+    """
+    Ecrit un script SLURM qui lance une tâche par tuile (job array)
+    """
+    path = os.path.join(path_output, "tuiles", "lancer_tuiles.slurm")
+    with open(path, "w") as f:
+        f.write("#!/bin/bash\n")
+        f.write(f"#SBATCH --array=0-{nb_tuiles-1}\n")
+        f.write("#SBATCH --nodes=1\n")
+        f.write("#SBATCH --ntasks-per-node=1\n")
+        f.write(f"#SBATCH --cpus-per-task={nb_cpus}\n")
+        f.write(f"#SBATCH -o {os.path.join(os.path.abspath(path_output), 'tuiles', 'tuile_%a.out')}\n")
+        f.write(f"#SBATCH -e {os.path.join(os.path.abspath(path_output), 'tuiles', 'tuile_%a.err')}\n")
+        f.write("\n")
+        f.write('eval "$(conda shell.bash hook)"\n')
+        f.write("conda activate samon\n")
+        f.write("\n")
+        f.write(f"srun python {os.path.abspath(chemin_script)} executer --output {os.path.abspath(path_output)} --indice $SLURM_ARRAY_TASK_ID\n")
+    return path
+
+
+def point_dans_coeur(x:float, y:float, coeur:Polygon)->bool:
+    """
+    Les coeurs de tuiles forment une partition du plan : on considère les intervalles semi-ouverts [xmin, xmax[ x [ymin, ymax[
+    pour qu'un point sur une frontière n'appartienne qu'à une seule tuile
+    """
+    xmin, ymin, xmax, ymax = coeur.bounds
+    return xmin <= x < xmax and ymin <= y < ymax
+
+
+def selectionner_batiments(gdf:gpd.GeoDataFrame, coeur:Polygon)->List:
+    """
+    Renvoie les identifiants des bâtiments dont la position au sol se trouve dans le coeur de la tuile.
+
+    La position (colonnes x_position et y_position, voir GroupeBatiments.compute_position_terrain) est calculée à partir des prédictions projetées sur le MNT,
+    avant l'estimation de la hauteur : elle ne dépend pas de la reconstruction faite dans la tuile.
+    Un bâtiment proche de la frontière entre deux coeurs est entièrement dans les emprises de traitement des deux tuiles (le halo est plus grand que les bâtiments),
+    il a donc la même position dans les deux et les coeurs semi-ouverts l'attribuent à une seule d'entre elles
+    """
+    if "x_position" not in gdf.columns or "y_position" not in gdf.columns:
+        raise ValueError("Les colonnes x_position et y_position sont absentes de batiments_fermes.gpkg : la tuile doit être traitée à nouveau")
+    identifiants = []
+    positions = gdf.groupby("id_bati", sort=False)[["x_position", "y_position"]].first()
+    for id_bati, position in positions.iterrows():
+        if point_dans_coeur(position["x_position"], position["y_position"], coeur):
+            identifiants.append(id_bati)
+    return identifiants
+
+
+def fusionner(path_output:str)->None:
+    """
+    Fusionne les résultats des tuiles.
+
+    Un bâtiment reconstruit dans plusieurs tuiles (car il se trouve dans un halo) n'est conservé que dans la tuile dont le coeur contient sa position au sol,
+    calculée avant la reconstruction (voir selectionner_batiments).
+    Les bords de toit de batiments_fermes/intersections.gpkg suivent la décision prise pour leur bâtiment.
+    Les autres entités sont conservées si leur centre se trouve dans le coeur de la tuile.
+    Les tuiles sont parcourues dans l'ordre de leur indice : le résultat ne dépend pas de l'ordre d'exécution des tâches
+    """
+    tuiles = gpd.read_file(os.path.join(path_output, "tuiles", "tuiles.gpkg")).sort_values("indice")
+
+    resultats:Dict[str, List[gpd.GeoDataFrame]] = {couche:[] for couche in COUCHES_A_FUSIONNER}
+    for _, tuile in tuiles.iterrows():
+        indice = int(tuile["indice"])
+        coeur = tuile["geometry"]
+        repertoire = get_repertoire_tuile(path_output, indice)
+
+        chemin_batiments = os.path.join(repertoire, COUCHES_A_FUSIONNER[0])
+        if not os.path.isfile(chemin_batiments):
+            print(f"Tuile {indice} : pas de résultat, elle est ignorée")
+            continue
+
+        batiments_conserves = None
+        for couche in COUCHES_A_FUSIONNER:
+            chemin = os.path.join(repertoire, couche)
+            if not os.path.isfile(chemin):
+                continue
+            gdf = gpd.read_file(chemin)
+            if gdf.shape[0]==0:
+                continue
+
+            if couche == COUCHES_A_FUSIONNER[0]:
+                batiments_conserves = set(selectionner_batiments(gdf, coeur))
+                masque = gdf["id_bati"].isin(batiments_conserves)
+            elif couche == COUCHES_A_FUSIONNER[1] and batiments_conserves is not None:
+                masque = gdf["id_bati"].isin(batiments_conserves)
+            else:
+                centres = gdf.geometry.centroid
+                masque = pd.Series([point_dans_coeur(c.x, c.y, coeur) for c in centres], index=gdf.index)
+
+            gdf = gdf[masque].copy()
+            # Les identifiants ne sont uniques qu'à l'intérieur d'une tuile
+            gdf.insert(0, "id_tuile", indice)
+            resultats[couche].append(gdf)
+
+    for couche, gdfs in resultats.items():
+        if len(gdfs)==0:
+            continue
+        gdf = gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True), crs="EPSG:2154")
+        chemin = os.path.join(path_output, couche)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        gdf.to_file(chemin)
+        print(f"{chemin} : {gdf.shape[0]} entités")
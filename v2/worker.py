@@ -0,0 +1,50 @@
+"""
+Démarrage des workers du pool.
+
+Les workers sont créés avec la méthode spawn : chaque worker est un nouvel interpréteur qui réimporte le module principal,
+puis les modules nécessaires pour désérialiser son initializer et ses tâches. Ce module n'importe rien de lourd :
+le contexte (et donc numpy, shapely, pyproj, scipy...) n'est importé qu'au moment d'initialiser le worker.
+
+A la première tâche, le worker importe les fonctions des tâches (v2/parallelisation.py) et les classes des objets qu'elles reçoivent :
+prédictions, groupes de pâtés de maisons et de bâtiments, calcul des intersections, fermeture, ordonnancement, tqdm, et avec eux geopandas et pandas
+(plus le moteur d'association des segments avec l'option pipeline, dont une étape est une tâche).
+Le traitement principal (v2/samon_gouttiere.py), les autres moteurs d'association, l'estimation du coût et la lecture des ressources partagées
+ne sont pas importés par les workers. GDAL et lxml ne sont importés que par les méthodes qui lisent le MNT, la RAF et le TA, appelées par le processus principal
+"""
+import os
+import time
+import multiprocessing
+
+
+# Durée de l'initialisation du worker courant, en secondes (imports et lecture du contexte)
+duree_initialisation:float = None
+
+
+def configurer_processus()->None:
+    """
+    A appeler dans le processus principal avant de créer le pool. Les variables d'environnement sont héritées par les workers :
+    chaque worker n'utilise qu'un thread pour numpy
+    """
+    multiprocessing.set_start_method('spawn', force=True)
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["MKL_NUM_THREADS"] = "1"
+    os.environ["OPENBLAS_NUM_THREADS"] = "1"
+
+
+def initialiser_worker(contexte_serialise:bytes, repertoire_profilage:str=None)->None:
+    """
+    Initializer des workers du pool. Si repertoire_profilage est donné, le worker est profilé (voir v2/profilage.py)
+    """
+    global duree_initialisation
+    if repertoire_profilage is not None:
+        from v2 import profilage
+        profilage.demarrer_worker(repertoire_profilage)
+    tic = time.perf_counter()
+    # Import ici : il n'est fait que dans les workers, une fois démarrés
+    from v2 import contexte
+    contexte.initialiser_worker(contexte_serialise)
+    duree_initialisation = time.perf_counter() - tic
+
+
+def get_duree_initialisation(_=None)->float:
+    return duree_initialisation